@@ -16,20 +16,12 @@ from releasing their forks in any public places. */
 
 #include "foggy_function.h"
 #include "foggy_backend.h"
+#include "foggy_log.h"
 
 
 #define MIN(X, Y) (((X) < (Y)) ? (X) : (Y))
 #define MAX(X, Y) (((X) > (Y)) ? (X) : (Y))
 
-#define DEBUG_PRINT 1
-#define debug_printf(fmt, ...)                            \
-  do {                                                    \
-    if (DEBUG_PRINT) { \
-      fprintf(stdout, fmt, ##__VA_ARGS__); \
-      fflush(stdout); \
-    } \
-  } while (0)
-
 // Compute cube root
 static double cbrt_custom(double x) {
   return pow(x, 1.0 / 3.0);
@@ -75,15 +67,14 @@ static uint32_t cubic_update(foggy_socket_t *sock) {
 
 
 void on_recv_pkt(foggy_socket_t *sock, uint8_t *pkt) {
-  debug_printf("Received packet\n");
+  log_trace("Received packet\n");
   foggy_tcp_header_t *hdr = (foggy_tcp_header_t *)pkt;
   uint8_t flags = get_flags(hdr);
 
   switch (flags) {
     case ACK_FLAG_MASK: {
       uint32_t ack = get_ack(hdr);
-      printf("Receive ACK %d\n", ack);
-      fflush(stdout);
+      log_trace("Receive ACK %d\n", ack);
       sock->window.advertised_window = get_advertised_window(hdr);
       handle_ack(sock, ack);
       break; 
@@ -91,15 +82,15 @@ void on_recv_pkt(foggy_socket_t *sock, uint8_t *pkt) {
 
     default: {
       if (get_payload_len(pkt) > 0) {
-        debug_printf("Received data packet %d %d\n", get_seq(hdr),
+        log_trace("Received data packet %d %d\n", get_seq(hdr),
                      get_seq(hdr) + get_payload_len(pkt));
 
-        debug_printf("Before add_receive_window\n");
+        log_trace("Before add_receive_window\n");
         sock->window.advertised_window = get_advertised_window(hdr);
         add_receive_window(sock, pkt);
-        debug_printf("After add_receive_window, before process\n");
+        log_trace("After add_receive_window, before process\n");
         process_receive_window(sock);
-        debug_printf("Sending ACK packet %d\n", sock->window.next_seq_expected);
+        log_trace("Sending ACK packet %d\n", sock->window.next_seq_expected);
 
         uint8_t *ack_pkt = create_packet(
             sock->my_port, ntohs(sock->conn.sin_port),
@@ -108,9 +99,11 @@ void on_recv_pkt(foggy_socket_t *sock, uint8_t *pkt) {
             MAX(MAX_NETWORK_BUFFER - (uint32_t)sock->received_len, MSS), 0,
             NULL, NULL, 0);
 
-        char client_ip[INET_ADDRSTRLEN];
-        inet_ntop(AF_INET, &(sock->conn.sin_addr), client_ip, INET_ADDRSTRLEN);
-        debug_printf("Sending ACK to %s:%d\n", client_ip, ntohs(sock->conn.sin_port));
+        if (foggy_log_enabled(LOG_TRACE)) {
+          char client_ip[INET_ADDRSTRLEN];
+          inet_ntop(AF_INET, &(sock->conn.sin_addr), client_ip, INET_ADDRSTRLEN);
+          log_trace("Sending ACK to %s:%d\n", client_ip, ntohs(sock->conn.sin_port));
+        }
 
         sendto(sock->socket, ack_pkt, sizeof(foggy_tcp_header_t), 0,
                (struct sockaddr *)&(sock->conn), sizeof(sock->conn));
@@ -232,7 +225,7 @@ void transmit_send_window(foggy_socket_t *sock) {
     uint16_t payload_len = get_payload_len(slot.msg);
 
     if (bytes_in_flight + payload_len <= effective_window) {
-      debug_printf("Sending packet %d %d\n", get_seq(hdr),
+      log_trace("Sending packet %d %d\n", get_seq(hdr),
                    get_seq(hdr) + payload_len);
       slot.is_sent = 1;
       sendto(sock->socket, slot.msg, get_plen(hdr), 0,
@@ -265,10 +258,10 @@ void receive_send_window(foggy_socket_t *sock) {
 void handle_ack(foggy_socket_t *sock, uint32_t ack) {
   if (ack == sock->window.last_ack_received) {
     sock->window.dup_ack_count++;
-    debug_printf("Duplicate ACK count: %d\n", sock->window.dup_ack_count);
+    log_trace("Duplicate ACK count: %d\n", sock->window.dup_ack_count);
 
     if (sock->window.dup_ack_count == 3) {
-      debug_printf("Fast retransmit triggered\n");
+      log_info("Fast retransmit triggered\n");
 
       // More gentle window reduction (0.7 instead of 0.5)
       sock->window.W_max = sock->window.congestion_window;
@@ -282,7 +275,7 @@ void handle_ack(foggy_socket_t *sock, uint32_t ack) {
       for (auto& slot : sock->send_window) {
         foggy_tcp_header_t *hdr = (foggy_tcp_header_t *)slot.msg;
         if (!has_been_acked(sock, get_seq(hdr))) {
-          debug_printf("Retransmitting packet %d\n", get_seq(hdr));
+          log_trace("Retransmitting packet %d\n", get_seq(hdr));
           sendto(sock->socket, slot.msg, get_plen(hdr), 0,
                 (struct sockaddr *)&(sock->conn), sizeof(sock->conn));
           break;
@@ -297,19 +290,19 @@ void handle_ack(foggy_socket_t *sock, uint32_t ack) {
     if (sock->window.reno_state == RENO_FAST_RECOVERY) {
       sock->window.congestion_window = sock->window.ssthresh;
       sock->window.reno_state = RENO_CONGESTION_AVOIDANCE;
-      debug_printf("Exiting Fast Recovery, CWND: %d\n", sock->window.congestion_window);
+      log_info("Exiting Fast Recovery, CWND: %d\n", sock->window.congestion_window);
     } else if (sock->window.reno_state == RENO_SLOW_START) {
       sock->window.congestion_window += MSS;
-      debug_printf("Slow Start, CWND: %d\n", sock->window.congestion_window);
+      log_trace("Slow Start, CWND: %d\n", sock->window.congestion_window);
 
       if (sock->window.congestion_window >= sock->window.ssthresh) {
         sock->window.reno_state = RENO_CONGESTION_AVOIDANCE;
-        debug_printf("Entering Congestion Avoidance\n");
+        log_info("Entering Congestion Avoidance\n");
       }
     } else if (sock->window.reno_state == RENO_CONGESTION_AVOIDANCE) {
       // Use Cubic instead of linear growth
       sock->window.congestion_window = cubic_update(sock);
-      debug_printf("Cubic Congestion Avoidance, CWND: %d\n", sock->window.congestion_window);
+      log_trace("Cubic Congestion Avoidance, CWND: %d\n", sock->window.congestion_window);
     }
 
     sock->window.last_ack_received = ack;
@@ -48,11 +48,12 @@ echo ""
 
 # 切换到目录
 cd "$BASE_DIR"
+export FOGGY_LOG_LEVEL=off
 
 # 编译
 echo -e "${YELLOW}[1/3] 编译代码...${NC}"
-make clean > /dev/null 2>&1
-make foggy > /dev/null 2>&1
+# release: -O2 且不含逐包日志, 避免 stdout 输出影响测得的吞吐量
+make release > /dev/null 2>&1
 if [ $? -ne 0 ]; then
     echo -e "${RED}编译失败!${NC}"
     exit 1
@@ -2,15 +2,18 @@
 
 # TCP 性能对比测试脚本 - 带网络延迟模拟
 # 使用方法: sudo ./benchmark_with_delay.sh [reno|cubic] [测试次数] [延迟ms]
+#           ./benchmark_with_delay.sh ...  (不使用 sudo 时由用户态 relay 施加延迟)
+#
+# 以 root 运行时在 lo 接口上配置 netem; 否则 (或设置 RELAY=1 时) 客户端经过
+# foggytcp2 的用户态 relay (cd foggytcp2/foggytcp && make relay) 连接服务器,
+# 两个方向各延迟 ${DELAY}ms, 与 lo 上的 netem 相同, 不需要 root, 也不影响其他程序。
+#
+# TRACE=<文件或名称> 让网络条件随时间变化: relay 在每次测试中从头回放该 trace
+# (格式见 foggytcp2/scripts/traces.py; 名称指 foggytcp2/testdata/traces/ 中附带的
+# step、sawtooth、burst_loss), 其中的 "-" 沿用 ${DELAY}ms 延迟。需要 relay, 以 root 运行时也使用 relay。
 
 set -e
 
-# 检查 root 权限
-if [ "$EUID" -ne 0 ]; then
-    echo "请使用 sudo 运行此脚本"
-    exit 1
-fi
-
 # 颜色定义
 RED='\033[0;31m'
 GREEN='\033[0;32m'
@@ -31,31 +34,113 @@ else
     ALGO_NAME="TCP Cubic"
 fi
 
+SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
+RELAY_BIN="$SCRIPT_DIR/../../foggytcp2/foggytcp/build/relay"
+TRACE_DIR="$SCRIPT_DIR/../../foggytcp2/testdata/traces"
+
+TRACE_FILE=""
+if [ -n "$TRACE" ]; then
+    if [ -f "$TRACE" ]; then
+        TRACE_FILE="$TRACE"
+    elif [ -f "$TRACE_DIR/$TRACE.trace" ]; then
+        TRACE_FILE="$TRACE_DIR/$TRACE.trace"
+    else
+        echo -e "${RED}错误: 找不到 trace: $TRACE${NC}"
+        exit 1
+    fi
+fi
+
+if [ "$EUID" -ne 0 ] || [ "${RELAY:-0}" = "1" ] || [ -n "$TRACE_FILE" ]; then
+    USE_RELAY=1
+else
+    USE_RELAY=0
+fi
+SERVER_PORT=15441
+CLIENT_PORT=$SERVER_PORT
+RELAY_PID=""
+
 TEST_FILE="$BASE_DIR/../testdata/test_1mb.bin"
 OUTPUT_FILE="/tmp/benchmark_output.bin"
-RESULTS_FILE="/tmp/benchmark_${ALGO}_delay${DELAY}_results.txt"
+if [ -n "$TRACE_FILE" ]; then
+    RESULTS_FILE="/tmp/benchmark_${ALGO}_delay${DELAY}_$(basename "$TRACE_FILE" .trace)_results.txt"
+else
+    RESULTS_FILE="/tmp/benchmark_${ALGO}_delay${DELAY}_results.txt"
+fi
 
 echo -e "${GREEN}========================================${NC}"
 echo -e "${GREEN}   $ALGO_NAME 性能测试 (RTT=${DELAY}ms×2)${NC}"
 echo -e "${GREEN}========================================${NC}"
 echo ""
 
+# relay 不存在时编译 (foggytcp2 的 make release 会先 clean, 连同 relay 一起删除)
+ensure_relay() {
+    if [ ! -x "$RELAY_BIN" ]; then
+        if ! make -C "$(dirname "$(dirname "$RELAY_BIN")")" relay > /dev/null 2>&1; then
+            echo -e "${RED}错误: relay 编译失败: $RELAY_BIN${NC}"
+            echo "请运行: make -C $(dirname "$(dirname "$RELAY_BIN")") relay, 或使用 sudo 运行此脚本"
+            exit 1
+        fi
+    fi
+}
+
+# 启动 relay; trace 从客户端的第一个数据报开始回放
+start_relay() {
+    local trace_args=()
+    if [ -n "$TRACE_FILE" ]; then
+        trace_args=(--trace "$TRACE_FILE")
+    fi
+    "$RELAY_BIN" --delay ${DELAY} --symmetric "${trace_args[@]}" \
+        127.0.0.1 $CLIENT_PORT 127.0.0.1 $SERVER_PORT > /dev/null &
+    RELAY_PID=$!
+}
+
+# 移除网络延迟 (停止 relay 或删除 lo 上的 netem)
+cleanup_network() {
+    if [ "$USE_RELAY" = "1" ]; then
+        if [ -n "$RELAY_PID" ]; then
+            kill $RELAY_PID 2>/dev/null || true
+            wait $RELAY_PID 2>/dev/null || true
+            RELAY_PID=""
+        fi
+    else
+        tc qdisc del dev lo root 2>/dev/null || true
+    fi
+}
+
 # 添加网络延迟
 echo -e "${YELLOW}[准备] 配置网络延迟...${NC}"
-tc qdisc del dev lo root 2>/dev/null || true
-tc qdisc add dev lo root netem delay ${DELAY}ms
-echo -e "${GREEN}✓ 已添加 ${DELAY}ms 延迟到 lo 接口${NC}"
-echo ""
+if [ "$USE_RELAY" = "1" ]; then
+    ensure_relay
+    # 由内核分配两个空闲端口, 多个实例可以同时运行
+    read SERVER_PORT CLIENT_PORT < <(python3 -c '
+import socket
+socks = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(2)]
+for s in socks:
+    s.bind(("127.0.0.1", 0))
+print(*(s.getsockname()[1] for s in socks))')
+    start_relay
+    echo -e "${GREEN}✓ relay 已启动: 127.0.0.1:${CLIENT_PORT} -> ${SERVER_PORT}, 每个方向延迟 ${DELAY}ms${NC}"
+    if [ -n "$TRACE_FILE" ]; then
+        echo -e "${GREEN}✓ 回放 trace: $TRACE_FILE (每次测试从头开始)${NC}"
+    fi
+else
+    tc qdisc del dev lo root 2>/dev/null || true
+    tc qdisc add dev lo root netem delay ${DELAY}ms
+    echo -e "${GREEN}✓ 已添加 ${DELAY}ms 延迟到 lo 接口${NC}"
+    echo ""
 
-# 检查配置
-echo "当前网络配置:"
-tc qdisc show dev lo
+    # 检查配置
+    echo "当前网络配置:"
+    tc qdisc show dev lo
+fi
+# 脚本因错误提前退出时也要恢复网络配置
+trap cleanup_network EXIT
 echo ""
 
 # 检查测试文件
 if [ ! -f "$TEST_FILE" ]; then
     echo -e "${RED}错误: 测试文件不存在: $TEST_FILE${NC}"
-    tc qdisc del dev lo root
+    cleanup_network
     exit 1
 fi
 
@@ -68,16 +153,20 @@ echo ""
 
 # 切换到目录
 cd "$BASE_DIR"
+export FOGGY_LOG_LEVEL=off
 
 # 编译
 echo -e "${YELLOW}[1/3] 编译代码...${NC}"
-make clean > /dev/null 2>&1
-make foggy > /dev/null 2>&1
+# release: -O2 且不含逐包日志, 避免 stdout 输出影响测得的吞吐量
+make release > /dev/null 2>&1
 if [ $? -ne 0 ]; then
     echo -e "${RED}编译失败!${NC}"
-    tc qdisc del dev lo root
+    cleanup_network
     exit 1
 fi
+if [ "$USE_RELAY" = "1" ]; then
+    ensure_relay
+fi
 echo -e "${GREEN}✓ 编译成功${NC}"
 echo ""
 
@@ -97,14 +186,20 @@ for i in $(seq 1 $RUNS); do
     # 清理输出文件
     rm -f "$OUTPUT_FILE"
 
+    # 重启 relay, 使 trace 从头回放
+    if [ -n "$TRACE_FILE" ]; then
+        cleanup_network
+        start_relay
+    fi
+
     # 启动服务器(后台,不输出)
-    ./server 127.0.0.1 15441 "$OUTPUT_FILE" > /dev/null 2>&1 &
+    ./server 127.0.0.1 $SERVER_PORT "$OUTPUT_FILE" > /dev/null 2>&1 &
     SERVER_PID=$!
     sleep 1
 
     # 运行客户端并测量时间
     START_TIME=$(date +%s.%N)
-    timeout 120 ./client 127.0.0.1 15441 "$TEST_FILE" > /dev/null 2>&1
+    timeout 120 ./client 127.0.0.1 $CLIENT_PORT "$TEST_FILE" > /dev/null 2>&1
     CLIENT_EXIT=$?
     END_TIME=$(date +%s.%N)
 
@@ -145,7 +240,7 @@ echo ""
 
 # 清理网络配置
 echo -e "${YELLOW}[清理] 移除网络延迟...${NC}"
-tc qdisc del dev lo root 2>/dev/null || true
+cleanup_network
 echo -e "${GREEN}✓ 已恢复网络配置${NC}"
 echo ""
 
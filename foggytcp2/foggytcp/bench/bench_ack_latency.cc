@@ -0,0 +1,140 @@
+/* Copyright (C) 2024 Hong Kong University of Science and Technology
+
+This repository is used for the Computer Networks (ELEC 3120)
+course taught at Hong Kong University of Science and Technology.
+
+No part of the project may be copied and/or distributed without
+the express permission of the course staff. Everyone is prohibited
+from releasing their forks in any public places. */
+
+/*
+ * Micro-benchmark for the backend's reaction time to an ACK.
+ *
+ * A real foggy-TCP sender talks to a fake receiver on a plain UDP socket. The
+ * receiver acknowledges every segment with an advertised window of one MSS,
+ * which forces stop-and-wait: the next segment can only leave after the
+ * backend has noticed the ACK. The time from sending the ACK to receiving the
+ * next segment is the ACK-to-send latency.
+ *
+ * Usage: make bench && ./build/bench_ack_latency [segments]
+ */
+
+#include <arpa/inet.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/socket.h>
+#include <sys/time.h>
+#include <unistd.h>
+
+#include <algorithm>
+#include <vector>
+
+#include "foggy_packet.h"
+#include "foggy_tcp.h"
+#include "foggy_timing.h"
+
+#define DEFAULT_SEGMENTS 2000
+#define RECV_TIMEOUT_S 5
+
+static int open_receiver(uint16_t* port) {
+  struct sockaddr_in addr;
+  socklen_t len = sizeof(addr);
+  struct timeval timeout = {RECV_TIMEOUT_S, 0};
+
+  int fd = socket(AF_INET, SOCK_DGRAM, 0);
+  memset(&addr, 0, sizeof(addr));
+  addr.sin_family = AF_INET;
+  addr.sin_addr.s_addr = inet_addr("127.0.0.1");
+  addr.sin_port = 0;
+  if (fd < 0 || bind(fd, (struct sockaddr*)&addr, sizeof(addr)) < 0) {
+    perror("ERROR opening receiver");
+    exit(-1);
+  }
+  setsockopt(fd, SOL_SOCKET, SO_RCVTIMEO, &timeout, sizeof(timeout));
+  getsockname(fd, (struct sockaddr*)&addr, &len);
+  *port = ntohs(addr.sin_port);
+  return fd;
+}
+
+/* foggy_write() blocks while the send buffer is full, so the data is written
+ * from its own thread. */
+static void* writer(void* in) {
+  void* sock = ((void**)in)[0];
+  int len = *(int*)((void**)in)[1];
+  uint8_t* data = (uint8_t*)calloc(len, 1);
+  foggy_write(sock, data, len);
+  free(data);
+  return NULL;
+}
+
+static void send_ack(int fd, struct sockaddr_in* peer, uint32_t ack) {
+  uint8_t* pkt = create_packet(0, ntohs(peer->sin_port), 0, ack,
+                               sizeof(foggy_tcp_header_t),
+                               sizeof(foggy_tcp_header_t), ACK_FLAG_MASK, MSS,
+                               0, NULL, NULL, 0);
+  sendto(fd, pkt, sizeof(foggy_tcp_header_t), 0, (struct sockaddr*)peer,
+         sizeof(*peer));
+  free(pkt);
+}
+
+int main(int argc, const char* argv[]) {
+  int segments = argc > 1 ? atoi(argv[1]) : DEFAULT_SEGMENTS;
+  if (segments < 2) {
+    fprintf(stderr, "Usage: %s [segments]\n", argv[0]);
+    return -1;
+  }
+  /* The debug build logs every packet unless told otherwise. */
+  setenv("FOGGY_LOG_LEVEL", "off", 0);
+
+  uint16_t port;
+  int fd = open_receiver(&port);
+  char port_str[8];
+  snprintf(port_str, sizeof(port_str), "%u", port);
+
+  void* sock = foggy_socket(TCP_INITIATOR, port_str, "127.0.0.1");
+  int len = segments * MSS;
+  void* writer_args[2] = {sock, &len};
+  pthread_t writer_thread;
+  pthread_create(&writer_thread, NULL, writer, writer_args);
+
+  std::vector<uint64_t> latency;
+  latency.reserve(segments);
+  uint8_t buf[MAX_LEN];
+  struct sockaddr_in peer;
+  socklen_t peer_len = sizeof(peer);
+  uint32_t next_seq = 0;
+  uint64_t ack_sent = 0, start = 0;
+
+  // Segments are not all MSS-sized when foggy_write() waits for space.
+  while (next_seq < (uint32_t)len) {
+    ssize_t n = recvfrom(fd, buf, sizeof(buf), 0, (struct sockaddr*)&peer,
+                         &peer_len);
+    uint64_t now = monotonic_ns();
+    if (n < 0) {
+      fprintf(stderr, "Timed out waiting for segment at seq %u\n", next_seq);
+      return -1;
+    }
+    foggy_tcp_header_t* hdr = (foggy_tcp_header_t*)buf;
+    if (get_seq(hdr) != next_seq) continue;  // Retransmission.
+
+    if (ack_sent != 0) latency.push_back(now - ack_sent);
+    else start = now;
+    next_seq += get_payload_len(buf);
+    ack_sent = monotonic_ns();
+    send_ack(fd, &peer, next_seq);
+  }
+  uint64_t elapsed = monotonic_ns() - start;
+
+  pthread_join(writer_thread, NULL);
+  foggy_close(sock);
+  close(fd);
+
+  std::sort(latency.begin(), latency.end());
+  size_t count = latency.size();
+  printf("%10s %14s %14s %14s\n", "segments", "median (us)", "p99 (us)",
+         "ACKs/s");
+  printf("%10d %14.1f %14.1f %14.0f\n", segments, latency[count / 2] / 1e3,
+         latency[count * 99 / 100] / 1e3, count / (elapsed / 1e9));
+  return 0;
+}
@@ -0,0 +1,111 @@
+/* Copyright (C) 2024 Hong Kong University of Science and Technology
+
+This repository is used for the Computer Networks (ELEC 3120)
+course taught at Hong Kong University of Science and Technology.
+
+No part of the project may be copied and/or distributed without
+the express permission of the course staff. Everyone is prohibited
+from releasing their forks in any public places. */
+
+/*
+ * Benchmark for mutex traffic during a bulk transfer.
+ *
+ * A foggy-TCP sender and receiver run in one process over loopback: a writer
+ * thread sends the data and the main thread reads it like server.cc. The
+ * binary is linked with -Wl,--wrap=pthread_mutex_lock, so every lock taken by
+ * the stack or the benchmark goes through a counter. The result is printed
+ * per second and per megabyte transferred.
+ *
+ * Only the public API is used, so the same file builds against older trees
+ * for a before and after comparison.
+ *
+ * Usage: make bench && ./build/bench_locks [megabytes]
+ */
+
+#include <arpa/inet.h>
+#include <pthread.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/socket.h>
+
+#include <atomic>
+
+#include "foggy_tcp.h"
+#include "foggy_timing.h"
+
+#define DEFAULT_MEGABYTES 64
+#define READ_SIZE 4096
+#define WRITE_SIZE 65536
+
+static std::atomic<uint64_t> lock_count(0);
+
+extern "C" int __real_pthread_mutex_lock(pthread_mutex_t* mutex);
+
+extern "C" int __wrap_pthread_mutex_lock(pthread_mutex_t* mutex) {
+  lock_count.fetch_add(1, std::memory_order_relaxed);
+  return __real_pthread_mutex_lock(mutex);
+}
+
+typedef struct {
+  void* sock;
+  uint64_t total;
+} writer_args_t;
+
+static void* writer(void* in) {
+  writer_args_t* args = (writer_args_t*)in;
+  uint8_t* data = (uint8_t*)calloc(WRITE_SIZE, 1);
+  for (uint64_t sent = 0; sent < args->total; sent += WRITE_SIZE) {
+    uint64_t len = args->total - sent;
+    foggy_write(args->sock, data, len < WRITE_SIZE ? len : WRITE_SIZE);
+  }
+  free(data);
+  return NULL;
+}
+
+int main(int argc, const char* argv[]) {
+  int megabytes = argc > 1 ? atoi(argv[1]) : DEFAULT_MEGABYTES;
+  if (megabytes <= 0) {
+    fprintf(stderr, "Usage: %s [megabytes]\n", argv[0]);
+    return -1;
+  }
+  /* The debug build logs every packet unless told otherwise. */
+  setenv("FOGGY_LOG_LEVEL", "off", 0);
+
+  void* receiver = foggy_socket(TCP_LISTENER, "0", NULL);
+  struct sockaddr_in server;
+  socklen_t server_len = sizeof(server);
+  getsockname(((foggy_socket_t*)receiver)->socket, (struct sockaddr*)&server,
+              &server_len);
+  char port_str[8];
+  snprintf(port_str, sizeof(port_str), "%u", ntohs(server.sin_port));
+  void* sender = foggy_socket(TCP_INITIATOR, port_str, "127.0.0.1");
+
+  writer_args_t args = {sender, (uint64_t)megabytes << 20};
+  uint8_t* buf = (uint8_t*)malloc(READ_SIZE);
+  uint64_t received = 0;
+  uint64_t locks_before = lock_count.load();
+  uint64_t start = monotonic_ns();
+
+  pthread_t writer_thread;
+  pthread_create(&writer_thread, NULL, writer, &args);
+  while (received < args.total) {
+    int n = foggy_read(receiver, buf, READ_SIZE);
+    if (n <= 0) break;
+    received += n;
+  }
+  double elapsed = (monotonic_ns() - start) / 1e9;
+  uint64_t locks = lock_count.load() - locks_before;
+
+  printf("%llu bytes in %.3f s (%.1f MB/s)\n", (unsigned long long)received,
+         elapsed, received / elapsed / (1 << 20));
+  printf("%12s %16s %14s\n", "locks", "locks/s", "locks/MB");
+  printf("%12llu %16.0f %14.1f\n", (unsigned long long)locks, locks / elapsed,
+         locks / ((double)received / (1 << 20)));
+
+  pthread_join(writer_thread, NULL);
+  foggy_close(sender);
+  foggy_close(receiver);
+  free(buf);
+  return 0;
+}
@@ -0,0 +1,119 @@
+/* Copyright (C) 2024 Hong Kong University of Science and Technology
+
+This repository is used for the Computer Networks (ELEC 3120)
+course taught at Hong Kong University of Science and Technology.
+
+No part of the project may be copied and/or distributed without
+the express permission of the course staff. Everyone is prohibited
+from releasing their forks in any public places. */
+
+/*
+ * Micro-benchmark for the receive path.
+ *
+ * Segments are fed straight into add_receive_window() and
+ * process_receive_window() the way check_for_pkt() does, and the application
+ * drains them with foggy_read() in BUF_SIZE chunks like server.cc. No packet
+ * reaches the socket, so its backend thread stays idle and the main thread
+ * stands in for it. Three patterns are measured:
+ *
+ *   in-order        the reader keeps up after every segment
+ *   in-order, lag   the reader drains only every 64 segments
+ *   reordered       every group of 16 segments arrives in reverse order
+ *
+ * Usage: make bench && ./build/bench_receive [megabytes]
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include <vector>
+
+#include "foggy_function.h"
+#include "foggy_timing.h"
+
+#define DEFAULT_MEGABYTES 32
+#define BUF_SIZE 4096
+#define LAG_SEGMENTS 64
+#define REORDER_GROUP 16
+
+typedef struct {
+  const char* name;
+  int drain_every;
+  int reorder_group;
+} pattern_t;
+
+static std::vector<uint8_t*> make_segments(int count) {
+  std::vector<uint8_t*> pkts(count);
+  uint8_t payload[MSS];
+  for (int i = 0; i < count; i++) {
+    memset(payload, i & 0xff, sizeof(payload));
+    pkts[i] = create_packet(0, 0, i * MSS, 0, sizeof(foggy_tcp_header_t),
+                            sizeof(foggy_tcp_header_t) + MSS, ACK_FLAG_MASK,
+                            MSS, 0, NULL, payload, MSS);
+  }
+  return pkts;
+}
+
+static void drain(foggy_socket_t* sock, uint8_t* buf) {
+  while (spsc_used(&sock->received) > 0) foggy_read(sock, buf, BUF_SIZE);
+}
+
+/**
+ * Returns the average cost in ns of receiving and reading one segment.
+ */
+static double bench_pattern(const std::vector<uint8_t*>& pkts,
+                            const pattern_t* pattern) {
+  foggy_socket_t* sock =
+      (foggy_socket_t*)foggy_socket(TCP_LISTENER, "0", NULL);
+  uint8_t buf[BUF_SIZE];
+  int count = pkts.size();
+
+  uint64_t start = monotonic_ns();
+  for (int i = 0; i < count; i++) {
+    int group = i / pattern->reorder_group * pattern->reorder_group;
+    int last = group + pattern->reorder_group - 1;
+    if (last >= count) last = count - 1;
+    uint8_t* pkt = pkts[last - (i - group)];
+
+    add_receive_window(sock, pkt);
+    process_receive_window(sock);
+
+    if ((i + 1) % pattern->drain_every == 0) drain(sock, buf);
+  }
+  drain(sock, buf);
+  uint64_t elapsed = monotonic_ns() - start;
+
+  if (sock->window.next_seq_expected != count * MSS) {
+    fprintf(stderr, "%s: only %u of %u bytes delivered\n", pattern->name,
+            sock->window.next_seq_expected, (uint32_t)(count * MSS));
+    exit(-1);
+  }
+  foggy_close(sock);
+  return (double)elapsed / count;
+}
+
+int main(int argc, const char* argv[]) {
+  int megabytes = argc > 1 ? atoi(argv[1]) : DEFAULT_MEGABYTES;
+  if (megabytes <= 0) {
+    fprintf(stderr, "Usage: %s [megabytes]\n", argv[0]);
+    return -1;
+  }
+  /* The debug build logs every packet unless told otherwise. */
+  setenv("FOGGY_LOG_LEVEL", "off", 0);
+
+  const pattern_t patterns[] = {
+      {"in-order", 1, 1},
+      {"in-order, lag", LAG_SEGMENTS, 1},
+      {"reordered", LAG_SEGMENTS, REORDER_GROUP},
+  };
+  std::vector<uint8_t*> pkts = make_segments(megabytes * 1000000 / MSS);
+
+  printf("%16s %14s %10s\n", "pattern", "segment (ns)", "MB/s");
+  for (const pattern_t& pattern : patterns) {
+    double ns = bench_pattern(pkts, &pattern);
+    printf("%16s %14.1f %10.0f\n", pattern.name, ns, MSS / ns * 1e3);
+  }
+  for (uint8_t* pkt : pkts) free(pkt);
+  return 0;
+}
@@ -0,0 +1,89 @@
+/* Copyright (C) 2024 Hong Kong University of Science and Technology
+
+This repository is used for the Computer Networks (ELEC 3120)
+course taught at Hong Kong University of Science and Technology.
+
+No part of the project may be copied and/or distributed without
+the express permission of the course staff. Everyone is prohibited
+from releasing their forks in any public places. */
+
+/*
+ * Micro-benchmark for the sender's per-tick bookkeeping.
+ *
+ * Every backend iteration calls send_pkts(sock, 0), which runs
+ * transmit_send_window() and receive_send_window(). This benchmark fills the
+ * send window with N in-flight segments (plus one that does not fit in the
+ * congestion window) and measures the cost of one such tick for growing N.
+ * The cost should stay flat as N grows.
+ *
+ * Usage: make bench && ./build/bench_send_window [ticks]
+ */
+
+#include <arpa/inet.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/socket.h>
+#include <time.h>
+#include <unistd.h>
+
+#include "foggy_function.h"
+#include "foggy_timing.h"
+
+#define DEFAULT_TICKS 200000
+#define DISCARD_PORT 9
+
+static foggy_socket_t* make_socket(uint32_t window_segments) {
+  foggy_socket_t* sock = new foggy_socket_t;
+  foggy_socket_init(sock, TCP_INITIATOR);
+  sock->socket = socket(AF_INET, SOCK_DGRAM, 0);
+  memset(&sock->conn, 0, sizeof(sock->conn));
+  sock->conn.sin_family = AF_INET;
+  sock->conn.sin_addr.s_addr = inet_addr("127.0.0.1");
+  sock->conn.sin_port = htons(DISCARD_PORT);
+  sock->my_port = 0;
+
+  sock->window.advertised_window = UINT32_MAX;
+  sock->window.congestion_window = window_segments * MSS;
+  sock->window.reno_state = RENO_CONGESTION_AVOIDANCE;
+  return sock;
+}
+
+static void free_socket(foggy_socket_t* sock) {
+  foggy_socket_release(sock);
+  close(sock->socket);
+  delete sock;
+}
+
+/**
+ * Returns the average cost in ns of one backend tick with a full window.
+ */
+static double bench_tick(uint32_t window_segments, int ticks) {
+  foggy_socket_t* sock = make_socket(window_segments);
+  uint32_t len = (window_segments + 1) * MSS;
+  sock->sending.tail = len;
+  send_pkts(sock, len);
+
+  uint64_t start = monotonic_ns();
+  for (int i = 0; i < ticks; i++) send_pkts(sock, 0);
+  uint64_t elapsed = monotonic_ns() - start;
+
+  free_socket(sock);
+  return (double)elapsed / ticks;
+}
+
+int main(int argc, const char* argv[]) {
+  int ticks = argc > 1 ? atoi(argv[1]) : DEFAULT_TICKS;
+  if (ticks <= 0) {
+    fprintf(stderr, "Usage: %s [ticks]\n", argv[0]);
+    return -1;
+  }
+  /* The debug build logs every packet unless told otherwise. */
+  setenv("FOGGY_LOG_LEVEL", "off", 0);
+
+  printf("%10s %14s\n", "segments", "tick (ns)");
+  for (uint32_t n = 8; n <= 512; n *= 2) {
+    printf("%10u %14.1f\n", n, bench_tick(n, ticks));
+  }
+  return 0;
+}
@@ -0,0 +1,292 @@
+/* Copyright (C) 2024 Hong Kong University of Science and Technology
+
+This repository is used for the Computer Networks (ELEC 3120)
+course taught at Hong Kong University of Science and Technology.
+
+No part of the project may be copied and/or distributed without
+the express permission of the course staff. Everyone is prohibited
+from releasing their forks in any public places. */
+
+/*
+ * Benchmark for throughput on a long, fat link.
+ *
+ * A foggy-TCP sender and receiver run in one process and talk through a link
+ * emulator thread. The emulator delays every packet by half the RTT and sends
+ * it out at the link rate, with a drop-tail queue of one bandwidth-delay
+ * product. The sender writes for a fixed time and the receiver prints its
+ * goodput, its receive window and the sender's congestion window every
+ * interval.
+ *
+ * An unscaled 64 KB receive window caps throughput at 64 KB per RTT, about
+ * 2.6 Mbps at 200 ms. With window scaling and autotuning the receive window
+ * follows the sender, and throughput reaches the link rate once congestion
+ * avoidance has grown cwnd to one BDP. Slow start ends at the initial
+ * ssthresh of 64 MSS, and from there one MSS per RTT takes about 26 s at
+ * 200 ms and 10 Mbps, so the average over the run stays well below the last
+ * interval unless the run is long.
+ *
+ * Besides the emulator's own drop-tail losses, the drop count includes
+ * datagrams the kernel dropped because a socket's receive buffer was full,
+ * e.g. while a thread was descheduled. Those never reach the emulator or the
+ * stack, but the sender still sees them as losses.
+ *
+ * Usage: make bench && ./build/bench_window [seconds] [rtt_ms] [mbps]
+ */
+
+#include <arpa/inet.h>
+#include <linux/sock_diag.h>
+#include <poll.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/socket.h>
+#include <unistd.h>
+
+#include <atomic>
+#include <deque>
+
+#include "foggy_packet.h"
+#include "foggy_tcp.h"
+#include "foggy_timing.h"
+
+#define DEFAULT_SECONDS 60
+#define DEFAULT_RTT_MS 200
+#define DEFAULT_MBPS 10
+#define REPORT_INTERVAL_NS 2000000000ULL
+#define READ_SIZE 65536
+#define WRITE_SIZE 65536
+#define POLL_MAX_MS 10
+
+typedef struct {
+  uint64_t release_ns;
+  struct sockaddr_in to;
+  uint16_t len;
+  uint8_t data[MAX_LEN];
+} held_packet_t;
+
+/* One direction of the link: packets leave one after another at the link
+ * rate, then wait out the propagation delay. */
+typedef struct {
+  std::deque<held_packet_t> queue;
+  uint64_t free_ns;  // When the link finishes sending what it holds.
+} direction_t;
+
+typedef struct {
+  int fd;
+  struct sockaddr_in server;
+  struct sockaddr_in client;
+  int has_client;
+  uint64_t delay_ns;
+  double ns_per_byte;
+  uint64_t queue_bytes;
+  uint64_t drops;
+  std::atomic<int> stop;
+} link_t;
+
+static int open_relay(uint16_t* port) {
+  struct sockaddr_in addr;
+  socklen_t len = sizeof(addr);
+
+  int fd = socket(AF_INET, SOCK_DGRAM, 0);
+  memset(&addr, 0, sizeof(addr));
+  addr.sin_family = AF_INET;
+  addr.sin_addr.s_addr = inet_addr("127.0.0.1");
+  addr.sin_port = 0;
+  if (fd < 0 || bind(fd, (struct sockaddr*)&addr, sizeof(addr)) < 0) {
+    perror("ERROR opening relay");
+    exit(-1);
+  }
+  getsockname(fd, (struct sockaddr*)&addr, &len);
+  *port = ntohs(addr.sin_port);
+  return fd;
+}
+
+/**
+ * Returns the datagrams the kernel has dropped on a socket because its receive
+ * buffer was full, or 0 if the kernel does not report it.
+ */
+static uint32_t socket_drops(int fd) {
+  uint32_t meminfo[SK_MEMINFO_VARS];
+  socklen_t len = sizeof(meminfo);
+  if (getsockopt(fd, SOL_SOCKET, SO_MEMINFO, meminfo, &len) < 0 ||
+      len < sizeof(meminfo)) {
+    return 0;
+  }
+  return meminfo[SK_MEMINFO_DROPS];
+}
+
+/**
+ * Queues a packet on one direction of the link, or drops it if the backlog
+ * would exceed the queue limit.
+ */
+static void enqueue(link_t* link, direction_t* dir, const uint8_t* data,
+                    uint16_t len, const struct sockaddr_in* to,
+                    uint64_t now) {
+  uint64_t start = dir->free_ns > now ? dir->free_ns : now;
+  uint64_t backlog = (uint64_t)((start - now) / link->ns_per_byte);
+  if (backlog + len > link->queue_bytes) {
+    link->drops++;
+    return;
+  }
+
+  held_packet_t pkt;
+  dir->free_ns = start + (uint64_t)(len * link->ns_per_byte);
+  pkt.release_ns = dir->free_ns + link->delay_ns;
+  pkt.to = *to;
+  pkt.len = len;
+  memcpy(pkt.data, data, len);
+  dir->queue.push_back(pkt);
+}
+
+static void* run_link(void* in) {
+  link_t* link = (link_t*)in;
+  direction_t up, down;  // Client to server, and back.
+  uint8_t buf[MAX_LEN];
+  struct sockaddr_in from;
+  socklen_t from_len;
+  struct pollfd pfd = {link->fd, POLLIN, 0};
+  up.free_ns = down.free_ns = 0;
+
+  while (!link->stop.load()) {
+    uint64_t now = monotonic_ns();
+    int timeout = POLL_MAX_MS;
+    for (direction_t* dir : {&up, &down}) {
+      if (dir->queue.empty()) continue;
+      uint64_t release = dir->queue.front().release_ns;
+      int ms = release > now ? (int)((release - now + 999999) / 1000000) : 0;
+      if (ms < timeout) timeout = ms;
+    }
+    poll(&pfd, 1, timeout);
+
+    now = monotonic_ns();
+    while (1) {
+      from_len = sizeof(from);
+      ssize_t n = recvfrom(link->fd, buf, sizeof(buf), MSG_DONTWAIT,
+                           (struct sockaddr*)&from, &from_len);
+      if (n <= 0) break;
+      if (from.sin_port == link->server.sin_port) {
+        if (link->has_client) {
+          enqueue(link, &down, buf, n, &link->client, now);
+        }
+      } else {
+        link->client = from;
+        link->has_client = 1;
+        enqueue(link, &up, buf, n, &link->server, now);
+      }
+    }
+
+    for (direction_t* dir : {&up, &down}) {
+      while (!dir->queue.empty() && dir->queue.front().release_ns <= now) {
+        held_packet_t& pkt = dir->queue.front();
+        sendto(link->fd, pkt.data, pkt.len, 0, (struct sockaddr*)&pkt.to,
+               sizeof(pkt.to));
+        dir->queue.pop_front();
+      }
+    }
+  }
+  return NULL;
+}
+
+static std::atomic<int> writing(1);
+
+static void* writer(void* sock) {
+  uint8_t* data = (uint8_t*)calloc(WRITE_SIZE, 1);
+  while (writing.load()) foggy_write(sock, data, WRITE_SIZE);
+  free(data);
+  return NULL;
+}
+
+int main(int argc, const char* argv[]) {
+  int seconds = argc > 1 ? atoi(argv[1]) : DEFAULT_SECONDS;
+  int rtt_ms = argc > 2 ? atoi(argv[2]) : DEFAULT_RTT_MS;
+  double mbps = argc > 3 ? atof(argv[3]) : DEFAULT_MBPS;
+  if (seconds <= 0 || rtt_ms <= 0 || mbps <= 0) {
+    fprintf(stderr, "Usage: %s [seconds] [rtt_ms] [mbps]\n", argv[0]);
+    return -1;
+  }
+  /* The debug build logs every packet unless told otherwise. */
+  setenv("FOGGY_LOG_LEVEL", "off", 0);
+
+  foggy_socket_t* receiver =
+      (foggy_socket_t*)foggy_socket(TCP_LISTENER, "0", NULL);
+  struct sockaddr_in server;
+  socklen_t server_len = sizeof(server);
+  getsockname(receiver->socket, (struct sockaddr*)&server, &server_len);
+  server.sin_addr.s_addr = inet_addr("127.0.0.1");
+
+  static link_t link;
+  uint16_t relay_port;
+  link.fd = open_relay(&relay_port);
+  link.server = server;
+  link.has_client = 0;
+  link.delay_ns = (uint64_t)rtt_ms * 1000000 / 2;
+  link.ns_per_byte = 8e3 / mbps;
+  link.queue_bytes = (uint64_t)(mbps * 1e6 / 8 * rtt_ms / 1e3);
+  link.drops = 0;
+  link.stop = 0;
+  /* The backlog the emulator has not read yet lives in the socket buffer; it
+   * should hold a whole queue and BDP so the kernel does not drop first. The
+   * kernel caps the request at net.core.rmem_max. */
+  int link_rcvbuf = (int)(4 * link.queue_bytes);
+  setsockopt(link.fd, SOL_SOCKET, SO_RCVBUF, &link_rcvbuf, sizeof(link_rcvbuf));
+  pthread_t link_thread;
+  pthread_create(&link_thread, NULL, run_link, &link);
+
+  char port_str[8];
+  snprintf(port_str, sizeof(port_str), "%u", relay_port);
+  foggy_socket_t* sender =
+      (foggy_socket_t*)foggy_socket(TCP_INITIATOR, port_str, "127.0.0.1");
+  pthread_t writer_thread;
+  pthread_create(&writer_thread, NULL, writer, sender);
+
+  printf("%.0f Mbps, %d ms RTT, %llu byte queue; 64 KB window cap %.2f Mbps\n",
+         mbps, rtt_ms, (unsigned long long)link.queue_bytes,
+         MAX_NETWORK_BUFFER * 8 / (rtt_ms * 1e3));
+  printf("%8s %12s %16s %12s %12s\n", "time (s)", "Mbps", "rcv window (B)",
+         "cwnd (B)", "socket drops");
+
+  uint8_t* buf = (uint8_t*)malloc(READ_SIZE);
+  uint64_t start = monotonic_ns();
+  uint64_t end = start + (uint64_t)seconds * 1000000000;
+  uint64_t report = start + REPORT_INTERVAL_NS;
+  uint64_t total = 0, interval = 0;
+  double last_mbps = 0;
+  int fds[] = {sender->socket, link.fd, receiver->socket};
+  auto all_socket_drops = [&]() {
+    uint64_t drops = 0;
+    for (int fd : fds) drops += socket_drops(fd);
+    return drops;
+  };
+
+  while (1) {
+    int n = foggy_read(receiver, buf, READ_SIZE);
+    uint64_t now = monotonic_ns();
+    interval += n;
+    total += n;
+    if (now < report) continue;
+
+    // The fields are read without locks: an approximate snapshot is enough.
+    last_mbps = interval * 8 / ((now - report + REPORT_INTERVAL_NS) / 1e3);
+    printf("%8.1f %12.2f %16u %12u %12llu\n", (now - start) / 1e9, last_mbps,
+           receiver->tuning.window, sender->window.congestion_window,
+           (unsigned long long)all_socket_drops());
+    interval = 0;
+    report = now + REPORT_INTERVAL_NS;
+    if (now >= end) break;
+  }
+  double elapsed = (monotonic_ns() - start) / 1e9;
+
+  printf("average %.2f Mbps, last interval %.2f Mbps (%.0f%% of the link), "
+         "%llu queue drops, %llu socket buffer drops\n",
+         total * 8 / elapsed / 1e6, last_mbps, last_mbps / mbps * 100,
+         (unsigned long long)link.drops,
+         (unsigned long long)all_socket_drops());
+
+  /* The transfer is cut off rather than closed: the sender would wait for
+   * its whole send buffer to be acknowledged. */
+  writing = 0;
+  link.stop = 1;
+  pthread_join(link_thread, NULL);
+  free(buf);
+  return 0;
+}
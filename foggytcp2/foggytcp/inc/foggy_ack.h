@@ -0,0 +1,70 @@
+/* Copyright (C) 2024 Hong Kong University of Science and Technology
+
+This repository is used for the Computer Networks (ELEC 3120)
+course taught at Hong Kong University of Science and Technology.
+
+No part of the project may be copied and/or distributed without
+the express permission of the course staff. Everyone is prohibited
+from releasing their forks in any public places. */
+
+/* This file defines the receiver's ACK policy. It is chosen per socket at
+ * runtime with the FOGGY_ACK_POLICY environment variable:
+ *
+ *   every    one ACK per data segment
+ *   delayed  (default) RFC 5681 delayed ACKs: at least every second
+ *            full-sized segment, or when the delayed ACK timer expires
+ *
+ * With the delayed policy, out-of-order and duplicate segments and segments
+ * that fill a gap are still acknowledged at once, so fast retransmit and SACK
+ * are not slowed down. Short segments and segments that use up the receive
+ * window are acknowledged at once too, since the sender may have nothing else
+ * to send until the ACK arrives. The first QUICK_ACK_SEGMENTS segments are also
+ * acknowledged at once, because the initial window is a single segment.
+ */
+
+#ifndef FOGGY_ACK_H_
+#define FOGGY_ACK_H_
+
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "foggy_packet.h"
+#include "grading.h"
+
+#define FOGGY_ACK_POLICY_ENV "FOGGY_ACK_POLICY"
+#define DELAYED_ACK_TIMEOUT_MS 40  // Linux's minimum, RFC 5681 allows 500.
+#define DELAYED_ACK_BYTES (2 * MSS)
+#define QUICK_ACK_SEGMENTS 16
+
+typedef enum {
+  ACK_POLICY_EVERY = 0,
+  ACK_POLICY_DELAYED = 1,
+} foggy_ack_policy_t;
+
+typedef struct {
+  foggy_ack_policy_t policy;
+  uint32_t pending_bytes;  // In-order bytes received since the last ACK.
+  uint32_t segments;       // Data segments received.
+  uint64_t deadline_ns;    // CLOCK_MONOTONIC, 0 when no ACK is delayed.
+  uint32_t window;         // Receive window in the last ACK sent.
+} ack_state_t;
+
+static inline foggy_ack_policy_t ack_policy_parse(const char* name) {
+  if (name != NULL && strcmp(name, "every") == 0) return ACK_POLICY_EVERY;
+  return ACK_POLICY_DELAYED;
+}
+
+static inline const char* ack_policy_name(foggy_ack_policy_t policy) {
+  return policy == ACK_POLICY_EVERY ? "every" : "delayed";
+}
+
+static inline void ack_state_init(ack_state_t* ack) {
+  ack->policy = ack_policy_parse(getenv(FOGGY_ACK_POLICY_ENV));
+  ack->pending_bytes = 0;
+  ack->segments = 0;
+  ack->deadline_ns = 0;
+  ack->window = MAX_NETWORK_BUFFER;
+}
+
+#endif  // FOGGY_ACK_H_
@@ -32,13 +32,22 @@ int has_been_acked(foggy_socket_t *sock, uint32_t seq);
 /**
  * Checks if the socket received any data.
  *
- * It first peeks at the header to figure out the length of the packet and
- * then reads the entire packet.
+ * Reads up to IO_BATCH_SIZE packets with one recvmmsg() call, handles them
+ * and sends the ACKs they trigger in one batch.
  *
  * @param sock The socket used for receiving data on the connection.
  * @param flags Flags that determine how the socket should wait for data.
  * Check `foggy_read_mode_t` for more information.
+ *
+ * @return The number of packets read, 0 if there were none.
+ */
+int check_for_pkt(foggy_socket_t *sock, foggy_read_mode_t flags);
+
+/**
+ * Wakes the backend thread if it is blocked waiting for packets or timers.
+ *
+ * @param sock The socket whose backend should be woken.
  */
-void check_for_pkt(foggy_socket_t *sock, foggy_read_mode_t flags);
+void wake_backend(foggy_socket_t *sock);
 
 #endif  // BACKEND_H_
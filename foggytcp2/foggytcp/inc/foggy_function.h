@@ -12,8 +12,8 @@ from releasing their forks in any public places. */
 /**
  * Updates the socket information to represent the newly received packet.
  *
- * In the current stop-and-wait implementation, this function also sends an
- * acknowledgement for the packet.
+ * Data segments are acknowledged according to the socket's ACK policy, either
+ * at once or later by check_delayed_ack().
  *
  * @param sock The socket used for handling packets received.
  * @param pkt The packet data received by the socket.
@@ -22,15 +22,24 @@ void on_recv_pkt(foggy_socket_t *sock, uint8_t *pkt);
 
 
 /**
- * Breaks up the data into packets and sends a single packet at a time.
+ * Splits new data in sending.buf into segments and sends as many segments as
+ * the window and the pacing mode allow.
  *
  * You should most certainly update this function in your implementation.
  *
  * @param sock The socket to use for sending data.
- * @param data The data to be sent.
- * @param buf_len The length of the data being sent.
+ * @param buf_len The number of bytes written to sending.buf since the last
+ * call, starting sending_queued bytes after the head of the sending queue.
  */
-void send_pkts(foggy_socket_t *sock, uint8_t *data, int buf_len);
+void send_pkts(foggy_socket_t *sock, int buf_len);
+
+/**
+ * Sends every datagram queued since the last flush with sendmmsg(), or
+ * through the simulator's hooks.
+ *
+ * @param sock The socket whose batch to flush.
+ */
+void flush_datagrams(foggy_socket_t *sock);
 
 /*<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<*/
 
@@ -42,4 +51,66 @@ void transmit_send_window(foggy_socket_t *sock);
 
 void receive_send_window(foggy_socket_t *sock);
 
-void handle_ack(foggy_socket_t *sock, uint32_t ack);
\ No newline at end of file
+/**
+ * Processes an ACK: updates the SACK scoreboard, the RTT estimate and the
+ * congestion window, and retransmits lost segments.
+ *
+ * @param sock The socket that received the ACK.
+ * @param ack The cumulative acknowledgement number.
+ * @param blocks The SACK blocks carried by the ACK.
+ * @param sack_count The number of SACK blocks, 0 if there are none.
+ */
+void handle_ack(foggy_socket_t *sock, uint32_t ack,
+                const sack_block_t *blocks, int sack_count);
+
+/**
+ * Returns the time left until the next send slot when pacing holds back a
+ * segment that fits in the window.
+ *
+ * @param sock The socket to check.
+ *
+ * @return Nanoseconds to wait, or -1 if pacing is off or not what the sender
+ *         is waiting for.
+ */
+int64_t pacing_timeout_ns(foggy_socket_t *sock);
+
+/**
+ * If the retransmission deadline has passed, backs off the timer, falls back
+ * to slow start and resends from the first unacknowledged segment.
+ *
+ * @param sock The socket to check.
+ */
+void check_retransmit_timer(foggy_socket_t *sock);
+
+/**
+ * Returns the time left until the retransmission deadline.
+ *
+ * @param sock The socket to check.
+ *
+ * @return Milliseconds to wait, suitable for poll(), or -1 if the timer is not
+ *         armed.
+ */
+int retransmit_timeout_ms(foggy_socket_t *sock);
+/**
+ * Sends the delayed ACK now, if there is one.
+ *
+ * @param sock The socket to flush.
+ */
+void flush_delayed_ack(foggy_socket_t *sock);
+
+/**
+ * Sends the delayed ACK if its timer has expired.
+ *
+ * @param sock The socket to check.
+ */
+void check_delayed_ack(foggy_socket_t *sock);
+
+/**
+ * Returns the time left until the delayed ACK is due.
+ *
+ * @param sock The socket to check.
+ *
+ * @return Milliseconds to wait, suitable for poll(), or -1 if no ACK is
+ *         delayed.
+ */
+int delayed_ack_timeout_ms(foggy_socket_t *sock);
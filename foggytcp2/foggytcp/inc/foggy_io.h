@@ -0,0 +1,78 @@
+/* Copyright (C) 2024 Hong Kong University of Science and Technology
+
+This repository is used for the Computer Networks (ELEC 3120)
+course taught at Hong Kong University of Science and Technology.
+
+No part of the project may be copied and/or distributed without
+the express permission of the course staff. Everyone is prohibited
+from releasing their forks in any public places. */
+
+/* This file defines the batches the backend uses for datagram I/O.
+ *
+ * Incoming datagrams are read with one recvmmsg() into IO_BATCH_SIZE pool
+ * buffers that the batch keeps for the lifetime of the socket. Outgoing
+ * datagrams are queued as a header copied into the batch plus up to two
+ * payload pieces that point into sending.buf, and leave with one sendmmsg()
+ * when the batch is flushed. Every path that queues a datagram flushes the
+ * batch before it returns, so nothing waits in it while the backend sleeps.
+ */
+
+#ifndef FOGGY_IO_H_
+#define FOGGY_IO_H_
+
+#include <netinet/in.h>
+#include <stdint.h>
+#include <string.h>
+#include <sys/socket.h>
+#include <sys/uio.h>
+
+#include "foggy_packet.h"
+#include "foggy_pool.h"
+#include "foggy_sack.h"
+#include "foggy_wscale.h"
+#include "grading.h"
+
+// Datagrams per recvmmsg() and sendmmsg() call.
+#define IO_BATCH_SIZE 64
+// Largest header the stack sends: an ACK with every option.
+#define IO_HEADER_MAX_LEN \
+  (sizeof(foggy_tcp_header_t) + WSCALE_OPTION_LEN + SACK_OPTION_MAX_LEN)
+
+typedef struct {
+  struct mmsghdr rx_msgs[IO_BATCH_SIZE];
+  struct iovec rx_iov[IO_BATCH_SIZE];
+  struct sockaddr_in rx_from[IO_BATCH_SIZE];
+  uint8_t* rx_bufs[IO_BATCH_SIZE];  // MAX_LEN pool buffers.
+
+  struct mmsghdr tx_msgs[IO_BATCH_SIZE];
+  struct iovec tx_iov[IO_BATCH_SIZE][3];  // Header and payload pieces.
+  uint8_t tx_headers[IO_BATCH_SIZE][IO_HEADER_MAX_LEN];
+  int tx_count;  // Datagrams queued since the last flush.
+} io_batch_t;
+
+/**
+ * Takes the receive buffers from the pool and points the receive messages at
+ * them.
+ */
+static inline void io_batch_init(io_batch_t* io, packet_pool_t* pool) {
+  memset(io->rx_msgs, 0, sizeof(io->rx_msgs));
+  for (int i = 0; i < IO_BATCH_SIZE; i++) {
+    io->rx_bufs[i] = pool_get(pool);
+    io->rx_iov[i].iov_base = io->rx_bufs[i];
+    io->rx_iov[i].iov_len = MAX_LEN;
+    io->rx_msgs[i].msg_hdr.msg_iov = &io->rx_iov[i];
+    io->rx_msgs[i].msg_hdr.msg_iovlen = 1;
+    io->rx_msgs[i].msg_hdr.msg_name = &io->rx_from[i];
+  }
+  memset(io->tx_msgs, 0, sizeof(io->tx_msgs));
+  io->tx_count = 0;
+}
+
+/**
+ * Returns the receive buffers to the pool.
+ */
+static inline void io_batch_destroy(io_batch_t* io, packet_pool_t* pool) {
+  for (int i = 0; i < IO_BATCH_SIZE; i++) pool_put(pool, io->rx_bufs[i]);
+}
+
+#endif  // FOGGY_IO_H_
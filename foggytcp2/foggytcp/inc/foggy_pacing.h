@@ -0,0 +1,99 @@
+/* Copyright (C) 2024 Hong Kong University of Science and Technology
+
+This repository is used for the Computer Networks (ELEC 3120)
+course taught at Hong Kong University of Science and Technology.
+
+No part of the project may be copied and/or distributed without
+the express permission of the course staff. Everyone is prohibited
+from releasing their forks in any public places. */
+
+/* This file defines the sender's pacing mode. It is chosen per socket at
+ * runtime with the FOGGY_PACING environment variable:
+ *
+ *   off     (default) the eligible window is sent back to back
+ *   on      segments are spread at gain * cwnd / SRTT, with Linux's gains:
+ *           2 in slow start, so the window can still double every round
+ *           trip, and 1.2 otherwise
+ *   <gain>  the same with one gain in every state, e.g. 1.25
+ *
+ * Each segment gets a send slot one interval after the previous one, and the
+ * backend sleeps until the next slot when the window has room. Segments due
+ * within PACING_SLACK_NS still leave together, because the backend cannot
+ * wake up much more precisely than that. There is no rate before the first
+ * RTT sample, so the handshake and the initial window are not paced.
+ */
+
+#ifndef FOGGY_PACING_H_
+#define FOGGY_PACING_H_
+
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+
+#define FOGGY_PACING_ENV "FOGGY_PACING"
+#define PACING_SLOW_START_GAIN 200  // Percent, as in Linux's tcp_pacing_ss_ratio.
+#define PACING_GAIN 120             // Percent, as in Linux's tcp_pacing_ca_ratio.
+#define PACING_SLACK_NS 200000
+
+typedef struct {
+  uint32_t slow_start_gain;  // Percent, 0 when pacing is off.
+  uint32_t gain;             // Percent, in the other states.
+  uint64_t next_send_ns;     // CLOCK_MONOTONIC time of the next send slot.
+} pacing_state_t;
+
+/**
+ * Reads a FOGGY_PACING value into `pacing`. Unknown values and gains that are
+ * not positive turn pacing off.
+ */
+static inline void pacing_parse(pacing_state_t* pacing, const char* value) {
+  pacing->slow_start_gain = 0;
+  pacing->gain = 0;
+  if (value == NULL || strcmp(value, "off") == 0) return;
+  if (strcmp(value, "on") == 0) {
+    pacing->slow_start_gain = PACING_SLOW_START_GAIN;
+    pacing->gain = PACING_GAIN;
+    return;
+  }
+  char* end;
+  double gain = strtod(value, &end);
+  if (end == value || *end != '\0' || !(gain > 0) || gain > 100) return;
+  pacing->slow_start_gain = pacing->gain = (uint32_t)(gain * 100 + 0.5);
+}
+
+static inline void pacing_init(pacing_state_t* pacing) {
+  pacing_parse(pacing, getenv(FOGGY_PACING_ENV));
+  pacing->next_send_ns = 0;
+}
+
+/**
+ * Returns the time one segment of `len` bytes takes at gain * cwnd / SRTT,
+ * or 0 if pacing is off or there is no RTT sample yet.
+ */
+static inline uint64_t pacing_interval_ns(const pacing_state_t* pacing,
+                                          uint32_t len, uint32_t cwnd,
+                                          uint32_t srtt_us, int slow_start) {
+  uint32_t gain = slow_start ? pacing->slow_start_gain : pacing->gain;
+  if (gain == 0 || srtt_us == 0 || cwnd == 0) return 0;
+  return (uint64_t)len * srtt_us * 1000 * 100 / ((uint64_t)gain * cwnd);
+}
+
+/**
+ * Tells if the next send slot is due at `now`.
+ */
+static inline int pacing_due(const pacing_state_t* pacing, uint64_t now) {
+  return pacing->next_send_ns <= now + PACING_SLACK_NS;
+}
+
+/**
+ * Moves the next send slot one interval on after a segment is sent at `now`.
+ * A slot missed by more than the slack is not made up for, so a sender that
+ * was idle or woke up late does not send a burst to catch up.
+ */
+static inline void pacing_sent(pacing_state_t* pacing, uint64_t now,
+                               uint64_t interval_ns) {
+  uint64_t earliest = now > PACING_SLACK_NS ? now - PACING_SLACK_NS : 0;
+  if (pacing->next_send_ns < earliest) pacing->next_send_ns = earliest;
+  pacing->next_send_ns += interval_ns;
+}
+
+#endif  // FOGGY_PACING_H_
@@ -0,0 +1,57 @@
+/* Copyright (C) 2024 Hong Kong University of Science and Technology
+
+This repository is used for the Computer Networks (ELEC 3120)
+course taught at Hong Kong University of Science and Technology.
+
+No part of the project may be copied and/or distributed without
+the express permission of the course staff. Everyone is prohibited
+from releasing their forks in any public places. */
+
+/* This file defines the per-socket packet pool. Every buffer is MAX_LEN bytes,
+ * enough for any packet the stack sends or accepts. Free buffers are kept in
+ * a singly linked list threaded through the buffers themselves, so taking and
+ * returning a buffer never calls malloc() or free(). The pool only grows when
+ * the list is empty, which the counters make visible.
+ *
+ * The pool is not thread-safe. Only the backend thread uses it.
+ */
+
+#ifndef FOGGY_POOL_H_
+#define FOGGY_POOL_H_
+
+#include <stdint.h>
+
+#define PACKET_POOL_INITIAL_SIZE 4
+
+typedef struct packet_buf_t {
+  struct packet_buf_t* next;  // Only valid while the buffer is free.
+} packet_buf_t;
+
+typedef struct {
+  packet_buf_t* free_list;
+  uint64_t gets;     // Buffers handed out.
+  uint64_t mallocs;  // Buffers allocated, including the initial ones.
+} packet_pool_t;
+
+/**
+ * Preallocates PACKET_POOL_INITIAL_SIZE buffers.
+ */
+void pool_init(packet_pool_t* pool);
+
+/**
+ * Frees every buffer in the pool. Buffers still in use are not tracked and
+ * must be returned first.
+ */
+void pool_destroy(packet_pool_t* pool);
+
+/**
+ * Takes a MAX_LEN buffer from the pool, allocating one if the pool is empty.
+ */
+uint8_t* pool_get(packet_pool_t* pool);
+
+/**
+ * Returns a buffer obtained from pool_get().
+ */
+void pool_put(packet_pool_t* pool, uint8_t* buf);
+
+#endif  // FOGGY_POOL_H_
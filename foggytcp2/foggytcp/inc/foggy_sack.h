@@ -0,0 +1,104 @@
+/* Copyright (C) 2024 Hong Kong University of Science and Technology
+
+This repository is used for the Computer Networks (ELEC 3120)
+course taught at Hong Kong University of Science and Technology.
+
+No part of the project may be copied and/or distributed without
+the express permission of the course staff. Everyone is prohibited
+from releasing their forks in any public places. */
+
+/* This file defines the selective acknowledgement (SACK) option carried in the
+ * header extension area of pure ACKs. The extension area is a list of
+ * options in the TCP kind/length style:
+ *
+ *   kind    1 byte   SACK_OPTION_KIND
+ *   length  1 byte   2 + 8 * blocks, including kind and length
+ *   blocks  8 bytes each: left and right edge, network byte order
+ *
+ * Each block [left, right) is a run of data the receiver holds above the
+ * cumulative ACK (RFC 2018). The first block contains the segment that
+ * triggered the ACK. Data segments carry no extension, so MSS is unchanged.
+ * utils/tcp.lua shows the blocks in Wireshark.
+ */
+
+#ifndef FOGGY_SACK_H_
+#define FOGGY_SACK_H_
+
+#include <arpa/inet.h>
+#include <stdint.h>
+#include <string.h>
+
+#define SACK_OPTION_END 0
+#define SACK_OPTION_NOP 1
+#define SACK_OPTION_KIND 5  // Same kind number as in TCP.
+#define SACK_MAX_BLOCKS 4
+#define SACK_OPTION_LEN(blocks) (2 + 8 * (blocks))
+#define SACK_OPTION_MAX_LEN SACK_OPTION_LEN(SACK_MAX_BLOCKS)
+
+typedef struct {
+  uint32_t left;   // First byte held.
+  uint32_t right;  // One past the last byte held.
+} sack_block_t;
+
+/**
+ * Writes a SACK option to an extension area.
+ *
+ * @param ext The extension area, at least SACK_OPTION_MAX_LEN bytes.
+ * @param blocks The blocks to report.
+ * @param count The number of blocks, at most SACK_MAX_BLOCKS.
+ *
+ * @return The length of the extension, 0 if there is nothing to report.
+ */
+static inline uint16_t sack_encode(uint8_t* ext, const sack_block_t* blocks,
+                                   int count) {
+  if (count <= 0) return 0;
+  ext[0] = SACK_OPTION_KIND;
+  ext[1] = SACK_OPTION_LEN(count);
+  for (int i = 0; i < count; i++) {
+    uint32_t edges[2] = {htonl(blocks[i].left), htonl(blocks[i].right)};
+    memcpy(ext + 2 + 8 * i, edges, sizeof(edges));
+  }
+  return SACK_OPTION_LEN(count);
+}
+
+/**
+ * Finds the SACK option in an extension area. Unknown options are skipped.
+ *
+ * @param ext The extension area.
+ * @param ext_len The length of the extension area.
+ * @param blocks Receives up to SACK_MAX_BLOCKS blocks.
+ *
+ * @return The number of blocks, 0 if there is no valid SACK option.
+ */
+static inline int sack_decode(const uint8_t* ext, uint16_t ext_len,
+                              sack_block_t* blocks) {
+  uint16_t pos = 0;
+
+  while (pos < ext_len) {
+    uint8_t kind = ext[pos];
+    if (kind == SACK_OPTION_END) break;
+    if (kind == SACK_OPTION_NOP) {
+      pos++;
+      continue;
+    }
+    if (pos + 2 > ext_len) break;
+    uint8_t len = ext[pos + 1];
+    if (len < 2 || pos + len > ext_len) break;
+
+    if (kind == SACK_OPTION_KIND) {
+      int count = (len - 2) / 8;
+      if (count > SACK_MAX_BLOCKS) count = SACK_MAX_BLOCKS;
+      for (int i = 0; i < count; i++) {
+        uint32_t edges[2];
+        memcpy(edges, ext + pos + 2 + 8 * i, sizeof(edges));
+        blocks[i].left = ntohl(edges[0]);
+        blocks[i].right = ntohl(edges[1]);
+      }
+      return count;
+    }
+    pos += len;
+  }
+  return 0;
+}
+
+#endif  // FOGGY_SACK_H_
@@ -0,0 +1,110 @@
+/* Copyright (C) 2024 Hong Kong University of Science and Technology
+
+This repository is used for the Computer Networks (ELEC 3120)
+course taught at Hong Kong University of Science and Technology.
+
+No part of the project may be copied and/or distributed without
+the express permission of the course staff. Everyone is prohibited
+from releasing their forks in any public places. */
+
+/* This file defines the simulator interface. The window and congestion
+ * control code only reads the clock and sends datagrams through a socket's
+ * hooks when sock->sim is set, so the same code can run under a virtual clock
+ * with no UDP socket and no backend thread.
+ *
+ * `make sim` builds build/libfoggy_sim.so with the functions below, for
+ * scripts/simulator.py. The caller plays the backend thread and the network:
+ * it sets the clock, hands the socket the datagrams that arrive, steps it
+ * like one backend iteration and collects the datagrams it sends. Nothing
+ * depends on wall-clock time, so a run is reproducible.
+ */
+
+#ifndef FOGGY_SIM_H_
+#define FOGGY_SIM_H_
+
+#include <stdint.h>
+#include <sys/uio.h>
+
+typedef struct {
+  uint64_t (*now_ns)(void* ctx);  // Replaces CLOCK_MONOTONIC.
+  // Sends one datagram, made of `iovcnt` pieces. Replaces sendmmsg().
+  void (*send)(void* ctx, const struct iovec* iov, int iovcnt);
+  void* ctx;
+} foggy_sim_hooks_t;
+
+// Returned by foggy_sim_next_event_ns() when no timer is armed.
+#define FOGGY_SIM_NO_EVENT UINT64_MAX
+
+typedef struct foggy_sim foggy_sim_t;
+
+extern "C" {
+
+/**
+ * Creates a simulated socket at time 0.
+ *
+ * @param type 0 for the sender (TCP_INITIATOR), 1 for the receiver.
+ * @param ack_policy A FOGGY_ACK_POLICY value, or NULL for the environment.
+ * @param pacing A FOGGY_PACING value, or NULL for the environment.
+ *
+ * @return The socket, or NULL on error.
+ */
+foggy_sim_t* foggy_sim_open(int type, const char* ack_policy,
+                            const char* pacing);
+
+void foggy_sim_close(foggy_sim_t* sim);
+
+/**
+ * Moves the virtual clock to `now_ns`, which must not go backwards.
+ */
+void foggy_sim_set_time(foggy_sim_t* sim, uint64_t now_ns);
+
+/**
+ * Queues up to `len` bytes from the application, like foggy_write() without
+ * blocking.
+ *
+ * @return The number of bytes queued, limited by the free space.
+ */
+uint32_t foggy_sim_write(foggy_sim_t* sim, uint32_t len);
+
+/**
+ * Handles a datagram that arrived at the socket, as check_for_pkt() does.
+ *
+ * @return 0 if it was handled, -1 if it was malformed and dropped.
+ */
+int foggy_sim_deliver(foggy_sim_t* sim, const uint8_t* pkt, uint32_t len);
+
+/**
+ * Runs one backend iteration: sends what the window and pacing allow and
+ * fires the timers that are due. The application then reads everything
+ * received in order.
+ */
+void foggy_sim_step(foggy_sim_t* sim);
+
+/**
+ * Returns the time of the earliest armed timer: the retransmission timer,
+ * the delayed ACK or the next pacing slot.
+ */
+uint64_t foggy_sim_next_event_ns(foggy_sim_t* sim);
+
+/**
+ * Takes the oldest datagram the socket sent.
+ *
+ * @return Its length, or 0 if none is left. A datagram longer than `cap` is
+ *         truncated.
+ */
+uint32_t foggy_sim_poll_datagram(foggy_sim_t* sim, uint8_t* buf, uint32_t cap);
+
+// Bytes the application has read.
+uint64_t foggy_sim_delivered(foggy_sim_t* sim);
+// Bytes the peer has acknowledged.
+uint64_t foggy_sim_acked(foggy_sim_t* sim);
+
+/**
+ * Writes the statistics as the JSON object that FOGGY_STATS receives.
+ *
+ * @return The length of the JSON text, or -1 if it does not fit in `cap`.
+ */
+int foggy_sim_stats(foggy_sim_t* sim, char* buf, uint32_t cap);
+}
+
+#endif  // FOGGY_SIM_H_
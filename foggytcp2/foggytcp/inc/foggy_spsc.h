@@ -0,0 +1,145 @@
+/* Copyright (C) 2024 Hong Kong University of Science and Technology
+
+This repository is used for the Computer Networks (ELEC 3120)
+course taught at Hong Kong University of Science and Technology.
+
+No part of the project may be copied and/or distributed without
+the express permission of the course staff. Everyone is prohibited
+from releasing their forks in any public places. */
+
+/* This file defines the lock-free byte queues between the application and
+ * the backend thread. Each queue has exactly one producer and one consumer:
+ *
+ *   sending   foggy_write() produces, the backend consumes once the bytes
+ *             are acknowledged
+ *   received  the backend produces in-order data, foggy_read() consumes
+ *
+ * head and tail count the bytes consumed and produced since the socket was
+ * created, and are taken modulo the power-of-two size in use. Each is written
+ * by one side only, so neither side needs a lock to use the queue. The size
+ * can grow up to the allocated capacity while the queue is empty, so a queue
+ * allocated for the worst case does not cycle through cold memory.
+ *
+ * A side that has to block (a reader with nothing to read, a writer with no
+ * space) sets a waiting flag and sleeps on a condition variable. Head and
+ * tail are published with sequentially consistent stores, and the other side
+ * checks the flag after publishing, so it either sees the flag or the sleeper
+ * sees the new head or tail. The mutex and the condition variable are only
+ * used at that boundary.
+ */
+
+#ifndef FOGGY_SPSC_H_
+#define FOGGY_SPSC_H_
+
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include <atomic>
+
+typedef struct {
+  uint8_t* buf;
+  uint32_t cap;                // Bytes allocated, a power of two.
+  std::atomic<uint32_t> size;  // Bytes in use, a power of two up to cap.
+  std::atomic<uint32_t> head;  // Bytes consumed, written by the consumer.
+  std::atomic<uint32_t> tail;  // Bytes produced, written by the producer.
+} spsc_ring_t;
+
+static inline void spsc_init(spsc_ring_t* ring, uint32_t cap) {
+  ring->buf = (uint8_t*)malloc(cap);
+  ring->cap = cap;
+  ring->size.store(cap, std::memory_order_relaxed);
+  ring->head.store(0, std::memory_order_relaxed);
+  ring->tail.store(0, std::memory_order_relaxed);
+}
+
+static inline void spsc_destroy(spsc_ring_t* ring) {
+  free(ring->buf);
+  ring->buf = NULL;
+}
+
+/**
+ * Returns the number of bytes produced and not consumed yet. Either side may
+ * call it; the other side can only make the result stale in its own favour.
+ * The loads are sequentially consistent so that a look after setting a
+ * waiting flag cannot be ordered before it.
+ */
+static inline uint32_t spsc_used(const spsc_ring_t* ring) {
+  return ring->tail.load(std::memory_order_seq_cst) -
+         ring->head.load(std::memory_order_seq_cst);
+}
+
+static inline uint32_t spsc_space(const spsc_ring_t* ring) {
+  return ring->size.load(std::memory_order_relaxed) - spsc_used(ring);
+}
+
+/**
+ * Changes the size in use to `size`, a power of two up to cap, if the queue is
+ * empty. Only the producer calls it. The consumer only looks at the size
+ * after it sees a tail published after the change, so it reads each byte
+ * where the producer put it.
+ *
+ * @return 1 if the size was changed, 0 if the queue was not empty.
+ */
+static inline int spsc_resize(spsc_ring_t* ring, uint32_t size) {
+  if (spsc_used(ring) != 0) return 0;
+  ring->size.store(size, std::memory_order_relaxed);
+  return 1;
+}
+
+/**
+ * Returns the address of the byte `offset` bytes after head, for the
+ * consumer. The bytes up to the end of the buffer are contiguous; the rest
+ * wrap around to buf.
+ */
+static inline uint8_t* spsc_at(const spsc_ring_t* ring, uint32_t offset) {
+  uint32_t head = ring->head.load(std::memory_order_relaxed);
+  uint32_t size = ring->size.load(std::memory_order_relaxed);
+  return ring->buf + ((head + offset) & (size - 1));
+}
+
+/**
+ * Appends `len` bytes. Only the producer calls it, and only with len at most
+ * spsc_space().
+ */
+static inline void spsc_push(spsc_ring_t* ring, const uint8_t* data,
+                             uint32_t len) {
+  uint32_t tail = ring->tail.load(std::memory_order_relaxed);
+  uint32_t size = ring->size.load(std::memory_order_relaxed);
+  uint32_t pos = tail & (size - 1);
+  uint32_t first = size - pos < len ? size - pos : len;
+  memcpy(ring->buf + pos, data, first);
+  memcpy(ring->buf, data + first, len - first);
+  ring->tail.store(tail + len, std::memory_order_seq_cst);
+}
+
+/**
+ * Hands `len` bytes at the head back to the producer. Only the consumer calls
+ * it.
+ */
+static inline void spsc_release(spsc_ring_t* ring, uint32_t len) {
+  uint32_t head = ring->head.load(std::memory_order_relaxed);
+  ring->head.store(head + len, std::memory_order_seq_cst);
+}
+
+/**
+ * Copies up to `len` bytes from the head into `out` and releases them. Only
+ * the consumer calls it.
+ *
+ * @return The number of bytes copied.
+ */
+static inline uint32_t spsc_pop(spsc_ring_t* ring, uint8_t* out,
+                                uint32_t len) {
+  uint32_t used = spsc_used(ring);
+  if (len > used) len = used;
+
+  uint32_t size = ring->size.load(std::memory_order_relaxed);
+  uint32_t pos = ring->head.load(std::memory_order_relaxed) & (size - 1);
+  uint32_t first = size - pos < len ? size - pos : len;
+  memcpy(out, ring->buf + pos, first);
+  memcpy(out + first, ring->buf, len - first);
+  spsc_release(ring, len);
+  return len;
+}
+
+#endif  // FOGGY_SPSC_H_
@@ -0,0 +1,146 @@
+/* Copyright (C) 2024 Hong Kong University of Science and Technology
+
+This repository is used for the Computer Networks (ELEC 3120)
+course taught at Hong Kong University of Science and Technology.
+
+No part of the project may be copied and/or distributed without
+the express permission of the course staff. Everyone is prohibited
+from releasing their forks in any public places. */
+
+/* This file defines per-connection loss recovery, ACK, burst and syscall
+ * statistics. The counters are always kept; when the environment variable
+ * FOGGY_STATS names a file, foggy_close() writes them there as one JSON object. The experiment drivers
+ * read the file (scripts/tcp_stats.py) and add the values to the results CSV.
+ */
+
+#ifndef FOGGY_STATS_H_
+#define FOGGY_STATS_H_
+
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+
+#define FOGGY_STATS_ENV "FOGGY_STATS"
+
+typedef struct {
+  uint64_t rtt_samples;  // Samples taken under Karn's rule.
+  uint64_t rtt_sum_us;
+  uint32_t rtt_min_us;
+  uint32_t rtt_max_us;
+  uint64_t rto_events;  // Retransmission timer expirations.
+  uint32_t max_backoff;  // Most consecutive expirations without a new ACK.
+  uint64_t fast_retransmits;
+  uint64_t sack_retransmits;  // Holes resent during SACK recovery.
+  uint64_t segments_sent;  // Data segments, including retransmissions.
+  uint64_t acks_sent;      // Pure ACKs sent by the receiver.
+  uint64_t acks_received;  // Pure ACKs received by the sender.
+  uint64_t send_syscalls;  // sendmmsg() calls.
+  uint64_t recv_syscalls;  // recvmmsg() calls, including empty ones.
+  /* The segments one transmit_send_window() call sends leave in one batch
+   * and form a burst; the gap is the time from one burst to the next. */
+  uint64_t bursts;
+  uint64_t burst_segments;
+  uint32_t burst_max;
+  uint64_t burst_gap_sum_ns;
+  uint64_t last_burst_ns;  // 0 before the first burst.
+} foggy_stats_t;
+
+static inline void stats_init(foggy_stats_t* stats) {
+  stats->rtt_samples = 0;
+  stats->rtt_sum_us = 0;
+  stats->rtt_min_us = UINT32_MAX;
+  stats->rtt_max_us = 0;
+  stats->rto_events = 0;
+  stats->max_backoff = 0;
+  stats->fast_retransmits = 0;
+  stats->sack_retransmits = 0;
+  stats->segments_sent = 0;
+  stats->acks_sent = 0;
+  stats->acks_received = 0;
+  stats->send_syscalls = 0;
+  stats->recv_syscalls = 0;
+  stats->bursts = 0;
+  stats->burst_segments = 0;
+  stats->burst_max = 0;
+  stats->burst_gap_sum_ns = 0;
+  stats->last_burst_ns = 0;
+}
+
+static inline void stats_rtt_sample(foggy_stats_t* stats, uint32_t rtt_us) {
+  stats->rtt_samples++;
+  stats->rtt_sum_us += rtt_us;
+  if (rtt_us < stats->rtt_min_us) stats->rtt_min_us = rtt_us;
+  if (rtt_us > stats->rtt_max_us) stats->rtt_max_us = rtt_us;
+}
+
+static inline void stats_burst(foggy_stats_t* stats, uint32_t segments,
+                               uint64_t now_ns) {
+  stats->bursts++;
+  stats->burst_segments += segments;
+  if (segments > stats->burst_max) stats->burst_max = segments;
+  if (stats->last_burst_ns != 0) {
+    stats->burst_gap_sum_ns += now_ns - stats->last_burst_ns;
+  }
+  stats->last_burst_ns = now_ns;
+}
+
+/**
+ * Writes the statistics and the final RTT estimator state to `f` as one JSON
+ * object. `transferred` is the number of bytes the connection sent or
+ * received, for the datagram syscalls per MB.
+ */
+static inline void stats_write(FILE* f, const foggy_stats_t* stats,
+                               uint32_t srtt_us, uint32_t rttvar_us,
+                               uint32_t rto_us, uint64_t transferred) {
+  uint64_t samples = stats->rtt_samples;
+  uint64_t syscalls = stats->send_syscalls + stats->recv_syscalls;
+  uint64_t bursts = stats->bursts;
+  fprintf(f,
+          "{\"rtt_samples\": %llu, \"rtt_min_us\": %u, \"rtt_mean_us\": %llu, "
+          "\"rtt_max_us\": %u, \"srtt_us\": %u, \"rttvar_us\": %u, "
+          "\"rto_us\": %u, \"rto_events\": %llu, \"max_backoff\": %u, "
+          "\"fast_retransmits\": %llu, \"sack_retransmits\": %llu, "
+          "\"segments_sent\": %llu, \"acks_sent\": %llu, "
+          "\"acks_received\": %llu, \"send_syscalls\": %llu, "
+          "\"recv_syscalls\": %llu, \"bytes_transferred\": %llu, "
+          "\"syscalls_per_mb\": %.1f, \"bursts\": %llu, "
+          "\"burst_mean\": %.2f, \"burst_max\": %u, \"gap_mean_us\": %.1f}\n",
+          (unsigned long long)samples, samples ? stats->rtt_min_us : 0,
+          (unsigned long long)(samples ? stats->rtt_sum_us / samples : 0),
+          stats->rtt_max_us, srtt_us, rttvar_us, rto_us,
+          (unsigned long long)stats->rto_events, stats->max_backoff,
+          (unsigned long long)stats->fast_retransmits,
+          (unsigned long long)stats->sack_retransmits,
+          (unsigned long long)stats->segments_sent,
+          (unsigned long long)stats->acks_sent,
+          (unsigned long long)stats->acks_received,
+          (unsigned long long)stats->send_syscalls,
+          (unsigned long long)stats->recv_syscalls,
+          (unsigned long long)transferred,
+          transferred ? syscalls / (transferred / 1e6) : 0.0,
+          (unsigned long long)bursts,
+          bursts ? (double)stats->burst_segments / bursts : 0.0,
+          stats->burst_max,
+          bursts > 1 ? stats->burst_gap_sum_ns / 1e3 / (bursts - 1) : 0.0);
+}
+
+/**
+ * Writes the statistics to $FOGGY_STATS with stats_write(). Does nothing if
+ * the variable is not set.
+ */
+static inline void stats_write_from_env(const foggy_stats_t* stats,
+                                        uint32_t srtt_us, uint32_t rttvar_us,
+                                        uint32_t rto_us, uint64_t transferred) {
+  const char* path = getenv(FOGGY_STATS_ENV);
+  if (path == NULL || path[0] == '\0') return;
+
+  FILE* f = fopen(path, "w");
+  if (f == NULL) {
+    perror("ERROR opening stats file");
+    return;
+  }
+  stats_write(f, stats, srtt_us, rttvar_us, rto_us, transferred);
+  fclose(f);
+}
+
+#endif  // FOGGY_STATS_H_
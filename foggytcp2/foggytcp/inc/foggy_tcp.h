@@ -19,9 +19,20 @@ from releasing their forks in any public places. */
 #include <sys/socket.h>
 #include <sys/types.h>
 #include <time.h>
+#include <atomic>
 #include <deque>
 
+#include "foggy_ack.h"
+#include "foggy_io.h"
+#include "foggy_pacing.h"
 #include "foggy_packet.h"
+#include "foggy_pool.h"
+#include "foggy_sack.h"
+#include "foggy_sim.h"
+#include "foggy_spsc.h"
+#include "foggy_stats.h"
+#include "foggy_trace.h"
+#include "foggy_wscale.h"
 #include "grading.h"
 
 using namespace std;
@@ -31,7 +42,28 @@ using namespace std;
 #define EXIT_FAILURE 1
 
 /* <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< */
-#define RECEIVE_WINDOW_SLOT_SIZE 64
+// Advertised windows are in units of 2^WINDOW_SCALE_SHIFT bytes (RFC 7323).
+#define WINDOW_SCALE_SHIFT 7
+// The receive window starts at MAX_NETWORK_BUFFER and is autotuned up to
+// this, about 8 MB.
+#define RECEIVE_WINDOW_MAX ((uint32_t)MAX_NETWORK_BUFFER << WINDOW_SCALE_SHIFT)
+// Capacity of the received queue, must be a power of two. It holds the
+// largest autotuned window, so the window is never larger than the space.
+#define RECEIVE_BUFFER_SIZE (1 << 23)
+// Part of the received queue in use at first, must be a power of two. It holds
+// the initial receive window and grows with the autotuned window.
+#define RECEIVE_BUFFER_INITIAL_SIZE (1 << 17)
+// Capacity of the sending queue, must be a power of two. foggy_write() blocks
+// while it is full, so it bounds the memory used for unacknowledged data.
+#define SEND_BUFFER_SIZE (1 << 20)
+// A blocked foggy_write() resumes once this much space is free, so it is not
+// woken up for every ACK.
+#define SEND_BUFFER_WAKE_SPACE (SEND_BUFFER_SIZE / 4)
+// Retransmission timeout bounds (RFC 6298). The minimum follows Linux rather
+// than the RFC's 1 s, which is long compared to the RTTs in the experiments.
+#define RTO_MIN_US 200000
+#define RTO_MAX_US 60000000
+#define RTO_CLOCK_GRANULARITY_US 1000
 
 typedef enum {
   RENO_SLOW_START = 0,
@@ -41,18 +73,36 @@ typedef enum {
 
 typedef struct {
   int is_sent;
-  uint8_t* msg;
+  uint32_t seq;
+  uint32_t offset;  // Start of the payload in sending.buf.
+  uint16_t len;
 
   int is_rtt_sample;
-  struct timespec send_time;
+  uint64_t send_time_ns;
   time_t timeout_interval;
+
+  int is_sacked;         // Reported by a SACK block, not in bytes_in_flight.
+  int is_retransmitted;  // Already resent in the current recovery episode.
 } send_window_slot_t;
 
 typedef struct {
-  uint8_t* msg;
-  int is_used;
+  uint8_t* payload;  // A buffer from the socket's packet pool.
+  uint32_t seq;
+  uint16_t len;
 } receive_window_slot_t;
 
+/* Receive window autotuning, after Linux's dynamic right-sizing: the window
+ * grows to twice the data delivered in one round trip, as measured by the
+ * receiver. */
+typedef struct {
+  uint32_t window;       // Receive window limit, up to RECEIVE_WINDOW_MAX.
+  uint32_t rtt_us;       // 0 until the first sample.
+  uint32_t rtt_seq;      // The RTT sample ends once this is received.
+  uint64_t rtt_start_ns;  // 0 when no sample is running.
+  uint32_t epoch_seq;    // next_seq_expected when the epoch started.
+  uint64_t epoch_start_ns;
+} receive_tuning_t;
+
 /* >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>> */
 
 typedef enum {
@@ -70,9 +120,18 @@ typedef struct {
   uint32_t ssthresh;
   uint32_t advertised_window;
   uint32_t congestion_window;
+  uint32_t bytes_in_flight;  // Sent but not acknowledged yet.
+  uint64_t rto_deadline_ns;  // CLOCK_MONOTONIC, 0 when nothing is in flight.
+  uint32_t srtt_us;          // 0 until the first RTT sample.
+  uint32_t rttvar_us;
+  uint32_t rto_us;           // Current timeout, including backoff.
+  uint32_t rto_backoff;      // Expirations since the last new ACK.
+  int peer_sack;             // The peer has sent SACK blocks.
+  uint32_t high_sacked;      // Right edge of the highest SACK block.
+  uint32_t recovery_point;   // Fast recovery ends once this is acked.
+  uint32_t bytes_acked;      // Congestion avoidance credit (RFC 3465).
 
   reno_state_t reno_state;
-  pthread_mutex_t ack_lock;
 } window_t;
 
 /**
@@ -85,21 +144,38 @@ struct foggy_socket_t {
   pthread_t thread_id;
   uint16_t my_port;
   struct sockaddr_in conn;
-  uint8_t* received_buf;
-  int received_len;
-  pthread_mutex_t recv_lock;
+  /* The backend thread owns everything below except the two queues and the
+   * flags, which are shared with the application (see foggy_spsc.h). */
+  spsc_ring_t received;  // In-order data waiting for foggy_read().
+  std::atomic<int> reader_waiting;  // foggy_read() sleeps on wait_cond.
+  pthread_mutex_t recv_lock;  // Only taken to sleep on or signal wait_cond.
   pthread_cond_t wait_cond;
-  uint8_t* sending_buf;
-  int sending_len;
+  spsc_ring_t sending;  // Written by foggy_write(), released once acked.
+  uint32_t sending_queued;  // Bytes from the head split into send_window.
+  std::atomic<int> writer_waiting;  // foggy_write() sleeps on send_cond.
+  pthread_cond_t send_cond;
   foggy_socket_type_t type;
-  pthread_mutex_t send_lock;
-  int dying;
-  pthread_mutex_t death_lock;
+  pthread_mutex_t send_lock;  // Only taken to sleep on or signal send_cond.
+  std::atomic<int> dying;
+  std::atomic<int> backend_waiting;  // The backend sleeps with window room.
+  int wake_fd;  // eventfd that wakes a sleeping backend on write and close.
+  // Clock and datagram I/O of the simulator, NULL for a real socket.
+  const foggy_sim_hooks_t* sim;
   window_t window;
 
   /* <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< */
   deque<send_window_slot_t> send_window;
-  receive_window_slot_t receive_window[RECEIVE_WINDOW_SLOT_SIZE];
+  size_t next_unsent;  // Index of the first slot in send_window not sent yet.
+  // Out-of-order segments sorted by sequence number, within tuning.window.
+  deque<receive_window_slot_t> receive_window;
+  receive_tuning_t tuning;
+  foggy_trace_t* trace;  // NULL unless $FOGGY_TRACE is set.
+  // Receive batch buffers and out-of-order payloads, backend thread only.
+  packet_pool_t pool;
+  io_batch_t io;  // Datagrams read and queued for sending, backend only.
+  foggy_stats_t stats;
+  ack_state_t ack;       // Receiver ACK policy and the delayed ACK, if any.
+  pacing_state_t pacing;  // Sender pacing mode and the next send slot.
   /* >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>> */
 };
 
@@ -174,4 +250,24 @@ int foggy_write(void* sock, const void* buf, int length);
  * You can declare more functions after this point if you need to.
  */
 
+/**
+ * Initializes the state of a socket: the queues, the window and the
+ * per-socket options. The UDP socket, the trace and the backend thread are
+ * left to foggy_socket(), so the simulator (foggy_sim.h) can share the rest.
+ *
+ * @param sock The socket to initialize.
+ * @param socket_type Indicates the type of socket: Listener or Initiator.
+ *
+ * @return 0 on success, -1 on error.
+ */
+int foggy_socket_init(foggy_socket_t* sock, foggy_socket_type_t socket_type);
+
+/**
+ * Frees what foggy_socket_init() allocated and closes the trace, once the
+ * backend is no longer running.
+ *
+ * @param sock The socket to release.
+ */
+void foggy_socket_release(foggy_socket_t* sock);
+
 #endif  // FOGGY_TCP_H_
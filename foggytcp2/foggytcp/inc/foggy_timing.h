@@ -0,0 +1,137 @@
+/* Copyright (C) 2024 Hong Kong University of Science and Technology
+
+This repository is used for the Computer Networks (ELEC 3120)
+course taught at Hong Kong University of Science and Technology.
+
+No part of the project may be copied and/or distributed without
+the express permission of the course staff. Everyone is prohibited
+from releasing their forks in any public places. */
+
+/* This file defines the timing side channel used by the client and server
+ * applications. When started with `--timing <file>`, each application writes
+ * one JSON object with CLOCK_MONOTONIC timestamps (in nanoseconds) of the
+ * connection setup, the first and last byte of the transfer and the close.
+ *
+ * CLOCK_MONOTONIC is shared by all network namespaces on the same host, so
+ * the experiment drivers can subtract the client's first byte from the
+ * server's last byte even when the two run in different namespaces.
+ *
+ * timing_write() only uses async-signal-safe calls, so the server can also
+ * call it from a SIGTERM handler.
+ */
+
+#ifndef FOGGY_TIMING_H_
+#define FOGGY_TIMING_H_
+
+#include <fcntl.h>
+#include <stdint.h>
+#include <time.h>
+#include <unistd.h>
+
+typedef struct {
+  const char* role;
+  int fd;  // -1 when timing is disabled.
+
+  volatile uint64_t handshake_start_ns;
+  volatile uint64_t handshake_end_ns;
+  volatile uint64_t first_byte_ns;
+  volatile uint64_t last_byte_ns;
+  volatile uint64_t close_start_ns;
+  volatile uint64_t close_end_ns;
+  volatile uint64_t bytes;
+} foggy_timing_t;
+
+static inline uint64_t monotonic_ns() {
+  struct timespec ts;
+  clock_gettime(CLOCK_MONOTONIC, &ts);
+  return (uint64_t)ts.tv_sec * 1000000000ull + (uint64_t)ts.tv_nsec;
+}
+
+/**
+ * Initializes the timing record and opens the output file.
+ *
+ * @param timing The timing record.
+ * @param role "client" or "server".
+ * @param path The output file, or NULL to disable timing.
+ *
+ * @return 0 on success, -1 if the file cannot be opened.
+ */
+static inline int timing_open(foggy_timing_t* timing, const char* role,
+                              const char* path) {
+  timing->role = role;
+  timing->handshake_start_ns = 0;
+  timing->handshake_end_ns = 0;
+  timing->first_byte_ns = 0;
+  timing->last_byte_ns = 0;
+  timing->close_start_ns = 0;
+  timing->close_end_ns = 0;
+  timing->bytes = 0;
+  timing->fd = -1;
+  if (path == NULL) return 0;
+  timing->fd = open(path, O_WRONLY | O_CREAT | O_TRUNC, 0644);
+  return timing->fd < 0 ? -1 : 0;
+}
+
+/**
+ * Records that `len` bytes were written or read by the application.
+ */
+static inline void timing_data(foggy_timing_t* timing, int len) {
+  uint64_t now = monotonic_ns();
+  if (timing->first_byte_ns == 0) timing->first_byte_ns = now;
+  timing->last_byte_ns = now;
+  timing->bytes += len;
+}
+
+static inline char* timing_append_str(char* out, const char* s) {
+  while (*s) *out++ = *s++;
+  return out;
+}
+
+static inline char* timing_append_u64(char* out, uint64_t v) {
+  char digits[20];
+  int n = 0;
+  do {
+    digits[n++] = '0' + v % 10;
+    v /= 10;
+  } while (v != 0);
+  while (n > 0) *out++ = digits[--n];
+  return out;
+}
+
+static inline char* timing_append_field(char* out, const char* name,
+                                        uint64_t v) {
+  out = timing_append_str(out, ", \"");
+  out = timing_append_str(out, name);
+  out = timing_append_str(out, "\": ");
+  return timing_append_u64(out, v);
+}
+
+/**
+ * Writes the timing record as a single JSON line, replacing any earlier
+ * record in the file. A timestamp of 0 means the event did not happen.
+ */
+static inline void timing_write(foggy_timing_t* timing) {
+  char buf[512];
+  char* out = buf;
+  if (timing->fd < 0) return;
+
+  out = timing_append_str(out, "{\"role\": \"");
+  out = timing_append_str(out, timing->role);
+  out = timing_append_str(out, "\", \"clock\": \"CLOCK_MONOTONIC\"");
+  out = timing_append_field(out, "handshake_start_ns",
+                            timing->handshake_start_ns);
+  out = timing_append_field(out, "handshake_end_ns", timing->handshake_end_ns);
+  out = timing_append_field(out, "first_byte_ns", timing->first_byte_ns);
+  out = timing_append_field(out, "last_byte_ns", timing->last_byte_ns);
+  out = timing_append_field(out, "close_start_ns", timing->close_start_ns);
+  out = timing_append_field(out, "close_end_ns", timing->close_end_ns);
+  out = timing_append_field(out, "bytes", timing->bytes);
+  out = timing_append_str(out, "}\n");
+
+  ssize_t len = out - buf;
+  if (pwrite(timing->fd, buf, len, 0) == len && ftruncate(timing->fd, len)) {
+    // Nothing else can be done safely inside a signal handler.
+  }
+}
+
+#endif  // FOGGY_TIMING_H_
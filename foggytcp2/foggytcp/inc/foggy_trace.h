@@ -0,0 +1,92 @@
+/* Copyright (C) 2024 Hong Kong University of Science and Technology
+
+This repository is used for the Computer Networks (ELEC 3120)
+course taught at Hong Kong University of Science and Technology.
+
+No part of the project may be copied and/or distributed without
+the express permission of the course staff. Everyone is prohibited
+from releasing their forks in any public places. */
+
+/* This file defines the opt-in congestion window trace. When the environment
+ * variable FOGGY_TRACE names a file, every ACK handled by the sender and every
+ * retransmission timeout appends a fixed-size binary record to a lock-free single-producer/single-consumer ring
+ * buffer. A flusher thread drains the ring to the file, so the backend thread
+ * never blocks on I/O. When the ring is full the record is dropped and counted
+ * instead.
+ *
+ * File layout (little endian):
+ *   foggy_trace_file_header_t  16 bytes
+ *   foggy_trace_record_t       32 bytes, repeated
+ *
+ * scripts/cwnd_trace.py reads the file with np.memmap.
+ */
+
+#ifndef FOGGY_TRACE_H_
+#define FOGGY_TRACE_H_
+
+#include <pthread.h>
+#include <stdint.h>
+
+#include <atomic>
+
+#define FOGGY_TRACE_ENV "FOGGY_TRACE"
+#define FOGGY_TRACE_MAGIC "FOGTRACE"
+#define FOGGY_TRACE_VERSION 1
+#define FOGGY_TRACE_RING_SIZE (1 << 14)  // Records, must be a power of two.
+#define FOGGY_TRACE_FLUSH_INTERVAL_US 10000
+
+typedef enum {
+  TRACE_ACK_NEW = 0,
+  TRACE_ACK_DUP = 1,
+  TRACE_FAST_RETRANSMIT = 2,
+  TRACE_RTO = 3,  // Retransmission timer expired, `ack` is the last ACK.
+} foggy_trace_event_t;
+
+typedef struct __attribute__((__packed__)) {
+  char magic[8];
+  uint16_t version;
+  uint16_t record_size;
+  uint32_t dropped;  // Records lost to a full ring, written on close.
+} foggy_trace_file_header_t;
+
+typedef struct __attribute__((__packed__)) {
+  uint64_t time_ns;  // CLOCK_MONOTONIC.
+  uint32_t seq;      // Next sequence number to be queued (last_byte_sent).
+  uint32_t ack;
+  uint32_t cwnd;
+  uint32_t ssthresh;
+  uint32_t bytes_in_flight;
+  uint8_t state;  // reno_state_t after the ACK was processed.
+  uint8_t event;  // foggy_trace_event_t.
+  uint16_t reserved;
+} foggy_trace_record_t;
+
+typedef struct {
+  int fd;
+  foggy_trace_record_t ring[FOGGY_TRACE_RING_SIZE];
+  std::atomic<uint64_t> head;  // Next slot to write, owned by the producer.
+  std::atomic<uint64_t> tail;  // Next slot to flush, owned by the flusher.
+  std::atomic<int> stop;
+  uint32_t dropped;
+  pthread_t flusher;
+} foggy_trace_t;
+
+/**
+ * Opens the trace named by $FOGGY_TRACE and starts its flusher thread.
+ *
+ * @return The trace, or NULL if tracing is disabled or the file can't be
+ *         created.
+ */
+foggy_trace_t* trace_open_from_env();
+
+/**
+ * Appends a record without blocking. Must only be called from one thread.
+ */
+void trace_record(foggy_trace_t* trace, const foggy_trace_record_t* record);
+
+/**
+ * Stops the flusher, writes the remaining records and closes the file.
+ */
+void trace_close(foggy_trace_t* trace);
+
+#endif  // FOGGY_TRACE_H_
@@ -0,0 +1,79 @@
+/* Copyright (C) 2024 Hong Kong University of Science and Technology
+
+This repository is used for the Computer Networks (ELEC 3120)
+course taught at Hong Kong University of Science and Technology.
+
+No part of the project may be copied and/or distributed without
+the express permission of the course staff. Everyone is prohibited
+from releasing their forks in any public places. */
+
+/* This file defines the window scale option (RFC 7323) carried in the header
+ * extension area of pure ACKs, next to the SACK option (foggy_sack.h):
+ *
+ *   kind    1 byte   WSCALE_OPTION_KIND
+ *   length  1 byte   WSCALE_OPTION_LEN
+ *   shift   1 byte   the advertised window is in units of 2^shift bytes
+ *
+ * There is no handshake to negotiate the shift, so every ACK carries the
+ * option and the window of a packet without it is taken as is. This keeps
+ * peers that do not know the option working, with at most 64 KB in flight.
+ */
+
+#ifndef FOGGY_WSCALE_H_
+#define FOGGY_WSCALE_H_
+
+#include <stdint.h>
+
+#include "foggy_sack.h"
+
+#define WSCALE_OPTION_KIND 3  // Same kind number as in TCP.
+#define WSCALE_OPTION_LEN 3
+#define WSCALE_MAX_SHIFT 14  // RFC 7323 2.3.
+
+/**
+ * Writes a window scale option to an extension area.
+ *
+ * @param ext The extension area, at least WSCALE_OPTION_LEN bytes.
+ * @param shift The scale applied to the advertised window.
+ *
+ * @return The length of the option.
+ */
+static inline uint16_t wscale_encode(uint8_t* ext, uint8_t shift) {
+  ext[0] = WSCALE_OPTION_KIND;
+  ext[1] = WSCALE_OPTION_LEN;
+  ext[2] = shift;
+  return WSCALE_OPTION_LEN;
+}
+
+/**
+ * Finds the window scale option in an extension area. Unknown options are
+ * skipped.
+ *
+ * @param ext The extension area.
+ * @param ext_len The length of the extension area.
+ *
+ * @return The shift, 0 if there is no valid option.
+ */
+static inline uint8_t wscale_decode(const uint8_t* ext, uint16_t ext_len) {
+  uint16_t pos = 0;
+
+  while (pos < ext_len) {
+    uint8_t kind = ext[pos];
+    if (kind == SACK_OPTION_END) break;
+    if (kind == SACK_OPTION_NOP) {
+      pos++;
+      continue;
+    }
+    if (pos + 2 > ext_len) break;
+    uint8_t len = ext[pos + 1];
+    if (len < 2 || pos + len > ext_len) break;
+
+    if (kind == WSCALE_OPTION_KIND && len == WSCALE_OPTION_LEN) {
+      return ext[pos + 2] > WSCALE_MAX_SHIFT ? WSCALE_MAX_SHIFT : ext[pos + 2];
+    }
+    pos += len;
+  }
+  return 0;
+}
+
+#endif  // FOGGY_WSCALE_H_
@@ -14,6 +14,7 @@ from releasing their forks in any public places. */
 using namespace std;
 
 #include "foggy_tcp.h"
+#include "foggy_timing.h"
 
 #define BUF_SIZE 4096
 
@@ -21,25 +22,55 @@ using namespace std;
  * This file implements a simple TCP client. Its purpose is to provide simple
  * test cases and demonstrate how the sockets will be used.
  *
- * Usage: ./client <server-ip> <server-port> <filename>
+ * Usage: ./client [--no-wait] [--timing <file>] <server-ip> <server-port>
+ *                 <filename>
+ *
+ * --no-wait skips the one second startup sleep. Use it when the caller has
+ * already made sure that the server is listening.
+ * --timing writes CLOCK_MONOTONIC timestamps of the transfer to <file> as a
+ * JSON line (see foggy_timing.h).
  *
  * For example:
  * ./client 10.0.1.1 3120 test.in
  */
 
 int main(int argc, const char* argv[]) {
-  if (argc != 4) {
-    cerr << "Usage: " << argv[0] << " <server-ip> <server-port> <filename>\n";
+  bool startup_wait = true;
+  const char* timing_file = NULL;
+  int argi = 1;
+  while (argi < argc && strncmp(argv[argi], "--", 2) == 0) {
+    if (strcmp(argv[argi], "--no-wait") == 0) {
+      startup_wait = false;
+      argi++;
+    } else if (strcmp(argv[argi], "--timing") == 0 && argi + 1 < argc) {
+      timing_file = argv[argi + 1];
+      argi += 2;
+    } else {
+      break;
+    }
+  }
+  if (argc - argi != 3) {
+    cerr << "Usage: " << argv[0]
+         << " [--no-wait] [--timing <file>] <server-ip> <server-port>"
+            " <filename>\n";
     return -1;
   }
 
-  const char* server_ip = argv[1];
-  const char* server_port = argv[2];
-  const char* filename = argv[3];
+  const char* server_ip = argv[argi];
+  const char* server_port = argv[argi + 1];
+  const char* filename = argv[argi + 2];
   struct timespec start_time;
+  foggy_timing_t timing;
+
+  if (timing_open(&timing, "client", timing_file) < 0) {
+    cerr << "Error: Can't open \"" << timing_file << "\"\n";
+    return -1;
+  }
 
   /* Create an initiator socket */
+  timing.handshake_start_ns = monotonic_ns();
   void* sock = foggy_socket(TCP_INITIATOR, server_port, server_ip);
+  timing.handshake_end_ns = monotonic_ns();
 
   /* Open the input file. If the file can't be opened, print an error message
    * and return -1 */
@@ -50,7 +81,7 @@ int main(int argc, const char* argv[]) {
   }
 
   /* Wait for one second to ensure the socket is up */
-  sleep(1);
+  if (startup_wait) sleep(1);
 
   char buf[BUF_SIZE];
   bool first_packet = true;
@@ -70,6 +101,7 @@ int main(int argc, const char* argv[]) {
       memcpy(timestamped_buf + sizeof(start_time), buf, bytes_read);
       
       /* Write timestamped first packet */
+      timing_data(&timing, bytes_read);
       int bytes_written = foggy_write(sock, timestamped_buf, bytes_read + sizeof(start_time));
       if (bytes_written < 0) {
         cerr << "Error: Write failed\n";
@@ -80,6 +112,7 @@ int main(int argc, const char* argv[]) {
     }
 
     if (bytes_read > 0) {
+      timing_data(&timing, bytes_read);
       int bytes_written = foggy_write(sock, buf, bytes_read);
       if (bytes_written < 0) {
         cerr << "Error: Write failed\n";
@@ -89,7 +122,10 @@ int main(int argc, const char* argv[]) {
   }
 
   /* Close the socket and the output file void convert */
+  timing.close_start_ns = monotonic_ns();
   foggy_close(sock);
+  timing.close_end_ns = monotonic_ns();
+  timing_write(&timing);
   ifs.close();
   cout << "Client: File transmission completed\n";
 
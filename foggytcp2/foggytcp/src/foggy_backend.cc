@@ -10,6 +10,8 @@ from releasing their forks in any public places. */
  /*
  * This file implements the foggy-TCP backend. The backend runs in a different
  * thread and handles all the socket operations separately from the application.
+ * It is the only thread that touches the window state; the application hands
+ * it data through the queues in foggy_spsc.h.
  *
  * This is where most of your code should go. Feel free to modify any function
  * in this file.
@@ -23,17 +25,20 @@ from releasing their forks in any public places. */
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <sys/eventfd.h>
 #include <sys/socket.h>
 #include <sys/types.h>
 #include <unistd.h>
 
 #include "foggy_backend.h"
 #include "foggy_function.h"
+#include "foggy_log.h"
 #include "foggy_packet.h"
 #include "foggy_tcp.h"
 
 /**
- * Tells if a given sequence number has been acknowledged by the socket.
+ * Tells if a given sequence number has been acknowledged by the socket. Only
+ * the backend thread, which owns the window, may call it.
  *
  * @param sock The socket to check for acknowledgements.
  * @param seq Sequence number to check.
@@ -41,117 +46,174 @@ from releasing their forks in any public places. */
  * @return 1 if the sequence number has been acknowledged, 0 otherwise.
  */
 int has_been_acked(foggy_socket_t *sock, uint32_t seq) {
-  int result;
-  while (pthread_mutex_lock(&(sock->window.ack_lock)) != 0) {
+  return after(sock->window.last_ack_received, seq);
+}
+
+/**
+ * Wakes foggy_read() if it is waiting and there is data for it. It is called
+ * once per batch rather than per segment, so a reader that keeps up takes a
+ * whole batch at a time.
+ */
+static void wake_reader(foggy_socket_t *sock) {
+  if (spsc_used(&(sock->received)) > 0 && sock->reader_waiting.exchange(0)) {
+    while (pthread_mutex_lock(&(sock->recv_lock)) != 0) {
+    }
+    pthread_cond_signal(&(sock->wait_cond));
+    pthread_mutex_unlock(&(sock->recv_lock));
   }
-  result = after(sock->window.last_ack_received, seq);
-  pthread_mutex_unlock(&(sock->window.ack_lock));
-  return result;
 }
 
 /**
  * Checks if the socket received any data.
  *
- * It first peeks at the header to figure out the length of the packet and
- * then reads the entire packet.
+ * Reads up to IO_BATCH_SIZE packets with one recvmmsg() call, handles them
+ * and sends the ACKs they trigger in one batch.
  *
  * @param sock The socket used for receiving data on the connection.
  * @param flags Flags that determine how the socket should wait for data.
  * Check `foggy_read_mode_t` for more information.
+ *
+ * @return The number of packets read, 0 if there were none.
  */
-void check_for_pkt(foggy_socket_t *sock, foggy_read_mode_t flags) {
-  foggy_tcp_header_t hdr;
-  uint8_t *pkt;
-  socklen_t conn_len = sizeof(sock->conn);
-  ssize_t len = 0;
-  uint32_t plen = 0, buf_size = 0, n = 0;
-
-  while (pthread_mutex_lock(&(sock->recv_lock)) != 0) {
+int check_for_pkt(foggy_socket_t *sock, foggy_read_mode_t flags) {
+  io_batch_t *io = &(sock->io);
+  int count = 0;
+
+  for (int i = 0; i < IO_BATCH_SIZE; i++) {
+    io->rx_msgs[i].msg_hdr.msg_namelen = sizeof(io->rx_from[i]);
   }
   switch (flags) {
     case NO_FLAG:
-      len = recvfrom(sock->socket, &hdr, sizeof(foggy_tcp_header_t), MSG_PEEK,
-                     (struct sockaddr *)&(sock->conn), &conn_len);
+      count = recvmmsg(sock->socket, io->rx_msgs, IO_BATCH_SIZE,
+                       MSG_WAITFORONE, NULL);
       break;
 
     // Fallthrough.
     case NO_WAIT:
-      len = recvfrom(sock->socket, &hdr, sizeof(foggy_tcp_header_t),
-                     MSG_DONTWAIT | MSG_PEEK, (struct sockaddr *)&(sock->conn),
-                     &conn_len);
+      count = recvmmsg(sock->socket, io->rx_msgs, IO_BATCH_SIZE, MSG_DONTWAIT,
+                       NULL);
       break;
 
     default:
       perror("ERROR unknown flag");
   }
-  if (len >= (ssize_t)sizeof(foggy_tcp_header_t)) {
-    plen = get_plen(&hdr);
-    pkt = (uint8_t*) malloc(plen);
-    while (buf_size < plen) {
-      n = recvfrom(sock->socket, pkt + buf_size, plen - buf_size, 0,
-                   (struct sockaddr *)&(sock->conn), &conn_len);
-      buf_size = buf_size + n;
+  sock->stats.recv_syscalls++;
+  if (count < 0) count = 0;
+
+  for (int i = 0; i < count; i++) {
+    struct msghdr *msg = &(io->rx_msgs[i].msg_hdr);
+    uint32_t len = io->rx_msgs[i].msg_len;
+    uint8_t *pkt = io->rx_bufs[i];
+
+    if (len < sizeof(foggy_tcp_header_t) || (msg->msg_flags & MSG_TRUNC) ||
+        get_plen((foggy_tcp_header_t *)pkt) > len) {
+      log_error("Dropping packet of %u bytes\n", len);
+      continue;
     }
+    sock->conn = io->rx_from[i];
     on_recv_pkt(sock, pkt);
-    free(pkt);
   }
-  pthread_mutex_unlock(&(sock->recv_lock));
+  flush_datagrams(sock);
+  wake_reader(sock);
+  return count;
+}
+
+void wake_backend(foggy_socket_t *sock) {
+  eventfd_write(sock->wake_fd, 1);
+}
+
+/**
+ * Returns the earlier of two poll() timeouts, where -1 means none.
+ */
+static int earliest_timeout_ms(int a, int b) {
+  if (a < 0) return b;
+  if (b < 0) return a;
+  return a < b ? a : b;
+}
+
+/**
+ * Blocks until a packet arrives, the application wakes the backend, the
+ * retransmission deadline passes, a delayed ACK is due or the next paced
+ * segment may leave. ppoll() is used for its nanosecond timeout, since pacing
+ * intervals are often shorter than a millisecond.
+ *
+ * foggy_write() only writes the eventfd while backend_waiting is set, and
+ * the backend only sets it when the window has room: otherwise new data could
+ * not be sent before the next ACK, which wakes poll() anyway. The flag is set
+ * before the last look at the sending queue, so a write in between is either
+ * seen here or wakes poll(). foggy_close() always writes the eventfd.
+ *
+ * @param sock The socket to wait on.
+ *
+ * @return 1 if packets may be waiting on the socket, 0 if poll() saw none.
+ */
+static int wait_for_event(foggy_socket_t *sock) {
+  int window_open = sock->next_unsent == sock->send_window.size();
+
+  sock->backend_waiting.store(window_open);
+  if (window_open && spsc_used(&(sock->sending)) > sock->sending_queued) {
+    sock->backend_waiting.store(0);
+    return 1;
+  }
+
+  struct pollfd fds[2];
+  fds[0].fd = sock->socket;
+  fds[0].events = POLLIN;
+  fds[1].fd = sock->wake_fd;
+  fds[1].events = POLLIN;
+
+  int timeout = earliest_timeout_ms(retransmit_timeout_ms(sock),
+                                    delayed_ack_timeout_ms(sock));
+  int64_t pacing = pacing_timeout_ns(sock);
+  struct timespec ts;
+  if (pacing >= 0 && (timeout < 0 || pacing < (int64_t)timeout * 1000000)) {
+    ts.tv_sec = pacing / 1000000000;
+    ts.tv_nsec = pacing % 1000000000;
+  } else {
+    ts.tv_sec = timeout / 1000;
+    ts.tv_nsec = (timeout % 1000) * 1000000L;
+  }
+  int ready = ppoll(fds, 2, pacing < 0 && timeout < 0 ? NULL : &ts, NULL);
+  if (ready > 0 && (fds[1].revents & POLLIN)) {
+    eventfd_t value;
+    eventfd_read(sock->wake_fd, &value);
+  }
+  sock->backend_waiting.store(0);
+  return ready != 0 && (ready < 0 || (fds[0].revents & POLLIN));
 }
 
 void *begin_backend(void *in) {
   foggy_socket_t *sock = (foggy_socket_t *)in;
-  int death, buf_len, send_signal;
-  uint8_t *data;
+  int death, buf_len, handled;
+  int drained = 0;  // The socket is known to have no packets waiting.
 
   while (1) {
-    while (pthread_mutex_lock(&(sock->death_lock)) != 0) {
-    }
-    death = sock->dying;
-    pthread_mutex_unlock(&(sock->death_lock));
+    death = sock->dying.load();
+    buf_len = spsc_used(&(sock->sending)) - sock->sending_queued;
 
-    while (pthread_mutex_lock(&(sock->send_lock)) != 0) {
-    }
-    buf_len = sock->sending_len;
-
-    if (!sock->send_window.empty()) {
-      // printf("Sending window is not empty\n");
-      send_pkts(sock, NULL, 0);
-      check_for_pkt(sock, NO_WAIT);
+    if (buf_len > 0 || !sock->send_window.empty()) {
+      send_pkts(sock, buf_len);
     }
 
     if (death && buf_len == 0 && sock->send_window.empty()) {
+      // Do not leave the peer waiting for a delayed ACK.
+      flush_delayed_ack(sock);
       break;
     }
 
-    if (buf_len > 0) {
-      
-      data = (uint8_t*)malloc(buf_len);
-      memcpy(data, sock->sending_buf, buf_len);
-      sock->sending_len = 0;
-      free(sock->sending_buf);
-      sock->sending_buf = NULL;
-      pthread_mutex_unlock(&(sock->send_lock));
-      send_pkts(sock, data, buf_len);
-      free(data);
-    } else {
-      pthread_mutex_unlock(&(sock->send_lock));
-    }
-
-    check_for_pkt(sock, NO_WAIT);
+    /* One batch at most before the backend sends again, so a burst of
+     * incoming packets cannot starve the send path. After a partial batch
+     * the socket is empty, and poll() reports anything that arrives since. */
+    handled = drained ? 0 : check_for_pkt(sock, NO_WAIT);
+    drained = handled < IO_BATCH_SIZE;
 
-    while (pthread_mutex_lock(&(sock->recv_lock)) != 0) {
-    }
+    check_retransmit_timer(sock);
+    check_delayed_ack(sock);
 
-    send_signal = sock->received_len > 0;
-
-    pthread_mutex_unlock(&(sock->recv_lock));
-
-    if (send_signal) {
-      pthread_cond_signal(&(sock->wait_cond));
-    }
+    // ACKs may have opened the window: send before blocking again.
+    if (handled > 0) continue;
 
-    // Add a small sleep to prevent CPU spinning
-    usleep(1000);  // 1ms sleep to reduce CPU usage
+    drained = !wait_for_event(sock);
   }
 
   pthread_exit(NULL);
@@ -7,242 +7,877 @@ No part of the project may be copied and/or distributed without
 the express permission of the course staff. Everyone is prohibited 
 from releasing their forks in any public places. */
 
+#include <algorithm>
 #include <deque>
+#include <cerrno>
 #include <cstdlib>
 #include <cstring>
 #include <cstdio>
+#include <sys/socket.h>
+#include <sys/uio.h>
 
 #include "foggy_function.h"
 #include "foggy_backend.h"
+#include "foggy_log.h"
+#include "foggy_timing.h"
 
 
 #define MIN(X, Y) (((X) < (Y)) ? (X) : (Y))
 #define MAX(X, Y) (((X) > (Y)) ? (X) : (Y))
 
-#define DEBUG_PRINT 1
-#define debug_printf(fmt, ...)                            \
-  do {                                                    \
-    if (DEBUG_PRINT) fprintf(stdout, fmt, ##__VA_ARGS__); \
-  } while (0)
 
+/**
+ * Returns the socket's time: CLOCK_MONOTONIC, or the simulator's clock.
+ */
+static inline uint64_t clock_ns(foggy_socket_t *sock) {
+  if (sock->sim == NULL) return monotonic_ns();
+  return sock->sim->now_ns(sock->sim->ctx);
+}
+
+static inline void arm_retransmit_timer(foggy_socket_t *sock, uint64_t now) {
+  sock->window.rto_deadline_ns = now + (uint64_t)sock->window.rto_us * 1000;
+}
+
+/**
+ * Queues a datagram made of a header and up to two payload pieces, flushing
+ * the batch first if it is full. The header is copied; the payload must stay
+ * in place until the next flush_datagrams().
+ */
+static void queue_datagram(foggy_socket_t *sock, const void *header,
+                           uint16_t header_len, const uint8_t *payload,
+                           uint32_t len, const uint8_t *wrapped,
+                           uint32_t wrapped_len) {
+  io_batch_t *io = &(sock->io);
+  if (io->tx_count == IO_BATCH_SIZE) flush_datagrams(sock);
+
+  int i = io->tx_count++;
+  struct iovec *iov = io->tx_iov[i];
+  struct msghdr *msg = &(io->tx_msgs[i].msg_hdr);
+  memcpy(io->tx_headers[i], header, header_len);
+  iov[0].iov_base = io->tx_headers[i];
+  iov[0].iov_len = header_len;
+  iov[1].iov_base = (void *)payload;
+  iov[1].iov_len = len;
+  iov[2].iov_base = (void *)wrapped;
+  iov[2].iov_len = wrapped_len;
+  msg->msg_name = &(sock->conn);
+  msg->msg_namelen = sizeof(sock->conn);
+  msg->msg_iov = iov;
+  msg->msg_iovlen = wrapped_len > 0 ? 3 : len > 0 ? 2 : 1;
+}
+
+void flush_datagrams(foggy_socket_t *sock) {
+  io_batch_t *io = &(sock->io);
+  int sent = 0;
+
+  if (sock->sim != NULL) {
+    for (int i = 0; i < io->tx_count; i++) {
+      struct msghdr *msg = &(io->tx_msgs[i].msg_hdr);
+      sock->sim->send(sock->sim->ctx, msg->msg_iov, msg->msg_iovlen);
+    }
+    sent = io->tx_count;
+  }
+  while (sent < io->tx_count) {
+    int n = sendmmsg(sock->socket, io->tx_msgs + sent, io->tx_count - sent, 0);
+    sock->stats.send_syscalls++;
+    if (n < 0) {
+      if (errno == EINTR) continue;
+      /* Skip the datagram that failed, e.g. on an ICMP error from a peer that
+       * is not listening yet, like the unchecked sendto() this replaces. */
+      n = 1;
+    }
+    sent += n;
+  }
+  io->tx_count = 0;
+}
+
+/**
+ * Returns the window to advertise for the free space in the received queue,
+ * under the autotuned limit. It never drops below one MSS, so the sender can
+ * always probe a full queue.
+ */
+static uint32_t receive_window_size(foggy_socket_t *sock) {
+  uint32_t used = spsc_used(&(sock->received));
+  uint32_t limit = MIN(sock->tuning.window, sock->received.size.load());
+  uint32_t space = used < limit ? limit - used : 0;
+  return MAX(space, MSS);
+}
+
+/**
+ * Fills `blocks` with the runs of out-of-order data in the receive window.
+ * Adjacent segments are merged into one block. The run holding `seq` comes
+ * first, then the others from the lowest sequence number up (RFC 2018).
+ *
+ * @param sock The socket holding the out-of-order data.
+ * @param seq The sequence number of the segment just received.
+ * @param blocks Receives up to SACK_MAX_BLOCKS blocks.
+ *
+ * @return The number of blocks.
+ */
+static int collect_sack_blocks(foggy_socket_t *sock, uint32_t seq,
+                               sack_block_t *blocks) {
+  sack_block_t others[SACK_MAX_BLOCKS], run = {0, 0};
+  int count = 0, found = 0;
+
+  auto add_run = [&](const sack_block_t &block) {
+    if (!found && !before(seq, block.left) && before(seq, block.right)) {
+      blocks[0] = block;
+      found = 1;
+    } else if (count < SACK_MAX_BLOCKS) {
+      others[count++] = block;
+    }
+  };
+
+  for (const receive_window_slot_t &slot : sock->receive_window) {
+    if (run.right == slot.seq && run.right != run.left) {
+      run.right += slot.len;
+      continue;
+    }
+    if (run.right != run.left) add_run(run);
+    if (found && count >= SACK_MAX_BLOCKS - 1) break;
+    run.left = slot.seq;
+    run.right = slot.seq + slot.len;
+  }
+  if (run.right != run.left && !(found && count >= SACK_MAX_BLOCKS - 1)) {
+    add_run(run);
+  }
+
+  count = MIN(count, SACK_MAX_BLOCKS - found);
+  memcpy(blocks + found, others, count * sizeof(sack_block_t));
+  return found + count;
+}
+
+/**
+ * Sends a cumulative ACK. It carries the window scale option, and while there
+ * is out-of-order data a SACK option whose first block holds `seq`, the
+ * segment just received.
+ *
+ * @param sock The socket to send the ACK on.
+ * @param seq The sequence number of the segment that triggered the ACK.
+ */
+static void send_ack(foggy_socket_t *sock, uint32_t seq) {
+  sack_block_t blocks[SACK_MAX_BLOCKS];
+  int count = 0;
+  uint16_t ext_len = 0;
+  uint8_t ack_pkt[IO_HEADER_MAX_LEN];
+  foggy_tcp_header_t *hdr = (foggy_tcp_header_t *)ack_pkt;
+  uint8_t *ext = get_extension_data(hdr);
+
+  if (!sock->receive_window.empty()) {
+    count = collect_sack_blocks(sock, seq, blocks);
+  }
+
+  // Round up, so one MSS is still advertised as at least one MSS.
+  uint32_t scaled = MIN((receive_window_size(sock) +
+                         (1 << WINDOW_SCALE_SHIFT) - 1) >> WINDOW_SCALE_SHIFT,
+                        UINT16_MAX);
+  sock->ack.window = scaled << WINDOW_SCALE_SHIFT;
+
+  /* set_header() would copy the extension over the extension_data pointer,
+   * so the options are written after the header instead. */
+  set_header(hdr, sock->my_port, ntohs(sock->conn.sin_port),
+             sock->window.last_byte_sent, sock->window.next_seq_expected,
+             sizeof(foggy_tcp_header_t), sizeof(foggy_tcp_header_t),
+             ACK_FLAG_MASK, scaled, 0, NULL);
+  ext_len = wscale_encode(ext, WINDOW_SCALE_SHIFT);
+  ext_len += sack_encode(ext + ext_len, blocks, count);
+  set_extension_length(hdr, ext_len);
+  set_hlen(hdr, sizeof(foggy_tcp_header_t) + ext_len);
+  set_plen(hdr, sizeof(foggy_tcp_header_t) + ext_len);
+  queue_datagram(sock, ack_pkt, sizeof(foggy_tcp_header_t) + ext_len, NULL, 0,
+                 NULL, 0);
+
+  sock->ack.pending_bytes = 0;
+  sock->ack.deadline_ns = 0;
+  sock->stats.acks_sent++;
+}
+
+/**
+ * Acknowledges a data segment now or delays the ACK, following the socket's
+ * ACK policy (RFC 5681 4.2). Out-of-order and duplicate segments, and those
+ * that fill a hole, are acknowledged at once so the sender gets duplicate ACKs
+ * and SACK blocks without delay. So is a segment after which the window last
+ * advertised has no room for another one, and a short segment, which usually
+ * ends the sender's data: the sender would stall until the timer fires.
+ *
+ * @param sock The socket that received the segment.
+ * @param seq The sequence number of the segment.
+ * @param len The payload length of the segment.
+ * @param expected next_seq_expected before the segment was processed.
+ * @param ooo_before Out-of-order segments held before it was processed.
+ */
+static void schedule_ack(foggy_socket_t *sock, uint32_t seq, uint16_t len,
+                         uint32_t expected, size_t ooo_before) {
+  ack_state_t *ack = &(sock->ack);
+  int immediate;
+
+  ack->segments++;
+  immediate = ack->policy == ACK_POLICY_EVERY || seq != expected ||
+              ooo_before > 0 || !sock->receive_window.empty() || len < MSS ||
+              ack->segments <= QUICK_ACK_SEGMENTS;
+  if (!immediate) {
+    ack->pending_bytes += len;
+    immediate = ack->pending_bytes >= DELAYED_ACK_BYTES ||
+                ack->pending_bytes + MSS > ack->window;
+  }
+
+  if (immediate) {
+    send_ack(sock, seq);
+  } else if (ack->deadline_ns == 0) {
+    ack->deadline_ns =
+        clock_ns(sock) + (uint64_t)DELAYED_ACK_TIMEOUT_MS * 1000000;
+  }
+}
+
+/**
+ * Grows the receive window to twice the data delivered per round trip, so it
+ * never limits a sender that could go faster.
+ *
+ * The receiver sends no data, so its RTT is the time to receive one
+ * advertised window: never less than the RTT, and close to it while the
+ * sender is limited by that window, which is when the estimate matters (as in
+ * Linux's tcp_rcv_rtt_measure()).
+ */
+static void tune_receive_window(foggy_socket_t *sock) {
+  receive_tuning_t *tuning = &(sock->tuning);
+  uint32_t next = sock->window.next_seq_expected;
+  uint64_t now = clock_ns(sock);
+
+  if (tuning->rtt_start_ns == 0) {
+    tuning->rtt_seq = next + sock->ack.window;
+    tuning->rtt_start_ns = now;
+  } else if (!before(next, tuning->rtt_seq)) {
+    uint32_t sample = MAX((now - tuning->rtt_start_ns) / 1000, 1);
+    // Only the minimum is kept: larger samples mean the sender was slower.
+    if (tuning->rtt_us == 0 || sample < tuning->rtt_us) {
+      tuning->rtt_us = sample;
+    }
+    tuning->rtt_start_ns = 0;
+  }
+  if (tuning->rtt_us == 0) return;
+
+  if (tuning->epoch_start_ns == 0) {
+    tuning->epoch_seq = next;
+    tuning->epoch_start_ns = now;
+    return;
+  }
+  if (now - tuning->epoch_start_ns < (uint64_t)tuning->rtt_us * 1000) return;
+
+  uint64_t target = 2 * (uint64_t)(next - tuning->epoch_seq);
+  if (target > tuning->window) {
+    tuning->window = MIN(target, RECEIVE_WINDOW_MAX);
+    /* The window is only as large as the UDP socket buffer behind it: a burst
+     * the buffer cannot hold is dropped before the backend reads it, and on
+     * one busy CPU the backend can fall behind by a whole window. The kernel
+     * doubles the request to cover its per-datagram overhead, and caps it at
+     * net.core.rmem_max. */
+    int rcvbuf = tuning->window;
+    if (sock->sim == NULL) {
+      setsockopt(sock->socket, SOL_SOCKET, SO_RCVBUF, &rcvbuf, sizeof(rcvbuf));
+    }
+    log_info("Receive window: %u bytes, RTT: %u us\n", tuning->window,
+             tuning->rtt_us);
+  }
+  tuning->epoch_seq = next;
+  tuning->epoch_start_ns = now;
+}
+
+/**
+ * Grows the part of the received queue in use to hold the autotuned window.
+ * The queue can only grow while it is empty, so this is retried until the
+ * reader has caught up; meanwhile the window is limited to the smaller size.
+ */
+static void resize_received(foggy_socket_t *sock) {
+  uint32_t size = sock->received.size.load();
+  if (size >= sock->tuning.window) return;
+  while (size < sock->tuning.window) size *= 2;
+  spsc_resize(&(sock->received), size);
+}
 
 void on_recv_pkt(foggy_socket_t *sock, uint8_t *pkt) {
-  debug_printf("Received packet\n");
+  log_trace("Received packet\n");
   foggy_tcp_header_t *hdr = (foggy_tcp_header_t *)pkt;
   uint8_t flags = get_flags(hdr);
 
   switch (flags) {
     case ACK_FLAG_MASK: {
       uint32_t ack = get_ack(hdr);
-      printf("Receive ACK %d\n", ack);
-      sock->window.advertised_window = get_advertised_window(hdr);
-      handle_ack(sock, ack);
+      uint8_t *ext = get_extension_data(hdr);
+      uint16_t ext_len = get_extension_length(hdr);
+      sack_block_t blocks[SACK_MAX_BLOCKS];
+      int count = sack_decode(ext, ext_len, blocks);
+      log_trace("Receive ACK %d, %d SACK blocks\n", ack, count);
+      if (get_payload_len(pkt) == 0) sock->stats.acks_received++;
+      sock->window.advertised_window = (uint32_t)get_advertised_window(hdr)
+                                       << wscale_decode(ext, ext_len);
+      handle_ack(sock, ack, blocks, count);
     }
 
     default: {
       if (get_payload_len(pkt) > 0) {
-        debug_printf("Received data packet %d %d\n", get_seq(hdr),
+        log_trace("Received data packet %d %d\n", get_seq(hdr),
                      get_seq(hdr) + get_payload_len(pkt));
 
-        sock->window.advertised_window = get_advertised_window(hdr);
+        uint32_t expected = sock->window.next_seq_expected;
+        size_t ooo_before = sock->receive_window.size();
+        resize_received(sock);
         add_receive_window(sock, pkt);
         process_receive_window(sock);
-        debug_printf("Sending ACK packet %d\n", sock->window.next_seq_expected);
-
-        uint8_t *ack_pkt = create_packet(
-            sock->my_port, ntohs(sock->conn.sin_port),
-            sock->window.last_byte_sent, sock->window.next_seq_expected,
-            sizeof(foggy_tcp_header_t), sizeof(foggy_tcp_header_t), ACK_FLAG_MASK,
-            MAX(MAX_NETWORK_BUFFER - (uint32_t)sock->received_len, MSS), 0,
-            NULL, NULL, 0);
-        sendto(sock->socket, ack_pkt, sizeof(foggy_tcp_header_t), 0,
-               (struct sockaddr *)&(sock->conn), sizeof(sock->conn));
-        free(ack_pkt);
+        tune_receive_window(sock);
+        log_trace("ACK %d due\n", sock->window.next_seq_expected);
+
+        schedule_ack(sock, get_seq(hdr), get_payload_len(pkt), expected,
+                     ooo_before);
       }
     }
   }
 }
 
-void send_pkts(foggy_socket_t *sock, uint8_t *data, int buf_len) {
-  uint8_t *data_offset = data;
-  transmit_send_window(sock);
-
-  if (buf_len > 0) {
-    while (buf_len != 0) {
-      uint16_t payload_len = MIN(buf_len, (int)MSS);
-
-      send_window_slot_t slot;
-      slot.is_sent = 0;
-      slot.msg = create_packet(
-          sock->my_port, ntohs(sock->conn.sin_port),
-          sock->window.last_byte_sent, sock->window.next_seq_expected,
-          sizeof(foggy_tcp_header_t), sizeof(foggy_tcp_header_t) + payload_len,
-          ACK_FLAG_MASK,
-          MAX(MAX_NETWORK_BUFFER - (uint32_t)sock->received_len, MSS), 0, NULL,
-          data_offset, payload_len);
-      sock->send_window.push_back(slot);
+void send_pkts(foggy_socket_t *sock, int buf_len) {
+  receive_send_window(sock);
 
-      buf_len -= payload_len;
-      data_offset += payload_len;
-      sock->window.last_byte_sent += payload_len;
-    }
+  while (buf_len > 0) {
+    uint16_t payload_len = MIN(buf_len, (int)MSS);
+
+    send_window_slot_t slot;
+    slot.is_sent = 0;
+    slot.is_rtt_sample = 0;
+    slot.is_sacked = 0;
+    slot.is_retransmitted = 0;
+    slot.seq = sock->window.last_byte_sent;
+    slot.offset = spsc_at(&(sock->sending), sock->sending_queued) -
+                  sock->sending.buf;
+    slot.len = payload_len;
+    sock->send_window.push_back(slot);
+
+    buf_len -= payload_len;
+    sock->sending_queued += payload_len;
+    sock->window.last_byte_sent += payload_len;
   }
-  receive_send_window(sock);
+  transmit_send_window(sock);
+  flush_datagrams(sock);
 }
 
+/**
+ * Queues one segment of the send window. The header is built on the stack and
+ * the payload is sent straight from the sending queue, in two pieces if it
+ * wraps.
+ */
+static void send_segment(foggy_socket_t *sock, send_window_slot_t *slot) {
+  foggy_tcp_header_t hdr;
+  uint32_t first = MIN((uint32_t)slot->len, SEND_BUFFER_SIZE - slot->offset);
+
+  // Data segments carry no window scale option: the window is unscaled.
+  set_header(&hdr, sock->my_port, ntohs(sock->conn.sin_port), slot->seq,
+             sock->window.next_seq_expected, sizeof(foggy_tcp_header_t),
+             sizeof(foggy_tcp_header_t) + slot->len, ACK_FLAG_MASK,
+             MIN(receive_window_size(sock), UINT16_MAX), 0, NULL);
+  queue_datagram(sock, &hdr, sizeof(hdr), sock->sending.buf + slot->offset,
+                 first, sock->sending.buf, slot->len - first);
+  sock->stats.segments_sent++;
+}
 
 void add_receive_window(foggy_socket_t *sock, uint8_t *pkt) {
   foggy_tcp_header_t *hdr = (foggy_tcp_header_t *)pkt;
   uint32_t seq = get_seq(hdr);
+  uint16_t payload_len = get_payload_len(pkt);
 
   if (before(seq, sock->window.next_seq_expected)) {
     return;
   }
 
   uint32_t offset = seq - sock->window.next_seq_expected;
-  uint32_t slot_index = offset / MSS;
 
-  if (slot_index >= RECEIVE_WINDOW_SLOT_SIZE) {
+  /* Whatever is kept must fit in the received queue once the hole before it
+   * is filled, since foggy_read() is the only one that can make room. */
+  if (offset >= sock->tuning.window ||
+      offset + payload_len > spsc_space(&(sock->received))) {
     return;
   }
 
-  receive_window_slot_t *cur_slot = &(sock->receive_window[slot_index]);
-  if (cur_slot->is_used == 0) {
-    cur_slot->is_used = 1;
-    cur_slot->msg = (uint8_t*) malloc(get_plen(hdr));
-    memcpy(cur_slot->msg, pkt, get_plen(hdr));
+  // In-order segments skip the reassembly window.
+  if (offset == 0) {
+    spsc_push(&(sock->received), get_payload(pkt), payload_len);
+    sock->window.next_seq_expected += payload_len;
+    return;
   }
+
+  /* Segments are not always MSS-sized, so they are sorted by sequence number
+   * instead of placed by position. Data reported in a SACK block must never
+   * be dropped, which a position collision would do. Segments after a loss
+   * arrive in order, so they are appended. */
+  auto pos = std::lower_bound(
+      sock->receive_window.begin(), sock->receive_window.end(), seq,
+      [](const receive_window_slot_t &slot, uint32_t value) {
+        return before(slot.seq, value);
+      });
+  if (pos != sock->receive_window.end() && pos->seq == seq) return;
+
+  receive_window_slot_t slot;
+  slot.payload = pool_get(&(sock->pool));
+  slot.seq = seq;
+  slot.len = payload_len;
+  memcpy(slot.payload, get_payload(pkt), payload_len);
+  sock->receive_window.insert(pos, slot);
 }
 
 void process_receive_window(foggy_socket_t *sock) {
-  while (1) {
-    receive_window_slot_t *cur_slot = &(sock->receive_window[0]);
-
-    if (cur_slot->is_used == 0) break;
-
-    foggy_tcp_header_t *hdr = (foggy_tcp_header_t *)cur_slot->msg;
-
-    if (get_seq(hdr) != sock->window.next_seq_expected) break;
-
-    uint16_t payload_len = get_payload_len(cur_slot->msg);
-    sock->window.next_seq_expected += payload_len;
-
-    sock->received_buf = (uint8_t*)
-        realloc(sock->received_buf, sock->received_len + payload_len);
-    memcpy(sock->received_buf + sock->received_len, get_payload(cur_slot->msg),
-           payload_len);
-    sock->received_len += payload_len;
-
-    cur_slot->is_used = 0;
-    free(cur_slot->msg);
-    cur_slot->msg = NULL;
-
-    for (int i = 1; i < RECEIVE_WINDOW_SLOT_SIZE; i++) {
-      sock->receive_window[i - 1] = sock->receive_window[i];
+  while (!sock->receive_window.empty()) {
+    receive_window_slot_t &slot = sock->receive_window.front();
+
+    if (slot.seq == sock->window.next_seq_expected) {
+      spsc_push(&(sock->received), slot.payload, slot.len);
+      sock->window.next_seq_expected += slot.len;
+    } else if (after(slot.seq, sock->window.next_seq_expected)) {
+      break;  // There is still a hole.
     }
-
-    sock->receive_window[RECEIVE_WINDOW_SLOT_SIZE - 1].is_used = 0;
-    sock->receive_window[RECEIVE_WINDOW_SLOT_SIZE - 1].msg = NULL;
+    // Delivered now, or already covered by an earlier segment.
+    pool_put(&(sock->pool), slot.payload);
+    sock->receive_window.pop_front();
   }
 }
 
+/**
+ * Returns the pacing interval after a segment of `len` bytes, from the
+ * current congestion window and smoothed RTT.
+ */
+static uint64_t next_interval_ns(foggy_socket_t *sock, uint16_t len) {
+  return pacing_interval_ns(&(sock->pacing), len,
+                            sock->window.congestion_window,
+                            sock->window.srtt_us,
+                            sock->window.reno_state == RENO_SLOW_START);
+}
+
 void transmit_send_window(foggy_socket_t *sock) {
   if (sock->send_window.empty()) return;
 
   uint32_t effective_window = MIN(sock->window.congestion_window,
                                    sock->window.advertised_window);
-
-  uint32_t bytes_in_flight = 0;
-  for (auto& slot : sock->send_window) {
-    if (slot.is_sent) {
-      foggy_tcp_header_t *hdr = (foggy_tcp_header_t *)slot.msg;
-      if (!has_been_acked(sock, get_seq(hdr))) {
-        bytes_in_flight += get_payload_len(slot.msg);
-      }
+  uint64_t now = clock_ns(sock);
+  uint32_t burst = 0;
+
+  /* Slots before next_unsent have all been sent, so only the unsent tail is
+   * visited and bytes_in_flight is kept up to date by send and ACK. */
+  while (sock->next_unsent < sock->send_window.size()) {
+    send_window_slot_t &slot = sock->send_window[sock->next_unsent];
+
+    // Only possible after a timeout rewound next_unsent.
+    if (slot.is_sacked) {
+      sock->next_unsent++;
+      continue;
     }
+    if (sock->window.bytes_in_flight + slot.len > effective_window) break;
+    // The backend comes back when the slot is due, see pacing_timeout_ns().
+    if (!pacing_due(&(sock->pacing), now)) break;
+
+    log_trace("Sending packet %d %d\n", slot.seq, slot.seq + slot.len);
+    // Karn's rule: a slot sent again after a timeout is never sampled.
+    slot.is_rtt_sample = !slot.is_sent;
+    slot.is_sent = 1;
+    slot.send_time_ns = now;
+    send_segment(sock, &slot);
+    sock->window.bytes_in_flight += slot.len;
+    sock->next_unsent++;
+    pacing_sent(&(sock->pacing), now, next_interval_ns(sock, slot.len));
+    burst++;
+
+    if (sock->window.rto_deadline_ns == 0) arm_retransmit_timer(sock, now);
   }
+  if (burst > 0) stats_burst(&(sock->stats), burst, now);
+}
 
-  for (auto& slot : sock->send_window) {
-    if (slot.is_sent) continue;
+int64_t pacing_timeout_ns(foggy_socket_t *sock) {
+  if (sock->pacing.gain == 0 ||
+      sock->next_unsent == sock->send_window.size()) {
+    return -1;
+  }
+  /* A slot that does not fit in the window waits for an ACK, which wakes the
+   * backend anyway. */
+  uint32_t effective_window = MIN(sock->window.congestion_window,
+                                   sock->window.advertised_window);
+  send_window_slot_t &slot = sock->send_window[sock->next_unsent];
+  if (sock->window.bytes_in_flight + slot.len > effective_window) return -1;
 
-    foggy_tcp_header_t *hdr = (foggy_tcp_header_t *)slot.msg;
-    uint16_t payload_len = get_payload_len(slot.msg);
+  uint64_t now = clock_ns(sock);
+  if (pacing_due(&(sock->pacing), now)) return 0;
+  return (int64_t)(sock->pacing.next_send_ns - PACING_SLACK_NS - now);
+}
 
-    if (bytes_in_flight + payload_len <= effective_window) {
-      debug_printf("Sending packet %d %d\n", get_seq(hdr),
-                   get_seq(hdr) + payload_len);
-      slot.is_sent = 1;
-      sendto(sock->socket, slot.msg, get_plen(hdr), 0,
-            (struct sockaddr *)&(sock->conn), sizeof(sock->conn));
-      bytes_in_flight += payload_len;
-    } else {
-      break;
-    }
-  }
+/**
+ * Tells if a slot is covered by the last ACK.
+ */
+static inline int slot_acked(foggy_socket_t *sock, send_window_slot_t *slot) {
+  return after(sock->window.last_ack_received, slot->seq);
 }
 
 void receive_send_window(foggy_socket_t *sock) {
+  uint32_t freed = 0;
+
   while (1) {
     if (sock->send_window.empty()) break;
 
     send_window_slot_t slot = sock->send_window.front();
-    foggy_tcp_header_t *hdr = (foggy_tcp_header_t *)slot.msg;
 
     if (slot.is_sent == 0) {
       break;
     }
-    if (has_been_acked(sock, get_seq(hdr)) == 0) {
+    if (!slot_acked(sock, &slot)) {
       break;
     }
     sock->send_window.pop_front();
-    free(slot.msg);
+    // After a timeout next_unsent is rewound and may already be 0.
+    if (sock->next_unsent > 0) sock->next_unsent--;
+    freed += slot.len;
+  }
+  if (freed == 0) return;
+
+  // Queued datagrams may point into the bytes handed back below.
+  flush_datagrams(sock);
+  // Hand the acknowledged bytes back to foggy_write().
+  sock->sending_queued -= freed;
+  spsc_release(&(sock->sending), freed);
+  if (spsc_space(&(sock->sending)) >= SEND_BUFFER_WAKE_SPACE &&
+      sock->writer_waiting.exchange(0)) {
+    while (pthread_mutex_lock(&(sock->send_lock)) != 0) {
+    }
+    pthread_cond_signal(&(sock->send_cond));
+    pthread_mutex_unlock(&(sock->send_lock));
+  }
+}
+
+static void trace_ack(foggy_socket_t *sock, uint32_t ack,
+                      foggy_trace_event_t event) {
+  foggy_trace_record_t record;
+  record.time_ns = clock_ns(sock);
+  record.seq = sock->window.last_byte_sent;
+  record.ack = ack;
+  record.cwnd = sock->window.congestion_window;
+  record.ssthresh = sock->window.ssthresh;
+  record.bytes_in_flight = sock->window.bytes_in_flight;
+  record.state = sock->window.reno_state;
+  record.event = event;
+  record.reserved = 0;
+  trace_record(sock->trace, &record);
+}
+
+/**
+ * Updates SRTT, RTTVAR and the RTO with a new measurement (RFC 6298, 2.2 and
+ * 2.3). A new sample also ends any exponential backoff.
+ */
+static void update_rtt(foggy_socket_t *sock, uint32_t rtt_us) {
+  window_t *w = &sock->window;
+
+  if (w->srtt_us == 0) {
+    w->srtt_us = MAX(rtt_us, 1);
+    w->rttvar_us = rtt_us / 2;
+  } else {
+    uint32_t delta = w->srtt_us > rtt_us ? w->srtt_us - rtt_us
+                                         : rtt_us - w->srtt_us;
+    w->rttvar_us = (3 * (uint64_t)w->rttvar_us + delta) / 4;
+    w->srtt_us = MAX((7 * (uint64_t)w->srtt_us + rtt_us) / 8, 1);
+  }
+  uint64_t rto = (uint64_t)w->srtt_us +
+                 MAX(RTO_CLOCK_GRANULARITY_US, 4 * (uint64_t)w->rttvar_us);
+  w->rto_us = MIN(MAX(rto, RTO_MIN_US), RTO_MAX_US);
+  w->rto_backoff = 0;
+  stats_rtt_sample(&sock->stats, rtt_us);
+}
+
+/**
+ * Drops the pending samples of everything in flight. After a retransmission
+ * the cumulative ACK that fills the hole also covers segments sent long
+ * before it, and their samples would include the recovery time.
+ */
+static void cancel_rtt_samples(foggy_socket_t *sock) {
+  for (size_t i = 0; i < sock->next_unsent; i++) {
+    sock->send_window[i].is_rtt_sample = 0;
+  }
+}
+
+/**
+ * Removes the slots newly covered by `ack` from bytes_in_flight and takes at
+ * most one RTT sample from them. Only slots sent exactly once carry
+ * is_rtt_sample, so retransmissions are never measured (Karn's rule).
+ */
+static void ack_slots(foggy_socket_t *sock, uint32_t ack) {
+  send_window_slot_t *sample = NULL;
+  uint32_t acked = 0;
+
+  for (size_t i = 0; i < sock->send_window.size(); i++) {
+    send_window_slot_t *slot = &sock->send_window[i];
+    if (!slot->is_sent || after(slot->seq + slot->len, ack)) break;
+    // Covered by an earlier ACK, not popped yet.
+    if (!after(slot->seq + slot->len, sock->window.last_ack_received)) {
+      continue;
+    }
+    // SACKed slots and slots rewound by a timeout are not in flight.
+    if (i < sock->next_unsent && !slot->is_sacked) acked += slot->len;
+    if (slot->is_rtt_sample) sample = slot;
+    slot->is_rtt_sample = 0;
+  }
+  sock->window.bytes_in_flight -= MIN(acked, sock->window.bytes_in_flight);
+  if (sample == NULL) return;
+
+  update_rtt(sock, (clock_ns(sock) - sample->send_time_ns) / 1000);
+}
+
+/**
+ * Updates the scoreboard with the SACK blocks of an ACK. Newly SACKed slots
+ * leave bytes_in_flight, so the pipe shrinks as the receiver reports data
+ * above a hole (RFC 6675).
+ */
+static void mark_sacked(foggy_socket_t *sock, const sack_block_t *blocks,
+                        int count) {
+  for (int b = 0; b < count; b++) {
+    uint32_t left = blocks[b].left, right = blocks[b].right;
+    if (!after(right, left) || !after(left, sock->window.last_ack_received)) {
+      continue;
+    }
+
+    auto it = std::lower_bound(
+        sock->send_window.begin(), sock->send_window.end(), left,
+        [](const send_window_slot_t &slot, uint32_t seq) {
+          return before(slot.seq, seq);
+        });
+    for (; it != sock->send_window.end(); ++it) {
+      send_window_slot_t *slot = &*it;
+      if (!slot->is_sent || after(slot->seq + slot->len, right)) break;
+      if (slot->is_sacked) continue;
+      slot->is_sacked = 1;
+      slot->is_rtt_sample = 0;
+      if ((size_t)(it - sock->send_window.begin()) < sock->next_unsent) {
+        sock->window.bytes_in_flight -=
+            MIN((uint32_t)slot->len, sock->window.bytes_in_flight);
+      }
+    }
+    if (after(right, sock->window.high_sacked)) {
+      sock->window.high_sacked = right;
+    }
+  }
+}
+
+/**
+ * Resends every hole below the highest SACK block that has not been resent in
+ * this recovery episode. The holes are still counted in bytes_in_flight, so
+ * the retransmissions do not add to it.
+ */
+static void retransmit_holes(foggy_socket_t *sock) {
+  for (size_t i = 0; i < sock->next_unsent; i++) {
+    send_window_slot_t *slot = &sock->send_window[i];
+    if (!before(slot->seq, sock->window.high_sacked)) break;
+    if (slot_acked(sock, slot) || slot->is_sacked || slot->is_retransmitted) {
+      continue;
+    }
+    log_trace("Retransmitting hole %d\n", slot->seq);
+    slot->is_retransmitted = 1;
+    send_segment(sock, slot);
+    sock->stats.sack_retransmits++;
   }
 }
 
-void handle_ack(foggy_socket_t *sock, uint32_t ack) {
+/**
+ * Returns the sequence number after the last byte sent.
+ */
+static uint32_t highest_sent(foggy_socket_t *sock) {
+  return sock->next_unsent < sock->send_window.size()
+             ? sock->send_window[sock->next_unsent].seq
+             : sock->window.last_byte_sent;
+}
+
+/**
+ * Enters fast recovery after the third duplicate ACK and resends the first
+ * unacknowledged segment. With SACK the window is not inflated, because
+ * SACKed segments already left bytes_in_flight, and recovery lasts until
+ * everything sent before it is acknowledged.
+ */
+static void enter_fast_recovery(foggy_socket_t *sock) {
+  log_info("Fast retransmit triggered\n");
+  sock->window.ssthresh = MAX(sock->window.congestion_window / 2, MSS);
+  sock->window.congestion_window =
+      sock->window.peer_sack ? sock->window.ssthresh
+                             : sock->window.ssthresh + 3 * MSS;
+  sock->window.reno_state = RENO_FAST_RECOVERY;
+  sock->window.recovery_point = highest_sent(sock);
+
+  /* Acknowledged slots stay at the front only until the next
+   * receive_send_window(), so this stops after a few slots. The
+   * retransmitted bytes are already counted in bytes_in_flight. */
+  cancel_rtt_samples(sock);
+  for (size_t i = 0; i < sock->next_unsent; i++) {
+    sock->send_window[i].is_retransmitted = 0;
+  }
+  for (size_t i = 0; i < sock->next_unsent; i++) {
+    send_window_slot_t *slot = &sock->send_window[i];
+    if (!slot_acked(sock, slot) && !slot->is_sacked) {
+      log_trace("Retransmitting packet %d\n", slot->seq);
+      slot->is_retransmitted = 1;
+      send_segment(sock, slot);
+      break;
+    }
+  }
+  sock->stats.fast_retransmits++;
+}
+
+void handle_ack(foggy_socket_t *sock, uint32_t ack,
+                const sack_block_t *blocks, int sack_count) {
+  foggy_trace_event_t event = TRACE_ACK_NEW;
+
+  if (sack_count > 0) {
+    sock->window.peer_sack = 1;
+    mark_sacked(sock, blocks, sack_count);
+  }
+
   if (ack == sock->window.last_ack_received) {
+    event = TRACE_ACK_DUP;
     sock->window.dup_ack_count++;
-    debug_printf("Duplicate ACK count: %d\n", sock->window.dup_ack_count);
-
-    if (sock->window.dup_ack_count == 3) {
-      debug_printf("Fast retransmit triggered\n");
-
-      sock->window.ssthresh = MAX(sock->window.congestion_window / 2, MSS);
-      sock->window.congestion_window = sock->window.ssthresh + 3 * MSS;
-      sock->window.reno_state = RENO_FAST_RECOVERY;
-
-      for (auto& slot : sock->send_window) {
-        foggy_tcp_header_t *hdr = (foggy_tcp_header_t *)slot.msg;
-        if (!has_been_acked(sock, get_seq(hdr))) {
-          debug_printf("Retransmitting packet %d\n", get_seq(hdr));
-          sendto(sock->socket, slot.msg, get_plen(hdr), 0,
-                (struct sockaddr *)&(sock->conn), sizeof(sock->conn));
-          break;
-        }
+    log_trace("Duplicate ACK count: %d\n", sock->window.dup_ack_count);
+
+    /* With SACK, duplicates of data resent after a timeout do not start
+     * another recovery until everything sent before it is acked (the
+     * "recover" variable of RFC 6582). */
+    int after_timeout = sock->window.peer_sack &&
+                        before(ack, sock->window.recovery_point);
+    if (sock->window.reno_state != RENO_FAST_RECOVERY && !after_timeout &&
+        sock->window.dup_ack_count == 3) {
+      event = TRACE_FAST_RETRANSMIT;
+      enter_fast_recovery(sock);
+      if (sock->window.peer_sack) retransmit_holes(sock);
+    } else if (sock->window.reno_state == RENO_FAST_RECOVERY) {
+      if (sock->window.peer_sack) {
+        retransmit_holes(sock);
+      } else if (sock->window.dup_ack_count > 3) {
+        sock->window.congestion_window += MSS;
       }
-    } else if (sock->window.reno_state == RENO_FAST_RECOVERY && sock->window.dup_ack_count > 3) {
-      sock->window.congestion_window += MSS;
     }
   } else if (after(ack, sock->window.last_ack_received)) {
+    uint32_t acked = ack - sock->window.last_ack_received;
     sock->window.dup_ack_count = 0;
+    ack_slots(sock, ack);
+    sock->window.last_ack_received = ack;
+    // RFC 6298 5.2 and 5.3: restart the timer for the remaining data.
+    if (sock->window.bytes_in_flight > 0) {
+      arm_retransmit_timer(sock, clock_ns(sock));
+    } else {
+      sock->window.rto_deadline_ns = 0;
+    }
 
-    if (sock->window.reno_state == RENO_FAST_RECOVERY) {
+    if (sock->window.reno_state == RENO_FAST_RECOVERY &&
+        sock->window.peer_sack &&
+        before(ack, sock->window.recovery_point)) {
+      // Partial ACK: stay in recovery and fill the remaining holes.
+      retransmit_holes(sock);
+    } else if (sock->window.reno_state == RENO_FAST_RECOVERY) {
       sock->window.congestion_window = sock->window.ssthresh;
+      sock->window.bytes_acked = 0;
       sock->window.reno_state = RENO_CONGESTION_AVOIDANCE;
-      debug_printf("Exiting Fast Recovery, CWND: %d\n", sock->window.congestion_window);
+      log_info("Exiting Fast Recovery, CWND: %d\n", sock->window.congestion_window);
     } else if (sock->window.reno_state == RENO_SLOW_START) {
-      sock->window.congestion_window += MSS;
-      debug_printf("Slow Start, CWND: %d\n", sock->window.congestion_window);
+      /* Appropriate Byte Counting (RFC 3465): grow by the bytes acked, at
+       * most 2 MSS per ACK, so delayed ACKs do not slow down slow start. */
+      sock->window.congestion_window += MIN(acked, 2 * MSS);
+      log_trace("Slow Start, CWND: %d\n", sock->window.congestion_window);
 
       if (sock->window.congestion_window >= sock->window.ssthresh) {
+        sock->window.bytes_acked = 0;
         sock->window.reno_state = RENO_CONGESTION_AVOIDANCE;
-        debug_printf("Entering Congestion Avoidance\n");
+        log_info("Entering Congestion Avoidance\n");
       }
     } else if (sock->window.reno_state == RENO_CONGESTION_AVOIDANCE) {
-      sock->window.congestion_window += (MSS * MSS) / sock->window.congestion_window;
-      debug_printf("Congestion Avoidance, CWND: %d\n", sock->window.congestion_window);
+      // One MSS per congestion window of acked bytes, however many ACKs.
+      sock->window.bytes_acked += acked;
+      if (sock->window.bytes_acked >= sock->window.congestion_window) {
+        sock->window.bytes_acked -= sock->window.congestion_window;
+        sock->window.congestion_window += MSS;
+      }
+      log_trace("Congestion Avoidance, CWND: %d\n", sock->window.congestion_window);
     }
+  }
 
-    sock->window.last_ack_received = ack;
+  if (sock->trace != NULL) trace_ack(sock, ack, event);
+}
+
+void check_retransmit_timer(foggy_socket_t *sock) {
+  uint64_t now;
+
+  if (sock->window.rto_deadline_ns == 0) return;
+  now = clock_ns(sock);
+  if (now < sock->window.rto_deadline_ns) return;
+
+  // RFC 6298 5.5: back off the timer.
+  sock->window.rto_us = MIN((uint64_t)sock->window.rto_us * 2, RTO_MAX_US);
+  sock->window.rto_backoff++;
+  sock->stats.rto_events++;
+  sock->stats.max_backoff =
+      MAX(sock->stats.max_backoff, sock->window.rto_backoff);
+  log_info("Retransmission timeout, RTO: %u us\n", sock->window.rto_us);
+
+  sock->window.ssthresh = MAX(sock->window.bytes_in_flight / 2, 2 * MSS);
+  sock->window.congestion_window = MSS;
+  sock->window.bytes_acked = 0;
+  sock->window.reno_state = RENO_SLOW_START;
+  sock->window.dup_ack_count = 0;
+
+  /* Everything in flight is presumed lost: go back to the first unacked slot
+   * and resend from there as the window reopens. Acked slots at the front are
+   * only popped by the next receive_send_window(). */
+  /* RFC 2018: SACK information is discarded after a timeout, in case the
+   * receiver reneged on it. */
+  for (size_t i = 0; i < sock->send_window.size(); i++) {
+    send_window_slot_t *slot = &sock->send_window[i];
+    if (!slot->is_sent) break;
+    slot->is_rtt_sample = 0;
+    slot->is_sacked = 0;
+    slot->is_retransmitted = 0;
+  }
+  sock->window.high_sacked = sock->window.last_ack_received;
+  sock->window.recovery_point = highest_sent(sock);
+  size_t first = 0;
+  while (first < sock->next_unsent &&
+         slot_acked(sock, &sock->send_window[first])) {
+    first++;
+  }
+  sock->next_unsent = first;
+  sock->window.bytes_in_flight = 0;
+  // The first retransmission does not wait for a slot from the old rate.
+  sock->pacing.next_send_ns = 0;
+  arm_retransmit_timer(sock, now);
+  transmit_send_window(sock);
+  flush_datagrams(sock);
+
+  if (sock->trace != NULL) {
+    trace_ack(sock, sock->window.last_ack_received, TRACE_RTO);
   }
 }
+
+int retransmit_timeout_ms(foggy_socket_t *sock) {
+  uint64_t now, deadline = sock->window.rto_deadline_ns;
+
+  if (deadline == 0) return -1;
+  now = clock_ns(sock);
+  if (now >= deadline) return 0;
+  /* Round up so poll() does not wake just before the deadline. */
+  return (int)((deadline - now + 999999) / 1000000);
+}
+
+void flush_delayed_ack(foggy_socket_t *sock) {
+  if (sock->ack.deadline_ns != 0) {
+    log_trace("Delayed ACK %d\n", sock->window.next_seq_expected);
+    send_ack(sock, sock->window.next_seq_expected);
+    flush_datagrams(sock);
+  }
+}
+
+void check_delayed_ack(foggy_socket_t *sock) {
+  if (sock->ack.deadline_ns != 0 && clock_ns(sock) >= sock->ack.deadline_ns) {
+    flush_delayed_ack(sock);
+  }
+}
+
+int delayed_ack_timeout_ms(foggy_socket_t *sock) {
+  uint64_t now, deadline = sock->ack.deadline_ns;
+
+  if (deadline == 0) return -1;
+  now = clock_ns(sock);
+  if (now >= deadline) return 0;
+  return (int)((deadline - now + 999999) / 1000000);
+}
@@ -0,0 +1,55 @@
+/* Copyright (C) 2024 Hong Kong University of Science and Technology
+
+This repository is used for the Computer Networks (ELEC 3120)
+course taught at Hong Kong University of Science and Technology.
+
+No part of the project may be copied and/or distributed without
+the express permission of the course staff. Everyone is prohibited
+from releasing their forks in any public places. */
+
+/*
+ * This file implements the packet pool declared in foggy_pool.h.
+ */
+
+#include "foggy_pool.h"
+
+#include <stdlib.h>
+
+#include "grading.h"
+
+static uint8_t* pool_grow(packet_pool_t* pool) {
+  pool->mallocs++;
+  return (uint8_t*)malloc(MAX_LEN);
+}
+
+void pool_init(packet_pool_t* pool) {
+  pool->free_list = NULL;
+  pool->gets = 0;
+  pool->mallocs = 0;
+  for (int i = 0; i < PACKET_POOL_INITIAL_SIZE; i++) {
+    pool_put(pool, pool_grow(pool));
+  }
+}
+
+void pool_destroy(packet_pool_t* pool) {
+  while (pool->free_list != NULL) {
+    packet_buf_t* buf = pool->free_list;
+    pool->free_list = buf->next;
+    free(buf);
+  }
+}
+
+uint8_t* pool_get(packet_pool_t* pool) {
+  pool->gets++;
+  if (pool->free_list == NULL) return pool_grow(pool);
+
+  packet_buf_t* buf = pool->free_list;
+  pool->free_list = buf->next;
+  return (uint8_t*)buf;
+}
+
+void pool_put(packet_pool_t* pool, uint8_t* buf) {
+  packet_buf_t* free_buf = (packet_buf_t*)buf;
+  free_buf->next = pool->free_list;
+  pool->free_list = free_buf;
+}
@@ -0,0 +1,174 @@
+/* Copyright (C) 2024 Hong Kong University of Science and Technology
+
+This repository is used for the Computer Networks (ELEC 3120)
+course taught at Hong Kong University of Science and Technology.
+
+No part of the project may be copied and/or distributed without
+the express permission of the course staff. Everyone is prohibited
+from releasing their forks in any public places. */
+
+/*
+ * This file implements the simulator interface in foggy_sim.h. A simulated
+ * socket is a foggy_socket_t with hooks that read a virtual clock and keep
+ * the datagrams it sends in a queue for the caller. The caller plays the
+ * backend thread, so the window code runs exactly as it does in begin_backend()
+ * but only when the caller steps it.
+ */
+
+#include "foggy_sim.h"
+
+#include <stdio.h>
+#include <string.h>
+
+#include <deque>
+#include <vector>
+
+#include "foggy_backend.h"
+#include "foggy_function.h"
+#include "foggy_log.h"
+#include "foggy_tcp.h"
+
+// Bytes foggy_sim_write() copies into the sending queue at a time.
+#define SIM_WRITE_CHUNK 65536
+
+struct foggy_sim {
+  foggy_socket_t sock;
+  foggy_sim_hooks_t hooks;
+  uint64_t now_ns;
+  std::deque<std::vector<uint8_t>> sent;  // Datagrams not polled yet.
+  uint64_t delivered;
+};
+
+static uint64_t sim_now_ns(void* ctx) { return ((foggy_sim_t*)ctx)->now_ns; }
+
+static void sim_send(void* ctx, const struct iovec* iov, int iovcnt) {
+  foggy_sim_t* sim = (foggy_sim_t*)ctx;
+  sim->sent.emplace_back();
+  std::vector<uint8_t>& datagram = sim->sent.back();
+  for (int i = 0; i < iovcnt; i++) {
+    const uint8_t* base = (const uint8_t*)iov[i].iov_base;
+    datagram.insert(datagram.end(), base, base + iov[i].iov_len);
+  }
+}
+
+foggy_sim_t* foggy_sim_open(int type, const char* ack_policy,
+                            const char* pacing) {
+  foggy_sim_t* sim = new foggy_sim_t;
+  foggy_socket_t* sock = &(sim->sock);
+
+  if (foggy_socket_init(sock, type ? TCP_LISTENER : TCP_INITIATOR) !=
+      EXIT_SUCCESS) {
+    delete sim;
+    return NULL;
+  }
+  sim->hooks.now_ns = sim_now_ns;
+  sim->hooks.send = sim_send;
+  sim->hooks.ctx = sim;
+  sim->now_ns = 0;
+  sim->delivered = 0;
+  sock->sim = &(sim->hooks);
+  memset(&(sock->conn), 0, sizeof(sock->conn));
+  sock->conn.sin_family = AF_INET;
+  sock->my_port = type ? 15441 : 15442;
+  sock->conn.sin_port = htons(type ? 15442 : 15441);
+  if (ack_policy != NULL) sock->ack.policy = ack_policy_parse(ack_policy);
+  if (pacing != NULL) pacing_parse(&(sock->pacing), pacing);
+  return sim;
+}
+
+void foggy_sim_close(foggy_sim_t* sim) {
+  foggy_socket_release(&(sim->sock));
+  delete sim;
+}
+
+void foggy_sim_set_time(foggy_sim_t* sim, uint64_t now_ns) {
+  if (now_ns > sim->now_ns) sim->now_ns = now_ns;
+}
+
+uint32_t foggy_sim_write(foggy_sim_t* sim, uint32_t len) {
+  static const uint8_t zeros[SIM_WRITE_CHUNK] = {0};
+  spsc_ring_t* sending = &(sim->sock.sending);
+  uint32_t space = spsc_space(sending);
+  uint32_t written = len < space ? len : space;
+
+  for (uint32_t n = written; n > 0;) {
+    uint32_t chunk = n < SIM_WRITE_CHUNK ? n : SIM_WRITE_CHUNK;
+    spsc_push(sending, zeros, chunk);
+    n -= chunk;
+  }
+  return written;
+}
+
+int foggy_sim_deliver(foggy_sim_t* sim, const uint8_t* pkt, uint32_t len) {
+  foggy_socket_t* sock = &(sim->sock);
+
+  // The same checks as check_for_pkt(), on a copy the size of a real buffer.
+  if (len < sizeof(foggy_tcp_header_t) || len > MAX_LEN ||
+      get_plen((foggy_tcp_header_t*)pkt) > len) {
+    log_error("Dropping packet of %u bytes\n", len);
+    return -1;
+  }
+  uint8_t* buf = pool_get(&(sock->pool));
+  memcpy(buf, pkt, len);
+  on_recv_pkt(sock, buf);
+  pool_put(&(sock->pool), buf);
+  flush_datagrams(sock);
+  return 0;
+}
+
+void foggy_sim_step(foggy_sim_t* sim) {
+  foggy_socket_t* sock = &(sim->sock);
+  int buf_len = spsc_used(&(sock->sending)) - sock->sending_queued;
+
+  // One iteration of begin_backend(), without the socket and the poll().
+  if (buf_len > 0 || !sock->send_window.empty()) send_pkts(sock, buf_len);
+  check_retransmit_timer(sock);
+  check_delayed_ack(sock);
+
+  uint32_t used = spsc_used(&(sock->received));
+  spsc_release(&(sock->received), used);
+  sim->delivered += used;
+}
+
+uint64_t foggy_sim_next_event_ns(foggy_sim_t* sim) {
+  foggy_socket_t* sock = &(sim->sock);
+  uint64_t next = FOGGY_SIM_NO_EVENT;
+
+  if (sock->window.rto_deadline_ns != 0) next = sock->window.rto_deadline_ns;
+  if (sock->ack.deadline_ns != 0 && sock->ack.deadline_ns < next) {
+    next = sock->ack.deadline_ns;
+  }
+  int64_t pacing = pacing_timeout_ns(sock);
+  if (pacing >= 0 && sim->now_ns + pacing < next) next = sim->now_ns + pacing;
+  return next;
+}
+
+uint32_t foggy_sim_poll_datagram(foggy_sim_t* sim, uint8_t* buf,
+                                 uint32_t cap) {
+  if (sim->sent.empty()) return 0;
+  std::vector<uint8_t>& datagram = sim->sent.front();
+  uint32_t len = datagram.size() < cap ? datagram.size() : cap;
+  memcpy(buf, datagram.data(), len);
+  sim->sent.pop_front();
+  return len;
+}
+
+uint64_t foggy_sim_delivered(foggy_sim_t* sim) { return sim->delivered; }
+
+uint64_t foggy_sim_acked(foggy_sim_t* sim) {
+  return sim->sock.window.last_ack_received;
+}
+
+int foggy_sim_stats(foggy_sim_t* sim, char* buf, uint32_t cap) {
+  foggy_socket_t* sock = &(sim->sock);
+  FILE* f = fmemopen(buf, cap, "w");
+  if (f == NULL) return -1;
+  // Sequence numbers start at 0, as in foggy_close().
+  stats_write(f, &(sock->stats), sock->window.srtt_us, sock->window.rttvar_us,
+              sock->window.rto_us,
+              (uint64_t)sock->window.last_ack_received +
+                  sock->window.next_seq_expected);
+  long len = ftell(f);
+  fclose(f);
+  return len >= 0 && (uint32_t)len < cap ? (int)len : -1;
+}
@@ -18,37 +18,36 @@ from releasing their forks in any public places. */
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <sys/eventfd.h>
 #include <sys/socket.h>
 #include <unistd.h>
 
 #include "foggy_backend.h"
+#include "foggy_log.h"
 
-void* foggy_socket(const foggy_socket_type_t socket_type,
-               const char *server_port, const char *server_ip) {
-  foggy_socket_t* sock = new foggy_socket_t;
-  int sockfd, optval;
-  socklen_t len;
-  struct sockaddr_in conn, my_addr;
-  len = sizeof(my_addr);
-
-  sockfd = socket(AF_INET, SOCK_DGRAM, 0);
-  if (sockfd < 0) {
-    perror("ERROR opening socket");
-    return NULL;
-  }
-  sock->socket = sockfd;
+int foggy_socket_init(foggy_socket_t* sock, foggy_socket_type_t socket_type) {
+  sock->socket = -1;
+  sock->sim = NULL;
   // sock->state = CLOSED;
-  sock->received_buf = NULL;
-  sock->received_len = 0;
+  spsc_init(&(sock->received), RECEIVE_BUFFER_SIZE);
+  spsc_resize(&(sock->received), RECEIVE_BUFFER_INITIAL_SIZE);
+  sock->reader_waiting = 0;
   pthread_mutex_init(&(sock->recv_lock), NULL);
 
-  sock->sending_buf = NULL;
-  sock->sending_len = 0;
+  spsc_init(&(sock->sending), SEND_BUFFER_SIZE);
+  sock->sending_queued = 0;
+  sock->writer_waiting = 0;
   pthread_mutex_init(&(sock->send_lock), NULL);
+  pthread_cond_init(&(sock->send_cond), NULL);
 
   sock->type = socket_type;
   sock->dying = 0;
-  pthread_mutex_init(&(sock->death_lock), NULL);
+  sock->backend_waiting = 0;
+  sock->wake_fd = eventfd(0, EFD_NONBLOCK | EFD_CLOEXEC);
+  if (sock->wake_fd < 0) {
+    perror("ERROR creating eventfd");
+    return EXIT_ERROR;
+  }
 
   // FIXME: Sequence numbers should be randomly initialized. The next expected
   // sequence number should be initialized according to the SYN packet from the
@@ -60,18 +59,71 @@ void* foggy_socket(const foggy_socket_type_t socket_type,
   sock->window.ssthresh = WINDOW_INITIAL_SSTHRESH;
   sock->window.advertised_window = WINDOW_INITIAL_ADVERTISED;
   sock->window.congestion_window = WINDOW_INITIAL_WINDOW_SIZE;
+  sock->window.bytes_in_flight = 0;
+  sock->window.rto_deadline_ns = 0;
+  sock->window.srtt_us = 0;
+  sock->window.rttvar_us = 0;
+  sock->window.rto_us = WINDOW_INITIAL_RTT * 1000;
+  sock->window.rto_backoff = 0;
+  sock->window.peer_sack = 0;
+  sock->window.high_sacked = 0;
+  sock->window.recovery_point = 0;
+  sock->window.bytes_acked = 0;
   sock->window.reno_state = RENO_SLOW_START;
-  pthread_mutex_init(&(sock->window.ack_lock), NULL);
 
-  for (int i = 0; i < RECEIVE_WINDOW_SLOT_SIZE; ++i) {
-    sock->receive_window[i].is_used = 0;
-    sock->receive_window[i].msg = NULL;
-  }
+  sock->tuning.window = MAX_NETWORK_BUFFER;
+  sock->tuning.rtt_us = 0;
+  sock->tuning.rtt_seq = 0;
+  sock->tuning.rtt_start_ns = 0;
+  sock->tuning.epoch_seq = 0;
+  sock->tuning.epoch_start_ns = 0;
+  sock->next_unsent = 0;
+  sock->trace = NULL;
+  pool_init(&(sock->pool));
+  io_batch_init(&(sock->io), &(sock->pool));
+  stats_init(&(sock->stats));
+  ack_state_init(&(sock->ack));
+  pacing_init(&(sock->pacing));
 
   if (pthread_cond_init(&sock->wait_cond, NULL) != 0) {
     perror("ERROR condition variable not set\n");
+    return EXIT_ERROR;
+  }
+  return EXIT_SUCCESS;
+}
+
+void foggy_socket_release(foggy_socket_t* sock) {
+  trace_close(sock->trace);
+  for (receive_window_slot_t& slot : sock->receive_window) {
+    pool_put(&(sock->pool), slot.payload);
+  }
+  sock->receive_window.clear();
+  io_batch_destroy(&(sock->io), &(sock->pool));
+  log_info("Packet pool: %llu packets, %llu mallocs\n",
+           (unsigned long long)sock->pool.gets,
+           (unsigned long long)sock->pool.mallocs);
+  pool_destroy(&(sock->pool));
+  spsc_destroy(&(sock->received));
+  spsc_destroy(&(sock->sending));
+  close(sock->wake_fd);
+}
+
+void* foggy_socket(const foggy_socket_type_t socket_type,
+               const char *server_port, const char *server_ip) {
+  foggy_socket_t* sock = new foggy_socket_t;
+  int sockfd, optval;
+  socklen_t len;
+  struct sockaddr_in conn, my_addr;
+  len = sizeof(my_addr);
+
+  sockfd = socket(AF_INET, SOCK_DGRAM, 0);
+  if (sockfd < 0) {
+    perror("ERROR opening socket");
     return NULL;
   }
+  if (foggy_socket_init(sock, socket_type) != EXIT_SUCCESS) return NULL;
+  sock->socket = sockfd;
+  sock->trace = trace_open_from_env();
 
   uint16_t portno = (uint16_t)atoi(server_port);
   switch (socket_type) {
@@ -126,78 +178,77 @@ void* foggy_socket(const foggy_socket_type_t socket_type,
 
 int foggy_close(void *in_sock) {
   struct foggy_socket_t *sock = (struct foggy_socket_t *)in_sock;
-  while (pthread_mutex_lock(&(sock->death_lock)) != 0) {
-  }
-  sock->dying = 1;
-  pthread_mutex_unlock(&(sock->death_lock));
+  sock->dying.store(1);
+  wake_backend(sock);
 
   pthread_join(sock->thread_id, NULL);
-
-  if (sock != NULL) {
-    if (sock->received_buf != NULL) {
-      free(sock->received_buf);
-    }
-    if (sock->sending_buf != NULL) {
-      free(sock->sending_buf);
-    }
-  } else {
-    perror("ERROR null socket\n");
-    return EXIT_ERROR;
-  }
+  // Sequence numbers start at 0, so these are the bytes sent and received.
+  stats_write_from_env(&(sock->stats), sock->window.srtt_us,
+                       sock->window.rttvar_us, sock->window.rto_us,
+                       (uint64_t)sock->window.last_ack_received +
+                           sock->window.next_seq_expected);
+  foggy_socket_release(sock);
   return close(sock->socket);
 }
 
 int foggy_read(void* in_sock, void *buf, int length) {
   struct foggy_socket_t *sock = (struct foggy_socket_t *)in_sock;  
-  uint8_t *new_buf;
-  int read_len = 0;
 
   if (length < 0) {
     perror("ERROR negative length");
     return EXIT_ERROR;
   }
 
-  while (pthread_mutex_lock(&(sock->recv_lock)) != 0) {
+  // The lock is only needed to sleep: reading the queue needs none.
+  if (spsc_used(&(sock->received)) == 0) {
+    while (pthread_mutex_lock(&(sock->recv_lock)) != 0) {
+    }
+    while (spsc_used(&(sock->received)) == 0) {
+      sock->reader_waiting.store(1);
+      if (spsc_used(&(sock->received)) > 0) break;
+      pthread_cond_wait(&(sock->wait_cond), &(sock->recv_lock));
+    }
+    sock->reader_waiting.store(0);
+    pthread_mutex_unlock(&(sock->recv_lock));
   }
+  return spsc_pop(&(sock->received), (uint8_t *)buf, length);
+}
 
-  while (sock->received_len == 0) {
-    pthread_cond_wait(&(sock->wait_cond), &(sock->recv_lock));
+/**
+ * Blocks until the backend has freed SEND_BUFFER_WAKE_SPACE bytes of the
+ * sending queue, so the writer is not woken up for every ACK.
+ */
+static void wait_for_space(foggy_socket_t *sock) {
+  while (pthread_mutex_lock(&(sock->send_lock)) != 0) {
   }
-  if (sock->received_len > 0) {
-    if (sock->received_len > length)
-      read_len = length;
-    else
-      read_len = sock->received_len;
-
-    memcpy(buf, sock->received_buf, read_len);
-    if (read_len < sock->received_len) {
-      new_buf = (uint8_t*) malloc(sock->received_len - read_len);
-      memcpy(new_buf, sock->received_buf + read_len,
-              sock->received_len - read_len);
-      free(sock->received_buf);
-      sock->received_len -= read_len;
-      sock->received_buf = new_buf;
-    } else {
-      free(sock->received_buf);
-      sock->received_buf = NULL;
-      sock->received_len = 0;
-    }
+  while (spsc_space(&(sock->sending)) < SEND_BUFFER_WAKE_SPACE) {
+    sock->writer_waiting.store(1);
+    if (spsc_space(&(sock->sending)) >= SEND_BUFFER_WAKE_SPACE) break;
+    pthread_cond_wait(&(sock->send_cond), &(sock->send_lock));
   }
-  pthread_mutex_unlock(&(sock->recv_lock));
-  return read_len;
+  sock->writer_waiting.store(0);
+  pthread_mutex_unlock(&(sock->send_lock));
 }
 
 int foggy_write(void *in_sock, const void *buf, int length) {
   struct foggy_socket_t *sock = (struct foggy_socket_t *)in_sock;
-  while (pthread_mutex_lock(&(sock->send_lock)) != 0) {
-  }
-  if (sock->sending_buf == NULL)
-    sock->sending_buf = (uint8_t*) malloc(length);
-  else
-    sock->sending_buf = (uint8_t*) realloc(sock->sending_buf, length + sock->sending_len);
-  memcpy(sock->sending_buf + sock->sending_len, buf, length);
-  sock->sending_len += length;
+  const uint8_t *data = (const uint8_t *)buf;
+  uint32_t n;
+
+  while (length > 0) {
+    // Backpressure: wait for the backend to free acknowledged bytes.
+    n = spsc_space(&(sock->sending));
+    if (n == 0) {
+      wait_for_space(sock);
+      continue;
+    }
+    if (n > (uint32_t)length) n = length;
+    spsc_push(&(sock->sending), data, n);
+    data += n;
+    length -= n;
 
-  pthread_mutex_unlock(&(sock->send_lock));
+    // Otherwise the backend picks the data up on its own.
+    if (sock->backend_waiting.load()) wake_backend(sock);
+  }
   return EXIT_SUCCESS;
 }
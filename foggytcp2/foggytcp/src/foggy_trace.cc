@@ -0,0 +1,117 @@
+/* Copyright (C) 2024 Hong Kong University of Science and Technology
+
+This repository is used for the Computer Networks (ELEC 3120)
+course taught at Hong Kong University of Science and Technology.
+
+No part of the project may be copied and/or distributed without
+the express permission of the course staff. Everyone is prohibited
+from releasing their forks in any public places. */
+
+/*
+ * This file implements the congestion window trace declared in foggy_trace.h.
+ */
+
+#include "foggy_trace.h"
+
+#include <fcntl.h>
+#include <stddef.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+
+static void write_all(int fd, const void* buf, size_t len) {
+  const uint8_t* p = (const uint8_t*)buf;
+  while (len > 0) {
+    ssize_t n = write(fd, p, len);
+    if (n <= 0) return;
+    p += n;
+    len -= n;
+  }
+}
+
+/**
+ * Writes every record between tail and head to the file. The ring is written
+ * in at most two contiguous chunks.
+ */
+static void trace_flush(foggy_trace_t* trace) {
+  uint64_t head = trace->head.load(std::memory_order_acquire);
+  uint64_t tail = trace->tail.load(std::memory_order_relaxed);
+
+  while (tail != head) {
+    uint64_t start = tail & (FOGGY_TRACE_RING_SIZE - 1);
+    uint64_t count = head - tail;
+    if (start + count > FOGGY_TRACE_RING_SIZE)
+      count = FOGGY_TRACE_RING_SIZE - start;
+    write_all(trace->fd, &trace->ring[start],
+              count * sizeof(foggy_trace_record_t));
+    tail += count;
+  }
+  trace->tail.store(tail, std::memory_order_release);
+}
+
+static void* trace_flusher(void* in) {
+  foggy_trace_t* trace = (foggy_trace_t*)in;
+  while (!trace->stop.load(std::memory_order_acquire)) {
+    trace_flush(trace);
+    usleep(FOGGY_TRACE_FLUSH_INTERVAL_US);
+  }
+  return NULL;
+}
+
+foggy_trace_t* trace_open_from_env() {
+  const char* path = getenv(FOGGY_TRACE_ENV);
+  if (path == NULL || path[0] == '\0') return NULL;
+
+  int fd = open(path, O_WRONLY | O_CREAT | O_TRUNC, 0644);
+  if (fd < 0) {
+    perror("ERROR opening trace file");
+    return NULL;
+  }
+
+  foggy_trace_file_header_t header;
+  memcpy(header.magic, FOGGY_TRACE_MAGIC, sizeof(header.magic));
+  header.version = FOGGY_TRACE_VERSION;
+  header.record_size = sizeof(foggy_trace_record_t);
+  header.dropped = 0;
+  write_all(fd, &header, sizeof(header));
+
+  foggy_trace_t* trace = new foggy_trace_t;
+  trace->fd = fd;
+  trace->head.store(0);
+  trace->tail.store(0);
+  trace->stop.store(0);
+  trace->dropped = 0;
+  if (pthread_create(&trace->flusher, NULL, trace_flusher, trace) != 0) {
+    close(fd);
+    delete trace;
+    return NULL;
+  }
+  return trace;
+}
+
+void trace_record(foggy_trace_t* trace, const foggy_trace_record_t* record) {
+  uint64_t head = trace->head.load(std::memory_order_relaxed);
+  uint64_t tail = trace->tail.load(std::memory_order_acquire);
+  if (head - tail >= FOGGY_TRACE_RING_SIZE) {
+    trace->dropped++;
+    return;
+  }
+  trace->ring[head & (FOGGY_TRACE_RING_SIZE - 1)] = *record;
+  trace->head.store(head + 1, std::memory_order_release);
+}
+
+void trace_close(foggy_trace_t* trace) {
+  if (trace == NULL) return;
+
+  trace->stop.store(1, std::memory_order_release);
+  pthread_join(trace->flusher, NULL);
+  trace_flush(trace);
+
+  if (pwrite(trace->fd, &trace->dropped, sizeof(trace->dropped),
+             offsetof(foggy_trace_file_header_t, dropped)) < 0) {
+    perror("ERROR writing trace header");
+  }
+  close(trace->fd);
+  delete trace;
+}
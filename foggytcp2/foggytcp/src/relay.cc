@@ -0,0 +1,740 @@
+/* Copyright (C) 2024 Hong Kong University of Science and Technology
+
+This repository is used for the Computer Networks (ELEC 3120)
+course taught at Hong Kong University of Science and Technology.
+
+No part of the project may be copied and/or distributed without
+the express permission of the course staff. Everyone is prohibited
+from releasing their forks in any public places. */
+
+#include <arpa/inet.h>
+#include <errno.h>
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/epoll.h>
+#include <sys/prctl.h>
+#include <sys/socket.h>
+#include <sys/timerfd.h>
+#include <unistd.h>
+
+#include <deque>
+#include <queue>
+#include <vector>
+
+#include "foggy_timing.h"
+
+/**
+ * This file implements a link emulator in user space. It relays UDP
+ * datagrams between a client and a server and shapes them like netem, but
+ * needs no privileges, so any number of relays can run side by side on
+ * loopback, each on its own ports.
+ *
+ * Usage: ./build/relay [options] <listen-ip> <listen-port> <server-ip>
+ *                      <server-port>
+ *
+ * The client sends to <listen-ip>:<listen-port>. The relay forwards its
+ * datagrams to the server from an ephemeral port, and the server's replies
+ * back to the client. The client to server direction is shaped:
+ *
+ * --rate <Mbit/s>    serialization rate, 0 for none (the default).
+ * --delay <ms>       one-way delay.
+ * --jitter <ms>      the delay varies uniformly within +/- jitter. As with
+ *                    netem, this can reorder datagrams.
+ * --loss <p>         drop probability in [0, 1], decided on arrival.
+ * --limit <packets>  datagrams held in the link, queued or delayed, as
+ *                    netem's limit (default 1000). Datagrams beyond it are
+ *                    dropped.
+ * --symmetric        shapes the replies the same way, like tc on lo.
+ *                    Otherwise they are relayed at once.
+ * --seed <n>         seed of the loss and jitter generator.
+ * --stats <file>     writes the counters as JSON on SIGINT or SIGTERM.
+ * --trace <file>     changes the rate, delay and loss over time, see below.
+ *
+ * Datagrams are read with recvmmsg(). Each direction serializes them one at
+ * a time at its current rate, then holds them in a queue ordered by release
+ * time, and sends them with sendmmsg(). A single timerfd is armed for the
+ * earliest of these events and the trace changes, and every event is
+ * handled at its scheduled time rather than when the process wakes up, so
+ * the schedule does not drift.
+ *
+ * A trace is a text file like Mahimahi's, one change per line:
+ *
+ *   <ms> <rate Mbit/s> <delay ms> <loss>
+ *
+ * From <ms> after the client's first datagram until the next line, the
+ * shaped directions use these values. A "-" keeps the value given on the
+ * command line, and a rate of 0 takes the link down: datagrams queue (up to
+ * the limit) until the rate is positive again. A last line with only <ms>
+ * makes the trace repeat with that period; without it the last values
+ * stay. Text after '#' is ignored. A change of rate applies from the next
+ * datagram put on the wire.
+ *
+ * For example:
+ * ./build/relay --rate 10 --delay 20 --loss 0.01 127.0.0.1 16000 127.0.0.1
+ * 15441
+ */
+
+// Datagrams per recvmmsg() and sendmmsg() call.
+#define RELAY_BATCH 64
+// Larger than any foggytcp datagram; longer ones are dropped.
+#define RELAY_MAX_LEN 2048
+#define RELAY_DEFAULT_LIMIT 1000
+#define RELAY_SOCKET_BUF (4 << 20)
+// netem on a veth counts Ethernet frames: 14 + 20 (IPv4) + 8 (UDP) bytes.
+#define RELAY_FRAME_OVERHEAD 42
+#define RELAY_NEVER UINT64_MAX
+#define RELAY_TRACE_LINE 256
+
+enum { FORWARD = 0, REVERSE = 1 };
+
+typedef struct {
+  uint64_t rate_bps;  // 0 for no rate limit.
+  uint64_t delay_ns;
+  uint64_t jitter_ns;
+  double loss;
+  uint32_t limit;
+  bool down;  // Set by a trace rate of 0.
+} shaping_t;
+
+typedef struct {
+  uint32_t slot;
+  uint32_t len;
+} queued_t;
+
+typedef struct {
+  shaping_t shaping;
+  shaping_t base;  // From the command line, for the "-" fields of a trace.
+  // Datagrams waiting to be serialized; the front one is on the wire.
+  std::deque<queued_t> fifo;
+  // When the front one finishes, or RELAY_NEVER while the link is down.
+  uint64_t head_done_ns;
+  uint32_t held;  // In the fifo or delayed.
+
+  uint64_t packets;
+  uint64_t bytes;
+  uint64_t losses;
+  uint64_t queue_drops;
+  uint64_t send_errors;
+  uint64_t delivered;
+  uint32_t max_held;
+} direction_t;
+
+typedef struct {
+  uint64_t release_ns;
+  uint64_t seq;  // Keeps datagrams released at the same time in order.
+  uint32_t slot;
+  int dir;
+} held_t;
+
+// A negative field keeps the base value.
+typedef struct {
+  uint64_t at_ns;
+  double rate_mbps;
+  double delay_ms;
+  double loss;
+} trace_entry_t;
+
+typedef struct {
+  std::vector<trace_entry_t> entries;
+  uint64_t period_ns;  // 0 if the trace does not repeat.
+  uint64_t cycle_ns;   // Start of the current repetition, 0 before it starts.
+  size_t next;
+  uint64_t next_ns;  // When entries[next] applies.
+  uint64_t changes;
+} trace_t;
+
+struct later {
+  bool operator()(const held_t& a, const held_t& b) const {
+    if (a.release_ns != b.release_ns) return a.release_ns > b.release_ns;
+    return a.seq > b.seq;
+  }
+};
+
+typedef struct {
+  int fd[2];  // FORWARD reads from the client, REVERSE from the server.
+  int timer_fd;
+  struct sockaddr_in client;
+  bool have_client;
+  bool symmetric;
+  direction_t dir[2];
+  trace_t trace;
+  uint64_t rng;
+  uint64_t seq;
+
+  std::vector<uint8_t> bufs;  // RELAY_MAX_LEN bytes per slot.
+  std::vector<uint32_t> lens;
+  std::vector<uint32_t> free_slots;
+  std::priority_queue<held_t, std::vector<held_t>, later> queue;
+} relay_t;
+
+static volatile sig_atomic_t stop_requested = 0;
+
+static void on_stop_signal(int) { stop_requested = 1; }
+
+// splitmix64, so a seed gives the same drops and delays on every machine.
+static uint64_t next_random(relay_t* relay) {
+  uint64_t z = (relay->rng += 0x9e3779b97f4a7c15ull);
+  z = (z ^ (z >> 30)) * 0xbf58476d1ce4e5b9ull;
+  z = (z ^ (z >> 27)) * 0x94d049bb133111ebull;
+  return z ^ (z >> 31);
+}
+
+static double next_uniform(relay_t* relay) {
+  return (next_random(relay) >> 11) * (1.0 / 9007199254740992.0);
+}
+
+static uint8_t* slot_buf(relay_t* relay, uint32_t slot) {
+  return relay->bufs.data() + (size_t)slot * RELAY_MAX_LEN;
+}
+
+/**
+ * When a datagram of `len` bytes put on the wire at `start` has been
+ * serialized.
+ */
+static uint64_t serialized_at(const shaping_t* shaping, uint64_t start,
+                              uint32_t len) {
+  if (shaping->down) return RELAY_NEVER;
+  if (shaping->rate_bps == 0) return start;
+  return start + (uint64_t)(len + RELAY_FRAME_OVERHEAD) * 8 * 1000000000ull /
+                     shaping->rate_bps;
+}
+
+/**
+ * Decides what happens to a datagram that arrives at `now`, in netem's
+ * order: loss, then the limit, then the rate and the delay.
+ *
+ * @return true if it joins the fifo, or false if it is dropped.
+ */
+static bool admit(relay_t* relay, direction_t* dir, uint32_t slot,
+                  uint32_t len, uint64_t now) {
+  const shaping_t* shaping = &(dir->shaping);
+
+  dir->packets++;
+  dir->bytes += len;
+  if (shaping->loss > 0 && next_uniform(relay) < shaping->loss) {
+    dir->losses++;
+    return false;
+  }
+  if (dir->held >= shaping->limit) {
+    dir->queue_drops++;
+    return false;
+  }
+
+  if (dir->fifo.empty()) dir->head_done_ns = serialized_at(shaping, now, len);
+  dir->fifo.push_back({slot, len});
+  dir->held++;
+  if (dir->held > dir->max_held) dir->max_held = dir->held;
+  return true;
+}
+
+/**
+ * Moves the datagram at the front of a fifo, serialized at `now`, to the
+ * release queue after the delay, and puts the next one on the wire.
+ */
+static void finish_head(relay_t* relay, int d, uint64_t now) {
+  direction_t* dir = &(relay->dir[d]);
+  const shaping_t* shaping = &(dir->shaping);
+  queued_t head = dir->fifo.front();
+  dir->fifo.pop_front();
+
+  int64_t delay = (int64_t)shaping->delay_ns;
+  if (shaping->jitter_ns > 0) {
+    delay += (int64_t)(next_random(relay) % (2 * shaping->jitter_ns + 1)) -
+             (int64_t)shaping->jitter_ns;
+    if (delay < 0) delay = 0;
+  }
+  relay->lens[head.slot] = head.len;
+  relay->queue.push({now + delay, relay->seq++, head.slot, d});
+
+  if (!dir->fifo.empty()) {
+    dir->head_done_ns = serialized_at(shaping, now, dir->fifo.front().len);
+  }
+}
+
+/**
+ * Applies the next trace entry at `now` and schedules the one after it.
+ */
+static void apply_trace(relay_t* relay, uint64_t now) {
+  trace_t* trace = &(relay->trace);
+  const trace_entry_t* entry = &(trace->entries[trace->next]);
+
+  for (int d = FORWARD; d <= (relay->symmetric ? REVERSE : FORWARD); d++) {
+    direction_t* dir = &(relay->dir[d]);
+    shaping_t* shaping = &(dir->shaping);
+    *shaping = dir->base;
+    if (entry->rate_mbps >= 0) {
+      shaping->rate_bps = (uint64_t)(entry->rate_mbps * 1e6);
+      shaping->down = shaping->rate_bps == 0;
+    }
+    if (entry->delay_ms >= 0) {
+      shaping->delay_ns = (uint64_t)(entry->delay_ms * 1e6);
+    }
+    if (entry->loss >= 0) shaping->loss = entry->loss;
+    // A datagram already on the wire keeps its time; one waiting for the
+    // link to come up starts now.
+    if (!dir->fifo.empty() && dir->head_done_ns == RELAY_NEVER) {
+      dir->head_done_ns = serialized_at(shaping, now, dir->fifo.front().len);
+    }
+  }
+  trace->changes++;
+
+  if (++trace->next == trace->entries.size()) {
+    if (trace->period_ns == 0) {
+      trace->next_ns = RELAY_NEVER;
+      return;
+    }
+    trace->next = 0;
+    trace->cycle_ns += trace->period_ns;
+  }
+  trace->next_ns = trace->cycle_ns + trace->entries[trace->next].at_ns;
+}
+
+/**
+ * Handles every trace change and finished serialization up to `now`, in
+ * the order they are due.
+ */
+static void advance(relay_t* relay, uint64_t now) {
+  for (;;) {
+    uint64_t due = relay->trace.next_ns;
+    int which = -1;
+    // A datagram finishing when the trace changes was sent at the old rate.
+    for (int d = FORWARD; d <= REVERSE; d++) {
+      const direction_t* dir = &(relay->dir[d]);
+      if (!dir->fifo.empty() && dir->head_done_ns <= due) {
+        due = dir->head_done_ns;
+        which = d;
+      }
+    }
+    if (due == RELAY_NEVER || due > now) return;
+    if (which < 0) {
+      apply_trace(relay, due);
+    } else {
+      finish_head(relay, which, due);
+    }
+  }
+}
+
+/**
+ * Reads every datagram waiting on one side, RELAY_BATCH at a time, and
+ * queues the ones the link admits.
+ */
+static void receive(relay_t* relay, int d) {
+  struct mmsghdr msgs[RELAY_BATCH];
+  struct iovec iov[RELAY_BATCH];
+  struct sockaddr_in from[RELAY_BATCH];
+  uint32_t slots[RELAY_BATCH];
+  direction_t* dir = &(relay->dir[d]);
+
+  for (;;) {
+    // The limits keep at least RELAY_BATCH slots free, see main().
+    memset(msgs, 0, sizeof(msgs));
+    for (int i = 0; i < RELAY_BATCH; i++) {
+      slots[i] = relay->free_slots.back();
+      relay->free_slots.pop_back();
+      iov[i].iov_base = slot_buf(relay, slots[i]);
+      iov[i].iov_len = RELAY_MAX_LEN;
+      msgs[i].msg_hdr.msg_iov = &iov[i];
+      msgs[i].msg_hdr.msg_iovlen = 1;
+      msgs[i].msg_hdr.msg_name = &from[i];
+      msgs[i].msg_hdr.msg_namelen = sizeof(from[i]);
+    }
+    int count = recvmmsg(relay->fd[d], msgs, RELAY_BATCH, MSG_DONTWAIT, NULL);
+    if (count < 0) count = 0;
+    uint64_t now = monotonic_ns();
+
+    // The trace starts with the client's first datagram.
+    trace_t* trace = &(relay->trace);
+    if (d == FORWARD && count > 0 && trace->cycle_ns == 0 &&
+        !trace->entries.empty()) {
+      trace->cycle_ns = now;
+      trace->next_ns = now + trace->entries[0].at_ns;
+    }
+    advance(relay, now);
+
+    for (int i = 0; i < RELAY_BATCH; i++) {
+      uint32_t len = msgs[i].msg_len;
+      bool keep = false;
+
+      if (i < count && !(msgs[i].msg_hdr.msg_flags & MSG_TRUNC)) {
+        if (d == FORWARD) {
+          relay->client = from[i];
+          relay->have_client = true;
+        }
+        // Replies have nowhere to go until the client has sent something.
+        keep = (d == FORWARD || relay->have_client) &&
+               admit(relay, dir, slots[i], len, now);
+      }
+      if (!keep) relay->free_slots.push_back(slots[i]);
+    }
+    if (count < RELAY_BATCH) return;
+  }
+}
+
+/**
+ * Sends the first `count` datagrams of a batch and frees their slots. A
+ * datagram the socket refuses is dropped.
+ */
+static void flush(relay_t* relay, int d, struct mmsghdr* msgs,
+                  uint32_t* slots, int count) {
+  direction_t* dir = &(relay->dir[d]);
+  int sent = 0;
+
+  while (sent < count) {
+    int n = sendmmsg(relay->fd[d == FORWARD ? REVERSE : FORWARD], msgs + sent,
+                     count - sent, 0);
+    if (n < 0) {
+      if (errno == EINTR) continue;
+      // Skip the datagram at fault and carry on with the rest.
+      dir->send_errors++;
+      n = 1;
+    } else {
+      dir->delivered += n;
+    }
+    sent += n;
+  }
+  for (int i = 0; i < count; i++) relay->free_slots.push_back(slots[i]);
+  dir->held -= count;
+}
+
+/**
+ * Sends every datagram whose release time has come, one sendmmsg() per
+ * RELAY_BATCH datagrams in each direction.
+ */
+static void release_due(relay_t* relay) {
+  struct mmsghdr msgs[2][RELAY_BATCH];
+  struct iovec iov[2][RELAY_BATCH];
+  uint32_t slots[2][RELAY_BATCH];
+  int count[2] = {0, 0};
+  uint64_t now = monotonic_ns();
+
+  advance(relay, now);
+  while (!relay->queue.empty() && relay->queue.top().release_ns <= now) {
+    held_t held = relay->queue.top();
+    relay->queue.pop();
+
+    int d = held.dir;
+    int i = count[d]++;
+    memset(&msgs[d][i], 0, sizeof(msgs[d][i]));
+    iov[d][i].iov_base = slot_buf(relay, held.slot);
+    iov[d][i].iov_len = relay->lens[held.slot];
+    msgs[d][i].msg_hdr.msg_iov = &iov[d][i];
+    msgs[d][i].msg_hdr.msg_iovlen = 1;
+    // The server side is connected; replies go to the client's address.
+    if (d == REVERSE) {
+      msgs[d][i].msg_hdr.msg_name = &(relay->client);
+      msgs[d][i].msg_hdr.msg_namelen = sizeof(relay->client);
+    }
+    slots[d][i] = held.slot;
+    if (count[d] == RELAY_BATCH) {
+      flush(relay, d, msgs[d], slots[d], count[d]);
+      count[d] = 0;
+    }
+  }
+  for (int d = FORWARD; d <= REVERSE; d++) {
+    if (count[d] > 0) flush(relay, d, msgs[d], slots[d], count[d]);
+  }
+}
+
+/**
+ * Arms the timer for the earliest release, serialization or trace change,
+ * or disarms it if there is none.
+ */
+static void arm_timer(relay_t* relay) {
+  uint64_t due = relay->trace.next_ns;
+  if (!relay->queue.empty() && relay->queue.top().release_ns < due) {
+    due = relay->queue.top().release_ns;
+  }
+  for (int d = FORWARD; d <= REVERSE; d++) {
+    const direction_t* dir = &(relay->dir[d]);
+    if (!dir->fifo.empty() && dir->head_done_ns < due) {
+      due = dir->head_done_ns;
+    }
+  }
+
+  struct itimerspec spec;
+  memset(&spec, 0, sizeof(spec));
+  if (due != RELAY_NEVER) {
+    spec.it_value.tv_sec = due / 1000000000ull;
+    spec.it_value.tv_nsec = due % 1000000000ull;
+    // A zero it_value would disarm the timer instead.
+    if (due == 0) spec.it_value.tv_nsec = 1;
+  }
+  timerfd_settime(relay->timer_fd, TFD_TIMER_ABSTIME, &spec, NULL);
+}
+
+static void write_direction(FILE* f, const char* name, const direction_t* dir) {
+  fprintf(f,
+          "\"%s\": {\"packets\": %lu, \"bytes\": %lu, \"losses\": %lu, "
+          "\"queue_drops\": %lu, \"max_queue\": %u, \"delivered\": %lu, "
+          "\"send_errors\": %lu}",
+          name, (unsigned long)dir->packets, (unsigned long)dir->bytes,
+          (unsigned long)dir->losses, (unsigned long)dir->queue_drops,
+          dir->max_held, (unsigned long)dir->delivered,
+          (unsigned long)dir->send_errors);
+}
+
+static void write_stats(const relay_t* relay, const char* path) {
+  FILE* f = fopen(path, "w");
+  if (f == NULL) {
+    perror("ERROR opening the stats file");
+    return;
+  }
+  fprintf(f, "{");
+  write_direction(f, "forward", &(relay->dir[FORWARD]));
+  fprintf(f, ", ");
+  write_direction(f, "reverse", &(relay->dir[REVERSE]));
+  fprintf(f, ", \"trace_changes\": %lu}\n",
+          (unsigned long)relay->trace.changes);
+  fclose(f);
+}
+
+/**
+ * Parses one trace field: "-" or a number in [0, max].
+ *
+ * @return false if the field is invalid.
+ */
+static bool parse_trace_field(const char* token, double max, double* value) {
+  if (strcmp(token, "-") == 0) {
+    *value = -1;
+    return true;
+  }
+  char* end;
+  *value = strtod(token, &end);
+  return end != token && *end == '\0' && *value >= 0 && *value <= max;
+}
+
+/**
+ * Reads a trace file in the format described at the top of this file.
+ *
+ * @return false after printing the offending line if the file is invalid.
+ */
+static bool load_trace(const char* path, trace_t* trace) {
+  FILE* f = fopen(path, "r");
+  if (f == NULL) {
+    perror("ERROR opening the trace");
+    return false;
+  }
+  char line[RELAY_TRACE_LINE];
+  int line_no = 0;
+  bool ok = true;
+
+  while (ok && fgets(line, sizeof(line), f) != NULL) {
+    line_no++;
+    char* comment = strchr(line, '#');
+    if (comment != NULL) *comment = '\0';
+    char* tokens[5];
+    int count = 0;
+    for (char* token = strtok(line, " \t\r\n"); token != NULL && count < 5;
+         token = strtok(NULL, " \t\r\n")) {
+      tokens[count++] = token;
+    }
+    if (count == 0) continue;
+
+    double at_ms;
+    trace_entry_t entry;
+    ok = trace->period_ns == 0 && (count == 1 || count == 4) &&
+         parse_trace_field(tokens[0], 1e12, &at_ms) && at_ms >= 0;
+    if (ok) {
+      entry.at_ns = (uint64_t)(at_ms * 1e6);
+      ok = trace->entries.empty() ||
+           entry.at_ns > trace->entries.back().at_ns;
+    }
+    if (ok && count == 1) {
+      trace->period_ns = entry.at_ns;
+      ok = !trace->entries.empty();
+    } else if (ok) {
+      ok = parse_trace_field(tokens[1], 1e6, &entry.rate_mbps) &&
+           parse_trace_field(tokens[2], 1e6, &entry.delay_ms) &&
+           parse_trace_field(tokens[3], 1, &entry.loss);
+      if (ok) trace->entries.push_back(entry);
+    }
+  }
+  fclose(f);
+
+  if (!ok) {
+    fprintf(stderr, "ERROR in the trace %s, line %d\n", path, line_no);
+  } else if (trace->entries.empty()) {
+    fprintf(stderr, "ERROR the trace %s has no entries\n", path);
+    ok = false;
+  }
+  return ok;
+}
+
+static int open_socket(const char* ip, const char* port, bool listen) {
+  struct sockaddr_in addr;
+  memset(&addr, 0, sizeof(addr));
+  addr.sin_family = AF_INET;
+  addr.sin_port = htons(atoi(port));
+  if (inet_pton(AF_INET, ip, &(addr.sin_addr)) != 1) {
+    fprintf(stderr, "ERROR invalid address %s\n", ip);
+    return -1;
+  }
+
+  int fd = socket(AF_INET, SOCK_DGRAM, 0);
+  if (fd < 0) {
+    perror("ERROR opening socket");
+    return -1;
+  }
+  int size = RELAY_SOCKET_BUF;
+  setsockopt(fd, SOL_SOCKET, SO_RCVBUF, &size, sizeof(size));
+  setsockopt(fd, SOL_SOCKET, SO_SNDBUF, &size, sizeof(size));
+  int ret = listen ? bind(fd, (struct sockaddr*)&addr, sizeof(addr))
+                   : connect(fd, (struct sockaddr*)&addr, sizeof(addr));
+  if (ret < 0) {
+    perror(listen ? "ERROR on binding" : "ERROR on connect");
+    close(fd);
+    return -1;
+  }
+  return fd;
+}
+
+static void usage(const char* prog) {
+  fprintf(stderr,
+          "Usage: %s [--rate <Mbit/s>] [--delay <ms>] [--jitter <ms>] "
+          "[--loss <p>] [--limit <packets>] [--symmetric] [--seed <n>] "
+          "[--stats <file>] [--trace <file>] <listen-ip> <listen-port> "
+          "<server-ip> <server-port>\n",
+          prog);
+}
+
+int main(int argc, const char* argv[]) {
+  shaping_t shaping = {0, 0, 0, 0.0, RELAY_DEFAULT_LIMIT, false};
+  bool symmetric = false;
+  uint64_t seed = 0;
+  const char* stats_file = NULL;
+  const char* trace_file = NULL;
+  int argi = 1;
+
+  while (argi < argc && strncmp(argv[argi], "--", 2) == 0) {
+    const char* opt = argv[argi];
+    if (strcmp(opt, "--symmetric") == 0) {
+      symmetric = true;
+      argi++;
+      continue;
+    }
+    if (argi + 1 >= argc) break;
+    const char* value = argv[argi + 1];
+    if (strcmp(opt, "--rate") == 0) {
+      shaping.rate_bps = (uint64_t)(atof(value) * 1e6);
+    } else if (strcmp(opt, "--delay") == 0) {
+      shaping.delay_ns = (uint64_t)(atof(value) * 1e6);
+    } else if (strcmp(opt, "--jitter") == 0) {
+      shaping.jitter_ns = (uint64_t)(atof(value) * 1e6);
+    } else if (strcmp(opt, "--loss") == 0) {
+      shaping.loss = atof(value);
+    } else if (strcmp(opt, "--limit") == 0) {
+      shaping.limit = (uint32_t)atoi(value);
+    } else if (strcmp(opt, "--seed") == 0) {
+      seed = strtoull(value, NULL, 10);
+    } else if (strcmp(opt, "--stats") == 0) {
+      stats_file = value;
+    } else if (strcmp(opt, "--trace") == 0) {
+      trace_file = value;
+    } else {
+      break;
+    }
+    argi += 2;
+  }
+  if (argc - argi != 4 || shaping.loss < 0 || shaping.loss > 1 ||
+      shaping.limit == 0) {
+    usage(argv[0]);
+    return -1;
+  }
+
+  relay_t relay;
+  relay.dir[FORWARD] = direction_t();
+  relay.dir[REVERSE] = direction_t();
+  relay.dir[FORWARD].shaping = shaping;
+  if (symmetric) {
+    relay.dir[REVERSE].shaping = shaping;
+  } else {
+    relay.dir[REVERSE].shaping = {0, 0, 0, 0.0, shaping.limit, false};
+  }
+  relay.dir[FORWARD].base = relay.dir[FORWARD].shaping;
+  relay.dir[REVERSE].base = relay.dir[REVERSE].shaping;
+  relay.have_client = false;
+  relay.symmetric = symmetric;
+  relay.trace.period_ns = 0;
+  relay.trace.cycle_ns = 0;
+  relay.trace.next = 0;
+  relay.trace.next_ns = RELAY_NEVER;
+  relay.trace.changes = 0;
+  if (trace_file != NULL && !load_trace(trace_file, &(relay.trace))) {
+    return -1;
+  }
+  relay.rng = seed;
+  relay.seq = 0;
+
+  // Both directions at their limits still leave a batch of free slots.
+  uint32_t slot_count = 2 * shaping.limit + RELAY_BATCH;
+  relay.bufs.resize((size_t)slot_count * RELAY_MAX_LEN);
+  relay.lens.resize(slot_count);
+  for (uint32_t i = slot_count; i > 0; i--) relay.free_slots.push_back(i - 1);
+
+  relay.fd[FORWARD] = open_socket(argv[argi], argv[argi + 1], true);
+  if (relay.fd[FORWARD] < 0) return -1;
+  relay.fd[REVERSE] = open_socket(argv[argi + 2], argv[argi + 3], false);
+  if (relay.fd[REVERSE] < 0) return -1;
+  relay.timer_fd = timerfd_create(CLOCK_MONOTONIC, TFD_NONBLOCK);
+  if (relay.timer_fd < 0) {
+    perror("ERROR creating the timer");
+    return -1;
+  }
+  // The default slack lets the kernel defer a wakeup by 50 us.
+  prctl(PR_SET_TIMERSLACK, 1, 0, 0, 0);
+
+  // The signals are only delivered inside epoll_pwait(), so a stop request
+  // cannot slip in between the check and the wait.
+  sigset_t stop_signals, wait_mask;
+  sigemptyset(&stop_signals);
+  sigaddset(&stop_signals, SIGINT);
+  sigaddset(&stop_signals, SIGTERM);
+  sigprocmask(SIG_BLOCK, &stop_signals, &wait_mask);
+  struct sigaction action;
+  memset(&action, 0, sizeof(action));
+  action.sa_handler = on_stop_signal;
+  sigaction(SIGINT, &action, NULL);
+  sigaction(SIGTERM, &action, NULL);
+
+  int epoll_fd = epoll_create1(0);
+  int fds[3] = {relay.fd[FORWARD], relay.fd[REVERSE], relay.timer_fd};
+  for (int i = 0; i < 3; i++) {
+    struct epoll_event event;
+    memset(&event, 0, sizeof(event));
+    event.events = EPOLLIN;
+    event.data.u32 = i;
+    epoll_ctl(epoll_fd, EPOLL_CTL_ADD, fds[i], &event);
+  }
+
+  while (!stop_requested) {
+    struct epoll_event events[3];
+    int n = epoll_pwait(epoll_fd, events, 3, -1, &wait_mask);
+    if (n < 0) {
+      if (errno == EINTR) continue;
+      perror("ERROR in epoll_pwait");
+      break;
+    }
+    for (int i = 0; i < n; i++) {
+      uint32_t which = events[i].data.u32;
+      if (which == 2) {
+        uint64_t expirations;
+        // Fails with EAGAIN if the timer was re-armed after it fired.
+        ssize_t ret = read(relay.timer_fd, &expirations, sizeof(expirations));
+        (void)ret;
+      } else {
+        receive(&relay, which);
+      }
+    }
+    release_due(&relay);
+    arm_timer(&relay);
+  }
+
+  if (stats_file != NULL) write_stats(&relay, stats_file);
+  close(epoll_fd);
+  close(relay.timer_fd);
+  close(relay.fd[FORWARD]);
+  close(relay.fd[REVERSE]);
+  return 0;
+}
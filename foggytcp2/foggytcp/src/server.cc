@@ -9,42 +9,107 @@
  * forks in any public places.
  */
 
+#include <pthread.h>
+#include <signal.h>
+
 #include <fstream>
 #include <iostream>
 #include <cstring>
 using namespace std;
 
 #include "foggy_tcp.h"
+#include "foggy_timing.h"
 
 #define BUF_SIZE 4096
 
+/* foggy_read() never returns 0 for the foggy stack, so the experiment drivers
+ * stop the server with SIGTERM. foggy_read() sleeps on a condition variable
+ * that a signal does not wake, so SIGTERM and SIGINT are blocked in every
+ * thread and taken by stop_watcher() instead. It waits for the write in
+ * progress, closes the output file and only then writes the timing record,
+ * so the file is complete once the timing record exists. */
+static foggy_timing_t timing;
+static ofstream ofs;
+static pthread_mutex_t output_lock = PTHREAD_MUTEX_INITIALIZER;
+
+/**
+ * Waits for SIGTERM or SIGINT, finishes the output file and the timing record,
+ * then terminates the process with the same signal.
+ *
+ * @param arg The set of stop signals, blocked in all threads.
+ */
+static void* stop_watcher(void* arg) {
+  sigset_t* stop_signals = (sigset_t*)arg;
+  int sig;
+  if (sigwait(stop_signals, &sig) != 0) return NULL;
+
+  /* Never released: the main thread must not write to the closed file. */
+  pthread_mutex_lock(&output_lock);
+  ofs.close();
+  timing_write(&timing);
+
+  signal(sig, SIG_DFL);
+  pthread_sigmask(SIG_UNBLOCK, stop_signals, NULL);
+  raise(sig);
+  return NULL;
+}
+
 /**
  * This file implements a simple TCP server. Its purpose is to provide simple
  * test cases and demonstrate how the sockets will be used.
  *
- * Usage: ./server <server-ip> <server-port> <filename>
+ * Usage: ./server [--timing <file>] <server-ip> <server-port> <filename>
+ *
+ * --timing writes CLOCK_MONOTONIC timestamps of the transfer to <file> as a
+ * JSON line (see foggy_timing.h), also when the server is stopped by SIGTERM
+ * or SIGINT. The output file is flushed and closed before the timing record is
+ * written.
  *
  * For example:
  * ./server 10.0.1.1 3120 test.out
  */
 
 int main(int argc, const char* argv[]) {
-  if (argc != 4) {
-    cerr << "Usage: " << argv[0] << " <server-ip> <server-port> <filename>\n";
+  const char* timing_file = NULL;
+  int argi = 1;
+  if (argc > 2 && strcmp(argv[1], "--timing") == 0) {
+    timing_file = argv[2];
+    argi = 3;
+  }
+  if (argc - argi != 3) {
+    cerr << "Usage: " << argv[0]
+         << " [--timing <file>] <server-ip> <server-port> <filename>\n";
     return -1;
   }
 
-  const char* server_ip = argv[1];
-  const char* server_port = argv[2];
-  const char* filename = argv[3];
+  const char* server_ip = argv[argi];
+  const char* server_port = argv[argi + 1];
+  const char* filename = argv[argi + 2];
   struct timespec start_time;
 
+  if (timing_open(&timing, "server", timing_file) < 0) {
+    cerr << "Error: Can't open \"" << timing_file << "\"\n";
+    return -1;
+  }
+  /* Block the stop signals before foggy_socket() starts the backend thread,
+   * which inherits the mask. */
+  static sigset_t stop_signals;
+  sigemptyset(&stop_signals);
+  sigaddset(&stop_signals, SIGTERM);
+  sigaddset(&stop_signals, SIGINT);
+  pthread_sigmask(SIG_BLOCK, &stop_signals, NULL);
+  pthread_t watcher;
+  pthread_create(&watcher, NULL, stop_watcher, &stop_signals);
+  pthread_detach(watcher);
+
   /* Create a listener socket */
+  timing.handshake_start_ns = monotonic_ns();
   void* sock = foggy_socket(TCP_LISTENER, server_port, server_ip);
+  timing.handshake_end_ns = monotonic_ns();
 
   /* Open the output file. If the file can't be opened, print an error message
    * and return -1 */
-  ofstream ofs(filename);
+  ofs.open(filename);
   if (!ofs) {
     cerr << "Error: Can't open \"" << filename << "\"\n";
     return -1;
@@ -62,10 +127,12 @@ int main(int argc, const char* argv[]) {
     if (bytes_read <= 0)
       break;
 
+    pthread_mutex_lock(&output_lock);
     if (first_packet) {
       /* Extract start time from first packet */
       if (bytes_read < sizeof(start_time)) {
         cerr << "Error: First packet too small to contain timestamp\n";
+        pthread_mutex_unlock(&output_lock);
         return -1;
       }
       
@@ -76,18 +143,26 @@ int main(int argc, const char* argv[]) {
       if (actual_data_size > 0) {
         ofs.write(buf + sizeof(start_time), actual_data_size);
       }
+      timing_data(&timing, actual_data_size);
       first_packet = false;
     } else {
       ofs.write((char*)buf, bytes_read);
+      timing_data(&timing, bytes_read);
     }
+    pthread_mutex_unlock(&output_lock);
   }
 
   struct timespec end_time;
   timespec_get(&end_time, TIME_UTC);
 
-  /* Close the socket and the output file */
-  foggy_close(sock);
+  /* Close the output file and the socket. The lock is kept so a late stop
+   * signal does not write the timing record a second time. */
+  pthread_mutex_lock(&output_lock);
   ofs.close();
+  timing.close_start_ns = monotonic_ns();
+  foggy_close(sock);
+  timing.close_end_ns = monotonic_ns();
+  timing_write(&timing);
 
   time_t transmission_time = (end_time.tv_sec - start_time.tv_sec) * 1000 +
                              (end_time.tv_nsec - start_time.tv_nsec) / 1000000;
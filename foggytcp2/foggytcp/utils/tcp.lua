@@ -22,9 +22,68 @@ local f_plen  = ProtoField.uint16("cmutcp.plen", "Packet Length")
 local f_flags  = ProtoField.uint8("cmutcp.flags", "Flags")
 local f_advertised_window  = ProtoField.uint16("cmutcp.advertised_window", "Advertised Window")
 local f_extension_length  = ProtoField.uint16("cmutcp.extension_length", "Extension Length")
-local f_extension_data = ProtoField.string("cmutcp.extension_data", "Extension Data")
+local f_extension_data = ProtoField.bytes("cmutcp.extension_data", "Extension Data")
+local f_option_kind = ProtoField.uint8("cmutcp.option.kind", "Option Kind")
+local f_option_length = ProtoField.uint8("cmutcp.option.length", "Option Length")
+local f_sack_left = ProtoField.uint32("cmutcp.sack.left", "Left Edge")
+local f_sack_right = ProtoField.uint32("cmutcp.sack.right", "Right Edge")
+local f_wscale_shift = ProtoField.uint8("cmutcp.wscale.shift", "Shift Count")
 
-tcp.fields = { f_identifier, f_source_port, f_destination_port, f_seq_num, f_ack_num, f_hlen, f_plen, f_flags, f_advertised_window, f_extension_length , f_extension_data}
+tcp.fields = { f_identifier, f_source_port, f_destination_port, f_seq_num, f_ack_num, f_hlen, f_plen, f_flags, f_advertised_window, f_extension_length , f_extension_data, f_option_kind, f_option_length, f_sack_left, f_sack_right, f_wscale_shift}
+
+-- Option kinds, see foggytcp/inc/foggy_sack.h and foggy_wscale.h
+local OPTION_END = 0
+local OPTION_NOP = 1
+local OPTION_WSCALE = 3
+local OPTION_SACK = 5
+
+-- Shows the options in the extension area and returns a summary of the SACK
+-- blocks for the info column
+local function dissect_options(ext, tree)
+   local pos = 0
+   local summary = ""
+   while pos < ext:len() do
+      local kind = ext(pos,1):uint()
+      if kind == OPTION_END then
+         break
+      end
+      if kind == OPTION_NOP then
+         pos = pos + 1
+      else
+         if pos + 2 > ext:len() then
+            break
+         end
+         local len = ext(pos+1,1):uint()
+         if len < 2 or pos + len > ext:len() then
+            break
+         end
+         local name = "Option"
+         if kind == OPTION_SACK then
+            name = "SACK"
+         elseif kind == OPTION_WSCALE then
+            name = "Window Scale"
+         end
+         local opt = tree:add(ext(pos,len), name)
+         opt:add(f_option_kind, ext(pos,1))
+         opt:add(f_option_length, ext(pos+1,1))
+         if kind == OPTION_WSCALE and len == 3 then
+            opt:add(f_wscale_shift, ext(pos+2,1))
+         end
+         if kind == OPTION_SACK then
+            for block = pos + 2, pos + len - 8, 8 do
+               local left = ext(block,4):uint()
+               local right = ext(block+4,4):uint()
+               local b = opt:add(ext(block,8), string.format("Block: %u-%u", left, right))
+               b:add(f_sack_left, ext(block,4))
+               b:add(f_sack_right, ext(block+4,4))
+               summary = summary .. string.format(" %u-%u", left, right)
+            end
+         end
+         pos = pos + len
+      end
+   end
+   return summary
+end
 
 function tcp.dissector(tvb, pInfo, root) -- Tvb, Pinfo, TreeItem
    if (tvb:len() ~= tvb:reported_len()) then
@@ -32,7 +91,8 @@ function tcp.dissector(tvb, pInfo, root) -- Tvb, Pinfo, TreeItem
       -- this can/may be re-enabled only for unfragmented UDP packets
    end
 
-   local t = root:add(tcp, tvb(0,25))
+   local hlen = tvb(16,2):uint()
+   local t = root:add(tcp, tvb(0,hlen))
    t:add(f_identifier, tvb(0,4))
    t:add(f_source_port, tvb(4,2))
    t:add(f_destination_port, tvb(6,2))
@@ -43,8 +103,15 @@ function tcp.dissector(tvb, pInfo, root) -- Tvb, Pinfo, TreeItem
    local f = t:add(f_flags, tvb(20,1))
    t:add(f_advertised_window, tvb(21,2))
    t:add(f_extension_length, tvb(23,2))
-   local extension_length = tvb(23,1):int()
-   t:add(f_extension_data, tvb(25,extension_length))
+   -- The extension follows the whole C struct, including the 8-byte
+   -- extension_data pointer, so it ends where the header does
+   local extension_length = tvb(23,2):uint()
+   local sack = ""
+   if extension_length > 0 and extension_length <= hlen then
+      local ext = tvb(hlen - extension_length, extension_length)
+      local e = t:add(f_extension_data, ext)
+      sack = dissect_options(ext, e)
+   end
 
 
    local flag = tvb(20,1):uint()
@@ -60,6 +127,9 @@ function tcp.dissector(tvb, pInfo, root) -- Tvb, Pinfo, TreeItem
    end
 
    pInfo.cols.protocol = "CMU TCP"
+   if sack ~= "" then
+      pInfo.cols.info:append(" SACK:" .. sack)
+   end
 end
 
 -- have to put the port for the server here
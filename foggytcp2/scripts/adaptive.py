@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+自适应试验次数: 序贯置信区间停止规则
+对同一丢包率/场景不断追加试验, 直到平均吞吐量置信区间的相对半宽低于目标值, 或达到最大试验次数
+
+相对半宽 = t(conf, n-1) * s / sqrt(n) / mean, 例如 0.05 表示 "均值 ±5%"。
+experiment_mathis.py 与 benchmark_test.py 共用。
+"""
+
+import math
+import statistics
+
+# 停止原因 (写入 CSV 的 stop_reason 列)
+STOP_CI_REACHED = "ci_reached"
+STOP_MAX_TRIALS = "max_trials"
+STOP_FIXED = "fixed"  # 非自适应模式, 固定试验次数
+STOP_INTERRUPTED = "interrupted"  # 用户中止时该组尚未满足停止条件
+
+DEFAULT_CI_TARGET = 0.05
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_MIN_TRIALS = 3
+DEFAULT_MAX_TRIALS = 30
+
+
+def t_quantile(p, df):
+    """Student t 分布的 p 分位数 (不依赖 scipy)
+
+    df = 1, 2 使用解析解, 其余使用 Abramowitz & Stegun 26.7.5 展开式;
+    df >= 3 时 95% 置信水平误差约 0.1%, 99% 置信水平误差约 1%。
+    """
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+
+    z = statistics.NormalDist().inv_cdf(p)
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    g4 = (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160
+    return z + g1 / df + g2 / df ** 2 + g3 / df ** 3 + g4 / df ** 4
+
+
+def ci_relative_half_width(values, confidence=DEFAULT_CONFIDENCE):
+    """均值置信区间的相对半宽; 样本不足 2 个或均值为 0 时返回 inf"""
+    n = len(values)
+    if n < 2:
+        return math.inf
+    mean = statistics.mean(values)
+    if mean <= 0:
+        return math.inf
+    t = t_quantile(1 - (1 - confidence) / 2, n - 1)
+    return t * statistics.stdev(values) / math.sqrt(n) / mean
+
+
+class SequentialStopper:
+    """单个丢包率/场景的序贯停止规则
+
+    attempts 统计所有已执行的试验 (包括失败的), 保证全部失败时也会在 max_trials 处停止。
+    """
+
+    def __init__(self, ci_target=DEFAULT_CI_TARGET, confidence=DEFAULT_CONFIDENCE,
+                 min_trials=DEFAULT_MIN_TRIALS, max_trials=DEFAULT_MAX_TRIALS):
+        self.ci_target = ci_target
+        self.confidence = confidence
+        self.min_trials = min_trials
+        self.max_trials = max_trials
+        self.values = []
+        self.attempts = 0
+
+    def add(self, throughput):
+        """记录一次试验结果; 失败的试验传入 None"""
+        self.attempts += 1
+        if throughput is not None:
+            self.values.append(throughput)
+
+    @property
+    def ci(self):
+        return ci_relative_half_width(self.values, self.confidence)
+
+    def stop_reason(self):
+        """满足停止条件时返回原因, 否则返回 None"""
+        if len(self.values) >= self.min_trials and self.ci <= self.ci_target:
+            return STOP_CI_REACHED
+        if self.attempts >= self.max_trials:
+            return STOP_MAX_TRIALS
+        return None
+
+    def remaining(self):
+        return self.max_trials - self.attempts
+
+
+def add_arguments(parser):
+    """向 argparse 添加自适应模式参数"""
+    group = parser.add_argument_group("自适应试验次数")
+    group.add_argument("--adaptive", action="store_true",
+                       help="按置信区间决定每组试验次数, 代替固定次数")
+    group.add_argument("--ci-target", type=float, default=DEFAULT_CI_TARGET,
+                       help=f"目标相对半宽 (默认 {DEFAULT_CI_TARGET}, 即均值 ±5%%)")
+    group.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE,
+                       help=f"置信水平 (默认 {DEFAULT_CONFIDENCE})")
+    group.add_argument("--min-trials", type=int, default=DEFAULT_MIN_TRIALS,
+                       help=f"每组最少试验次数 (默认 {DEFAULT_MIN_TRIALS})")
+    group.add_argument("--max-trials", type=int, default=DEFAULT_MAX_TRIALS,
+                       help=f"每组最多试验次数 (默认 {DEFAULT_MAX_TRIALS})")
+
+
+def check_arguments(parser, args):
+    if not 0 < args.confidence < 1:
+        parser.error("--confidence 必须在 (0, 1) 之间")
+    if args.ci_target <= 0:
+        parser.error("--ci-target 必须 > 0")
+    if not 2 <= args.min_trials <= args.max_trials:
+        parser.error("需要 2 <= --min-trials <= --max-trials")
+
+
+def stopper_from_args(args):
+    return SequentialStopper(args.ci_target, args.confidence,
+                             args.min_trials, args.max_trials)
@@ -2,9 +2,12 @@
 # -*- coding: utf-8 -*-
 """
 Dr. Matt Mathis 假设验证 - 数据分析脚本
-执行线性回归、计算相关系数、生成可视化图表
+执行线性回归、计算相关系数、拟合按链路容量截断的 Mathis / PFTK 模型 (mathis_fit.py)、生成可视化图表
 """
 
+import argparse
+import math
+import re
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -12,6 +15,10 @@ from scipy import stats
 from pathlib import Path
 import sys
 
+import cwnd_trace
+import mathis_fit
+import results_store
+
 # 设置中文字体支持
 plt.rcParams['font.sans-serif'] = ['DejaVu Sans', 'SimHei', 'Arial Unicode MS']
 plt.rcParams['axes.unicode_minus'] = False
@@ -23,6 +30,10 @@ RESULTS_DIR = PROJECT_ROOT / "results"
 INPUT_CSV = RESULTS_DIR / "mathis_data.csv"
 OUTPUT_PLOT = RESULTS_DIR / "mathis_plot.png"
 OUTPUT_SUMMARY = RESULTS_DIR / "mathis_summary.txt"
+OUTPUT_CWND_PLOT = RESULTS_DIR / "mathis_cwnd.png"
+
+# experiment_mathis.py --trace 生成的追踪文件名
+TRACE_NAME = re.compile(r"loss(?P<loss>[0-9.eE+-]+)_trial(?P<trial>\d+)\.trace$")
 
 # TCP 参数
 MSS = 1400  # bytes (PDF理论值，用于公式计算)
@@ -45,22 +56,71 @@ def load_data():
     return df
 
 
+def load_store(root, runs):
+    """
+    从结果存储 (results_store.py) 读取 Mathis 实验的成功试验, 返回 (数据, [(分区, 汇总)])
+
+    各分区的汇总统计来自缓存, 只有新增或内容变化的分区需要重新统计;
+    模型拟合的 bootstrap 和散点图需要逐点数据, 仍读取全部分区。
+    """
+    parts = [part for part in results_store.partitions(root, runs=runs,
+                                                       algorithms=[results_store.MATHIS_ALGORITHM])
+             if results_store.scenario_loss(part.scenario) is not None]
+    if not parts:
+        print(f"[错误] 结果存储 {root} 中没有{'指定运行的' if runs else ''} Mathis 实验数据")
+        print("请先运行 experiment_mathis.py, 或用 results_store.py --import 导入已有的 CSV")
+        sys.exit(1)
+
+    summaries, counts = results_store.summarize(parts, root)
+    frames = [pd.DataFrame(results_store.read(part.path)).assign(run_id=part.run_id) for part in parts]
+    df = pd.concat(frames, ignore_index=True)
+    if 'success' in df:
+        df = df[df['success'].astype(bool)].reset_index(drop=True)
+    print(f"[加载] 结果存储 {root}: {len({part.run_id for part in parts})} 次运行, {len(parts)} 个分区, "
+          f"{len(df)} 条成功记录 (汇总缓存命中 {counts['cached']}, 重新统计 {counts['computed']})")
+    print(f"\n数据预览:")
+    print(df.head())
+
+    return df, summaries
+
+
 # ============ 数据分析 ============
 
-def calculate_statistics(df):
-    """计算统计量"""
+def store_grouped(summaries):
+    """由各分区的汇总合并出每个丢包率的统计量 (与 calculate_statistics 的表格相同), 不读取逐点数据"""
+    by_loss = {}
+    for part, stats in summaries:
+        by_loss.setdefault(results_store.scenario_loss(part.scenario), []).append(stats)
+    rows = []
+    for loss_rate in sorted(by_loss):
+        summary = results_store.column_summary(results_store.merge_stats(by_loss[loss_rate]),
+                                               'throughput_mbps')
+        if summary is None:
+            continue
+        count, mean, std, low, high = summary
+        rows.append((loss_rate, mean, std if count > 1 else np.nan, low, high, count, 1 / math.sqrt(loss_rate)))
+    grouped = pd.DataFrame(rows, columns=['loss_rate', 'Mean Throughput', 'Std Dev', 'Min', 'Max',
+                                          'Count', '1/sqrt(p)'])
+    return grouped.set_index('loss_rate')
+
+
+def calculate_statistics(df, summaries=None):
+    """计算统计量; summaries 为结果存储中各分区的汇总时由其合并, 否则由 df 分组计算"""
     print("\n" + "=" * 60)
     print("数据统计分析")
     print("=" * 60)
 
-    # 按丢包率分组统计
-    grouped = df.groupby('loss_rate').agg({
-        'throughput_mbps': ['mean', 'std', 'min', 'max', 'count'],
-        '1_over_sqrt_p': 'first'
-    })
+    if summaries is not None:
+        grouped = store_grouped(summaries)
+    else:
+        # 按丢包率分组统计
+        grouped = df.groupby('loss_rate').agg({
+            'throughput_mbps': ['mean', 'std', 'min', 'max', 'count'],
+            '1_over_sqrt_p': 'first'
+        })
 
-    # Rename columns
-    grouped.columns = ['Mean Throughput', 'Std Dev', 'Min', 'Max', 'Count', '1/sqrt(p)']
+        # Rename columns
+        grouped.columns = ['Mean Throughput', 'Std Dev', 'Min', 'Max', 'Count', '1/sqrt(p)']
 
     print("\nStatistics by Loss Rate:")
     print(grouped.to_string())
@@ -69,9 +129,9 @@ def calculate_statistics(df):
 
 
 def linear_regression(df):
-    """线性回归分析"""
+    """线性回归分析 (直接回归, 未考虑链路带宽截断, 作为对照)"""
     print("\n" + "=" * 60)
-    print("线性回归分析")
+    print("线性回归分析 (未考虑链路截断)")
     print("=" * 60)
 
     # 使用所有数据点进行回归
@@ -124,6 +184,26 @@ def linear_regression(df):
     }
 
 
+def model_fit(df, resamples, seed):
+    """截断的 Mathis / PFTK 模型拟合, C 带 bootstrap 置信区间; 没有 p > 0 的数据时返回 None"""
+    print("\n" + "=" * 60)
+    print("模型拟合 (按链路容量截断)")
+    print("=" * 60)
+
+    fits = mathis_fit.fit([df], resamples=resamples, seed=seed, mss=MSS, rtt=RTT)[0]
+    if fits is None:
+        print("\n[警告] 没有丢包率大于 0 的数据, 跳过模型拟合")
+        return None
+    if resamples > 0:
+        print(f"\n{fits['mathis']['points']} 个数据点, {resamples} 次分层 bootstrap 重抽样, "
+              f"{mathis_fit.CONFIDENCE:.0%} 置信区间")
+    else:
+        print(f"\n{fits['mathis']['points']} 个数据点, 不计算置信区间")
+    for model, entry in fits.items():
+        print(f"  {mathis_fit.format_fit(model, entry)}")
+    return fits
+
+
 def correlation_analysis(df):
     """相关性分析"""
     print("\n" + "=" * 60)
@@ -164,7 +244,7 @@ def correlation_analysis(df):
 
 # ============ 可视化 ============
 
-def create_plot(df, grouped, regression_results, correlation_results):
+def create_plot(df, grouped, regression_results, correlation_results, fits):
     """创建回归分析图表"""
     print("\n" + "=" * 60)
     print("生成可视化图表")
@@ -193,6 +273,17 @@ def create_plot(df, grouped, regression_results, correlation_results):
     ax.plot(x_line, y_line, 'r--', linewidth=3,
             label=f"Regression: y = {regression_results['slope']:.4f}x + {regression_results['intercept']:.4f}")
 
+    # 4. Clipped model fits
+    if fits is not None:
+        p_line = 1 / x_line ** 2
+        for model, style in (('mathis', 'g-'), ('pftk', 'm-.')):
+            entry = fits[model]
+            y_model = mathis_fit.model_throughput(model, p_line, entry['C'], MSS, RTT)
+            if entry['capacity'] is not None:
+                y_model = np.minimum(y_model, entry['capacity'])
+            ax.plot(x_line, y_model, style, linewidth=2.5,
+                    label=f"{'Mathis' if model == 'mathis' else 'PFTK'} (clipped): C = {entry['C']:.4f}")
+
     # Labels and title
     ax.set_xlabel('1/sqrt(p)', fontsize=16, fontweight='bold')
     ax.set_ylabel('Throughput (Mbps)', fontsize=16, fontweight='bold')
@@ -206,9 +297,16 @@ def create_plot(df, grouped, regression_results, correlation_results):
     ax.grid(True, alpha=0.3, linestyle='--', linewidth=0.8)
 
     # Add statistics text box
-    textstr = '\n'.join([
-        f"Constant C = {regression_results['C']:.4f}",
+    lines = [
+        f"Constant C = {regression_results['C']:.4f} (naive)",
         f"R-squared = {regression_results['r_squared']:.4f}",
+    ]
+    if fits is not None:
+        lines.append(f"Clipped Mathis C = {fits['mathis']['C']:.4f}")
+        if fits['mathis']['C_ci'] is not None:
+            low, high = fits['mathis']['C_ci']
+            lines.append(f"  CI [{low:.4f}, {high:.4f}]")
+    textstr = '\n'.join(lines + [
         f"Pearson r = {correlation_results['pearson_r']:.4f}",
         f"",
         f"MSS = {MSS} bytes",
@@ -232,9 +330,68 @@ def create_plot(df, grouped, regression_results, correlation_results):
     # plt.show()  # 取消注释以显示图表
 
 
+def load_traces(trace_dir):
+    """读取目录中的追踪文件, 返回 {丢包率: [(试验编号, 记录数组), ...]}"""
+    traces = {}
+    for path in sorted(Path(trace_dir).glob("*.trace")):
+        m = TRACE_NAME.search(path.name)
+        if m is None:
+            continue
+        try:
+            records = cwnd_trace.load(path)
+        except cwnd_trace.TraceFormatError as e:
+            print(f"[跳过] {e}")
+            continue
+        traces.setdefault(float(m.group("loss")), []).append((int(m.group("trial")), records))
+    for trials in traces.values():
+        trials.sort(key=lambda t: t[0])
+    return traces
+
+
+def create_cwnd_plot(trace_dir):
+    """每个丢包率一个子图, 画出每次试验的拥塞窗口锯齿 (以 MSS 为单位)"""
+    print("\n" + "=" * 60)
+    print("生成拥塞窗口图表")
+    print("=" * 60)
+
+    traces = load_traces(trace_dir)
+    if not traces:
+        print(f"[警告] {trace_dir} 中没有追踪文件 (experiment_mathis.py --trace 生成)")
+        return
+
+    loss_rates = sorted(traces)
+    cols = min(len(loss_rates), 2)
+    rows = math.ceil(len(loss_rates) / cols)
+    fig, axes = plt.subplots(rows, cols, figsize=(8 * cols, 4 * rows), squeeze=False)
+
+    for ax, loss_rate in zip(axes.flat, loss_rates):
+        for trial, records in traces[loss_rate]:
+            t = cwnd_trace.relative_seconds(records)
+            ax.plot(t, records['cwnd'] / MSS, linewidth=0.8, label=f"Trial {trial}")
+            retransmit = records['event'] == 2  # TRACE_FAST_RETRANSMIT
+            ax.plot(t[retransmit], records['cwnd'][retransmit] / MSS, 'x',
+                    markersize=4, color='red')
+            timeout = records['event'] == 3  # TRACE_RTO
+            ax.plot(t[timeout], records['cwnd'][timeout] / MSS, 'o',
+                    markersize=4, color='black', fillstyle='none')
+        ax.set_title(f"Loss Rate = {loss_rate * 100:g}%", fontsize=12)
+        ax.set_xlabel('Time (s)')
+        ax.set_ylabel('cwnd (MSS)')
+        ax.grid(True, alpha=0.3, linestyle='--')
+        if len(traces[loss_rate]) <= 10:
+            ax.legend(fontsize=8, loc='upper right')
+    for ax in axes.flat[len(loss_rates):]:
+        ax.set_visible(False)
+
+    fig.suptitle('Congestion Window per Trial (x = fast retransmit, o = RTO)', fontsize=14, fontweight='bold')
+    plt.tight_layout()
+    plt.savefig(OUTPUT_CWND_PLOT, dpi=200, bbox_inches='tight')
+    print(f"\n[保存] 拥塞窗口图表已保存到: {OUTPUT_CWND_PLOT}")
+
+
 # ============ 生成摘要报告 ============
 
-def generate_summary(df, grouped, regression_results, correlation_results):
+def generate_summary(df, grouped, regression_results, correlation_results, fits):
     """生成文本摘要报告"""
     print("\n" + "=" * 60)
     print("生成摘要报告")
@@ -261,7 +418,7 @@ def generate_summary(df, grouped, regression_results, correlation_results):
         f.write("\n\n")
 
         # Linear Regression Results
-        f.write("Linear Regression Results\n")
+        f.write("Linear Regression Results (naive, ignores link capacity)\n")
         f.write("-" * 60 + "\n")
         f.write(f"Regression Equation: throughput = {regression_results['slope']:.6f} × (1/sqrt(p)) + {regression_results['intercept']:.6f}\n")
         f.write(f"Slope: {regression_results['slope']:.6f}\n")
@@ -271,6 +428,18 @@ def generate_summary(df, grouped, regression_results, correlation_results):
         f.write(f"Standard Error: {regression_results['std_err']:.6f}\n")
         f.write(f"\nConstant C: {regression_results['C']:.6f}\n\n")
 
+        # Model Fits
+        if fits is not None:
+            f.write("Model Fits (clipped at link capacity, least squares)\n")
+            f.write("-" * 60 + "\n")
+            f.write("mathis: throughput = min(cap, MSS/RTT × C/sqrt(p))\n")
+            f.write(f"pftk:   Padhye et al. with timeout term, T0 = {mathis_fit.RTO * 1000:.0f} ms\n")
+            if fits['mathis']['C_ci'] is not None:
+                f.write(f"Intervals: {mathis_fit.CONFIDENCE:.0%} stratified bootstrap percentile\n")
+            for model, entry in fits.items():
+                f.write(mathis_fit.format_fit(model, entry).replace("无截断", "no clipping") + "\n")
+            f.write("\n")
+
         # Correlation Analysis
         f.write("Pearson Correlation Analysis\n")
         f.write("-" * 60 + "\n")
@@ -305,39 +474,117 @@ def generate_summary(df, grouped, regression_results, correlation_results):
         f.write(f"2. Pearson correlation coefficient r = {correlation_results['pearson_r']:.4f}, ")
         f.write(f"indicates {correlation_results['strength']}\n")
 
-        f.write(f"3. Constant C = {regression_results['C']:.4f}, ")
-        if 0.5 <= regression_results['C'] <= 2.0:
-            f.write("within theoretical expected range (0.5-2.0)\n")
+        # 常数 C 以截断的 Mathis 拟合为准; 直接回归的 C 受链路带宽限制影响, 仅在无法拟合时使用
+        if fits is not None:
+            C = fits['mathis']['C']
+            f.write(f"3. Constant C = {C:.4f} (clipped Mathis fit")
+            if fits['mathis']['C_ci'] is not None:
+                low, high = fits['mathis']['C_ci']
+                f.write(f", {mathis_fit.CONFIDENCE:.0%} CI [{low:.4f}, {high:.4f}]")
+                inside = 0.5 <= low and high <= 2.0
+                outside = high < 0.5 or low > 2.0
+            else:
+                inside = 0.5 <= C <= 2.0
+                outside = not inside
+            f.write("), ")
         else:
+            C = regression_results['C']
+            f.write(f"3. Constant C = {C:.4f}, ")
+            inside = 0.5 <= C <= 2.0
+            outside = not inside
+        if inside:
+            f.write("within theoretical expected range (0.5-2.0)\n")
+        elif outside:
             f.write("outside theoretical expected range (0.5-2.0)\n")
+        else:
+            f.write("confidence interval overlaps the edge of the expected range (0.5-2.0)\n")
 
     print(f"\n[保存] 摘要报告已保存到: {OUTPUT_SUMMARY}")
 
 
 # ============ 主函数 ============
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mathis 假设验证 - 数据分析")
+    parser.add_argument("--traces", metavar="DIR",
+                        help="同时绘制拥塞窗口追踪 (例如 results/runs/<run_id>/traces)")
+    parser.add_argument("--input", metavar="CSV",
+                        help=f"数据文件 (默认 {INPUT_CSV.name}; 例如 simulate_mathis.py 生成的 mathis_sim_data.csv),"
+                             " 输出文件名以其文件名为前缀")
+    parser.add_argument("--store", nargs="?", const=results_store.STORE_DIR, default=None, type=Path,
+                        metavar="DIR",
+                        help=f"改为从结果存储读取 (默认 {results_store.STORE_DIR}), 输出文件名以 mathis_store 为前缀")
+    parser.add_argument("--run", dest="runs", action="append", metavar="RUN",
+                        help="配合 --store: 只分析指定的 run_id, 可重复 (默认全部运行)")
+    parser.add_argument("--resamples", type=int, default=mathis_fit.RESAMPLES,
+                        help=f"模型拟合的 bootstrap 重抽样次数 (默认 {mathis_fit.RESAMPLES}, 0 表示不计算置信区间)")
+    parser.add_argument("--seed", type=int, default=0, help="bootstrap 随机数种子 (默认 0)")
+    args = parser.parse_args()
+    if args.store is not None and args.input:
+        parser.error("--store 与 --input 不能同时使用")
+    if args.runs and args.store is None:
+        parser.error("--run 需要 --store")
+    return args
+
+
+def use_input(path):
+    """改用另一个数据文件, 图表和摘要保存在它旁边, 文件名由它的文件名导出 (mathis_sim_data.csv -> mathis_sim_plot.png)"""
+    global INPUT_CSV, OUTPUT_PLOT, OUTPUT_SUMMARY, OUTPUT_CWND_PLOT
+    INPUT_CSV = Path(path)
+    stem = INPUT_CSV.stem
+    prefix = stem[:-len("_data")] if stem.endswith("_data") else stem
+    OUTPUT_PLOT = INPUT_CSV.with_name(f"{prefix}_plot.png")
+    OUTPUT_SUMMARY = INPUT_CSV.with_name(f"{prefix}_summary.txt")
+    OUTPUT_CWND_PLOT = INPUT_CSV.with_name(f"{prefix}_cwnd.png")
+
+
+def use_store(root):
+    """从结果存储读取时, 图表和摘要保存在存储目录旁边 (results/mathis_store_plot.png)"""
+    use_input(Path(root).parent / "mathis_store_data")
+
+
 def main():
+    args = parse_args()
+    if args.resamples < 0:
+        print("[错误] --resamples 不能为负数")
+        sys.exit(1)
+    if args.input:
+        use_input(args.input)
+    elif args.store is not None:
+        use_store(args.store)
+
     print("=" * 60)
     print("Dr. Matt Mathis 假设验证 - 数据分析")
     print("=" * 60)
 
     # 1. 加载数据
-    df = load_data()
+    summaries = None
+    if args.store is not None:
+        df, summaries = load_store(args.store, args.runs)
+    else:
+        df = load_data()
 
     # 2. 统计分析
-    grouped = calculate_statistics(df)
+    grouped = calculate_statistics(df, summaries)
 
     # 3. 线性回归
     regression_results = linear_regression(df)
 
-    # 4. 相关性分析
+    # 4. 截断模型拟合
+    fits = model_fit(df, args.resamples, args.seed)
+
+    # 5. 相关性分析
     correlation_results = correlation_analysis(df)
 
-    # 5. 生成图表
-    create_plot(df, grouped, regression_results, correlation_results)
+    # 6. 生成图表
+    create_plot(df, grouped, regression_results, correlation_results, fits)
+
+    # 7. 生成摘要报告
+    generate_summary(df, grouped, regression_results, correlation_results, fits)
 
-    # 6. 生成摘要报告
-    generate_summary(df, grouped, regression_results, correlation_results)
+    # 8. 拥塞窗口追踪 (可选)
+    if args.traces:
+        create_cwnd_plot(args.traces)
 
     print("\n" + "=" * 60)
     print("分析完成!")
@@ -345,8 +592,15 @@ def main():
     print(f"\n生成的文件:")
     print(f"  - 图表: {OUTPUT_PLOT}")
     print(f"  - 摘要: {OUTPUT_SUMMARY}")
+    if args.traces:
+        print(f"  - 拥塞窗口: {OUTPUT_CWND_PLOT}")
     print(f"\n关键结果:")
-    print(f"  - 常数 C: {regression_results['C']:.4f}")
+    if fits is not None:
+        for model, name in (('mathis', '截断的 Mathis 拟合'), ('pftk', 'PFTK 拟合')):
+            entry = fits[model]
+            ci = "" if entry['C_ci'] is None else " [{:.4f}, {:.4f}]".format(*entry['C_ci'])
+            print(f"  - 常数 C ({name}): {entry['C']:.4f}{ci}")
+    print(f"  - 常数 C (直接回归): {regression_results['C']:.4f}")
     print(f"  - R²: {regression_results['r_squared']:.4f}")
     print(f"  - Pearson r: {correlation_results['pearson_r']:.4f}")
 
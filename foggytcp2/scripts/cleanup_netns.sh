@@ -21,20 +21,16 @@ NS_CLIENT="ns_client"
 
 echo "[清理] 删除网络命名空间..."
 
-# 删除 server 命名空间
-if ip netns list | grep -q "^$NS_SERVER"; then
-    ip netns del $NS_SERVER
-    echo "  ✓ 已删除: $NS_SERVER"
-else
-    echo "  - $NS_SERVER 不存在"
-fi
-
-# 删除 client 命名空间
-if ip netns list | grep -q "^$NS_CLIENT"; then
-    ip netns del $NS_CLIENT
-    echo "  ✓ 已删除: $NS_CLIENT"
-else
-    echo "  - $NS_CLIENT 不存在"
+# 删除所有 server/client 命名空间 (包括 setup_netns.sh N 创建的编号组)
+found=0
+for ns in $(ip netns list | awk '{print $1}' | grep -E "^($NS_SERVER|$NS_CLIENT)[0-9]*$"); do
+    ip netns del $ns
+    echo "  ✓ 已删除: $ns"
+    found=1
+done
+
+if [ "$found" -eq 0 ]; then
+    echo "  - $NS_SERVER / $NS_CLIENT 不存在"
 fi
 
 echo ""
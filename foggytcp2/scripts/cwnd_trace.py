@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+读取 FOGGY_TRACE 生成的拥塞窗口二进制追踪文件 (格式见 foggytcp/inc/foggy_trace.h)
+
+客户端在环境变量 FOGGY_TRACE 指定的文件中, 每处理一个 ACK 或发生一次重传超时写入一条 32 字节记录。
+load() 用 np.memmap 直接映射文件, 不需要逐行解析文本。
+
+用法:
+  FOGGY_TRACE=/tmp/client.trace ./client ...
+  python3 cwnd_trace.py /tmp/client.trace
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b"FOGTRACE"
+VERSION = 1
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("version", "<u2"),
+    ("record_size", "<u2"),
+    ("dropped", "<u4"),
+])
+
+RECORD_DTYPE = np.dtype([
+    ("time_ns", "<u8"),
+    ("seq", "<u4"),
+    ("ack", "<u4"),
+    ("cwnd", "<u4"),
+    ("ssthresh", "<u4"),
+    ("bytes_in_flight", "<u4"),
+    ("state", "u1"),
+    ("event", "u1"),
+    ("reserved", "<u2"),
+])
+
+# reno_state_t / foggy_trace_event_t
+STATE_NAMES = {0: "slow_start", 1: "congestion_avoidance", 2: "fast_recovery"}
+EVENT_NAMES = {0: "ack", 1: "dup_ack", 2: "fast_retransmit", 3: "rto"}
+
+
+class TraceFormatError(Exception):
+    """文件不是 foggy 追踪文件, 或版本不兼容"""
+
+
+def read_header(path):
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) != 1 or header["magic"][0] != MAGIC:
+        raise TraceFormatError(f"不是 foggy 追踪文件: {path}")
+    if header["version"][0] != VERSION or header["record_size"][0] != RECORD_DTYPE.itemsize:
+        raise TraceFormatError(f"追踪文件版本不兼容: {path} (version={header['version'][0]})")
+    return header[0]
+
+
+def load(path):
+    """返回记录数组 (只读 np.memmap); 末尾不完整的记录 (进程被杀时) 会被忽略"""
+    read_header(path)
+    count = (Path(path).stat().st_size - HEADER_DTYPE.itemsize) // RECORD_DTYPE.itemsize
+    if count <= 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode="r",
+                     offset=HEADER_DTYPE.itemsize, shape=(count,))
+
+
+def relative_seconds(records):
+    """以第一条记录为 0 的时间轴 (秒)"""
+    if len(records) == 0:
+        return np.zeros(0)
+    return (records["time_ns"] - records["time_ns"][0]) / 1e9
+
+
+def summary(path):
+    header = read_header(path)
+    records = load(path)
+    lines = [f"{path}: {len(records)} 条记录, 丢弃 {header['dropped']} 条"]
+    if len(records) > 0:
+        duration = relative_seconds(records)[-1]
+        lines.append(f"  时长 {duration:.3f} s, cwnd 最大 {records['cwnd'].max()} bytes, "
+                     f"平均 {records['cwnd'].mean():.0f} bytes")
+        for code, name in EVENT_NAMES.items():
+            lines.append(f"  {name}: {int(np.count_nonzero(records['event'] == code))}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"用法: {sys.argv[0]} <trace文件>...")
+        sys.exit(1)
+    for arg in sys.argv[1:]:
+        print(summary(arg))
@@ -10,10 +10,15 @@ import signal
 import re
 from pathlib import Path
 
+import launcher
+import timing
+
 # 配置
 FOGGY_DIR = Path("/home/serennan/work/algo2/foggytcp2/foggytcp")
 TEST_FILE = Path("/home/serennan/work/algo2/foggytcp2/testdata/test_1mb.bin")
 OUTPUT_FILE = Path("/home/serennan/work/algo2/foggytcp2/results/debug_output.bin")
+CLIENT_TIMING = OUTPUT_FILE.with_name("debug_client_timing.json")
+SERVER_TIMING = OUTPUT_FILE.with_name("debug_server_timing.json")
 
 SERVER_BIN = FOGGY_DIR / "server"
 CLIENT_BIN = FOGGY_DIR / "client"
@@ -33,9 +38,10 @@ print()
 
 # 启动 server
 print("[1] 启动 server...")
-server_cmd = [str(SERVER_BIN), SERVER_IP, str(SERVER_PORT), str(OUTPUT_FILE)]
+server_cmd = [str(SERVER_BIN), "--timing", str(SERVER_TIMING), SERVER_IP, str(SERVER_PORT), str(OUTPUT_FILE)]
 print(f"    命令: {' '.join(server_cmd)}")
 
+start = time.monotonic()
 server_proc = subprocess.Popen(
     server_cmd,
     stdout=subprocess.PIPE,
@@ -43,20 +49,20 @@ server_proc = subprocess.Popen(
     text=True
 )
 print(f"    Server PID: {server_proc.pid}")
-time.sleep(1)  # 等待server启动
 
-# 检查server是否还在运行
-if server_proc.poll() is not None:
+# 等待server绑定端口
+if not launcher.wait_until_bound(server_proc, SERVER_PORT):
     print(f"    [错误] Server启动失败!")
+    server_proc.kill()
     stdout, stderr = server_proc.communicate()
     print(f"    stdout: {stdout}")
     print(f"    stderr: {stderr}")
     exit(1)
-print("    Server运行中...")
+print(f"    Server运行中... (就绪耗时 {(time.monotonic() - start) * 1000:.1f} ms)")
 
 # 启动 client
 print("\n[2] 启动 client...")
-client_cmd = [str(CLIENT_BIN), SERVER_IP, str(SERVER_PORT), str(TEST_FILE)]
+client_cmd = [str(CLIENT_BIN), "--no-wait", "--timing", str(CLIENT_TIMING), SERVER_IP, str(SERVER_PORT), str(TEST_FILE)]
 print(f"    命令: {' '.join(client_cmd)}")
 
 try:
@@ -128,8 +134,20 @@ except subprocess.TimeoutExpired:
     print("    [超时] Server未在5秒内退出,强制kill")
     server_proc.kill()
 
+# 程序内 CLOCK_MONOTONIC 计时 (与 experiment_mathis.py 使用的时长相同)
+print("\n[4] 读取计时文件...")
+client_timing = timing.load(CLIENT_TIMING)
+server_timing = timing.load(SERVER_TIMING)
+for name, record in (("client", client_timing), ("server", server_timing)):
+    print(f"    {name}: {record if record is not None else '(无)'}")
+transfer_ms = timing.transfer_ms(client_timing, server_timing)
+if transfer_ms is not None:
+    print(f"    传输时长: {transfer_ms:.1f} ms (客户端首字节 -> 服务器末字节)")
+else:
+    print(f"    [错误] {timing.RECOMPILE_HINT}")
+
 # 检查输出文件
-print("\n[4] 检查输出文件...")
+print("\n[5] 检查输出文件...")
 if OUTPUT_FILE.exists():
     output_size = OUTPUT_FILE.stat().st_size
     input_size = TEST_FILE.stat().st_size
@@ -5,30 +5,53 @@ Dr. Matt Mathis 假设验证实验脚本
 自动化执行不同丢包率下的吞吐量测试
 """
 
+import argparse
 import subprocess
+import threading
+import queue
 import time
 import csv
 import os
 import signal
 import sys
 import re
+import fcntl
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
 
+import adaptive
+import launcher
+import relay
+import results_store
+import tcp_stats
+import timing
+import traces
+from harness_daemon import (
+    DEFAULT_LOG_LEVEL, DEFAULT_SOCKET, LOG_LEVELS, HarnessClient, HarnessError, pacing_mode,
+)
+from journal import JournalError, RunJournal
+
 # ============ 配置参数 ============
 # Mathis 假设验证实验 - 使用系统 TCP (标准 TCP Reno)
-# 使用网络命名空间 + Python计时方案
+# 使用网络命名空间 + 程序内 CLOCK_MONOTONIC 计时 (client/server --timing)
 LOSS_RATES = [0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1]
-TRIALS_PER_LOSS = 10  # 每个丢包率重复次数 (PDF要求)
+TRIALS_PER_LOSS = 10  # 每个丢包率重复次数 (PDF要求); --adaptive 模式下由置信区间决定
 BANDWIDTH = "10Mbps"  # 带宽
 DELAY = "20ms"  # 单向延迟 (RTT = 40ms, PDF要求)
 TIMEOUT_SECONDS = 600  # 单次传输超时时间(秒)
+LOG_LEVEL = DEFAULT_LOG_LEVEL  # 传给 client/server 的 FOGGY_LOG_LEVEL, 可用 --log-level 修改
+PACING = None  # 传给 client 的 FOGGY_PACING, None 表示使用实现的默认值 (off), 可用 --pacing 修改
+NET_TRACE = None  # relay 回放的网络条件 trace 文件 (见 traces.py), 可用 --net-trace 设置 (需要 --relay)
 
-# 网络命名空间配置
+# 网络命名空间配置 (第 0 组; 第 i 组追加后缀 i, 见 setup_netns.sh)
 NS_SERVER = "ns_server"
 NS_CLIENT = "ns_client"
 INTERFACE = "veth_client"  # 客户端命名空间中的虚拟网卡
 SERVER_IP = "10.0.1.1"  # 服务器在命名空间中的IP
 CLIENT_IP = "10.0.1.2"  # 客户端在命名空间中的IP
+DEFAULT_WORKERS = 1  # 并行 worker 数 (每个 worker 独占一组命名空间)
 
 # 文件路径配置
 SCRIPT_DIR = Path(__file__).parent
@@ -37,6 +60,8 @@ FOGGY_DIR = PROJECT_ROOT / "foggytcp"
 TEST_FILE = PROJECT_ROOT / "testdata" / "test_10mb.bin"  # 使用1MB文件,传输更快
 RESULTS_DIR = PROJECT_ROOT / "results"
 OUTPUT_CSV = RESULTS_DIR / "mathis_data.csv"
+RUNS_DIR = RESULTS_DIR / "runs"  # 每次运行的 manifest + journal, 供 --resume 使用
+TRACE_SUBDIR = "traces"  # --trace 时拥塞窗口追踪文件保存在运行目录的该子目录
 
 SERVER_PORT = 15441
 SERVER_BIN = FOGGY_DIR / "server"
@@ -44,91 +69,185 @@ CLIENT_BIN = FOGGY_DIR / "client"
 
 # ============ 辅助函数 ============
 
-def cleanup_network():
+class NetnsPair:
+    """一组 server/client 网络命名空间, 由一个 worker 独占使用"""
+
+    def __init__(self, index):
+        suffix = "" if index == 0 else str(index)
+        self.index = index
+        self.ns_server = f"{NS_SERVER}{suffix}"
+        self.ns_client = f"{NS_CLIENT}{suffix}"
+        self.interface = f"{INTERFACE}{suffix}"
+        self.server_ip = f"10.0.{index + 1}.1"
+        self.client_ip = f"10.0.{index + 1}.2"
+        self.port = SERVER_PORT + index
+        self.tag = f"[W{index}]"
+        self.loss_rate = None  # 当前 tcconfig 已配置的丢包率
+
+    def exec_prefix(self, ns):
+        """在命名空间 ns 中执行命令的前缀"""
+        return ["sudo", "ip", "netns", "exec", ns]
+
+    def location(self, ns):
+        return f"命名空间: {ns}"
+
+    @property
+    def client_target(self):
+        """客户端连接的地址与端口"""
+        return self.server_ip, self.port
+
+
+class RelayPair(NetnsPair):
+    """
+    不使用命名空间的一组链路 (--relay): client -> relay -> server 都在本机回环上, 不需要 root
+
+    端口由内核分配并加锁占用 (relay.PortReservation), 多个实验进程可以同时运行。
+    网络参数由 relay 进程施加, 修改时重启 relay。
+    """
+
+    def __init__(self, index):
+        super().__init__(index)
+        self.server_ip = self.client_ip = relay.LOOPBACK
+        self.ports = relay.PortReservation(2)
+        self.port, self.relay_port = self.ports.ports
+        self.relay = None  # 当前运行的 relay.Relay
+
+    def renew_ports(self):
+        """换一组端口 (relay 绑定失败, 端口被其他程序占用)"""
+        self.port, self.relay_port = self.ports.renew()
+
+    def exec_prefix(self, ns):
+        return []
+
+    def location(self, ns):
+        return "本机回环, 经过 relay"
+
+    @property
+    def client_target(self):
+        return relay.LOOPBACK, self.relay_port
+
+
+def cleanup_network(pair):
     """清理网络限制配置"""
-    print(f"\n[清理] 删除网络接口 {INTERFACE} 上的所有限制...")
+    if isinstance(pair, RelayPair):
+        if pair.relay is not None:
+            pair.relay.stop()
+            pair.relay = None
+        pair.loss_rate = None
+        return
+    print(f"\n{pair.tag}[清理] 删除网络接口 {pair.interface} 上的所有限制...")
     try:
-        subprocess.run(["sudo", "ip", "netns", "exec", NS_CLIENT,
-                       "tcdel", INTERFACE, "--all"],
+        subprocess.run(["sudo", "ip", "netns", "exec", pair.ns_client,
+                       "tcdel", pair.interface, "--all"],
                       check=False, capture_output=True)
-        print("[清理] 网络限制已清除")
+        pair.loss_rate = None
+        print(f"{pair.tag}[清理] 网络限制已清除")
     except Exception as e:
-        print(f"[警告] 清理网络失败: {e}")
-
-
-def set_network_config(loss_rate):
+        print(f"{pair.tag}[警告] 清理网络失败: {e}")
+
+
+RELAY_START_ATTEMPTS = 3  # relay 启动失败 (通常是端口被占用) 时换端口重试的次数
+
+
+def set_relay_config(pair, loss_rate):
+    """以新的丢包率重启该组的 relay (不需要 sudo); 有 NET_TRACE 时每次试验从头回放"""
+    cleanup_network(pair)
+    for attempt in range(RELAY_START_ATTEMPTS):
+        if attempt > 0:
+            pair.renew_ports()
+            print(f"{pair.tag}[重试] relay 启动失败, 换用端口 {pair.relay_port} -> {pair.port}")
+        pair.relay = relay.Relay(pair.relay_port, pair.port, rate=BANDWIDTH, delay=DELAY,
+                                 loss=loss_rate, trace=NET_TRACE)
+        print(f"\n{pair.tag}[配置] relay: {pair.relay.describe()} "
+              f"(端口 {pair.relay_port} -> {pair.port})")
+        if pair.relay.start():
+            pair.loss_rate = loss_rate
+            return True
+        if not relay.available():
+            break
+    print(f"{pair.tag}[错误] relay 启动失败")
+    pair.relay = None
+    return False
+
+
+def set_network_config(pair, loss_rate):
     """设置网络参数"""
+    if isinstance(pair, RelayPair):
+        return set_relay_config(pair, loss_rate)
+
     # 先清理之前的配置
-    subprocess.run(["sudo", "ip", "netns", "exec", NS_CLIENT,
-                   "tcdel", INTERFACE, "--all"],
+    subprocess.run(["sudo", "ip", "netns", "exec", pair.ns_client,
+                   "tcdel", pair.interface, "--all"],
                    check=False, capture_output=True)
+    pair.loss_rate = None
 
     # 设置新配置
     loss_percent = loss_rate * 100  # 转换为百分比
     cmd = [
-        "sudo", "ip", "netns", "exec", NS_CLIENT,
-        "tcset", INTERFACE,
+        "sudo", "ip", "netns", "exec", pair.ns_client,
+        "tcset", pair.interface,
         "--rate", BANDWIDTH,
         "--delay", DELAY,
         "--loss", f"{loss_percent}%"
     ]
 
-    print(f"\n[配置] 设置网络参数: 丢包率={loss_percent}%, 延迟={DELAY}, 带宽={BANDWIDTH}")
+    print(f"\n{pair.tag}[配置] 设置网络参数: 丢包率={loss_percent}%, 延迟={DELAY}, 带宽={BANDWIDTH}")
     result = subprocess.run(cmd, capture_output=True, text=True)
 
     if result.returncode != 0:
-        print(f"[错误] tcset 命令失败: {result.stderr}")
+        print(f"{pair.tag}[错误] tcset 命令失败: {result.stderr}")
         return False
 
     # 验证配置
-    verify_cmd = ["sudo", "ip", "netns", "exec", NS_CLIENT, "tcshow", INTERFACE]
+    verify_cmd = ["sudo", "ip", "netns", "exec", pair.ns_client, "tcshow", pair.interface]
     result = subprocess.run(verify_cmd, capture_output=True, text=True)
-    print(f"[验证] 当前网络配置:\n{result.stdout}")
+    print(f"{pair.tag}[验证] 当前网络配置:\n{result.stdout}")
 
+    pair.loss_rate = loss_rate
     return True
 
 
-def start_server(output_file):
+def start_server(pair, output_file, timing_file):
     """启动服务器进程"""
     # 在 server 命名空间中运行
     cmd = [
-        "sudo", "ip", "netns", "exec", NS_SERVER,
-        str(SERVER_BIN.absolute()), SERVER_IP, str(SERVER_PORT), str(Path(output_file).absolute())
+        *pair.exec_prefix(pair.ns_server), "env", f"FOGGY_LOG_LEVEL={LOG_LEVEL}",
+        str(SERVER_BIN.absolute()), "--timing", str(timing_file),
+        pair.server_ip, str(pair.port), str(Path(output_file).absolute())
     ]
-    print(f"[服务器] 启动 (命名空间: {NS_SERVER})")
-    print(f"[调试] 命令: {' '.join(cmd)}")
-
-    proc = subprocess.Popen(
-        cmd,
-        stdout=subprocess.DEVNULL,  # 不捕获输出
-        stderr=subprocess.DEVNULL,  # 不捕获输出
-        cwd=str(FOGGY_DIR.absolute())
-    )
-
-    time.sleep(1)  # 给服务器启动时间
+    print(f"{pair.tag}[服务器] 启动 ({pair.location(pair.ns_server)})")
+    print(f"{pair.tag}[调试] 命令: {' '.join(cmd)}")
 
-    # 检查进程是否立即失败
-    if proc.poll() is not None:
-        print(f"[错误] 服务器启动失败! 返回码: {proc.returncode}")
+    # 检测到端口绑定后立即返回 (不捕获输出)
+    proc = launcher.start_server(cmd, pair.port, cwd=str(FOGGY_DIR.absolute()))
+    if proc is None:
+        print(f"{pair.tag}[错误] 服务器启动失败!")
         return None
 
     return proc
 
 
-def run_client_and_get_duration(server_proc):
-    """运行客户端并获取传输时长 (使用Python计时)"""
-    # 在 client 命名空间中运行
+def run_client_and_get_duration(pair, server_proc, client_timing, server_timing, trace=None,
+                                client_stats=None):
+    """运行客户端并获取传输时长 (client/server 写出的 CLOCK_MONOTONIC 时间戳)"""
+    # 在 client 命名空间中运行; sudo 会清除环境变量, 因此通过 env 传递
+    env = ["env", f"FOGGY_LOG_LEVEL={LOG_LEVEL}"]
+    if client_stats is not None:
+        env.append(f"FOGGY_STATS={client_stats}")
+    if trace is not None:
+        env.append(f"FOGGY_TRACE={trace}")
+    if PACING is not None:
+        env.append(f"FOGGY_PACING={PACING}")
+    target_ip, target_port = pair.client_target
     cmd = [
-        "sudo", "ip", "netns", "exec", NS_CLIENT,
-        str(CLIENT_BIN.absolute()), SERVER_IP, str(SERVER_PORT), str(TEST_FILE.absolute())
+        *pair.exec_prefix(pair.ns_client), *env,
+        str(CLIENT_BIN.absolute()), "--no-wait", "--timing", str(client_timing),
+        target_ip, str(target_port), str(TEST_FILE.absolute())
     ]
-    print(f"[客户端] 启动 (命名空间: {NS_CLIENT})")
-    print(f"[调试] 命令: {' '.join(cmd)}")
+    print(f"{pair.tag}[客户端] 启动 ({pair.location(pair.ns_client)})")
+    print(f"{pair.tag}[调试] 命令: {' '.join(cmd)}")
 
     try:
-        # Python 计时开始
-        start_time = time.time()
-
         # 运行客户端 (不捕获输出)
         client_result = subprocess.run(
             cmd,
@@ -137,47 +256,36 @@ def run_client_and_get_duration(server_proc):
             stderr=subprocess.DEVNULL
         )
 
-        # Python 计时结束
-        end_time = time.time()
-        duration_ms = int((end_time - start_time) * 1000)
-
         if client_result.returncode != 0:
-            print(f"[错误] 客户端退出异常,返回码: {client_result.returncode}")
+            print(f"{pair.tag}[错误] 客户端退出异常,返回码: {client_result.returncode}")
             return None
 
-        print(f"[客户端] 完成")
-        print(f"[结果] 传输时长: {duration_ms} ms (Python计时)")
+        print(f"{pair.tag}[客户端] 完成")
 
-        # 等待服务器处理完成
-        time.sleep(0.5)
+        # 等待服务器处理完成后终止; 服务器在 SIGTERM 时写出计时文件
+        launcher.stop_server(server_proc)
 
-        # 终止服务器进程
-        server_proc.terminate()
-        try:
-            server_proc.wait(timeout=3)
-        except subprocess.TimeoutExpired:
-            server_proc.kill()
+        duration_ms = timing.transfer_ms(timing.load(client_timing), timing.load(server_timing))
+        if duration_ms is None:
+            print(f"{pair.tag}[错误] {timing.RECOMPILE_HINT}")
+            return None
 
+        print(f"{pair.tag}[结果] 传输时长: {duration_ms:.1f} ms (CLOCK_MONOTONIC)")
         return duration_ms
 
     except subprocess.TimeoutExpired:
-        print(f"[错误] 传输超时 (>{TIMEOUT_SECONDS}秒)")
+        print(f"{pair.tag}[错误] 传输超时 (>{TIMEOUT_SECONDS}秒)")
         server_proc.kill()
         return None
     except Exception as e:
-        print(f"[错误] 执行客户端时出错: {e}")
+        print(f"{pair.tag}[错误] 执行客户端时出错: {e}")
         server_proc.kill()
         return None
 
 
 def cleanup_process(proc):
     """清理进程"""
-    if proc and proc.poll() is None:
-        proc.terminate()
-        try:
-            proc.wait(timeout=3)
-        except subprocess.TimeoutExpired:
-            proc.kill()
+    launcher.stop_process(proc)
 
 
 def calculate_throughput(duration_ms, file_size_bytes):
@@ -192,35 +300,122 @@ def calculate_throughput(duration_ms, file_size_bytes):
     return throughput_mbps
 
 
-def save_to_csv(data_row):
-    """保存数据到CSV"""
-    file_exists = OUTPUT_CSV.exists()
+_csv_lock = threading.Lock()
 
+
+def save_to_csv(data_row):
+    """保存数据到CSV (多个 worker 共用, 加锁串行写入; 文件锁见 _append_csv_row)"""
+    with _csv_lock:
+        _append_csv_row(data_row)
+
+
+CSV_HEADER = [
+    'loss_rate', 'trial', 'duration_ms',
+    'file_size_bytes', 'throughput_mbps', '1_over_sqrt_p',
+    *tcp_stats.COLUMNS,
+    'ci_rel_width', 'stop_reason'
+]
+
+
+def _rotate_old_csv():
+    """已有 CSV 的表头与当前格式不同时, 改名保留旧文件, 避免列错位"""
+    if not OUTPUT_CSV.exists():
+        return
+    with open(OUTPUT_CSV, newline='') as f:
+        header = next(csv.reader(f), None)
+    if header is None or header == CSV_HEADER:
+        return
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M")
+    rotated = OUTPUT_CSV.with_name(f"{OUTPUT_CSV.stem}_old_{timestamp}.csv")
+    OUTPUT_CSV.rename(rotated)
+    print(f"[注意] {OUTPUT_CSV.name} 的列与当前格式不同, 已改名为 {rotated.name}")
+
+
+def _append_csv_row(data_row):
     with open(OUTPUT_CSV, 'a', newline='') as f:
+        # 同时运行的多个实验进程 (--relay) 共用该文件: 持有文件锁期间写完整行
+        fcntl.flock(f, fcntl.LOCK_EX)
         writer = csv.writer(f)
 
-        # 如果文件不存在,写入表头
-        if not file_exists:
-            writer.writerow([
-                'loss_rate', 'trial', 'duration_ms',
-                'file_size_bytes', 'throughput_mbps', '1_over_sqrt_p'
-            ])
+        # 如果文件为空,写入表头
+        if f.seek(0, os.SEEK_END) == 0:
+            writer.writerow(CSV_HEADER)
 
         writer.writerow(data_row)
+        f.flush()
 
 
-def check_prerequisites():
+def check_prerequisites(pairs, harness=None):
     """检查前置条件"""
     print("\n[检查] 验证前置条件...")
 
+    if harness is not None:
+        return check_files() and check_harness(pairs, harness)
+    if isinstance(pairs[0], RelayPair):
+        return check_files() and check_relay()
+
     # 检查网络命名空间是否存在
     result = subprocess.run(["ip", "netns", "list"], capture_output=True, text=True)
-    if NS_SERVER not in result.stdout or NS_CLIENT not in result.stdout:
-        print(f"[错误] 网络命名空间未创建")
-        print(f"请先运行: sudo {SCRIPT_DIR}/setup_netns.sh")
+    existing = {line.split()[0] for line in result.stdout.splitlines() if line.strip()}
+    for pair in pairs:
+        if pair.ns_server not in existing or pair.ns_client not in existing:
+            print(f"[错误] 网络命名空间未创建: {pair.ns_server}, {pair.ns_client}")
+            print(f"请先运行: sudo {SCRIPT_DIR}/setup_netns.sh {len(pairs)}")
+            return False
+    print(f"[检查] 网络命名空间已就绪: {len(pairs)} 组 "
+          f"({', '.join(p.ns_server + '/' + p.ns_client for p in pairs)})")
+
+    if not check_files():
         return False
-    else:
-        print(f"[检查] 网络命名空间已就绪: {NS_SERVER}, {NS_CLIENT}")
+
+    # 检查 tcconfig
+    result = subprocess.run(["which", "tcset"], capture_output=True)
+    if result.returncode != 0:
+        print("[错误] tcconfig 未安装")
+        print("请运行: pip install tcconfig")
+        return False
+
+    print("[检查] tcconfig 已安装")
+
+    # 检查 sudo 权限
+    result = subprocess.run(["sudo", "-n", "true"], capture_output=True)
+    if result.returncode != 0:
+        print("[警告] 需要 sudo 权限,运行时需要输入密码")
+
+    print("[检查] ✓ 所有前置条件满足")
+    return True
+
+
+def check_harness(pairs, harness):
+    """检查守护进程是否运行并提供足够的链路"""
+    try:
+        links = harness.ping()["links"]
+    except HarnessError as e:
+        print(f"[错误] {e}")
+        print(f"请先运行: sudo python3 {SCRIPT_DIR}/harness_daemon.py --pairs {len(pairs)}")
+        return False
+    if links < len(pairs):
+        print(f"[错误] 守护进程只管理 {links} 条链路, 少于 worker 数 {len(pairs)}")
+        return False
+
+    print(f"[检查] 守护进程已就绪: {harness.path} ({links} 条链路)")
+    print("[检查] ✓ 所有前置条件满足")
+    return True
+
+
+def check_relay():
+    """检查 relay 已编译; 经过 UDP 中继的必须是 foggy 版本的 client/server"""
+    if not relay.available():
+        print(f"[错误] relay 不存在: {relay.RELAY_BIN}")
+        print(relay.BUILD_HINT)
+        return False
+    print(f"[检查] relay 已就绪: {relay.RELAY_BIN} (需要 foggy 版本: cd {FOGGY_DIR} && make foggy)")
+    print("[检查] ✓ 所有前置条件满足")
+    return True
+
+
+def check_files():
+    """检查可执行文件、测试文件与结果目录"""
 
     # 检查可执行文件
     if not SERVER_BIN.exists():
@@ -264,137 +459,487 @@ def check_prerequisites():
         print(f"请运行: sudo chown -R $USER:$USER {RESULTS_DIR}")
         return False
 
-    # 检查 tcconfig
-    result = subprocess.run(["which", "tcset"], capture_output=True)
-    if result.returncode != 0:
-        print("[错误] tcconfig 未安装")
-        print("请运行: pip install tcconfig")
-        return False
+    return True
 
-    print("[检查] tcconfig 已安装")
 
-    # 检查 sudo 权限
-    result = subprocess.run(["sudo", "-n", "true"], capture_output=True)
-    if result.returncode != 0:
-        print("[警告] 需要 sudo 权限,运行时需要输入密码")
+# ============ 主实验流程 ============
 
-    print("[检查] ✓ 所有前置条件满足")
-    return True
+class ExperimentProgress:
+    """多个 worker 共享的进度统计"""
 
+    def __init__(self, total):
+        self.total = total
+        self.completed = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def record(self, success):
+        with self.lock:
+            if success:
+                self.completed += 1
+            else:
+                self.failed += 1
+            done = self.completed + self.failed
+            progress = done / self.total * 100
+            print(f"\n[进度] {done}/{self.total} ({progress:.1f}%) | "
+                  f"成功: {self.completed} | 失败: {self.failed}")
+
+
+def trace_path(trace_dir, loss_rate, trial):
+    """单次试验的拥塞窗口追踪文件; trace_dir 为 None 时不追踪"""
+    if trace_dir is None:
+        return None
+    return Path(trace_dir).absolute() / f"loss{loss_rate}_trial{trial}.trace"
+
+
+def run_trial_via_harness(harness, pair, loss_rate, trace=None):
+    """通过常驻守护进程执行一次试验, 返回 (传输时长(ms), 连接统计), 失败时时长为 None"""
+    try:
+        if harness.shape(pair.index, BANDWIDTH, DELAY, loss_rate)["changed"]:
+            print(f"{pair.tag}[配置] netem: 丢包率={loss_rate * 100}%, 延迟={DELAY}, 带宽={BANDWIDTH}")
+        pair.loss_rate = loss_rate
+
+        extra = {"trace": str(trace)} if trace is not None else {}
+        if PACING is not None:
+            extra["pacing"] = PACING
+        result = harness.trial(pair.index, FOGGY_DIR.absolute(), TEST_FILE.absolute(),
+                               TIMEOUT_SECONDS, **extra)
+    except HarnessError as e:
+        print(f"{pair.tag}[错误] 守护进程: {e}")
+        return None, None
+
+    stats = result.get("stats")
+    if result.get("trace_error"):
+        print(f"{pair.tag}[警告] 拥塞窗口追踪未保存: {result['trace_error']}")
+    if result.get("timed_out"):
+        print(f"{pair.tag}[错误] 传输超时 (>{TIMEOUT_SECONDS}秒)")
+        return None, stats
+    if result["returncode"] != 0:
+        print(f"{pair.tag}[错误] 客户端退出异常,返回码: {result['returncode']}")
+        return None, stats
+
+    duration_ms = result["duration_ms"]
+    if duration_ms is None:
+        print(f"{pair.tag}[错误] {timing.RECOMPILE_HINT}")
+        return None, stats
+    print(f"{pair.tag}[结果] 传输时长: {duration_ms:.1f} ms (CLOCK_MONOTONIC)")
+    return duration_ms, stats
+
+
+def run_trial(pair, loss_rate, trial, file_size, harness=None, trace_dir=None):
+    """在指定命名空间组上执行一次试验, 返回 CSV 数据行, 失败返回 None"""
+    print(f"\n{pair.tag}--- 丢包率 {loss_rate * 100}% 试验 {trial} ---")
+    trace = trace_path(trace_dir, loss_rate, trial)
+
+    if harness is not None:
+        duration_ms, stats = run_trial_via_harness(harness, pair, loss_rate, trace)
+        return make_data_row(pair, loss_rate, trial, duration_ms, file_size, stats)
+
+    # 该组当前的网络配置与本次试验不同时才重新配置
+    if pair.loss_rate != loss_rate:
+        if not set_network_config(pair, loss_rate):
+            print(f"{pair.tag}[跳过] 无法设置网络参数")
+            return None
+        # 等待网络配置生效 (relay 启动后即已生效)
+        if not isinstance(pair, RelayPair):
+            time.sleep(2)
+
+    # 临时输出文件与计时文件 (名字由 tempfile 生成, 同时运行的多个实验进程互不冲突)
+    with tempfile.NamedTemporaryFile(prefix=f"temp_output_{loss_rate}_{trial}_", suffix=".bin",
+                                     dir=RESULTS_DIR, delete=False) as f:
+        output_file = Path(f.name)
+    client_timing, server_timing = timing.make_paths(RESULTS_DIR, f"temp_timing_w{pair.index}")
+    client_stats = timing.make_path(RESULTS_DIR, f"temp_stats_w{pair.index}", "client")
+
+    # 启动服务器
+    server_proc = start_server(pair, output_file, server_timing)
+    if server_proc is None:
+        timing.remove(output_file, client_timing, server_timing, client_stats)
+        return None
+
+    # 运行客户端并获取时长
+    duration_ms = run_client_and_get_duration(pair, server_proc, client_timing, server_timing,
+                                              trace, client_stats)
+    stats = tcp_stats.load(client_stats)
+
+    # 清理服务器进程
+    cleanup_process(server_proc)
+
+    # 清理临时文件
+    if output_file.exists():
+        output_file.unlink()
+    timing.remove(client_timing, server_timing, client_stats)
+
+    return make_data_row(pair, loss_rate, trial, duration_ms, file_size, stats)
+
+
+def make_data_row(pair, loss_rate, trial, duration_ms, file_size, stats=None):
+    """由传输时长与客户端的连接统计生成 CSV 数据行"""
+    if duration_ms is None:
+        if stats is not None:
+            print(f"{pair.tag}[统计] RTO {stats['rto_events']} 次, "
+                  f"最大退避 {stats['max_backoff']} 次")
+        return None
+
+    # 计算吞吐量
+    throughput = calculate_throughput(duration_ms, file_size)
+    # 处理丢包率为 0 的情况
+    one_over_sqrt_p = 1 / (loss_rate ** 0.5) if loss_rate > 0 else float('inf')
+
+    print(f"{pair.tag}[成功] 吞吐量: {throughput:.2f} Mbps")
+    if stats is not None:
+        print(f"{pair.tag}[统计] SRTT {stats['srtt_us'] / 1000:.1f} ms, "
+              f"RTO {stats['rto_events']} 次, 快速重传 {stats['fast_retransmits']} 次")
+        if "burst_mean" in stats:
+            print(f"{pair.tag}[统计] 突发 平均 {stats['burst_mean']:.2f} 段, 最大 {stats['burst_max']} 段, "
+                  f"间隔 {stats['gap_mean_us'] / 1000:.2f} ms")
+    return [
+        loss_rate,
+        trial,
+        duration_ms,
+        file_size,
+        throughput,
+        one_over_sqrt_p,
+        *tcp_stats.csv_values(stats)
+    ]
+
+
+def run_trials(pairs, jobs, file_size, progress, journal, harness=None, on_row=None,
+               trace_dir=None):
+    """把 (loss_rate, trial) 任务分配给空闲的命名空间组并发执行
+
+    每次试验结束立即写入 journal; 返回与 jobs 顺序对应的数据行列表 (失败为 None),
+    on_row 在每次成功后立即调用。
+    """
+    free_pairs = queue.Queue()
+    for pair in pairs:
+        free_pairs.put(pair)
+
+    def worker(job):
+        loss_rate, trial = job
+        pair = free_pairs.get()
+        try:
+            data_row = run_trial(pair, loss_rate, trial, file_size, harness, trace_dir)
+            journal.record({"type": "trial", "loss_rate": loss_rate, "trial": trial,
+                            "ok": data_row is not None, "row": data_row})
+            if data_row is not None:
+                if on_row is not None:
+                    on_row(data_row)
+            else:
+                print(f"{pair.tag}[失败] 此次实验失败")
+            progress.record(data_row is not None)
+            return data_row
+        finally:
+            free_pairs.put(pair)
+
+    executor = ThreadPoolExecutor(max_workers=len(pairs))
+    futures = [executor.submit(worker, job) for job in jobs]
+    try:
+        return [future.result() for future in futures]
+    finally:
+        # Ctrl-C 时丢弃尚未开始的试验, 等待正在运行的试验结束
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def journal_trials(journal, loss_rate=None):
+    """按顺序返回 journal 中的试验记录, 可按丢包率过滤"""
+    return [e for e in journal.entries()
+            if e["type"] == "trial" and (loss_rate is None or e["loss_rate"] == loss_rate)]
+
+
+def run_fixed(pairs, file_size, progress, harness, journal, trace_dir=None):
+    """固定次数模式: 每个丢包率 TRIALS_PER_LOSS 次, 所有任务一起排队
+
+    journal 中已成功的 (丢包率, 试验) 会被跳过, 失败或缺失的重新执行。
+    """
+    done = {(e["loss_rate"], e["trial"]) for e in journal_trials(journal) if e["ok"]}
+    # 按丢包率顺序排列任务, 相邻任务尽量复用同一网络配置
+    jobs = [(loss_rate, trial)
+            for loss_rate in LOSS_RATES
+            for trial in range(1, TRIALS_PER_LOSS + 1)
+            if (loss_rate, trial) not in done]
+    if done:
+        print(f"[恢复] 跳过已完成的 {len(done)} 次试验, 剩余 {len(jobs)} 次")
+    progress.total = len(jobs)
+    run_trials(pairs, jobs, file_size, progress, journal, harness,
+               on_row=lambda row: save_to_csv(row + ["", adaptive.STOP_FIXED]),
+               trace_dir=trace_dir)
+
+
+def run_adaptive(pairs, file_size, progress, harness, journal, args, trace_dir=None):
+    """自适应模式: 每个丢包率按轮追加试验 (每轮 worker 数次), 直到置信区间满足目标
+
+    该组停止后才写入 CSV, 每行附带该组最终的相对半宽与停止原因。
+    恢复运行时已停止的组被跳过, 未停止的组从 journal 中的试验结果继续。
+    """
+    finished = {e["loss_rate"] for e in journal.entries() if e["type"] == "group"}
+    for loss_rate in LOSS_RATES:
+        if loss_rate in finished:
+            print(f"[恢复] 丢包率 {loss_rate * 100}% 已完成, 跳过")
+            continue
+
+        stopper = adaptive.stopper_from_args(args)
+        rows = []
+        for entry in journal_trials(journal, loss_rate):
+            stopper.add(entry["row"][4] if entry["ok"] else None)
+            if entry["ok"]:
+                rows.append(entry["row"])
+        if stopper.attempts:
+            print(f"[恢复] 丢包率 {loss_rate * 100}%: 沿用已有的 {stopper.attempts} 次试验")
+
+        while stopper.stop_reason() is None:
+            batch = min(len(pairs), stopper.remaining())
+            jobs = [(loss_rate, stopper.attempts + i + 1) for i in range(batch)]
+            for row in run_trials(pairs, jobs, file_size, progress, journal, harness,
+                                  trace_dir=trace_dir):
+                stopper.add(row[4] if row is not None else None)
+                if row is not None:
+                    rows.append(row)
+            print(f"\n[自适应] 丢包率 {loss_rate * 100}%: {len(stopper.values)} 次成功, "
+                  f"相对半宽 {stopper.ci:.3f} (目标 {stopper.ci_target})")
+
+        reason = stopper.stop_reason()
+        ci = f"{stopper.ci:.6f}" if rows else ""
+        journal.record({"type": "group", "loss_rate": loss_rate,
+                        "stop_reason": reason, "ci_rel_width": ci})
+        for row in rows:
+            save_to_csv(row + [ci, reason])
+        print(f"[自适应] 丢包率 {loss_rate * 100}% 停止: {reason}")
+
+
+def run_rows(journal):
+    """由 journal 得到本次运行每个 (丢包率, 试验) 的最终结果, 按顺序返回 (丢包率, 试验, CSV 数据行)
+
+    数据行带有该组的相对半宽与停止原因; 试验失败时为 None。同一试验被重跑时以最后一次为准。
+    journal 是唯一可信的记录: 即使中途崩溃, 由此导出的数据也不会重复或遗漏。
+    """
+    groups = {e["loss_rate"]: e for e in journal.entries() if e["type"] == "group"}
+    adaptive_mode = journal.manifest["config"]["adaptive"] is not None
+    latest = {}
+    for entry in journal_trials(journal):
+        latest[(entry["loss_rate"], entry["trial"])] = entry["row"] if entry["ok"] else None
+
+    rows = []
+    for (loss_rate, trial), row in sorted(latest.items()):
+        if row is not None:
+            if not adaptive_mode:
+                row = row + ["", adaptive.STOP_FIXED]
+            elif loss_rate in groups:
+                row = row + [groups[loss_rate]["ci_rel_width"], groups[loss_rate]["stop_reason"]]
+            else:
+                row = row + ["", adaptive.STOP_INTERRUPTED]
+        rows.append((loss_rate, trial, row))
+    return rows
+
+
+def export_run_csv(journal):
+    """由 journal 重建本次运行的完整 CSV (运行目录下的 mathis_data.csv), 只包含成功的试验"""
+    path = journal.run_dir / OUTPUT_CSV.name
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for _, _, row in run_rows(journal):
+            if row is not None:
+                writer.writerow(row)
+    return path
+
+
+def export_run_store(journal):
+    """把本次运行写入结果存储 (results/store/<run_id>/, 见 results_store.py), 包括失败的试验
+
+    恢复运行后再次导出时, 只有试验有变化的丢包率分区会被重写。返回 (写入的分区数, 未变的分区数)。
+    """
+    rows = []
+    for loss_rate, trial, row in run_rows(journal):
+        if row is None:
+            rows.append({"loss_rate": loss_rate, "trial": trial, "success": False})
+        else:
+            rows.append(dict(zip(CSV_HEADER, row), success=True))
+    return results_store.write(results_store.mathis_rows(rows), journal.run_id)
+
+
+def experiment_config(args, harness):
+    """记录到 manifest 的实验配置; 恢复运行时必须与之一致"""
+    return {
+        "loss_rates": LOSS_RATES,
+        "trials_per_loss": TRIALS_PER_LOSS,
+        "bandwidth": BANDWIDTH,
+        "delay": DELAY,
+        "test_file": str(TEST_FILE.absolute()),
+        "shaper": ("harness_daemon" if harness is not None
+                   else "relay" if args.relay else "tcconfig"),
+        "net_trace": None if NET_TRACE is None else str(NET_TRACE),
+        "pacing": args.pacing,
+        "adaptive": {
+            "ci_target": args.ci_target,
+            "confidence": args.confidence,
+            "min_trials": args.min_trials,
+            "max_trials": args.max_trials,
+        } if args.adaptive else None,
+    }
+
+
+def open_journal(args, harness):
+    """新建运行目录, 或按 --resume 打开已有的并校验配置与文件哈希"""
+    config = experiment_config(args, harness)
+    files = {"server": SERVER_BIN, "client": CLIENT_BIN, "test_file": TEST_FILE}
+    if NET_TRACE is not None:
+        files["net_trace"] = NET_TRACE
+
+    if args.resume is None:
+        return RunJournal.create(RUNS_DIR, config, files)
+
+    journal = RunJournal.open(RUNS_DIR, args.resume)
+    problems = journal.verify(config, files)
+    if problems:
+        print(f"[错误] 运行 {journal.run_id} 与当前环境不一致:")
+        for problem in problems:
+            print(f"  - {problem}")
+        if not args.force:
+            print("结果将无法与之前的试验合并; 确认无误请加 --force")
+            sys.exit(1)
+        print("[警告] --force: 忽略不一致, 继续运行")
+    return journal
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mathis 假设验证实验")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="并行 worker 数, 需先运行 setup_netns.sh N 创建 N 组命名空间 (--relay 时不需要) "
+                             f"(默认 {DEFAULT_WORKERS})")
+    parser.add_argument("--daemon", nargs="?", const=DEFAULT_SOCKET, default=None,
+                        metavar="SOCKET",
+                        help="通过常驻守护进程 harness_daemon.py 执行试验 "
+                             f"(默认套接字 {DEFAULT_SOCKET})")
+    parser.add_argument("--relay", action="store_true",
+                        help="不使用命名空间和 tcconfig, 由用户态 relay (make relay) 施加网络参数, "
+                             "不需要 root; 需要 foggy 版本的 client/server")
+    parser.add_argument("--resume", metavar="RUN",
+                        help=f"继续之前中断的运行 (run_id 或 {RUNS_DIR.name}/ 下的目录), "
+                             "只执行失败或缺失的试验")
+    parser.add_argument("--force", action="store_true",
+                        help="--resume 时忽略配置或可执行文件哈希不一致")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default=DEFAULT_LOG_LEVEL,
+                        help=f"client/server 的日志级别 FOGGY_LOG_LEVEL (默认 {DEFAULT_LOG_LEVEL}); "
+                             "守护进程模式使用 harness_daemon.py --log-level")
+    parser.add_argument("--pacing", type=pacing_mode, default=None, metavar="MODE",
+                        help="发送端 pacing 模式 FOGGY_PACING: off、on (Linux 的增益) 或正数增益, "
+                             "如 1.25 (默认不设置, 即实现的默认值 off); 守护进程模式下随试验请求传递")
+    parser.add_argument("--trace", action="store_true",
+                        help=f"记录每次试验的拥塞窗口追踪 (FOGGY_TRACE), 保存到运行目录的 "
+                             f"{TRACE_SUBDIR}/ 下, 供 analyze_mathis.py --traces 使用")
+    parser.add_argument("--net-trace", metavar="TRACE",
+                        help="网络条件随时间变化: relay 在每次试验中回放该 trace 文件或附带的 trace "
+                             f"({', '.join(traces.bundled_names())}; 格式见 traces.py), "
+                             "其中的 \"-\" 沿用带宽、延迟和当前丢包率; 需要 --relay")
+    adaptive.add_arguments(parser)
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers 必须 >= 1")
+    if args.relay and args.daemon:
+        parser.error("--relay 与 --daemon 不能同时使用")
+    if args.net_trace is not None:
+        if not args.relay:
+            parser.error("--net-trace 需要 --relay (tcconfig 无法按毫秒回放 trace)")
+        try:
+            args.net_trace = traces.resolve(args.net_trace).absolute()
+            traces.load(args.net_trace)
+        except (OSError, traces.TraceError) as e:
+            parser.error(str(e))
+    adaptive.check_arguments(parser, args)
+    return args
 
-# ============ 主实验流程 ============
 
 def main():
+    global LOG_LEVEL, PACING, NET_TRACE
+    args = parse_args()
+    LOG_LEVEL = args.log_level
+    PACING = args.pacing
+    NET_TRACE = args.net_trace
+    pair_type = RelayPair if args.relay else NetnsPair
+    pairs = [pair_type(i) for i in range(args.workers)]
+    harness = HarnessClient(args.daemon) if args.daemon else None
+
     print("=" * 60)
     print("Dr. Matt Mathis 假设验证实验")
     print("=" * 60)
 
     # 检查前置条件
-    if not check_prerequisites():
+    if not check_prerequisites(pairs, harness):
         print("\n[失败] 前置条件检查未通过,退出")
         sys.exit(1)
 
+    try:
+        journal = open_journal(args, harness)
+    except JournalError as e:
+        print(f"[错误] {e}")
+        sys.exit(1)
+
     # 获取文件大小
     file_size = TEST_FILE.stat().st_size
     print(f"\n[配置] 测试文件大小: {file_size / 1e6:.2f} MB")
     print(f"[配置] 丢包率列表: {LOSS_RATES}")
-    print(f"[配置] 每个丢包率重复: {TRIALS_PER_LOSS} 次")
-    print(f"[配置] 总实验次数: {len(LOSS_RATES) * TRIALS_PER_LOSS} 次")
+    if args.adaptive:
+        print(f"[配置] 自适应模式: 相对半宽 <= {args.ci_target} ({args.confidence:.0%} 置信), "
+              f"每个丢包率 {args.min_trials}-{args.max_trials} 次")
+        total_experiments = len(LOSS_RATES) * args.max_trials
+        print(f"[配置] 总实验次数上限: {total_experiments} 次")
+    else:
+        print(f"[配置] 每个丢包率重复: {TRIALS_PER_LOSS} 次")
+        total_experiments = len(LOSS_RATES) * TRIALS_PER_LOSS
+        print(f"[配置] 总实验次数: {total_experiments} 次")
+    print(f"[配置] 并行 worker 数: {len(pairs)}")
+    if PACING is not None:
+        print(f"[配置] 发送端 pacing: {PACING}")
+    if harness is not None:
+        print(f"[配置] 常驻守护进程: {harness.path}")
+    if args.relay:
+        print("[配置] 网络参数由用户态 relay 施加 (不需要 root)")
+    if NET_TRACE is not None:
+        print(f"[配置] 网络条件 trace: {traces.describe(NET_TRACE)} ({NET_TRACE})")
     print(f"[配置] 结果保存到: {OUTPUT_CSV}")
+    print(f"[配置] 运行目录: {journal.run_dir}"
+          f"{' (恢复运行)' if args.resume else ''}")
+    trace_dir = None
+    if args.trace:
+        trace_dir = journal.run_dir / TRACE_SUBDIR
+        trace_dir.mkdir(exist_ok=True)
+        print(f"[配置] 拥塞窗口追踪: {trace_dir}")
     print("\n开始实验...")
 
-    # 记录统计
-    total_experiments = len(LOSS_RATES) * TRIALS_PER_LOSS
-    completed = 0
-    failed = 0
+    _rotate_old_csv()
+    progress = ExperimentProgress(total_experiments)
 
     try:
-        for loss_rate in LOSS_RATES:
-            print("\n" + "=" * 60)
-            # 处理丢包率为 0 的情况
-            if loss_rate > 0:
-                sqrt_p_inv = 1 / (loss_rate ** 0.5)
-                print(f"丢包率: {loss_rate * 100}% (1/√p = {sqrt_p_inv:.2f})")
-            else:
-                print(f"丢包率: {loss_rate * 100}% (无丢包)")
-            print("=" * 60)
-
-            # 设置网络参数
-            if not set_network_config(loss_rate):
-                print(f"[跳过] 无法设置网络参数,跳过此丢包率")
-                failed += TRIALS_PER_LOSS
-                continue
-
-            # 等待网络配置生效
-            time.sleep(2)
-
-            # 进行重复实验
-            for trial in range(1, TRIALS_PER_LOSS + 1):
-                print(f"\n--- 试验 {trial}/{TRIALS_PER_LOSS} ---")
-
-                # 临时输出文件
-                output_file = RESULTS_DIR / f"temp_output_{loss_rate}_{trial}.bin"
-
-                # 启动服务器
-                server_proc = start_server(output_file)
-
-                # 运行客户端并获取时长
-                duration_ms = run_client_and_get_duration(server_proc)
-
-                # 清理服务器进程
-                cleanup_process(server_proc)
-
-                if duration_ms is not None:
-                    # 计算吞吐量
-                    throughput = calculate_throughput(duration_ms, file_size)
-                    # 处理丢包率为 0 的情况
-                    one_over_sqrt_p = 1 / (loss_rate ** 0.5) if loss_rate > 0 else float('inf')
-
-                    # 保存数据
-                    data_row = [
-                        loss_rate,
-                        trial,
-                        duration_ms,
-                        file_size,
-                        throughput,
-                        one_over_sqrt_p
-                    ]
-                    save_to_csv(data_row)
-
-                    print(f"[成功] 吞吐量: {throughput:.2f} Mbps")
-                    completed += 1
-                else:
-                    print(f"[失败] 此次实验失败")
-                    failed += 1
-
-                # 清理临时文件
-                if output_file.exists():
-                    output_file.unlink()
-
-                # 短暂延迟,避免端口占用
-                time.sleep(2)
-
-                # 进度报告
-                progress = (completed + failed) / total_experiments * 100
-                print(f"\n[进度] {completed + failed}/{total_experiments} ({progress:.1f}%) | "
-                      f"成功: {completed} | 失败: {failed}")
+        if args.adaptive:
+            run_adaptive(pairs, file_size, progress, harness, journal, args, trace_dir)
+        else:
+            run_fixed(pairs, file_size, progress, harness, journal, trace_dir)
 
     except KeyboardInterrupt:
         print("\n\n[中断] 用户中止实验")
+        print(f"[中断] 继续运行: python3 {Path(__file__).name} --resume {journal.run_id}")
 
     finally:
-        # 清理网络配置
-        cleanup_network()
+        # 清理网络配置 (守护进程模式下保留 netem 队列供下次复用)
+        if harness is None:
+            for pair in pairs:
+                cleanup_network(pair)
 
     # 最终统计
     print("\n" + "=" * 60)
     print("实验完成!")
     print("=" * 60)
-    print(f"总实验次数: {total_experiments}")
-    print(f"成功: {completed}")
-    print(f"失败: {failed}")
-    print(f"成功率: {completed / total_experiments * 100:.1f}%")
+    executed = progress.completed + progress.failed
+    print(f"总实验次数: {executed}")
+    print(f"成功: {progress.completed}")
+    print(f"失败: {progress.failed}")
+    print(f"成功率: {progress.completed / max(executed, 1) * 100:.1f}%")
     print(f"\n结果已保存到: {OUTPUT_CSV}")
+    print(f"本次运行的完整数据: {export_run_csv(journal)}")
+    written, unchanged = export_run_store(journal)
+    print(f"结果存储: {results_store.STORE_DIR / journal.run_id} "
+          f"(写入 {written} 个分区, {unchanged} 个未变)")
     print("\n下一步: 运行 analyze_mathis.py 进行数据分析")
 
 
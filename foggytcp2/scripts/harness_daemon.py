@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+常驻实验守护进程
+保持网络命名空间、netem 队列和预先启动的服务器进程, 通过 Unix 套接字为实验驱动执行试验
+
+每次试验不再需要 sudo / tcconfig / 启动服务器的往返开销:
+  - 网络参数用 `tc qdisc change` 原地修改, 参数未变化时不执行任何命令
+  - 每条链路预先启动下一次试验的服务器, 试验请求到达时服务器已经就绪
+  - 守护进程本身以 root 运行, 客户端直接在命名空间中执行, 不经过 sudo
+
+用法:
+  sudo ./setup_netns.sh 4
+  sudo python3 harness_daemon.py --pairs 4 [--loopback]
+  python3 experiment_mathis.py --workers 4 --daemon
+
+协议: 每个连接发送一行 JSON 请求 {"op": ..., ...}, 守护进程回复一行 JSON
+{"ok": true/false, ...}。支持的 op 见 HarnessHandler.OPS。
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import launcher
+import timing
+
+# ============ 配置参数 ============
+SCRIPT_DIR = Path(__file__).parent
+PROJECT_ROOT = SCRIPT_DIR.parent
+DEFAULT_SOCKET = "/tmp/foggy_harness.sock"
+
+# 允许执行的实现目录 (目录下需有 server/client 可执行文件)
+DEFAULT_IMPL_DIRS = [
+    PROJECT_ROOT / "foggytcp",
+    PROJECT_ROOT.parent / "enhanced_cca" / "foggytcp",
+]
+
+# 允许客户端发送的测试文件所在目录 (含子目录)
+DEFAULT_DATA_DIRS = [PROJECT_ROOT / "testdata"]
+
+# 允许写入拥塞窗口追踪文件的目录 (含子目录), experiment_mathis.py 写在 results/runs/<run_id>/traces/
+DEFAULT_TRACE_DIRS = [PROJECT_ROOT / "results"]
+
+# 与 setup_netns.sh / experiment_mathis.py 相同的命名规则
+NS_SERVER = "ns_server"
+NS_CLIENT = "ns_client"
+INTERFACE = "veth_client"
+SERVER_PORT = 15441
+LOOPBACK_LINK = "lo"
+LOG_LEVELS = ("off", "error", "info", "trace")  # FOGGY_LOG_LEVEL, 见 foggytcp/inc/foggy_log.h
+DEFAULT_LOG_LEVEL = "error"
+ACK_POLICIES = ("every", "delayed")  # FOGGY_ACK_POLICY, 见 foggytcp/inc/foggy_ack.h
+DEFAULT_ACK_POLICY = "delayed"
+PACING_MODES = ("off", "on")  # FOGGY_PACING, 见 foggytcp/inc/foggy_pacing.h; 也可以是正数增益
+DEFAULT_PACING = "off"
+
+
+def pacing_mode(value):
+    """校验 FOGGY_PACING 的取值 (off、on 或正数增益, 如 1.25), 不合法时抛出 ValueError;
+    也用作 argparse 的 type"""
+    if value in PACING_MODES:
+        return value
+    try:
+        gain = float(value)
+    except ValueError:
+        raise ValueError(f"未知 pacing 模式: {value} (可选 off、on 或正数增益)") from None
+    if not 0 < gain <= 100:
+        raise ValueError(f"pacing 增益必须在 (0, 100] 内: {value}")
+    return value
+
+
+# ============ 客户端 ============
+
+class HarnessError(Exception):
+    """守护进程返回错误或无法连接"""
+
+
+class HarnessClient:
+    """实验驱动使用的守护进程客户端, 每个请求使用一个独立连接 (线程安全)"""
+
+    def __init__(self, path=DEFAULT_SOCKET):
+        self.path = path
+
+    def request(self, op, **params):
+        params["op"] = op
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(self.path)
+                sock.sendall(json.dumps(params).encode() + b"\n")
+                with sock.makefile("r") as f:
+                    line = f.readline()
+        except OSError as e:
+            raise HarnessError(f"无法连接守护进程 {self.path}: {e}") from e
+        if not line:
+            raise HarnessError("守护进程未返回结果")
+        reply = json.loads(line)
+        if not reply.get("ok"):
+            raise HarnessError(reply.get("error", "未知错误"))
+        return reply
+
+    def ping(self):
+        return self.request("ping")
+
+    def shape(self, link, rate, delay, loss_rate):
+        return self.request("shape", link=link, rate=rate, delay=delay, loss=loss_rate)
+
+    def clear(self, link):
+        return self.request("clear", link=link)
+
+    def trial(self, link, impl_dir, test_file, timeout, **extra):
+        return self.request("trial", link=link, impl_dir=str(impl_dir),
+                            test_file=str(test_file), timeout=timeout, **extra)
+
+
+# ============ 链路 ============
+
+def netem_rate(bandwidth):
+    """把 tcconfig 风格的带宽 (如 "10Mbps") 转换为 netem 的 "10mbit" """
+    m = re.fullmatch(r"\s*([\d.]+)\s*([KMG]?)bps\s*", bandwidth, re.IGNORECASE)
+    if not m:
+        raise ValueError(f"无法解析带宽: {bandwidth}")
+    return f"{m.group(1)}{m.group(2).lower()}bit"
+
+
+def chown_to_caller(path):
+    """把守护进程 (root) 创建的文件交给调用 sudo 的用户"""
+    if "SUDO_UID" in os.environ and os.path.exists(path):
+        os.chown(path, int(os.environ["SUDO_UID"]), int(os.environ["SUDO_GID"]))
+
+
+def deliver_to_caller(src, dest):
+    """
+    把守护进程工作目录中的文件复制到 dest, 以调用 sudo 的用户身份写入
+
+    root 不会替调用者打开 dest: 调用者无权写入的路径会失败, 不会覆盖或占有别人的文件。
+    不是经 sudo 启动 (没有 SUDO_UID) 时无法降低权限, 拒绝写入。
+    """
+    if "SUDO_UID" not in os.environ:
+        raise OSError("守护进程不是经 sudo 启动, 无法以调用者身份写入追踪文件")
+    with open(src, "rb") as f:
+        result = subprocess.run(["tee", "--", str(dest)], stdin=f, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, text=True,
+                                user=int(os.environ["SUDO_UID"]), group=int(os.environ["SUDO_GID"]),
+                                extra_groups=[])
+    if result.returncode != 0:
+        raise OSError(result.stderr.strip() or f"无法写入 {dest}")
+
+
+class ServerHandle:
+    """一个已就绪、等待下一次试验的服务器进程"""
+
+    def __init__(self, proc, output_file, timing_file):
+        self.proc = proc
+        self.output_file = output_file
+        self.timing_file = timing_file
+
+    def remove_files(self):
+        Path(self.output_file).unlink(missing_ok=True)
+        Path(self.timing_file).unlink(missing_ok=True)
+
+
+class Link:
+    """一条实验链路: 服务器端 + 客户端 + 客户端出口上的 netem 队列"""
+
+    def __init__(self, name, ns_server, ns_client, interface, server_ip, port, workdir):
+        self.name = name
+        self.ns_server = ns_server
+        self.ns_client = ns_client
+        self.interface = interface
+        self.server_ip = server_ip
+        self.port = port
+        self.workdir = workdir
+        self.netem = None  # 当前 netem 参数, None 表示未配置
+        self.lock = threading.Lock()  # 同一链路上的试验串行执行
+        self.spawner = ThreadPoolExecutor(max_workers=1)
+        self.pool = {}  # (impl_dir, ack_policy) -> Future[ServerHandle]
+        self.trials = 0
+
+    @classmethod
+    def netns(cls, index, workdir):
+        suffix = "" if index == 0 else str(index)
+        return cls(str(index), f"{NS_SERVER}{suffix}", f"{NS_CLIENT}{suffix}",
+                   f"{INTERFACE}{suffix}", f"10.0.{index + 1}.1",
+                   SERVER_PORT + index, workdir)
+
+    @classmethod
+    def loopback(cls, workdir):
+        return cls(LOOPBACK_LINK, None, None, "lo", "127.0.0.1", SERVER_PORT, workdir)
+
+    def _in_ns(self, ns, cmd):
+        return ["ip", "netns", "exec", ns] + cmd if ns else cmd
+
+    def _tc(self, *args):
+        cmd = ["tc"] + (["-n", self.ns_client] if self.ns_client else []) + list(args)
+        return subprocess.run(cmd, capture_output=True, text=True)
+
+    # ---- 网络参数 ----
+
+    def shape(self, rate, delay, loss):
+        """配置 netem; 已有队列时原地 change, 参数未变化时直接返回"""
+        params = ["delay", delay, "rate", netem_rate(rate), "loss", f"{loss * 100}%"]
+        if params == self.netem:
+            return False
+
+        action = "change" if self.netem is not None else "replace"
+        result = self._tc("qdisc", action, "dev", self.interface, "root", "netem", *params)
+        if result.returncode != 0 and action == "change":
+            # 队列被外部删除时回退为重新创建
+            result = self._tc("qdisc", "replace", "dev", self.interface, "root", "netem", *params)
+        if result.returncode != 0:
+            self.netem = None
+            raise RuntimeError(f"tc 配置失败: {result.stderr.strip()}")
+        self.netem = params
+        return True
+
+    def clear(self):
+        if self.netem is not None:
+            self._tc("qdisc", "del", "dev", self.interface, "root")
+            self.netem = None
+
+    # ---- 服务器池 ----
+
+    def _spawn_server(self, impl_dir, ack_policy):
+        fd, output_file = tempfile.mkstemp(prefix=f"link{self.name}_", suffix=".bin",
+                                           dir=self.workdir)
+        os.close(fd)
+        timing_file = timing.make_path(self.workdir, f"link{self.name}", "server")
+        server_cmd = [str(impl_dir / "server"), "--timing", str(timing_file),
+                      self.server_ip, str(self.port), output_file]
+        if ack_policy is not None:
+            # ACK 策略只影响接收端, 即服务器
+            server_cmd = ["env", f"FOGGY_ACK_POLICY={ack_policy}"] + server_cmd
+        cmd = self._in_ns(self.ns_server, server_cmd)
+        handle = ServerHandle(None, output_file, timing_file)
+        handle.proc = launcher.start_server(cmd, self.port, cwd=str(impl_dir))
+        if handle.proc is None:
+            handle.remove_files()
+            return None
+        return handle
+
+    def prespawn(self, impl_dir, ack_policy=None):
+        key = (impl_dir, ack_policy)
+        if key not in self.pool:
+            self.pool[key] = self.spawner.submit(self._spawn_server, impl_dir, ack_policy)
+
+    def take_server(self, impl_dir, ack_policy=None):
+        """取出预先启动的服务器; 池中没有时同步启动"""
+        key = (impl_dir, ack_policy)
+        # 所有服务器监听同一端口: 先停掉为其他实现或 ACK 策略预启动的服务器
+        for other in [k for k in self.pool if k != key]:
+            self._discard(self.pool.pop(other))
+        self.prespawn(impl_dir, ack_policy)
+        handle = self.pool.pop(key).result()
+        if handle is not None and handle.proc.poll() is not None:
+            # 预启动的服务器已意外退出
+            handle.remove_files()
+            handle = self._spawn_server(impl_dir, ack_policy)
+        return handle
+
+    @staticmethod
+    def _discard(future):
+        handle = future.result()
+        if handle is not None:
+            launcher.stop_process(handle.proc)
+            handle.remove_files()
+
+    def drain_pool(self):
+        for future in self.pool.values():
+            self._discard(future)
+        self.pool.clear()
+
+    # ---- 试验 ----
+
+    def run_trial(self, impl_dir, test_file, timeout, trace=None, ack_policy=None, pacing=None):
+        """trace 为拥塞窗口追踪文件的目标路径, None 表示不追踪; 客户端 (FOGGY_TRACE) 写入守护进程
+        工作目录中的文件, 试验结束后以调用者身份复制到 trace, 失败时回复中带有 trace_error;
+        ack_policy 为接收端的 ACK 策略 (FOGGY_ACK_POLICY), pacing 为发送端的 pacing 模式
+        (FOGGY_PACING), None 表示使用实现的默认值"""
+        with self.lock:
+            server = self.take_server(impl_dir, ack_policy)
+            if server is None:
+                raise RuntimeError("服务器启动失败")
+
+            client_timing = timing.make_path(self.workdir, f"link{self.name}", "client")
+            client_stats = timing.make_path(self.workdir, f"link{self.name}", "stats")
+            client_cmd = [str(impl_dir / "client"), "--no-wait", "--timing", str(client_timing),
+                          self.server_ip, str(self.port), test_file]
+            env = [f"FOGGY_STATS={client_stats}"]
+            client_trace = Path(self.workdir) / f"link{self.name}_trace.bin"
+            if trace is not None:
+                env.append(f"FOGGY_TRACE={client_trace}")
+            if pacing is not None:
+                # pacing 只影响发送端, 即客户端
+                env.append(f"FOGGY_PACING={pacing}")
+            client_cmd = ["env", *env] + client_cmd
+            cmd = self._in_ns(self.ns_client, client_cmd)
+            # duration_ms 为 client/server 的 CLOCK_MONOTONIC 时间戳之差;
+            # wall_ms 为客户端进程的总运行时间, 仅供参考; stats 为客户端的 RTT/RTO 统计
+            reply = {"returncode": None, "duration_ms": None, "wall_ms": None,
+                     "output_size": 0, "timing": None, "stats": None}
+            try:
+                start = time.monotonic()
+                result = subprocess.run(cmd, timeout=timeout, cwd=str(impl_dir),
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                reply["wall_ms"] = (time.monotonic() - start) * 1000
+                reply["returncode"] = result.returncode
+            except subprocess.TimeoutExpired:
+                reply["timed_out"] = True
+            finally:
+                launcher.stop_server(server.proc)
+                output = Path(server.output_file)
+                reply["output_size"] = output.stat().st_size if output.exists() else 0
+                reply["timing"] = {"client": timing.load(client_timing),
+                                   "server": timing.load(server.timing_file)}
+                reply["duration_ms"] = timing.transfer_ms(reply["timing"]["client"],
+                                                          reply["timing"]["server"])
+                reply["stats"] = timing.load(client_stats)
+                server.remove_files()
+                timing.remove(client_timing, client_stats)
+                if trace is not None and client_trace.exists():
+                    try:
+                        deliver_to_caller(client_trace, trace)
+                    except OSError as e:
+                        reply["trace_error"] = str(e)
+                    client_trace.unlink()
+                # 在后台为下一次试验准备服务器
+                self.prespawn(impl_dir, ack_policy)
+                self.trials += 1
+            return reply
+
+    def describe(self):
+        return {"name": self.name, "ns_server": self.ns_server, "ns_client": self.ns_client,
+                "interface": self.interface, "server_ip": self.server_ip, "port": self.port,
+                "netem": " ".join(self.netem) if self.netem else None,
+                "trials": self.trials}
+
+
+# ============ 服务 ============
+
+class HarnessHandler(socketserver.StreamRequestHandler):
+    OPS = ("ping", "links", "shape", "clear", "trial", "shutdown")
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            req = json.loads(line)
+            op = req.get("op")
+            if op not in self.OPS:
+                raise ValueError(f"未知操作: {op}")
+            reply = getattr(self, f"op_{op}")(req)
+            reply["ok"] = True
+        except Exception as e:
+            reply = {"ok": False, "error": str(e)}
+        self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+    def _link(self, req):
+        name = str(req.get("link"))
+        if name not in self.server.links:
+            raise ValueError(f"未知链路: {name}")
+        return self.server.links[name]
+
+    def op_ping(self, req):
+        return {"pid": os.getpid(), "links": len(self.server.links)}
+
+    def op_links(self, req):
+        return {"links": [link.describe() for link in self.server.links.values()]}
+
+    def op_shape(self, req):
+        link = self._link(req)
+        with link.lock:
+            changed = link.shape(req["rate"], req["delay"], float(req["loss"]))
+        return {"changed": changed}
+
+    def op_clear(self, req):
+        link = self._link(req)
+        with link.lock:
+            link.clear()
+        return {}
+
+    def op_trial(self, req):
+        link = self._link(req)
+        impl_dir = Path(req["impl_dir"]).resolve()
+        if impl_dir not in self.server.impl_dirs:
+            raise ValueError(f"实现目录未注册: {impl_dir} (使用 --impl-dir 添加)")
+        test_file = Path(req["test_file"]).resolve()
+        if not any(test_file.is_relative_to(d) for d in self.server.data_dirs):
+            raise ValueError(f"测试文件不在允许的目录中: {test_file} (使用 --data-dir 添加)")
+        if not test_file.is_file():
+            raise ValueError(f"测试文件不存在: {test_file}")
+        trace = req.get("trace")
+        if trace is not None:
+            trace = Path(trace)
+            if not trace.is_absolute() or trace.name in ("", ".", ".."):
+                raise ValueError(f"trace 必须是文件的绝对路径: {trace}")
+            trace = trace.parent.resolve() / trace.name
+            if not any(trace.is_relative_to(d) for d in self.server.trace_dirs):
+                raise ValueError(f"trace 不在允许的目录中: {trace} (使用 --trace-dir 添加)")
+        ack_policy = req.get("ack_policy")
+        if ack_policy is not None and ack_policy not in ACK_POLICIES:
+            raise ValueError(f"未知 ACK 策略: {ack_policy} (可选 {', '.join(ACK_POLICIES)})")
+        pacing = req.get("pacing")
+        if pacing is not None:
+            pacing = pacing_mode(str(pacing))
+        return link.run_trial(impl_dir, str(test_file),
+                              float(req.get("timeout", 600)), trace, ack_policy, pacing)
+
+    def op_shutdown(self, req):
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+        return {}
+
+
+class HarnessServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, links, impl_dirs, data_dirs, trace_dirs):
+        self.links = {link.name: link for link in links}
+        self.impl_dirs = impl_dirs
+        self.data_dirs = data_dirs
+        self.trace_dirs = trace_dirs
+        super().__init__(path, HarnessHandler)
+
+    def cleanup(self):
+        for link in self.links.values():
+            link.drain_pool()
+            link.clear()
+            link.spawner.shutdown()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="常驻实验守护进程 (需 root 权限)")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET,
+                        help=f"Unix 套接字路径 (默认 {DEFAULT_SOCKET})")
+    parser.add_argument("--pairs", type=int, default=1,
+                        help="管理的命名空间组数, 与 setup_netns.sh N 一致 (默认 1)")
+    parser.add_argument("--loopback", action="store_true",
+                        help="额外提供本地回环链路 \"lo\" (benchmark_test.py 使用)")
+    parser.add_argument("--impl-dir", action="append", default=[],
+                        help="额外允许执行的实现目录, 可重复")
+    parser.add_argument("--data-dir", action="append", default=[],
+                        help=f"额外允许作为测试文件来源的目录, 可重复 (默认只允许 {DEFAULT_DATA_DIRS[0]})")
+    parser.add_argument("--trace-dir", action="append", default=[],
+                        help=f"额外允许写入拥塞窗口追踪文件的目录, 可重复 (默认只允许 {DEFAULT_TRACE_DIRS[0]})")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default=DEFAULT_LOG_LEVEL,
+                        help=f"client/server 的日志级别 FOGGY_LOG_LEVEL (默认 {DEFAULT_LOG_LEVEL})")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if os.geteuid() != 0:
+        print("[错误] 守护进程需要 root 权限, 请使用 sudo 运行")
+        sys.exit(1)
+
+    # 所有 client/server 子进程 (包括 ip netns exec 启动的) 继承该级别
+    os.environ["FOGGY_LOG_LEVEL"] = args.log_level
+
+    result = subprocess.run(["ip", "netns", "list"], capture_output=True, text=True)
+    existing = {line.split()[0] for line in result.stdout.splitlines() if line.strip()}
+
+    workdir = tempfile.mkdtemp(prefix="foggy_harness_")
+    links = []
+    for i in range(args.pairs):
+        link = Link.netns(i, workdir)
+        if link.ns_server not in existing or link.ns_client not in existing:
+            print(f"[错误] 网络命名空间未创建: {link.ns_server}, {link.ns_client}")
+            print(f"请先运行: sudo {SCRIPT_DIR}/setup_netns.sh {args.pairs}")
+            sys.exit(1)
+        links.append(link)
+    if args.loopback:
+        links.append(Link.loopback(workdir))
+
+    impl_dirs = {Path(d).resolve() for d in DEFAULT_IMPL_DIRS + args.impl_dir}
+    data_dirs = [Path(d).resolve() for d in DEFAULT_DATA_DIRS + args.data_dir]
+    trace_dirs = [Path(d).resolve() for d in DEFAULT_TRACE_DIRS + args.trace_dir]
+
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    server = HarnessServer(args.socket, links, impl_dirs, data_dirs, trace_dirs)
+
+    # 只允许调用 sudo 的用户 (及 root) 访问
+    os.chmod(args.socket, 0o600)
+    chown_to_caller(args.socket)
+
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+
+    print(f"[守护进程] 监听 {args.socket}, 链路: {', '.join(server.links)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("[守护进程] 清理服务器进程与网络配置...")
+        server.cleanup()
+        server.server_close()
+        os.unlink(args.socket)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+实验运行目录与追加式日志
+崩溃或 Ctrl-C 之后可以用 --resume 继续, 只重跑失败或缺失的试验
+
+运行目录结构 (results/runs/<run_id>/):
+  manifest.json  - 实验配置以及 server/client/测试文件的 SHA-256, 创建后不再修改
+  journal.jsonl  - 每完成一次试验追加一行 JSON 并 fsync; 崩溃时最多丢失正在写入的一行,
+                   重新打开时截掉这半行, 之后的记录从新的一行开始
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+MANIFEST_NAME = "manifest.json"
+JOURNAL_NAME = "journal.jsonl"
+
+
+class JournalError(Exception):
+    """运行目录不存在, 或与当前配置/可执行文件不一致"""
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_atomic(path, text):
+    """写入临时文件后 rename, 保证文件要么是旧内容要么是完整的新内容"""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path.parent)
+
+
+def _truncate_torn_tail(path):
+    """截掉崩溃时写了一半的最后一行 (没有以换行结尾), 否则下一条记录会接在它后面一起损坏"""
+    if not path.exists():
+        return
+    with open(path, "r+b") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class RunJournal:
+    """一个运行目录: 只读的 manifest + 追加式 journal"""
+
+    def __init__(self, run_dir, manifest):
+        self.run_dir = Path(run_dir)
+        self.manifest = manifest
+        self.lock = threading.Lock()
+
+    @property
+    def run_id(self):
+        return self.manifest["run_id"]
+
+    @classmethod
+    def create(cls, runs_dir, config, files):
+        """新建运行目录; files 为 {名称: 路径}, 记录其 SHA-256"""
+        # 同一秒内启动的多个运行加序号区分
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        Path(runs_dir).mkdir(parents=True, exist_ok=True)
+        for n in range(1000):
+            run_id = stamp if n == 0 else f"{stamp}_{n}"
+            run_dir = Path(runs_dir) / run_id
+            try:
+                run_dir.mkdir()
+                break
+            except FileExistsError:
+                continue
+        else:
+            raise JournalError(f"无法在 {runs_dir} 中创建运行目录: {stamp}_* 已全部存在")
+        manifest = {
+            "run_id": run_id,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "config": config,
+            "hashes": {name: file_sha256(path) for name, path in files.items()},
+        }
+        _write_atomic(run_dir / MANIFEST_NAME,
+                      json.dumps(manifest, indent=2, ensure_ascii=False) + "\n")
+        return cls(run_dir, manifest)
+
+    @classmethod
+    def open(cls, runs_dir, run):
+        """打开已有运行目录; run 可以是 run_id 或目录路径"""
+        run_dir = Path(run)
+        if not (run_dir / MANIFEST_NAME).exists():
+            run_dir = Path(runs_dir) / run
+        manifest_path = run_dir / MANIFEST_NAME
+        if not manifest_path.exists():
+            raise JournalError(f"找不到运行目录: {run}")
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        _truncate_torn_tail(run_dir / JOURNAL_NAME)
+        return cls(run_dir, manifest)
+
+    def verify(self, config, files):
+        """检查当前配置与文件哈希是否与 manifest 一致, 返回差异描述列表"""
+        problems = []
+        for key, value in config.items():
+            if self.manifest["config"].get(key) != value:
+                problems.append(f"配置 {key}: 原 {self.manifest['config'].get(key)!r}, 现 {value!r}")
+        for name, path in files.items():
+            if self.manifest["hashes"].get(name) != file_sha256(path):
+                problems.append(f"{name} ({path}) 的 SHA-256 已改变")
+        return problems
+
+    def record(self, entry):
+        """追加一条记录并落盘"""
+        entry = dict(entry, time=datetime.now().isoformat(timespec="seconds"))
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self.lock:
+            with open(self.run_dir / JOURNAL_NAME, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def entries(self):
+        """读取全部记录; 崩溃时写了一半的最后一行会被忽略"""
+        path = self.run_dir / JOURNAL_NAME
+        if not path.exists():
+            return []
+        entries = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return entries
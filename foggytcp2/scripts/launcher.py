@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+实验驱动共用的服务器启动工具
+通过轮询 /proc/<pid>/net/{udp,tcp} 检测服务器监听端口已绑定, 取代固定的 time.sleep(1)
+
+/proc/<pid>/net 反映的是该进程所在的网络命名空间, 因此对
+`sudo ip netns exec <ns> ./server ...` 启动的服务器同样有效, 无需再进入命名空间。
+foggy 版本绑定 UDP 端口, system 版本处于 TCP LISTEN 状态, 两者都能检测。
+"""
+
+import subprocess
+import time
+from pathlib import Path
+
+READY_TIMEOUT = 5.0  # 等待服务器绑定端口的最长时间(秒)
+POLL_INTERVAL = 0.002  # 轮询间隔(秒)
+START_RETRIES = 5  # 服务器启动即退出(例如端口尚未释放)时的重试次数
+STOP_GRACE = 0.5  # 客户端结束后等待服务器自行退出的时间(秒)
+
+TCP_LISTEN = "0A"  # /proc/net/tcp 中 LISTEN 状态的编码
+
+
+def _children(pid):
+    """返回 pid 的直接子进程"""
+    children = []
+    try:
+        for task in Path(f"/proc/{pid}/task").iterdir():
+            children.extend(int(c) for c in (task / "children").read_text().split())
+    except OSError:
+        pass
+    return children
+
+
+def _process_tree(pid):
+    """返回 pid 及其所有后代进程 (sudo -> ip netns exec -> server)"""
+    tree = [pid]
+    i = 0
+    while i < len(tree):
+        tree.extend(_children(tree[i]))
+        i += 1
+    return tree
+
+
+def _port_bound(pid, port):
+    """检查 pid 所在网络命名空间中是否已有套接字绑定到 port"""
+    port_hex = f"{port:04X}"
+    for proto in ("udp", "udp6", "tcp", "tcp6"):
+        try:
+            lines = Path(f"/proc/{pid}/net/{proto}").read_text().splitlines()[1:]
+        except OSError:
+            continue
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 4 or not fields[1].endswith(":" + port_hex):
+                continue
+            if proto.startswith("udp") or fields[3] == TCP_LISTEN:
+                return True
+    return False
+
+
+def wait_until_bound(proc, port, timeout=READY_TIMEOUT):
+    """等待 proc (或其子进程) 绑定 port。进程提前退出或超时返回 False"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            return False
+        # 只检查叶子进程: sudo 本身仍在根命名空间, 不能代表服务器
+        tree = _process_tree(proc.pid)
+        leaves = [p for p in tree if not _children(p)]
+        if any(_port_bound(p, port) for p in leaves):
+            return True
+        time.sleep(POLL_INTERVAL)
+    return False
+
+
+def start_server(cmd, port, cwd=None, stdout=subprocess.DEVNULL,
+                 stderr=subprocess.DEVNULL, timeout=READY_TIMEOUT):
+    """启动服务器并等待其绑定端口, 返回 Popen 对象; 失败返回 None
+
+    服务器启动后立即退出(通常是上一次试验的端口尚未释放)时按指数退避重试,
+    代替每次试验之间固定的等待。
+    """
+    backoff = 0.05
+    for attempt in range(START_RETRIES):
+        proc = subprocess.Popen(cmd, stdout=stdout, stderr=stderr, cwd=cwd)
+        if wait_until_bound(proc, port, timeout):
+            return proc
+
+        if proc.poll() is None:
+            # 超时仍未绑定, 视为启动失败
+            stop_process(proc)
+            return None
+
+        time.sleep(backoff)
+        backoff *= 2
+    return None
+
+
+def stop_process(proc, grace=0.0):
+    """等待进程在 grace 秒内自行退出, 否则 terminate, 最后 kill"""
+    if proc is None or proc.poll() is not None:
+        return
+    try:
+        proc.wait(timeout=grace)
+        return
+    except subprocess.TimeoutExpired:
+        pass
+    proc.terminate()
+    try:
+        proc.wait(timeout=3)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def stop_server(proc):
+    """客户端结束后停止服务器: system 版本会自行退出, foggy 版本需要终止"""
+    stop_process(proc, grace=STOP_GRACE)
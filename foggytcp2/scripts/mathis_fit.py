@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Mathis / PFTK 模型拟合与 bootstrap 置信区间 (analyze_mathis.py 的分析引擎)
+
+吞吐量 (Mbit/s) 与丢包率 p 的两个模型, 都按链路容量截断:
+  Mathis:  B = min(cap, MSS/RTT · C/√p)
+  PFTK:    B = min(cap, MSS / (RTT·√(2bp/3) + T0·min(1, 3·√(3bp/8))·p·(1+32p²)))   (Padhye 等, 1998)
+PFTK 中取 b = 3/(2C²), 使第一项与 Mathis 的 C 含义相同, 第二项为重传超时 (T0 = RTO) 的影响。
+C 和 cap 都由数据拟合 (最小二乘); 低丢包率下吞吐量被链路带宽限制的点由 cap 解释,
+不再像直接线性回归那样把 C 拉低并产生很大的截距。
+
+置信区间为按丢包率分层的 bootstrap 百分位区间: 每个文件的所有重抽样由一次 NumPy 数组运算生成,
+每个丢包率只保留 (次数, Σy, Σy²), 多个文件和全部重抽样拼成一个二维数组一起求解, 没有逐样本的 Python 循环。
+
+用法:
+  python3 mathis_fit.py ../results/mathis_data.csv ../results/runs/*/mathis_data.csv
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# ============ 配置参数 ============
+MSS = 1400  # bytes, 与 analyze_mathis.py 相同
+RTT = 0.04  # s, 实验配置的 RTT
+RTO = 0.2  # s, PFTK 的 T0: 实验的 RTT 下 RTO 取协议栈的下限 RTO_MIN_US (foggy_tcp.h)
+RESAMPLES = 2000
+CONFIDENCE = 0.95
+MODELS = ("mathis", "pftk")
+
+# PFTK 对 C 的搜索: 对数网格定位, 再在相邻网格点之间做黄金分割。
+# 原始数据在 C_GRID 上搜索; 重抽样的结果都在原始数据的 C 附近, 只在其 LOCAL_SPAN 倍范围内的 LOCAL_POINTS 个点上搜索
+C_GRID = np.logspace(-2, 2, 33)
+LOCAL_SPAN = 3.0
+LOCAL_POINTS = 9
+GOLDEN_STEPS = 26  # 原始数据: 相对精度约 1e-6
+LOCAL_GOLDEN_STEPS = 17  # 重抽样: 相对精度约 1e-4, 远小于 bootstrap 本身的波动
+_GOLDEN = (np.sqrt(5) - 1) / 2
+CHUNK_ROWS = 8192  # 分块搜索, 临时数组留在缓存中
+
+
+def mbps_per_pkt(mss=MSS):
+    """每秒一个包对应的 Mbit/s"""
+    return mss * 8 / 1e6
+
+
+def model_throughput(model, p, c, mss=MSS, rtt=RTT, rto=RTO):
+    """不截断的模型吞吐量 (Mbit/s); p 与 c 可以广播"""
+    if model == "pftk":
+        return _pftk(c, *_pftk_terms(p, mss, rtt, rto))
+    return mbps_per_pkt(mss) * c / (rtt * np.sqrt(p))
+
+
+def _pftk_terms(p, mss, rtt, rto):
+    """PFTK 中与 C 无关的部分, 拟合时每个 C 都要重新计算模型值, 这些只算一次"""
+    sqrt_p = np.sqrt(p)
+    scale = 1 / mbps_per_pkt(mss)
+    return rtt * sqrt_p * scale, 9 / 4 * sqrt_p, rto * p * (1 + 32 * p ** 2) * scale
+
+
+def _pftk(c, rtt_term, rto_ratio, rto_term):
+    return 1 / (rtt_term / c + np.minimum(1, rto_ratio / c) * rto_term)
+
+
+# ============ 数据准备 ============
+def _levels(df):
+    """按丢包率升序分组, 返回 (丢包率数组, 各组吞吐量数组列表); p <= 0 的行无法拟合, 被忽略"""
+    df = df[df["loss_rate"] > 0]
+    groups = [(p, g["throughput_mbps"].to_numpy(dtype=float))
+              for p, g in df.groupby("loss_rate", sort=True)]
+    return np.array([p for p, _ in groups]), [y for _, y in groups]
+
+
+def _resample_sums(groups, resamples, rng):
+    """
+    第 0 行为原始数据, 其余为分层 bootstrap 重抽样, 返回每组的 (Σy, Σy²), 形状 (resamples + 1, 组数)
+
+    每个点在自己的丢包率组内有放回地重抽样, 所有重抽样由一个 (resamples, 点数) 的下标数组完成。
+    """
+    y = np.concatenate(groups)
+    sizes = np.array([len(g) for g in groups])
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    point_start = np.repeat(starts, sizes)
+    point_size = np.repeat(sizes, sizes)
+    idx = point_start + (rng.random((resamples, len(y))) * point_size).astype(np.intp)
+    samples = np.vstack((y, y[idx]))
+    return (np.add.reduceat(samples, starts, axis=1),
+            np.add.reduceat(samples * samples, starts, axis=1))
+
+
+def _stack(frames, resamples, seed):
+    """
+    把每个文件的原始数据和重抽样拼成 (文件数 × (resamples + 1), 最大组数) 的数组
+
+    组数较少的文件用 n = 0 的空组补齐 (放在最后, p = 1), 空组对误差和没有贡献。
+    """
+    rng = np.random.default_rng(seed)
+    levels = [_levels(df) for df in frames]
+    width = max((len(p) for p, _ in levels), default=0)
+    rows = resamples + 1
+    shape = (len(frames) * rows, width)
+    p = np.ones(shape)
+    n = np.zeros(shape)
+    sy = np.zeros(shape)
+    syy = np.zeros(shape)
+    for i, (loss, groups) in enumerate(levels):
+        if len(loss) == 0:
+            continue
+        block = slice(i * rows, (i + 1) * rows)
+        k = len(loss)
+        p[block, :k] = loss
+        n[block, :k] = [len(g) for g in groups]
+        sy[block, :k], syy[block, :k] = _resample_sums(groups, resamples, rng)
+    return p, n, sy, syy
+
+
+# ============ 截断模型的最小二乘 ============
+def _prefix(a):
+    """在第 1 维前面补 0 的累加和: 结果的第 j 列为前 j 组之和"""
+    return np.concatenate((np.zeros((a.shape[0], 1)), np.cumsum(a, axis=1)), axis=1)
+
+
+class _CappedFit:
+    """
+    按行 (文件 × 重抽样) 求截断模型 min(cap, f) 的最小二乘, cap 由数据决定; 与模型值无关的量只计算一次
+
+    各组按丢包率升序, 不截断的模型值 f 单调不增, 被截断的总是前 j 组。前 j 组截断为 cap 时误差和
+    (不含常数 Σy²) 为 Σ_{l>=j}(n f² - 2 f Σy) + Σ_{l<j}(n cap² - 2 cap Σy), 关于 cap 分段为二次函数,
+    最优值必在以下候选中: 不截断; 第 j 段内部的驻点 (cap 为前 j 组的均值, 且落在 [f_j, f_{j-1}] 内);
+    分段的端点 (cap 恰为某组的 f)。
+
+    内部数组为 (组数, 行数), 沿组方向的累加在整行上向量化; candidates/sse 的 f 也是这个形状。
+    """
+
+    def __init__(self, n, sy):
+        self.n = np.ascontiguousarray(n.T)
+        self.sy2 = 2 * np.ascontiguousarray(sy.T)
+        pn = np.cumsum(self.n, axis=0)
+        psy = np.cumsum(sy.T, axis=0)
+        # 分割 j = 1 .. width - 1 (截断前 j 组), 之后至少还有一个非空组
+        self.pn = pn[:-1]
+        self.psy2 = 2 * psy[:-1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.split_cap = psy[:-1] / self.pn
+        self.split_base = -self.split_cap * psy[:-1]
+        self.split_ok = (self.pn > 0) & (self.pn < pn[-1])
+        self.edge_ok = self.n[1:] > 0
+
+    def candidates(self, f):
+        """返回 (不截断的误差和, 各分割的误差和, 各端点的误差和), 不可行的候选为 inf"""
+        partial = np.cumsum(f * (self.n * f - self.sy2), axis=0)
+        total = partial[-1]
+        tail = total - partial[:-1]
+        inner = f[1:]
+        split = np.where(self.split_ok & (self.split_cap <= f[:-1]) & (self.split_cap >= inner),
+                         tail + self.split_base, np.inf)
+        edge = np.where(self.edge_ok, tail + inner * (self.pn * inner - self.psy2), np.inf)
+        return total, split, edge
+
+    def sse(self, f):
+        """各行对 cap 最优时的误差和"""
+        best, split, edge = self.candidates(f)
+        if split.shape[0] == 0:
+            return best
+        return np.minimum(best, np.minimum(split.min(axis=0), edge.min(axis=0)))
+
+    def solve(self, f):
+        """各行的 (误差和, cap), cap 为 inf 表示不截断"""
+        best, split, edge = self.candidates(f)
+        cap = np.full(len(best), np.inf)
+        rows = np.arange(len(best))
+        for sse, caps in ((split, self.split_cap), (edge, f[1:])):
+            if sse.shape[0] == 0:
+                continue
+            j = np.argmin(sse, axis=0)
+            better = sse[j, rows] < best
+            best = np.where(better, sse[j, rows], best)
+            cap = np.where(better, caps[j, rows], cap)
+        return best, cap
+
+
+def _fit_mathis(p, n, sy, mss, rtt):
+    """
+    Mathis 模型对 C 线性, 每种截断方式都有闭式解, 误差和只需要各组的累加和
+
+    前 j 组截断为其均值、其余组决定 C (需自洽); 或前 j 组截断到 a_j·C (端点)。取误差和最小的候选。
+    """
+    a = model_throughput("mathis", p, 1.0, mss, rtt)  # C = 1 时的模型值
+    pn = _prefix(n)
+    psy = _prefix(sy)
+    s_na2 = np.cumsum((n * a * a)[:, ::-1], axis=1)[:, ::-1]
+    s_ay = np.cumsum((a * sy)[:, ::-1], axis=1)[:, ::-1]
+    best = np.full(p.shape[0], np.inf)
+    c_best = np.full(p.shape[0], np.nan)
+    cap_best = np.full(p.shape[0], np.inf)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for j in range(p.shape[1]):
+            c = s_ay[:, j] / s_na2[:, j]
+            sse = -s_ay[:, j] * c
+            cap = np.full(p.shape[0], np.inf)
+            ok = s_na2[:, j] > 0
+            if j > 0:
+                cap = psy[:, j] / pn[:, j]
+                sse = sse - psy[:, j] * cap
+                ok &= (cap >= a[:, j] * c) & (cap <= a[:, j - 1] * c)
+            candidates = [(c, cap, sse, ok)]
+            if j > 0:
+                num = a[:, j] * psy[:, j] + s_ay[:, j]
+                den = a[:, j] ** 2 * pn[:, j] + s_na2[:, j]
+                edge_c = num / den
+                candidates.append((edge_c, a[:, j] * edge_c, -num * edge_c, n[:, j] > 0))
+            for cand_c, cand_cap, cand_sse, cand_ok in candidates:
+                better = cand_ok & (cand_sse < best)
+                best = np.where(better, cand_sse, best)
+                c_best = np.where(better, cand_c, c_best)
+                cap_best = np.where(better, cand_cap, cap_best)
+    return c_best, cap_best, best
+
+
+def _golden(profile, grid, steps):
+    """
+    在每行自己的对数网格 grid (行数 × 点数) 上找误差和最小的点, 再在相邻两点之间做黄金分割
+
+    profile(c) 返回各行在 c (每行一个值) 处的误差和。返回各行的 log C。
+    """
+    sse = np.stack([profile(np.exp(grid[:, k])) for k in range(grid.shape[1])], axis=1)
+    i = np.argmin(sse, axis=1)
+    rows = np.arange(grid.shape[0])
+    lo = grid[rows, np.maximum(i - 1, 0)]
+    hi = grid[rows, np.minimum(i + 1, grid.shape[1] - 1)]
+    x1 = hi - _GOLDEN * (hi - lo)
+    x2 = lo + _GOLDEN * (hi - lo)
+    f1 = profile(np.exp(x1))
+    f2 = profile(np.exp(x2))
+    for _ in range(steps):
+        # f1 <= f2 时最优点在 [lo, x2], 原 x1 成为新的 x2; 否则在 [x1, hi], 原 x2 成为新的 x1
+        left = f1 <= f2
+        hi = np.where(left, x2, hi)
+        lo = np.where(left, lo, x1)
+        kept_x = np.where(left, x1, x2)
+        kept_f = np.where(left, f1, f2)
+        new_x = np.where(left, hi - _GOLDEN * (hi - lo), lo + _GOLDEN * (hi - lo))
+        new_f = profile(np.exp(new_x))
+        x1, f1 = np.where(left, new_x, kept_x), np.where(left, new_f, kept_f)
+        x2, f2 = np.where(left, kept_x, new_x), np.where(left, kept_f, new_f)
+    return (lo + hi) / 2
+
+
+def _fit_pftk(p, n, sy, mss, rtt, rto, rows_per_file):
+    """
+    PFTK 对 C 非线性: 先对每个文件的原始数据 (每 rows_per_file 行的第一行) 在 C_GRID 上搜索,
+    再让所有行在各自文件的结果附近搜索
+    """
+    def search(select, grid, steps):
+        fitter = _CappedFit(n[select], sy[select])
+        terms = _pftk_terms(np.ascontiguousarray(p[select].T), mss, rtt, rto)
+        return _golden(lambda c: fitter.sse(_pftk(c, *terms)), grid, steps)
+
+    point = slice(None, None, rows_per_file)
+    files = p[point].shape[0]
+    center = search(point, np.tile(np.log(C_GRID), (files, 1)), GOLDEN_STEPS)
+    offsets = np.linspace(-np.log(LOCAL_SPAN), np.log(LOCAL_SPAN), LOCAL_POINTS)
+    grid = np.repeat(center, rows_per_file)[:, None] + offsets
+    log_c = np.concatenate([search(slice(start, start + CHUNK_ROWS), grid[start:start + CHUNK_ROWS],
+                                   LOCAL_GOLDEN_STEPS)
+                            for start in range(0, len(grid), CHUNK_ROWS)])
+    log_c[point] = center
+    c = np.exp(log_c)
+    best, cap = _CappedFit(n, sy).solve(model_throughput("pftk", p.T, c, mss, rtt, rto))
+    return c, cap, best
+
+
+# ============ 接口 ============
+def _interval(values, confidence):
+    """bootstrap 百分位区间; 取最近的样本值, 以便 cap 中的 inf (不截断) 不参与插值"""
+    alpha = 1 - confidence
+    return np.quantile(values, [alpha / 2, 1 - alpha / 2], axis=1, method="nearest")
+
+
+def _finite(value):
+    return None if not np.isfinite(value) else float(value)
+
+
+def fit(frames, models=MODELS, resamples=RESAMPLES, confidence=CONFIDENCE, seed=0,
+        mss=MSS, rtt=RTT, rto=RTO):
+    """
+    拟合一个或多个数据表 (需要 loss_rate 和 throughput_mbps 两列), 返回与 frames 一一对应的结果
+
+    每个结果为 {模型: {"C", "C_ci", "capacity", "capacity_ci", "r_squared", "rmse", "points"}},
+    PFTK 另有 "b" (每个 ACK 确认的包数)。capacity 为 None 表示没有点被截断; 区间为 (下限, 上限),
+    resamples 为 0 时为 None。没有 p > 0 的数据时结果为 None。
+    """
+    rows = resamples + 1
+    p, n, sy, syy = _stack(frames, resamples, seed)
+    points = n.sum(axis=1)
+    sst = syy.sum(axis=1) - sy.sum(axis=1) ** 2 / np.maximum(points, 1)
+
+    fitted = {}
+    for model in models:
+        if model == "mathis":
+            c, cap, sse = _fit_mathis(p, n, sy, mss, rtt)
+        elif model == "pftk":
+            c, cap, sse = _fit_pftk(p, n, sy, mss, rtt, rto, rows)
+        else:
+            raise ValueError(f"未知模型: {model}")
+        sse = np.maximum(sse + syy.sum(axis=1), 0)
+        fitted[model] = (c.reshape(-1, rows), cap.reshape(-1, rows), sse.reshape(-1, rows))
+    points = points.reshape(-1, rows)[:, 0]
+    sst = sst.reshape(-1, rows)[:, 0]
+
+    results = []
+    for i in range(len(frames)):
+        if points[i] == 0:
+            results.append(None)
+            continue
+        result = {}
+        for model, (c, cap, sse) in fitted.items():
+            c_ci = cap_ci = None
+            if resamples > 0:
+                c_ci = tuple(float(v) for v in _interval(c[i:i + 1, 1:], confidence)[:, 0])
+                cap_ci = tuple(_finite(v) for v in _interval(cap[i:i + 1, 1:], confidence)[:, 0])
+            entry = {
+                "C": float(c[i, 0]),
+                "C_ci": c_ci,
+                "capacity": _finite(cap[i, 0]),
+                "capacity_ci": cap_ci,
+                "r_squared": float(1 - sse[i, 0] / sst[i]) if sst[i] > 0 else None,
+                "rmse": float(np.sqrt(sse[i, 0] / points[i])),
+                "points": int(points[i]),
+            }
+            if model == "pftk":
+                entry["b"] = 3 / (2 * entry["C"] ** 2)
+            result[model] = entry
+        results.append(result)
+    return results
+
+
+def format_fit(model, entry):
+    """一行摘要, 如 "mathis: C = 1.2 [1.1, 1.3], cap = 10.6 Mbps, R² = 0.97" """
+    def span(ci, fmt):
+        if ci is None:
+            return ""
+        return " [" + ", ".join("inf" if v is None else format(v, fmt) for v in ci) + "]"
+
+    text = f"{model}: C = {entry['C']:.4f}{span(entry['C_ci'], '.4f')}"
+    if entry["capacity"] is None:
+        text += ", 无截断"
+    else:
+        text += f", cap = {entry['capacity']:.3f}{span(entry['capacity_ci'], '.3f')} Mbps"
+    if "b" in entry:
+        text += f", b = {entry['b']:.2f}"
+    if entry["r_squared"] is not None:
+        text += f", R² = {entry['r_squared']:.4f}"
+    return text + f", RMSE = {entry['rmse']:.3f} Mbps"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mathis / PFTK 模型批量拟合 (带 bootstrap 置信区间)")
+    parser.add_argument("files", nargs="+", metavar="CSV",
+                        help="experiment_mathis.py / simulate_mathis.py 生成的数据文件, 可以有多个")
+    parser.add_argument("--resamples", type=int, default=RESAMPLES,
+                        help=f"bootstrap 重抽样次数 (默认 {RESAMPLES}, 0 表示不计算区间)")
+    parser.add_argument("--confidence", type=float, default=CONFIDENCE,
+                        help=f"置信水平 (默认 {CONFIDENCE})")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子 (默认 0)")
+    parser.add_argument("--mss", type=float, default=MSS, help=f"MSS, 字节 (默认 {MSS})")
+    parser.add_argument("--rtt", type=float, default=RTT, help=f"RTT, 秒 (默认 {RTT})")
+    parser.add_argument("--rto", type=float, default=RTO, help=f"PFTK 的 T0, 秒 (默认 {RTO})")
+    args = parser.parse_args()
+    if args.resamples < 0:
+        parser.error("--resamples 不能为负数")
+    if not 0 < args.confidence < 1:
+        parser.error("--confidence 必须在 0 和 1 之间")
+    return args
+
+
+def main():
+    args = parse_args()
+    start = time.monotonic()
+    paths, frames = [], []
+    for path in args.files:
+        try:
+            frames.append(pd.read_csv(path, usecols=["loss_rate", "throughput_mbps"]))
+            paths.append(path)
+        except (OSError, ValueError) as e:
+            print(f"[跳过] {path}: {e}")
+    if not frames:
+        return 1
+
+    results = fit(frames, resamples=args.resamples, confidence=args.confidence, seed=args.seed,
+                  mss=args.mss, rtt=args.rtt, rto=args.rto)
+    elapsed = time.monotonic() - start
+
+    for path, result in zip(paths, results):
+        print(f"\n{path}")
+        if result is None:
+            print("  [跳过] 没有丢包率 > 0 的数据")
+            continue
+        for model, entry in result.items():
+            print(f"  {format_fit(model, entry)}")
+    print(f"\n[完成] {len(frames)} 个文件, 每个 {args.resamples} 次重抽样, "
+          f"{args.confidence:.0%} 置信区间, 用时 {elapsed:.2f} 秒")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用户态链路仿真 relay 的启动工具 (foggytcp/build/relay, 见 foggytcp/src/relay.cc)
+
+relay 是 client 与 server 之间的 UDP 中继, 按 netem 的方式施加带宽、延迟、抖动、丢包和队列长度限制,
+不需要 root 和网络命名空间: 每个实例只占用本机回环上的两个端口, 多个实例可以同时运行。
+实验驱动用它代替 sudo tcset (experiment_mathis.py --relay, benchmark_test.py --relay)。
+trace 让网络参数在每次试验中随时间变化 (格式见 traces.py)。
+
+只适用于 foggy 版本 (UDP) 的 client/server, 系统 TCP 版本无法经过 UDP 中继。
+"""
+
+import fcntl
+import os
+import random
+import socket
+import tempfile
+from pathlib import Path
+
+import launcher
+import simulator
+import timing
+import traces
+
+# ============ 配置参数 ============
+SCRIPT_DIR = Path(__file__).parent
+FOGGY_DIR = SCRIPT_DIR.parent / "foggytcp"
+RELAY_BIN = FOGGY_DIR / "build" / "relay"
+BUILD_HINT = f"请运行: make -C {FOGGY_DIR} relay"
+LOOPBACK = "127.0.0.1"
+PORT_LOCK_PREFIX = "foggy_port_"  # 端口锁文件名前缀, 位于系统临时目录
+RESERVE_ATTEMPTS = 20  # PortReservation 重新申请端口的次数上限
+
+
+def available():
+    """relay 是否已编译"""
+    return RELAY_BIN.exists()
+
+
+def free_ports(count):
+    """向内核申请 count 个当前空闲的 UDP 端口 (同时绑定, 保证互不相同)"""
+    socks = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(count)]
+    try:
+        for s in socks:
+            s.bind((LOOPBACK, 0))
+        return [s.getsockname()[1] for s in socks]
+    finally:
+        for s in socks:
+            s.close()
+
+
+class PortReservation:
+    """
+    向内核申请 count 个空闲 UDP 端口, 并用锁文件在本机的实验进程之间占用它们
+
+    free_ports 关闭探测套接字后端口即空闲, 而 server 每次试验、relay 每次修改参数都会重新绑定,
+    其间另一个实验进程可能分到同一端口 (foggy server 设置了 SO_REUSEADDR, 会静默共用而不报错)。
+    其他进程的 PortReservation 跳过已加锁的端口; 锁在 release() 或进程退出时释放。
+    """
+
+    def __init__(self, count):
+        self.count = count
+        self.ports = []
+        self.locks = []
+        self.renew()
+
+    def renew(self):
+        """释放当前端口并申请一组新的 (例如端口被不使用锁文件的程序占用时)"""
+        for _ in range(RESERVE_ATTEMPTS):
+            self.release()
+            self.ports = free_ports(self.count)
+            if all(self._lock(port) for port in self.ports):
+                return self.ports
+        self.release()
+        raise RuntimeError(f"无法申请 {self.count} 个未被占用的端口")
+
+    def _lock(self, port):
+        path = Path(tempfile.gettempdir()) / f"{PORT_LOCK_PREFIX}{port}.lock"
+        try:
+            fd = os.open(path, os.O_RDONLY | os.O_CREAT, 0o666)
+        except OSError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self.locks.append(fd)
+        return True
+
+    def release(self):
+        for fd in self.locks:
+            os.close(fd)
+        self.locks = []
+
+
+class Relay:
+    """
+    一个 relay 进程: client 发往 listen_port 的数据报经过整形后转发到 server_port, 服务器的回复原路返回
+
+    rate / delay / jitter 使用 tcset 的写法 ("10Mbps", "20ms"), None 表示不限制;
+    loss 为丢包率 (0~1)。默认只整形 client -> server 方向 (与只在客户端网卡上配置 netem 一致),
+    symmetric=True 时两个方向相同 (与 tcset lo 一致)。seed 为 None 时随机选择。
+    trace 为 trace 文件或附带 trace 的名称 (traces.resolve), 其中的 "-" 沿用上面的参数。
+    """
+
+    def __init__(self, listen_port, server_port, rate=None, delay=None, jitter=None, loss=0.0,
+                 limit=simulator.NETEM_LIMIT, symmetric=False, seed=None, trace=None,
+                 ip=LOOPBACK):
+        self.listen_port = listen_port
+        self.server_port = server_port
+        self.ip = ip
+        self.rate = rate
+        self.delay = delay
+        self.jitter = jitter
+        self.loss = loss
+        self.limit = limit
+        self.symmetric = symmetric
+        self.seed = random.getrandbits(63) if seed is None else seed
+        self.trace = None if trace is None else traces.resolve(trace)
+        self.proc = None
+        self.stats_path = None
+
+    def command(self):
+        cmd = [str(RELAY_BIN)]
+        if self.rate is not None:
+            cmd += ["--rate", str(simulator.parse_rate(self.rate) / 1e6)]
+        if self.delay is not None:
+            cmd += ["--delay", str(simulator.parse_delay(self.delay) / 1e6)]
+        if self.jitter is not None:
+            cmd += ["--jitter", str(simulator.parse_delay(self.jitter) / 1e6)]
+        if self.loss:
+            cmd += ["--loss", repr(self.loss)]
+        cmd += ["--limit", str(self.limit), "--seed", str(self.seed)]
+        if self.symmetric:
+            cmd.append("--symmetric")
+        if self.trace is not None:
+            cmd += ["--trace", str(self.trace)]
+        if self.stats_path is not None:
+            cmd += ["--stats", str(self.stats_path)]
+        return cmd + [self.ip, str(self.listen_port), self.ip, str(self.server_port)]
+
+    def describe(self):
+        parts = [f"带宽={self.rate or '不限'}", f"延迟={self.delay or '0ms'}"]
+        if self.jitter:
+            parts.append(f"抖动={self.jitter}")
+        parts.append(f"丢包率={self.loss * 100}%")
+        if self.trace is not None:
+            parts.append(f"trace={self.trace.stem}")
+        parts.append("双向" if self.symmetric else "单向")
+        return ", ".join(parts)
+
+    def start(self):
+        """启动 relay 并等待其绑定监听端口, 成功返回 True"""
+        if not available():
+            return False
+        # 空文件: relay 退出时写入计数, 未写入时 timing.load() 返回 None
+        self.stats_path = timing.make_path(tempfile.gettempdir(), "relay", "stats")
+        self.proc = launcher.start_server(self.command(), self.listen_port)
+        return self.proc is not None
+
+    def stop(self):
+        """停止 relay, 返回计数 ({"forward": ..., "reverse": ..., "trace_changes": ...}), 没有时返回 None"""
+        if self.proc is None:
+            return None
+        launcher.stop_process(self.proc)
+        self.proc = None
+        stats = timing.load(self.stats_path)
+        timing.remove(self.stats_path)
+        return stats
+
+    def __enter__(self):
+        if not self.start():
+            raise RuntimeError(f"relay 启动失败 ({RELAY_BIN}); {BUILD_HINT}")
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+实验结果的列式存储: 两个驱动脚本 (experiment_mathis.py, scripts/benchmark_test.py) 的结果写入同一个数据集
+
+目录结构 (results/store/), 每个分区一个文件, 按 run_id / 算法 / 场景划分, 分区内每次试验一行 (trial 列):
+  <run_id>/<algorithm>/<scenario>.parquet   - 安装了 pyarrow 时
+  <run_id>/<algorithm>/<scenario>.npz       - 否则, 每列一个 NumPy 数组 (不使用 pickle)
+  _summary_cache.json                       - 每个分区的汇总统计, 以文件内容的 SHA-256 判断是否失效
+
+Mathis 实验的 run_id 与 results/runs/ 下的运行目录相同, 算法为 foggytcp2_reno, 场景为 loss<丢包率>;
+benchmark_test.py 的 run_id 为 benchmark_<时间戳>, 场景为测试场景名。
+重新写入一个分区时内容不变则不改动文件, 所以追加几次试验后重新分析只会重新计算变化或新增的分区。
+
+用法:
+  python3 results_store.py                                  # 列出分区及各 (算法, 场景) 的汇总
+  python3 results_store.py --import ../results/mathis_data*.csv /path/to/benchmark_results_*.csv
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+
+from journal import file_sha256
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 没有 pyarrow 时使用 npz
+    pa = pq = None
+
+# ============ 配置参数 ============
+SCRIPT_DIR = Path(__file__).parent
+STORE_DIR = SCRIPT_DIR.parent / "results" / "store"
+CACHE_NAME = "_summary_cache.json"
+CACHE_VERSION = 1
+SUFFIXES = (".parquet", ".npz")
+FORMAT_SUFFIX = ".parquet" if pq is not None else ".npz"
+
+# Mathis 实验的分区键
+MATHIS_ALGORITHM = "foggytcp2_reno"
+LOSS_SCENARIO = re.compile(r"^loss(?P<loss>[0-9.eE+-]+)$")
+
+# 分区路径中不允许的字符替换为 "_"; 以 "_" 或 "." 开头的名称保留给存储本身
+_UNSAFE = re.compile(r"[^A-Za-z0-9.+=-]")
+
+
+class StoreError(ValueError):
+    pass
+
+
+def loss_scenario(loss_rate):
+    """Mathis 实验中一个丢包率对应的场景名, 与拥塞窗口追踪文件名一致 (loss0.001)"""
+    return f"loss{loss_rate}"
+
+
+def scenario_loss(scenario):
+    """loss_scenario 的逆运算; 不是丢包率场景时返回 None"""
+    m = LOSS_SCENARIO.match(scenario)
+    return float(m.group("loss")) if m else None
+
+
+def _safe(name):
+    name = _UNSAFE.sub("_", str(name))
+    if not name or name[0] in "._":
+        raise StoreError(f"无效的分区名: {name!r}")
+    return name
+
+
+# ============ 列的编码 ============
+def _parse(text):
+    """字符串 (CSV 中的值, 或驱动脚本格式化后的数值) 转换为 bool / int / float, 空字符串为 None, 其余保持字符串"""
+    if text is None or text == "":
+        return None
+    if text in ("True", "False"):
+        return text == "True"
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return text
+
+
+def _column(values):
+    """
+    一列值转换为 NumPy 数组: 全为 bool -> bool; 全为整数 -> int64; 数值 (可有缺失, 或全部缺失) -> float64, 缺失为 NaN;
+    否则为字符串
+    """
+    values = [_parse(v) if isinstance(v, str) else v for v in values]
+    present = [v for v in values if v is not None and v != ""]
+    if present and all(isinstance(v, (bool, np.bool_)) for v in present) and len(present) == len(values):
+        return np.array(values, dtype=bool)
+    numeric = all(isinstance(v, (int, float, np.integer, np.floating))
+                  and not isinstance(v, (bool, np.bool_)) for v in present)
+    if numeric:
+        if present and len(present) == len(values) and all(isinstance(v, (int, np.integer)) for v in present):
+            return np.array(values, dtype=np.int64)
+        return np.array([np.nan if v is None or v == "" else v for v in values], dtype=float)
+    return np.array(["" if v is None else str(v) for v in values], dtype=str)
+
+
+def _same(a, b):
+    if a.dtype.kind != b.dtype.kind or a.shape != b.shape:
+        return False
+    if a.dtype.kind == "f":
+        return np.array_equal(a, b, equal_nan=True)
+    return np.array_equal(a, b)
+
+
+# ============ 分区读写 ============
+class Partition:
+    """一个分区文件及其键"""
+
+    def __init__(self, root, path):
+        self.path = Path(path)
+        self.run_id, self.algorithm = self.path.relative_to(root).parts[:2]
+        self.scenario = self.path.stem
+
+    @property
+    def key(self):
+        return f"{self.run_id}/{self.algorithm}/{self.path.name}"
+
+    def __repr__(self):
+        return f"Partition({self.key})"
+
+
+def read(path):
+    """读取一个分区文件, 返回 {列名: 数组}"""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        if pq is None:
+            raise StoreError(f"读取 {path} 需要 pyarrow")
+        table = pq.read_table(path)
+        return {name: table.column(name).to_numpy() for name in table.column_names}
+    with np.load(path, allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
+
+
+def _write(path, columns):
+    """写入临时文件后 rename, 读者不会看到写了一半的分区"""
+    tmp = path.with_name(path.name + ".tmp")
+    if path.suffix == ".parquet":
+        pq.write_table(pa.table(columns), tmp)
+    else:
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, **columns)
+    os.replace(tmp, path)
+
+
+def write(rows, run_id, root=STORE_DIR):
+    """
+    写入一次运行的结果; rows 为字典列表, 每行需要 "algorithm"、"scenario"、"trial" 三个键
+
+    按 (algorithm, scenario) 分区, 每个分区保存该运行在此分区的全部试验 (按 trial 排序, 同一 trial 以最后一行为准),
+    覆盖已有的同名分区; 内容不变的分区不改动文件。返回 (写入的分区数, 未变的分区数)。
+    """
+    root = Path(root)
+    run_dir = root / _safe(run_id)
+    groups = {}
+    for row in rows:
+        row = dict(row)
+        key = (_safe(row.pop("algorithm")), _safe(row.pop("scenario")))
+        groups.setdefault(key, {})[row["trial"]] = row
+
+    written = unchanged = 0
+    for (algorithm, scenario), trials in sorted(groups.items()):
+        ordered = [trials[t] for t in sorted(trials)]
+        names = list(dict.fromkeys(name for row in ordered for name in row))
+        columns = {name: _column([row.get(name) for row in ordered]) for name in names}
+
+        directory = run_dir / algorithm
+        path = directory / f"{scenario}{FORMAT_SUFFIX}"
+        if path.exists():
+            old = read(path)
+            if old.keys() == columns.keys() and all(_same(old[k], columns[k]) for k in columns):
+                unchanged += 1
+                continue
+        directory.mkdir(parents=True, exist_ok=True)
+        _write(path, columns)
+        # 换了存储格式时删除另一种格式的旧文件, 每个分区只有一个文件
+        for suffix in SUFFIXES:
+            if suffix != FORMAT_SUFFIX:
+                directory.joinpath(f"{scenario}{suffix}").unlink(missing_ok=True)
+        written += 1
+    return written, unchanged
+
+
+def partitions(root=STORE_DIR, runs=None, algorithms=None, scenarios=None):
+    """列出分区, 可按 run_id / 算法 / 场景过滤 (None 表示不过滤)"""
+    root = Path(root)
+    found = []
+    for suffix in SUFFIXES:
+        for path in root.glob(f"*/*/*{suffix}"):
+            part = Partition(root, path)
+            if ((runs is None or part.run_id in runs)
+                    and (algorithms is None or part.algorithm in algorithms)
+                    and (scenarios is None or part.scenario in scenarios)):
+                found.append(part)
+    return sorted(found, key=lambda p: p.key)
+
+
+# ============ 汇总统计与缓存 ============
+def partition_stats(columns):
+    """
+    一个分区的汇总: 试验数、成功数, 以及成功试验中每个数值列的 (n, Σx, Σx², min, max)
+
+    这些量可以直接相加合并, 多个运行的同一场景不需要重新读取数据。没有 success 列时所有行都算成功。
+    """
+    rows = len(next(iter(columns.values()))) if columns else 0
+    success = columns.get("success")
+    ok = success.astype(bool) if success is not None else np.ones(rows, dtype=bool)
+    stats = {"attempts": rows, "successes": int(ok.sum()), "columns": {}}
+    for name, values in columns.items():
+        if name == "trial" or values.dtype.kind not in "iuf":
+            continue
+        x = values[ok].astype(float)
+        x = x[np.isfinite(x)]
+        if len(x) == 0:
+            continue
+        stats["columns"][name] = {"n": len(x), "sum": float(x.sum()), "sumsq": float((x * x).sum()),
+                                  "min": float(x.min()), "max": float(x.max())}
+    return stats
+
+
+def merge_stats(items):
+    """合并多个分区的汇总"""
+    merged = {"attempts": 0, "successes": 0, "columns": {}}
+    for stats in items:
+        merged["attempts"] += stats["attempts"]
+        merged["successes"] += stats["successes"]
+        for name, s in stats["columns"].items():
+            m = merged["columns"].get(name)
+            if m is None:
+                merged["columns"][name] = dict(s)
+                continue
+            m["n"] += s["n"]
+            m["sum"] += s["sum"]
+            m["sumsq"] += s["sumsq"]
+            m["min"] = min(m["min"], s["min"])
+            m["max"] = max(m["max"], s["max"])
+    return merged
+
+
+def column_summary(stats, name):
+    """某列的 (次数, 均值, 样本标准差, 最小值, 最大值); 没有数据时返回 None"""
+    s = stats["columns"].get(name)
+    if s is None:
+        return None
+    n = s["n"]
+    mean = s["sum"] / n
+    var = (s["sumsq"] - s["sum"] * mean) / (n - 1) if n > 1 else 0.0
+    return n, mean, math.sqrt(max(var, 0.0)), s["min"], s["max"]
+
+
+def _load_cache(root):
+    path = root / CACHE_NAME
+    try:
+        with open(path, encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    if cache.get("version") != CACHE_VERSION:
+        return {}
+    return cache.get("partitions", {})
+
+
+def _save_cache(root, entries):
+    path = root / CACHE_NAME
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": CACHE_VERSION, "partitions": entries}, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def summarize(parts, root=STORE_DIR):
+    """
+    返回 ([(分区, 汇总)], {"cached", "computed"}), 汇总优先取自缓存
+
+    大小和修改时间都未变的分区直接使用缓存; 否则重新计算 SHA-256, 与缓存一致时仍沿用 (只更新文件元数据),
+    不一致才读取该分区重新统计。缓存中已不存在的分区会被清除。
+    """
+    root = Path(root)
+    cache = _load_cache(root)
+    entries = {}
+    result = []
+    counts = {"cached": 0, "computed": 0}
+    for part in parts:
+        st = part.path.stat()
+        entry = cache.get(part.key)
+        if entry is not None and (entry["size"], entry["mtime_ns"]) != (st.st_size, st.st_mtime_ns):
+            digest = file_sha256(part.path)
+            entry = dict(entry, size=st.st_size, mtime_ns=st.st_mtime_ns) if entry["sha256"] == digest else None
+        if entry is None:
+            entry = {"sha256": file_sha256(part.path), "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                     "stats": partition_stats(read(part.path))}
+            counts["computed"] += 1
+        else:
+            counts["cached"] += 1
+        entries[part.key] = entry
+        result.append((part, entry["stats"]))
+
+    # 只保留仍然存在的分区; 本次未涉及 (被过滤掉) 的分区原样保留
+    for key, entry in cache.items():
+        if key not in entries and (root / key).exists():
+            entries[key] = entry
+    if entries != cache and root.is_dir():
+        _save_cache(root, entries)
+    return result, counts
+
+
+# ============ 导入旧的 CSV ============
+def _benchmark_algorithm(row):
+    """benchmark_test.py 的一行对应的算法名: 实现名, 以及 ACK 策略、pacing (如果有)"""
+    name = row["implementation"]
+    if row.get("ack_policy"):
+        name += f"+ack={row['ack_policy']}"
+    if row.get("pacing"):
+        name += f"+pacing={row['pacing']}"
+    return name
+
+
+def benchmark_rows(rows):
+    """benchmark_test.py 的结果行加上分区键"""
+    return [dict(row, algorithm=_benchmark_algorithm(row)) for row in rows]
+
+
+def mathis_rows(rows):
+    """experiment_mathis.py 的结果行 (含 loss_rate、trial) 加上分区键"""
+    return [dict(row, algorithm=MATHIS_ALGORITHM, scenario=loss_scenario(row["loss_rate"]))
+            for row in rows]
+
+
+def import_csv(path, root=STORE_DIR):
+    """
+    导入一个已有的结果 CSV, 根据列判断来源; 返回 (run_id, 行数, 写入的分区数, 未变的分区数)
+
+    run_id 为文件名 (去掉 .csv); results/runs/<run_id>/ 中导出的 CSV 使用运行目录名。
+    同一分区中重复的 trial 以最后一行为准。
+    """
+    path = Path(path)
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = [{k: _parse(v) for k, v in row.items()} for row in csv.DictReader(f)]
+    if not rows:
+        raise StoreError(f"{path} 中没有数据")
+    if "implementation" in rows[0] and "scenario" in rows[0]:
+        rows = benchmark_rows(rows)
+    elif "loss_rate" in rows[0] and "trial" in rows[0]:
+        rows = mathis_rows(rows)
+    else:
+        raise StoreError(f"无法识别 {path} 的格式 (列: {', '.join(rows[0])})")
+
+    if (path.parent / "manifest.json").exists():
+        run_id = path.parent.name
+    else:
+        run_id = path.name.removesuffix(".csv")
+    return (run_id, len(rows), *write(rows, run_id, root))
+
+
+# ============ 主函数 ============
+def print_summary(root, runs=None):
+    parts = partitions(root, runs=runs)
+    if not parts:
+        print(f"[信息] {root} 中没有{'匹配的' if runs else ''}分区")
+        return
+    summaries, counts = summarize(parts, root)
+    print(f"[存储] {root}: {len(parts)} 个分区, {len({p.run_id for p in parts})} 次运行"
+          f" (缓存命中 {counts['cached']}, 重新统计 {counts['computed']})")
+
+    groups = {}
+    for part, stats in summaries:
+        groups.setdefault((part.algorithm, part.scenario), []).append(stats)
+    print("\n算法 / 场景: 成功/试验, 吞吐量 Mbps (均值 ± 标准差)")
+    for (algorithm, scenario), items in sorted(groups.items()):
+        stats = merge_stats(items)
+        summary = column_summary(stats, "throughput_mbps")
+        throughput = "-" if summary is None else f"{summary[1]:.3f} ± {summary[2]:.3f}"
+        print(f"  {algorithm:32s} {scenario:16s} {stats['successes']:>4d}/{stats['attempts']:<4d} {throughput:>16s}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="实验结果的列式存储")
+    parser.add_argument("--store", metavar="DIR", default=STORE_DIR, type=Path,
+                        help=f"存储目录 (默认 {STORE_DIR})")
+    parser.add_argument("--import", dest="imports", nargs="+", metavar="CSV",
+                        help="导入已有的结果 CSV (mathis_data*.csv, benchmark_results_*.csv)")
+    parser.add_argument("--run", dest="runs", action="append", metavar="RUN",
+                        help="只汇总指定的 run_id, 可重复 (默认全部; 不同运行的同一场景会合并)")
+    args = parser.parse_args()
+
+    for path in args.imports or []:
+        try:
+            run_id, rows, written, unchanged = import_csv(path, args.store)
+        except (OSError, StoreError) as e:
+            print(f"[跳过] {e}")
+            continue
+        print(f"[导入] {path} -> {run_id}: {rows} 行, 写入 {written} 个分区, {unchanged} 个未变")
+    print_summary(args.store, args.runs)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
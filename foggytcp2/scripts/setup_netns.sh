@@ -2,6 +2,12 @@
 # 网络命名空间设置脚本
 # 用于 Mathis 假设验证实验
 # 创建隔离的网络环境以支持 tcconfig 网络参数控制
+#
+# 用法: sudo ./setup_netns.sh [组数N]
+#   N 默认为 1, 即只创建 ns_server/ns_client 一组。
+#   N > 1 时额外创建 ns_server1/ns_client1 ... ns_server{N-1}/ns_client{N-1},
+#   供 experiment_mathis.py --workers N 并行使用。
+#   第 i 组使用子网 10.0.{i+1}.0/24, 服务器为 .1, 客户端为 .2
 
 set -e  # 遇到错误立即退出
 
@@ -17,59 +23,90 @@ if [ "$EUID" -ne 0 ]; then
 fi
 
 # 配置参数
+NUM_PAIRS="${1:-1}"
+if ! [[ "$NUM_PAIRS" =~ ^[1-9][0-9]*$ ]] || [ "$NUM_PAIRS" -gt 250 ]; then
+    echo "[错误] 组数必须是 1-250 之间的整数: $NUM_PAIRS"
+    exit 1
+fi
+
 NS_SERVER="ns_server"
 NS_CLIENT="ns_client"
 VETH_SERVER="veth_server"
 VETH_CLIENT="veth_client"
-IP_SERVER="10.0.1.1/24"
-IP_CLIENT="10.0.1.2/24"
+
+# 第 i 组的名称后缀 (第 0 组保持原名, 兼容单组用法)
+suffix() {
+    if [ "$1" -eq 0 ]; then echo ""; else echo "$1"; fi
+}
 
 echo "[1/6] 清理可能存在的旧配置..."
 # 删除可能存在的旧命名空间
-ip netns del $NS_SERVER 2>/dev/null || true
-ip netns del $NS_CLIENT 2>/dev/null || true
+for ((i = 0; i < NUM_PAIRS; i++)); do
+    s=$(suffix $i)
+    ip netns del $NS_SERVER$s 2>/dev/null || true
+    ip netns del $NS_CLIENT$s 2>/dev/null || true
+done
 echo "     ✓ 清理完成"
 
 echo "[2/6] 创建网络命名空间..."
-ip netns add $NS_SERVER
-ip netns add $NS_CLIENT
-echo "     ✓ 命名空间已创建: $NS_SERVER, $NS_CLIENT"
+for ((i = 0; i < NUM_PAIRS; i++)); do
+    s=$(suffix $i)
+    ip netns add $NS_SERVER$s
+    ip netns add $NS_CLIENT$s
+    echo "     ✓ 命名空间已创建: $NS_SERVER$s, $NS_CLIENT$s"
+done
 
 echo "[3/6] 创建虚拟网络接口对..."
-ip link add $VETH_SERVER type veth peer name $VETH_CLIENT
-echo "     ✓ 接口对已创建: $VETH_SERVER <-> $VETH_CLIENT"
+for ((i = 0; i < NUM_PAIRS; i++)); do
+    s=$(suffix $i)
+    ip link add $VETH_SERVER$s type veth peer name $VETH_CLIENT$s
+    echo "     ✓ 接口对已创建: $VETH_SERVER$s <-> $VETH_CLIENT$s"
+done
 
 echo "[4/6] 将接口分配到命名空间..."
-ip link set $VETH_SERVER netns $NS_SERVER
-ip link set $VETH_CLIENT netns $NS_CLIENT
+for ((i = 0; i < NUM_PAIRS; i++)); do
+    s=$(suffix $i)
+    ip link set $VETH_SERVER$s netns $NS_SERVER$s
+    ip link set $VETH_CLIENT$s netns $NS_CLIENT$s
+done
 echo "     ✓ 接口已分配到各自的命名空间"
 
 echo "[5/6] 配置 IP 地址..."
-ip netns exec $NS_SERVER ip addr add $IP_SERVER dev $VETH_SERVER
-ip netns exec $NS_CLIENT ip addr add $IP_CLIENT dev $VETH_CLIENT
-echo "     ✓ Server: $IP_SERVER"
-echo "     ✓ Client: $IP_CLIENT"
+for ((i = 0; i < NUM_PAIRS; i++)); do
+    s=$(suffix $i)
+    subnet="10.0.$((i + 1))"
+    ip netns exec $NS_SERVER$s ip addr add $subnet.1/24 dev $VETH_SERVER$s
+    ip netns exec $NS_CLIENT$s ip addr add $subnet.2/24 dev $VETH_CLIENT$s
+    echo "     ✓ Server$s: $subnet.1/24  Client$s: $subnet.2/24"
+done
 
 echo "[6/6] 启用网络接口..."
-ip netns exec $NS_SERVER ip link set dev $VETH_SERVER up
-ip netns exec $NS_CLIENT ip link set dev $VETH_CLIENT up
-ip netns exec $NS_SERVER ip link set dev lo up
-ip netns exec $NS_CLIENT ip link set dev lo up
+for ((i = 0; i < NUM_PAIRS; i++)); do
+    s=$(suffix $i)
+    ip netns exec $NS_SERVER$s ip link set dev $VETH_SERVER$s up
+    ip netns exec $NS_CLIENT$s ip link set dev $VETH_CLIENT$s up
+    ip netns exec $NS_SERVER$s ip link set dev lo up
+    ip netns exec $NS_CLIENT$s ip link set dev lo up
+done
 echo "     ✓ 所有接口已启用"
 
 echo ""
 echo "========================================"
-echo "网络命名空间设置完成!"
+echo "网络命名空间设置完成! (共 $NUM_PAIRS 组)"
 echo "========================================"
 echo ""
 echo "验证网络连通性:"
-echo "  从 client 到 server:"
-if ip netns exec $NS_CLIENT ping -c 2 -W 2 10.0.1.1 >/dev/null 2>&1; then
-    echo "    ✓ Ping 成功 (10.0.1.1)"
-else
-    echo "    ✗ Ping 失败"
-    exit 1
-fi
+for ((i = 0; i < NUM_PAIRS; i++)); do
+    s=$(suffix $i)
+    server_ip="10.0.$((i + 1)).1"
+    echo "  从 $NS_CLIENT$s 到 $NS_SERVER$s:"
+    if ip netns exec $NS_CLIENT$s ping -c 2 -W 2 $server_ip >/dev/null 2>&1; then
+        echo "    ✓ Ping 成功 ($server_ip)"
+    else
+        echo "    ✗ Ping 失败"
+        exit 1
+    fi
+done
 
 echo ""
 echo "查看网络配置:"
@@ -89,5 +126,10 @@ echo ""
 echo "  设置网络参数 (在 client 端):"
 echo "    sudo ip netns exec $NS_CLIENT tcset $VETH_CLIENT --rate 10Mbps --delay 20ms --loss 0.01%"
 echo ""
+if [ "$NUM_PAIRS" -gt 1 ]; then
+    echo "  并行实验:"
+    echo "    sudo python3 experiment_mathis.py --workers $NUM_PAIRS"
+    echo ""
+fi
 echo "清理环境请运行: sudo ./cleanup_netns.sh"
 echo "========================================"
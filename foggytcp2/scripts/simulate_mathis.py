@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Mathis 实验的仿真版本
+用 simulator.py 在虚拟时钟下执行与 experiment_mathis.py 相同的丢包率 × 试验次数扫描,
+不需要网络命名空间、sudo 或真实传输时间, 多个进程并行执行。
+
+每次试验的随机数种子由 --seed、丢包率和试验序号确定, 与进程数和执行顺序无关,
+所以相同参数两次运行生成的 CSV 完全相同。结果使用 experiment_mathis.py 的 CSV 格式,
+可以直接交给 analyze_mathis.py:
+
+  make -C ../foggytcp sim
+  python3 simulate_mathis.py --jobs 8 --seed 1
+  python3 analyze_mathis.py --input ../results/mathis_sim_data.csv
+"""
+
+import argparse
+import csv
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import adaptive
+import simulator
+import tcp_stats
+from experiment_mathis import (
+    BANDWIDTH, CSV_HEADER, DELAY, LOSS_RATES, RESULTS_DIR, TEST_FILE, TIMEOUT_SECONDS,
+    TRIALS_PER_LOSS, calculate_throughput,
+)
+from harness_daemon import pacing_mode
+
+# ============ 配置参数 ============
+OUTPUT_CSV = RESULTS_DIR / "mathis_sim_data.csv"
+DEFAULT_FILE_SIZE = 10_000_000  # 测试文件不存在时使用的传输大小
+
+
+def trial_seed(seed, loss_rate, trial):
+    """由总种子、丢包率和试验序号导出一次试验的种子 (字符串种子不受 PYTHONHASHSEED 影响)"""
+    return random.Random(f"{seed}:{loss_rate!r}:{trial}").getrandbits(64)
+
+
+def run_trial(config, loss_rate, trial):
+    """在 worker 进程中仿真一次试验, 返回 (loss_rate, trial, CSV 行或 None, 链路统计)"""
+    if config["burst"] is None:
+        loss = simulator.BernoulliLoss(loss_rate)
+    else:
+        loss = simulator.GilbertElliottLoss.from_mean(loss_rate, config["burst"])
+    result = simulator.run_transfer(
+        config["file_size"], config["rate_bps"], config["delay_ns"], loss,
+        seed=trial_seed(config["seed"], loss_rate, trial), limit=config["limit"],
+        reverse_delay_ns=config["reverse_delay_ns"], ack_policy=config["ack_policy"],
+        pacing=config["pacing"], timeout_s=TIMEOUT_SECONDS)
+    if result["timed_out"]:
+        return loss_rate, trial, None, result["forward"]
+
+    duration_ms = result["duration_ms"]
+    one_over_sqrt_p = 1 / (loss_rate ** 0.5) if loss_rate > 0 else float('inf')
+    row = [
+        loss_rate,
+        trial,
+        duration_ms,
+        config["file_size"],
+        calculate_throughput(duration_ms, config["file_size"]),
+        one_over_sqrt_p,
+        *tcp_stats.csv_values(result["stats"]),
+        "",
+        adaptive.STOP_FIXED,
+    ]
+    return loss_rate, trial, row, result["forward"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mathis 假设验证 - 离散事件仿真")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="并行进程数 (默认 CPU 核数)")
+    parser.add_argument("--seed", type=int, default=1, help="随机数种子 (默认 1)")
+    parser.add_argument("--trials", type=int, default=TRIALS_PER_LOSS,
+                        help=f"每个丢包率的试验次数 (默认 {TRIALS_PER_LOSS})")
+    parser.add_argument("--loss-rates", type=float, nargs="+", default=LOSS_RATES,
+                        help="丢包率列表 (默认与 experiment_mathis.py 相同)")
+    parser.add_argument("--file-size", type=int, default=None,
+                        help=f"传输字节数 (默认为 {TEST_FILE.name} 的大小)")
+    parser.add_argument("--bandwidth", default=BANDWIDTH, help=f"带宽 (默认 {BANDWIDTH})")
+    parser.add_argument("--delay", default=DELAY, help=f"数据方向单向延迟 (默认 {DELAY})")
+    parser.add_argument("--reverse-delay", default="0ms",
+                        help="ACK 方向延迟 (默认 0ms, 与只在客户端网卡上配置 netem 一致)")
+    parser.add_argument("--limit", type=int, default=simulator.NETEM_LIMIT,
+                        help=f"队列长度, 包 (默认 netem 的 {simulator.NETEM_LIMIT})")
+    parser.add_argument("--burst", type=float, default=None,
+                        help="使用 Gilbert-Elliott 丢包, 指定坏状态的平均长度 (包); 默认独立丢包")
+    parser.add_argument("--ack-policy", default=None, help="FOGGY_ACK_POLICY 的值")
+    parser.add_argument("--pacing", type=pacing_mode, default=None, help="FOGGY_PACING 的值")
+    parser.add_argument("--output", default=str(OUTPUT_CSV), help=f"输出 CSV (默认 {OUTPUT_CSV})")
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs 必须至少为 1")
+    if args.trials < 1:
+        parser.error("--trials 必须至少为 1")
+    return args
+
+
+def main():
+    args = parse_args()
+    try:
+        config = {
+            "file_size": args.file_size or (TEST_FILE.stat().st_size if TEST_FILE.exists()
+                                            else DEFAULT_FILE_SIZE),
+            "rate_bps": simulator.parse_rate(args.bandwidth),
+            "delay_ns": simulator.parse_delay(args.delay),
+            "reverse_delay_ns": simulator.parse_delay(args.reverse_delay),
+            "limit": args.limit,
+            "burst": args.burst,
+            "ack_policy": args.ack_policy,
+            "pacing": args.pacing,
+            "seed": args.seed,
+        }
+        simulator.load_library()
+    except (ValueError, simulator.SimulatorError) as e:
+        print(f"[错误] {e}")
+        return 1
+
+    tasks = [(loss_rate, trial) for loss_rate in args.loss_rates
+             for trial in range(1, args.trials + 1)]
+    model = "独立丢包" if args.burst is None else f"Gilbert-Elliott (平均突发 {args.burst} 包)"
+    print("=" * 60)
+    print("Mathis 假设验证 - 离散事件仿真")
+    print("=" * 60)
+    print(f"[配置] 带宽={args.bandwidth}, 延迟={args.delay}, ACK 方向延迟={args.reverse_delay}, "
+          f"队列={args.limit} 包, {model}")
+    print(f"[配置] 文件 {config['file_size']} 字节, {len(args.loss_rates)} 个丢包率 × "
+          f"{args.trials} 次 = {len(tasks)} 次试验, {args.jobs} 个进程, 种子 {args.seed}")
+
+    rows = {}
+    failed = 0
+    virtual_ms = 0.0
+    start = time.monotonic()
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(run_trial, config, loss_rate, trial) for loss_rate, trial in tasks]
+        for done, future in enumerate(as_completed(futures), 1):
+            loss_rate, trial, row, link = future.result()
+            if row is None:
+                failed += 1
+                print(f"[{done}/{len(tasks)}] 丢包率 {loss_rate} 试验 {trial}: 超时")
+                continue
+            rows[(loss_rate, trial)] = row
+            virtual_ms += row[2]
+            print(f"[{done}/{len(tasks)}] 丢包率 {loss_rate} 试验 {trial}: "
+                  f"{row[4]:.2f} Mbps, 丢包 {link['losses']}, 队列丢弃 {link['queue_drops']}")
+    elapsed = time.monotonic() - start
+
+    # 按 (丢包率, 试验) 排序写出, 与完成顺序无关
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for key in sorted(rows):
+            writer.writerow(rows[key])
+
+    print(f"\n[完成] {len(rows)} 次成功, {failed} 次超时, 用时 {elapsed:.1f} 秒 "
+          f"(虚拟时间 {virtual_ms / 1000:.1f} 秒, {virtual_ms / 1000 / max(elapsed, 1e-9):.0f} 倍)")
+    print(f"[保存] {args.output}")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离散事件链路仿真: 在虚拟时钟下运行 foggytcp 真实的窗口与拥塞控制代码
+
+foggytcp/build/libfoggy_sim.so (make sim, 接口见 foggytcp/inc/foggy_sim.h) 提供没有 UDP 套接字和后台线程的 socket,
+本模块用 ctypes 调用它, 并扮演后台线程和网络:
+  - 发送端与接收端各一个 socket, 应用层分别是一次写完整个文件的发送方和立即读走数据的接收方
+  - 数据方向经过一条仿 netem 的链路: 入队时按丢包模型丢包, 超过队列长度丢弃, 按带宽串行发送, 再加单向延迟
+  - ACK 方向默认只有延迟 (0), 与实验中只在客户端网卡上配置 tcset/netem 一致
+  - 事件按虚拟时间 (整数纳秒) 处理, 不读取墙上时钟, 随机数只来自 random.Random(seed), 相同参数和种子的结果完全相同
+
+用法:
+  make -C ../foggytcp sim
+  python3 simulator.py --loss 0.01 --seed 1
+"""
+
+import argparse
+import ctypes
+import heapq
+import json
+import re
+from collections import deque
+from pathlib import Path
+
+# ============ 配置参数 ============
+SCRIPT_DIR = Path(__file__).parent
+PROJECT_ROOT = SCRIPT_DIR.parent
+FOGGY_DIR = PROJECT_ROOT / "foggytcp"
+LIB_PATH = FOGGY_DIR / "build" / "libfoggy_sim.so"
+
+NO_EVENT = (1 << 64) - 1  # FOGGY_SIM_NO_EVENT
+START_NS = 1_000_000_000  # 虚拟时钟的起点; 协议栈把 0 当作 "未设置" 的时间
+MAX_DATAGRAM = 2048  # 大于 foggy_packet.h 的 MAX_LEN
+STATS_BUF = 4096
+WRITE_CHUNK = 1 << 20  # 每次向发送队列写入的字节数
+NETEM_LIMIT = 1000  # netem 默认的队列长度 (包)
+# netem 在 veth 上按以太网帧计算发送时间: 以太网 14 + IPv4 20 + UDP 8 字节头部
+FRAME_OVERHEAD = 42
+
+_lib = None
+
+
+# ============ 链路参数 (tcset 写法) ============
+_UNITS = {"": 1, "k": 10 ** 3, "m": 10 ** 6, "g": 10 ** 9}
+
+
+def parse_rate(value):
+    """把 tcset 的带宽写法 (如 10Mbps) 转换为 bit/s"""
+    match = re.fullmatch(r"([0-9.]+)\s*([kKmMgG]?)bps", value.strip())
+    if match is None:
+        raise ValueError(f"无法解析带宽: {value}")
+    return int(float(match.group(1)) * _UNITS[match.group(2).lower()])
+
+
+def parse_delay(value):
+    """把 tcset 的延迟写法 (如 20ms) 转换为纳秒"""
+    match = re.fullmatch(r"([0-9.]+)\s*(us|ms|s)", value.strip())
+    if match is None:
+        raise ValueError(f"无法解析延迟: {value}")
+    scale = {"us": 10 ** 3, "ms": 10 ** 6, "s": 10 ** 9}[match.group(2)]
+    return int(float(match.group(1)) * scale)
+
+
+class SimulatorError(Exception):
+    """仿真库缺失或调用失败"""
+
+
+def load_library(path=LIB_PATH):
+    """加载仿真库并声明函数签名, 每个进程只加载一次"""
+    global _lib
+    if _lib is not None:
+        return _lib
+    if not Path(path).exists():
+        raise SimulatorError(f"仿真库不存在: {path}, 请先执行 make -C {FOGGY_DIR} sim")
+    lib = ctypes.CDLL(str(path))
+    handle = ctypes.c_void_p
+    u8p = ctypes.POINTER(ctypes.c_uint8)
+    signatures = {
+        "foggy_sim_open": ([ctypes.c_int, ctypes.c_char_p, ctypes.c_char_p], handle),
+        "foggy_sim_close": ([handle], None),
+        "foggy_sim_set_time": ([handle, ctypes.c_uint64], None),
+        "foggy_sim_write": ([handle, ctypes.c_uint32], ctypes.c_uint32),
+        "foggy_sim_deliver": ([handle, u8p, ctypes.c_uint32], ctypes.c_int),
+        "foggy_sim_step": ([handle], None),
+        "foggy_sim_next_event_ns": ([handle], ctypes.c_uint64),
+        "foggy_sim_poll_datagram": ([handle, u8p, ctypes.c_uint32], ctypes.c_uint32),
+        "foggy_sim_delivered": ([handle], ctypes.c_uint64),
+        "foggy_sim_acked": ([handle], ctypes.c_uint64),
+        "foggy_sim_stats": ([handle, ctypes.c_char_p, ctypes.c_uint32], ctypes.c_int),
+    }
+    for name, (argtypes, restype) in signatures.items():
+        func = getattr(lib, name)
+        func.argtypes = argtypes
+        func.restype = restype
+    _lib = lib
+    return lib
+
+
+# ============ 丢包模型 ============
+class BernoulliLoss:
+    """每个包独立地以概率 p 丢弃 (netem loss random)"""
+
+    def __init__(self, p):
+        if not 0 <= p <= 1:
+            raise ValueError(f"丢包率必须在 [0, 1] 内: {p}")
+        self.p = p
+
+    def lost(self, rng):
+        return self.p > 0 and rng.random() < self.p
+
+    def mean_loss(self):
+        return self.p
+
+
+class GilbertElliottLoss:
+    """
+    两状态马尔可夫丢包 (netem loss gemodel p r 1-h 1-k)
+
+    好状态以概率 p 转入坏状态, 坏状态以概率 r 回到好状态;
+    好状态的丢包率为 loss_good (1-k), 坏状态为 loss_bad (1-h)。每个包先转移状态再判断是否丢包, 与 netem 相同。
+    """
+
+    def __init__(self, p, r, loss_good=0.0, loss_bad=1.0):
+        for name, value in (("p", p), ("r", r), ("loss_good", loss_good), ("loss_bad", loss_bad)):
+            if not 0 <= value <= 1:
+                raise ValueError(f"{name} 必须在 [0, 1] 内: {value}")
+        if p + r == 0:
+            raise ValueError("p 与 r 不能同时为 0")
+        self.p = p
+        self.r = r
+        self.loss_good = loss_good
+        self.loss_bad = loss_bad
+        self.bad = False
+
+    @classmethod
+    def from_mean(cls, loss_rate, burst):
+        """由平均丢包率和坏状态的平均长度 (包) 构造坏状态全丢、好状态不丢的模型"""
+        if burst < 1:
+            raise ValueError(f"平均突发长度至少为 1: {burst}")
+        if not 0 <= loss_rate < 1:
+            raise ValueError(f"丢包率必须在 [0, 1) 内: {loss_rate}")
+        r = 1 / burst
+        return cls(loss_rate * r / (1 - loss_rate), r)
+
+    def lost(self, rng):
+        if self.bad:
+            if rng.random() < self.r:
+                self.bad = False
+            return rng.random() < self.loss_bad
+        if rng.random() < self.p:
+            self.bad = True
+        return rng.random() < self.loss_good
+
+    def mean_loss(self):
+        bad = self.p / (self.p + self.r)
+        return bad * self.loss_bad + (1 - bad) * self.loss_good
+
+
+# ============ 链路 ============
+class LinkDirection:
+    """
+    单向链路, 与 netem 的处理顺序相同: 入队时先按丢包模型丢包, 再检查队列长度,
+    之后按带宽串行发送并加上传播延迟。队列长度与 netem 的 limit 一样计入延迟中的包。
+    """
+
+    def __init__(self, rate_bps=None, delay_ns=0, loss=None, limit=NETEM_LIMIT):
+        self.rate_bps = rate_bps
+        self.delay_ns = delay_ns
+        self.loss = loss
+        self.limit = limit
+        self.busy_until_ns = 0
+        self.in_flight = deque()  # 链路中各包的到达时间, 单调不减
+        self.packets = 0
+        self.losses = 0
+        self.queue_drops = 0
+        self.max_queue = 0
+
+    def send(self, now_ns, size, rng):
+        """一个 size 字节的数据报在 now_ns 进入链路, 返回到达时间, 被丢弃时返回 None"""
+        self.packets += 1
+        if self.loss is not None and self.loss.lost(rng):
+            self.losses += 1
+            return None
+        while self.in_flight and self.in_flight[0] <= now_ns:
+            self.in_flight.popleft()
+        if len(self.in_flight) >= self.limit:
+            self.queue_drops += 1
+            return None
+        depart = now_ns
+        if self.rate_bps:
+            depart = max(now_ns, self.busy_until_ns)
+            depart += (size + FRAME_OVERHEAD) * 8 * 1_000_000_000 // self.rate_bps
+            self.busy_until_ns = depart
+        arrival = depart + self.delay_ns
+        self.in_flight.append(arrival)
+        self.max_queue = max(self.max_queue, len(self.in_flight))
+        return arrival
+
+    def summary(self):
+        return {"packets": self.packets, "losses": self.losses,
+                "queue_drops": self.queue_drops, "max_queue": self.max_queue}
+
+
+# ============ 端点 ============
+class SimSocket:
+    """仿真库中的一个 socket"""
+
+    def __init__(self, lib, receiver, ack_policy=None, pacing=None):
+        self.lib = lib
+        self.handle = lib.foggy_sim_open(1 if receiver else 0, _encode(ack_policy), _encode(pacing))
+        if not self.handle:
+            raise SimulatorError("foggy_sim_open 失败")
+        self.timer_ns = NO_EVENT  # 已加入事件队列的最早定时器
+        self._buf = (ctypes.c_uint8 * MAX_DATAGRAM)()
+
+    def close(self):
+        if self.handle:
+            self.lib.foggy_sim_close(self.handle)
+            self.handle = None
+
+    def set_time(self, now_ns):
+        self.lib.foggy_sim_set_time(self.handle, now_ns)
+
+    def write(self, length):
+        return self.lib.foggy_sim_write(self.handle, length)
+
+    def deliver(self, datagram):
+        buf = (ctypes.c_uint8 * len(datagram)).from_buffer_copy(datagram)
+        return self.lib.foggy_sim_deliver(self.handle, buf, len(datagram))
+
+    def step(self):
+        self.lib.foggy_sim_step(self.handle)
+
+    def next_event_ns(self):
+        return self.lib.foggy_sim_next_event_ns(self.handle)
+
+    def datagrams(self):
+        """取出 socket 发出的全部数据报"""
+        while True:
+            length = self.lib.foggy_sim_poll_datagram(self.handle, self._buf, MAX_DATAGRAM)
+            if length == 0:
+                return
+            yield bytes(self._buf[:length])
+
+    def delivered(self):
+        return self.lib.foggy_sim_delivered(self.handle)
+
+    def stats(self):
+        buf = ctypes.create_string_buffer(STATS_BUF)
+        length = self.lib.foggy_sim_stats(self.handle, buf, STATS_BUF)
+        if length < 0:
+            raise SimulatorError("foggy_sim_stats 失败")
+        return json.loads(buf.raw[:length].decode())
+
+
+def _encode(value):
+    return None if value is None else str(value).encode()
+
+
+# ============ 仿真 ============
+def run_transfer(file_size, rate_bps, delay_ns, loss=None, seed=0, limit=NETEM_LIMIT,
+                 reverse_delay_ns=0, ack_policy=None, pacing=None, timeout_s=600):
+    """
+    仿真一次 file_size 字节的传输
+
+    loss 为丢包模型 (BernoulliLoss / GilbertElliottLoss), 只作用于数据方向。
+    返回 {"duration_ms", "timed_out", "stats", "forward", "reverse", "events"}:
+    duration_ms 为发送方写入第一个字节到接收方读到最后一个字节的虚拟时间, stats 为发送端的 FOGGY_STATS 统计。
+    """
+    import random
+
+    lib = load_library()
+    rng = random.Random(seed)
+    forward = LinkDirection(rate_bps, delay_ns, loss, limit)
+    reverse = LinkDirection(None, reverse_delay_ns, None, limit)
+    sender = SimSocket(lib, False, ack_policy, pacing)
+    receiver = SimSocket(lib, True, ack_policy, pacing)
+    peers = {id(sender): (receiver, forward), id(receiver): (sender, reverse)}
+
+    events = []  # (时间, 序号, socket, 数据报; None 表示定时器)
+    order = 0
+    written = 0
+    now = START_NS
+    deadline = START_NS + int(timeout_s * 1_000_000_000)
+    handled = 0
+
+    def service(sock):
+        """推进一个 socket: 补充发送数据, 运行一次后台循环, 把发出的数据报交给链路并登记定时器"""
+        nonlocal order, written
+        if sock is sender:
+            while written < file_size:
+                n = sock.write(min(file_size - written, WRITE_CHUNK))
+                if n == 0:
+                    break
+                written += n
+        sock.step()
+        peer, link = peers[id(sock)]
+        for datagram in sock.datagrams():
+            arrival = link.send(now, len(datagram), rng)
+            if arrival is not None:
+                order += 1
+                heapq.heappush(events, (arrival, order, peer, datagram))
+        timer = sock.next_event_ns()
+        if timer < sock.timer_ns:
+            sock.timer_ns = timer
+            order += 1
+            heapq.heappush(events, (max(timer, now), order, sock, None))
+
+    try:
+        sender.set_time(now)
+        receiver.set_time(now)
+        service(sender)
+        while events and receiver.delivered() < file_size:
+            now, _, sock, datagram = heapq.heappop(events)
+            if now > deadline:
+                break
+            handled += 1
+            sock.set_time(now)
+            if datagram is None:
+                if now != sock.timer_ns:
+                    continue  # 已被更早的定时器取代
+                sock.timer_ns = NO_EVENT
+            else:
+                sock.deliver(datagram)
+            service(sock)
+
+        done = receiver.delivered() >= file_size
+        return {
+            "duration_ms": (now - START_NS) / 1_000_000 if done else None,
+            "timed_out": not done,
+            "stats": sender.stats(),
+            "forward": forward.summary(),
+            "reverse": reverse.summary(),
+            "events": handled,
+        }
+    finally:
+        sender.close()
+        receiver.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="foggytcp 离散事件链路仿真 (单次传输)")
+    parser.add_argument("--size", type=int, default=10_000_000, help="传输字节数 (默认 10MB)")
+    parser.add_argument("--rate", type=float, default=10.0, help="数据方向带宽 Mbit/s (默认 10)")
+    parser.add_argument("--delay", type=float, default=20.0, help="数据方向单向延迟 ms (默认 20)")
+    parser.add_argument("--reverse-delay", type=float, default=0.0, help="ACK 方向延迟 ms (默认 0)")
+    parser.add_argument("--loss", type=float, default=0.0, help="平均丢包率 (默认 0)")
+    parser.add_argument("--burst", type=float, default=None,
+                        help="使用 Gilbert-Elliott 丢包, 指定坏状态的平均长度 (包)")
+    parser.add_argument("--limit", type=int, default=NETEM_LIMIT, help="队列长度 (包)")
+    parser.add_argument("--ack-policy", default=None, help="FOGGY_ACK_POLICY 的值")
+    parser.add_argument("--pacing", default=None, help="FOGGY_PACING 的值")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.burst is None:
+        loss = BernoulliLoss(args.loss)
+    else:
+        loss = GilbertElliottLoss.from_mean(args.loss, args.burst)
+    try:
+        result = run_transfer(args.size, int(args.rate * 1e6), int(args.delay * 1e6), loss,
+                              seed=args.seed, limit=args.limit,
+                              reverse_delay_ns=int(args.reverse_delay * 1e6),
+                              ack_policy=args.ack_policy, pacing=args.pacing)
+    except SimulatorError as e:
+        print(f"[错误] {e}")
+        return 1
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
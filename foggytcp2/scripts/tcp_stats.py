@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+读取 FOGGY_STATS 输出的连接统计 (见 foggytcp/inc/foggy_stats.h)
+
+客户端在 foggy_close() 时把 RTT 采样 (Karn 规则)、重传超时 (RTO)、SACK 重传、ACK 计数、收发系统调用次数
+与发送突发 (一批连续发出的新数据段) 的大小和间隔写成一个 JSON 对象,
+实验脚本把其中的几项追加到 CSV (COLUMNS)。
+"""
+
+import timing
+
+# CSV 列名, 顺序与 csv_values() 一致
+COLUMNS = ['rtt_samples', 'srtt_ms', 'min_rtt_ms', 'mean_rtt_ms',
+           'rto_events', 'max_rto_backoff', 'fast_retransmits', 'sack_retransmits',
+           'segments_sent', 'acks_received', 'syscalls_per_mb',
+           'burst_mean', 'burst_max', 'gap_mean_us']
+
+
+def load(path):
+    """读取一个统计文件, 文件不存在或内容不完整时返回 None"""
+    return timing.load(path)
+
+
+def csv_values(stats):
+    """按 COLUMNS 的顺序返回 CSV 的值; 没有统计时 (旧版 client) 全部为空字符串"""
+    if stats is None:
+        return [""] * len(COLUMNS)
+    return [
+        stats["rtt_samples"],
+        stats["srtt_us"] / 1000,
+        stats["rtt_min_us"] / 1000,
+        stats["rtt_mean_us"] / 1000,
+        stats["rto_events"],
+        stats["max_backoff"],
+        stats["fast_retransmits"],
+        stats.get("sack_retransmits", ""),
+        stats.get("segments_sent", ""),
+        stats.get("acks_received", ""),
+        stats.get("syscalls_per_mb", ""),
+        stats.get("burst_mean", ""),
+        stats.get("burst_max", ""),
+        stats.get("gap_mean_us", ""),
+    ]
+
+
+def ack_rate(stats):
+    """每个发出的数据段收到的 ACK 数 (逐段 ACK 约为 1, 延迟 ACK 约为 0.5); 没有统计时返回 None"""
+    if stats is None or not stats.get("segments_sent"):
+        return None
+    return stats["acks_received"] / stats["segments_sent"]
+
+
+def syscalls_per_mb(stats):
+    """每传输 1 MB 的收发系统调用次数 (recvmmsg + sendmmsg); 没有统计或旧版 client 时返回 None"""
+    if stats is None:
+        return None
+    return stats.get("syscalls_per_mb")
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""journal.py 的测试: 运行 python -m pytest foggytcp2/scripts/test_journal.py"""
+
+import json
+
+import journal
+
+
+def make_journal(tmp_path):
+    test_file = tmp_path / "test.bin"
+    test_file.write_bytes(b"foggy")
+    return journal.RunJournal.create(tmp_path / "runs", {"trials": 3}, {"test_file": test_file})
+
+
+def test_record_after_torn_line(tmp_path):
+    run = make_journal(tmp_path)
+    run.record({"loss_rate": 0.01, "trial": 1, "status": "ok"})
+    # 模拟崩溃: 第二条记录只写了一半
+    with open(run.run_dir / journal.JOURNAL_NAME, "a", encoding="utf-8") as f:
+        f.write('{"loss_rate": 0.01, "trial": 2, "sta')
+
+    resumed = journal.RunJournal.open(tmp_path / "runs", run.run_id)
+    resumed.record({"loss_rate": 0.01, "trial": 3, "status": "ok"})
+
+    assert [e["trial"] for e in resumed.entries()] == [1, 3]
+    lines = (run.run_dir / journal.JOURNAL_NAME).read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["trial"] for line in lines] == [1, 3]
+
+
+def test_open_keeps_complete_journal(tmp_path):
+    run = make_journal(tmp_path)
+    run.record({"trial": 1})
+    run.record({"trial": 2})
+    resumed = journal.RunJournal.open(tmp_path / "runs", run.run_dir)
+    assert [e["trial"] for e in resumed.entries()] == [1, 2]
+
+
+def test_create_same_second(tmp_path):
+    runs = [make_journal(tmp_path) for _ in range(3)]
+    assert len({run.run_id for run in runs}) == 3
+    assert all((run.run_dir / journal.MANIFEST_NAME).exists() for run in runs)
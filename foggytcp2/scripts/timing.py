@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+读取 client/server `--timing <file>` 输出的时间戳 (见 foggytcp/inc/foggy_timing.h)
+
+传输时长 = 服务器收到最后一个字节 - 客户端写入第一个字节。
+两端使用同一台主机的 CLOCK_MONOTONIC (不受网络命名空间影响), 因此可以直接相减;
+不再包含 sudo / ip netns exec / 进程启动与退出、握手和 1 秒启动等待的开销。
+"""
+
+import json
+import tempfile
+from pathlib import Path
+
+RECOMPILE_HINT = "未找到计时输出, 请重新编译 client/server (make release 或 make system) 以支持 --timing"
+
+
+def load(path):
+    """读取一个计时文件, 文件不存在或内容不完整时返回 None"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def transfer_ms(client, server):
+    """由两端的计时记录计算传输时长 (ms, 浮点数); 任一端缺少时间戳时返回 None"""
+    if client is None or server is None:
+        return None
+    start = client.get("first_byte_ns", 0)
+    end = server.get("last_byte_ns", 0)
+    if start <= 0 or end <= start:
+        return None
+    return (end - start) / 1e6
+
+
+def make_path(directory, prefix, role):
+    """在 directory 中创建一个空的计时文件并返回其路径"""
+    f = tempfile.NamedTemporaryFile(prefix=f"{prefix}_{role}_", suffix=".json",
+                                    dir=directory, delete=False)
+    f.close()
+    return Path(f.name)
+
+
+def make_paths(directory, prefix):
+    """创建一对计时文件, 返回 (client_path, server_path)"""
+    return make_path(directory, prefix, "client"), make_path(directory, prefix, "server")
+
+
+def remove(*paths):
+    for path in paths:
+        Path(path).unlink(missing_ok=True)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+随时间变化的网络条件 (trace), 由 relay 在每次试验中按毫秒精度回放 (relay --trace, 见 foggytcp/src/relay.cc)
+
+格式与 Mahimahi 的 trace 类似, 纯文本, 每行一次变化:
+  <ms> <带宽 Mbit/s> <单向延迟 ms> <丢包率>
+表示从客户端第一个数据报之后 <ms> 毫秒起使用这组值, 直到下一行。
+"-" 表示沿用命令行 (场景) 中的值; 带宽 0 表示链路中断, 数据报在队列中等待 (超过队列长度丢弃)。
+最后一行只有 <ms> 时, trace 以此为周期循环; 否则最后一行的值一直保持。"#" 之后为注释。
+
+testdata/traces/ 中附带三个合成 trace (可用名称代替路径, 如 --trace step):
+  step        带宽阶跃: 10 -> 2 -> 10 Mbit/s, 每段 0.5 秒
+  sawtooth    带宽锯齿: 1 秒内从 2 Mbit/s 逐级升到接近 10 Mbit/s 后骤降
+  burst_loss  突发丢包: 平时不丢包, 每 2 秒出现 3 次几十毫秒的高丢包
+时间尺度为几十个 RTT, 1MB 的测试文件在 10 Mbit/s 下也能经历完整的周期。
+
+用法:
+  python3 traces.py              # 列出附带的 trace
+  python3 traces.py --generate   # 重新生成附带的 trace
+"""
+
+import argparse
+import random
+from pathlib import Path
+
+# ============ 配置参数 ============
+SCRIPT_DIR = Path(__file__).parent
+TRACE_DIR = SCRIPT_DIR.parent / "testdata" / "traces"
+SUFFIX = ".trace"
+GENERATOR_SEED = 3120  # burst_loss 的随机数种子, 保证重新生成的文件不变
+
+
+class TraceError(ValueError):
+    pass
+
+
+def resolve(name):
+    """trace 的路径: 已存在的文件, 或 testdata/traces/ 中附带的 trace 名称"""
+    path = Path(name)
+    if path.is_file():
+        return path
+    bundled = TRACE_DIR / f"{name}{SUFFIX}"
+    if bundled.is_file():
+        return bundled
+    raise TraceError(f"找不到 trace: {name} (附带的 trace: {', '.join(bundled_names())})")
+
+
+def bundled_names():
+    return sorted(p.stem for p in TRACE_DIR.glob(f"*{SUFFIX}"))
+
+
+def _field(token, maximum):
+    if token == "-":
+        return None
+    value = float(token)
+    if not 0 <= value <= maximum:
+        raise ValueError(token)
+    return value
+
+
+def load(path):
+    """
+    读取并检查一个 trace (规则与 relay 相同), 返回 {"entries", "period_ms"}
+
+    entries 为 (ms, 带宽, 延迟, 丢包率) 列表, "-" 对应 None; 不循环时 period_ms 为 None。
+    """
+    entries = []
+    period_ms = None
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            tokens = line.split("#", 1)[0].split()
+            if not tokens:
+                continue
+            try:
+                if period_ms is not None or len(tokens) not in (1, 4):
+                    raise ValueError(line)
+                at_ms = _field(tokens[0], 1e12)
+                if at_ms is None or (entries and at_ms <= entries[-1][0]):
+                    raise ValueError(tokens[0])
+                if len(tokens) == 1:
+                    if not entries:
+                        raise ValueError(line)
+                    period_ms = at_ms
+                else:
+                    entries.append((at_ms, _field(tokens[1], 1e6), _field(tokens[2], 1e6),
+                                    _field(tokens[3], 1)))
+            except ValueError:
+                raise TraceError(f"{path} 第 {line_no} 行格式错误: {line.strip()}") from None
+    if not entries:
+        raise TraceError(f"{path} 中没有任何条目")
+    return {"entries": entries, "period_ms": period_ms}
+
+
+def describe(path):
+    """一行摘要, 如 "step: 3 段, 周期 15.0 s, 带宽 2~10 Mbit/s" """
+    trace = load(path)
+    entries = trace["entries"]
+    parts = [f"{len(entries)} 段"]
+    if trace["period_ms"] is not None:
+        parts.append(f"周期 {trace['period_ms'] / 1000:.1f} s")
+    else:
+        parts.append(f"{entries[-1][0] / 1000:.1f} s 后保持")
+    for index, name, unit in ((1, "带宽", " Mbit/s"), (2, "延迟", " ms"), (3, "丢包率", "")):
+        values = [e[index] for e in entries if e[index] is not None]
+        if values:
+            parts.append(f"{name} {min(values):g}~{max(values):g}{unit}")
+    return f"{Path(path).stem}: " + ", ".join(parts)
+
+
+# ============ 附带的合成 trace ============
+def step(high=10, low=2, hold_ms=500):
+    """带宽阶跃: high、low、high 各保持 hold_ms"""
+    lines = [f"# 带宽阶跃 {high} -> {low} -> {high} Mbit/s, 每段 {hold_ms} ms, 延迟和丢包率沿用场景设置"]
+    lines += [f"0 {high} - -", f"{hold_ms} {low} - -", f"{2 * hold_ms} {high} - -", str(3 * hold_ms)]
+    return lines
+
+
+def sawtooth(low=2, high=10, ramp_ms=1000, step_ms=50):
+    """带宽锯齿: 从 low 起每 step_ms 等量升高, ramp_ms 后接近 high 时骤降回 low"""
+    lines = [f"# 带宽锯齿 {low} -> {high} Mbit/s, 每 {ramp_ms} ms 一个周期"]
+    steps = ramp_ms // step_ms
+    for i in range(steps):
+        lines.append(f"{i * step_ms} {low + (high - low) * i / steps:g} - -")
+    lines.append(str(ramp_ms))
+    return lines
+
+
+def burst_loss(period_ms=2000, bursts=3, seed=GENERATOR_SEED):
+    """突发丢包: 每个周期内随机出现 bursts 次持续 10~80 ms、丢包率 20%~50% 的突发, 其余时间不丢包"""
+    rng = random.Random(seed)
+    # 起点间隔至少 100 ms, 长于最长的突发
+    starts = sorted(rng.sample(range(100, period_ms - 100, 100), bursts))
+    lines = [f"# 突发丢包: 每 {period_ms} ms 出现 {bursts} 次 10~80 ms 的高丢包, 带宽和延迟沿用场景设置",
+             "0 - - 0"]
+    for begin in starts:
+        lines.append(f"{begin} - - {rng.choice((0.2, 0.3, 0.5))}")
+        lines.append(f"{begin + rng.randrange(10, 81)} - - 0")
+    lines.append(str(period_ms))
+    return lines
+
+
+GENERATORS = {"step": step, "sawtooth": sawtooth, "burst_loss": burst_loss}
+
+
+def generate(directory=TRACE_DIR):
+    """写出附带的合成 trace, 返回写出的路径"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for name, generator in GENERATORS.items():
+        path = directory / f"{name}{SUFFIX}"
+        path.write_text("\n".join(generator()) + "\n", encoding="utf-8")
+        load(path)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="relay 回放的网络条件 trace")
+    parser.add_argument("--generate", action="store_true", help=f"重新生成附带的 trace ({TRACE_DIR})")
+    args = parser.parse_args()
+
+    if args.generate:
+        for path in generate():
+            print(f"[保存] {path}")
+        return 0
+    for name in bundled_names():
+        print(describe(TRACE_DIR / f"{name}{SUFFIX}"))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
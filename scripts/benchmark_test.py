@@ -1,17 +1,33 @@
 #!/usr/bin/env python3
 """
 自动化性能测试脚本
-用途：对比 TCP Reno (foggytcp2) 和 Enhanced Cubic (enhanced_cca) 的性能
+用途：对比 TCP Reno (foggytcp2) 和 Enhanced Cubic (enhanced_cca) 的性能,
+以及 foggytcp2 接收端不同 ACK 策略 (--ack-policy) 下的 ACK 数与吞吐量;
+--pacing 选择 foggytcp2 发送端的 pacing 模式
 """
 
+import argparse
 import subprocess
-import time
 import os
 import csv
 import statistics
+import sys
 from pathlib import Path
 from datetime import datetime
 
+# 复用 foggytcp2/scripts 中的实验工具模块
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "foggytcp2" / "scripts"))
+import adaptive  # noqa: E402
+import launcher  # noqa: E402
+import relay  # noqa: E402
+import results_store  # noqa: E402
+import tcp_stats  # noqa: E402
+import timing  # noqa: E402
+from harness_daemon import (  # noqa: E402
+    ACK_POLICIES, DEFAULT_ACK_POLICY, DEFAULT_LOG_LEVEL, DEFAULT_SOCKET, LOG_LEVELS,
+    LOOPBACK_LINK, HarnessClient, HarnessError, pacing_mode,
+)
+
 # 配置
 FOGGYTCP2_DIR = "/home/serennan/work/algo2/foggytcp2/foggytcp"
 ENHANCED_CCA_DIR = "/home/serennan/work/algo2/enhanced_cca/foggytcp"
@@ -50,13 +66,50 @@ TEST_SCENARIOS = [
         "bandwidth": "10Mbps",
         "loss_rate": 0.001,
     },
+    # 网络条件随时间变化: relay 按 trace 回放 (foggytcp2/testdata/traces, 格式见 traces.py), 需要 --relay
+    {
+        "name": "trace_step",
+        "description": "带宽阶跃 (40ms RTT, 10 -> 2 -> 10 Mbps)",
+        "rtt_ms": 20,
+        "bandwidth": "10Mbps",
+        "loss_rate": 0.0,
+        "trace": "step",
+    },
+    {
+        "name": "trace_sawtooth",
+        "description": "带宽锯齿 (40ms RTT, 2 ~ 10 Mbps)",
+        "rtt_ms": 20,
+        "bandwidth": "10Mbps",
+        "loss_rate": 0.0,
+        "trace": "sawtooth",
+    },
+    {
+        "name": "trace_burst_loss",
+        "description": "突发丢包 (40ms RTT, 10Mbps)",
+        "rtt_ms": 20,
+        "bandwidth": "10Mbps",
+        "loss_rate": 0.0,
+        "trace": "burst_loss",
+    },
 ]
 
-TRIALS_PER_SCENARIO = 10  # 每个场景重复次数
+TRIALS_PER_SCENARIO = 10  # 每个场景重复次数; --adaptive 模式下由置信区间决定
 
 class TestRunner:
-    def __init__(self):
+    def __init__(self, harness=None, stopper_factory=None, use_relay=False):
         self.results = []
+        # 常驻守护进程 (harness_daemon.py --loopback), None 表示直接调用 sudo tcset
+        self.harness = harness
+        # 自适应模式下为每个场景创建 SequentialStopper, None 表示固定 TRIALS_PER_SCENARIO 次
+        self.stopper_factory = stopper_factory
+        # --relay: 由用户态 relay 施加网络参数, 不需要 root; 端口由内核分配, 可与其他实例同时运行
+        self.use_relay = use_relay
+        self.relay = None  # 当前场景的 relay.Relay, 不整形时为 None
+        if use_relay:
+            self.ports = relay.PortReservation(2)
+            self.server_port, self.relay_port = self.ports.ports
+        else:
+            self.server_port = SERVER_PORT
         Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
 
     def compile_implementation(self, impl_dir, impl_name):
@@ -67,11 +120,8 @@ class TestRunner:
 
         os.chdir(impl_dir)
 
-        # 清理
-        subprocess.run(["make", "clean"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-        # 编译
-        result = subprocess.run(["make", "foggy"], capture_output=True, text=True)
+        # 编译 release 版本 (-O2, 无逐包日志; make release 会先 clean)
+        result = subprocess.run(["make", "release"], capture_output=True, text=True)
         if result.returncode != 0:
             print(f"❌ 编译失败:")
             print(result.stderr)
@@ -82,12 +132,27 @@ class TestRunner:
 
     def setup_network(self, scenario):
         """配置网络参数（使用 tcconfig）"""
+        if scenario.get("trace") and not self.use_relay:
+            # tcset 和守护进程只能设置固定参数, 无法按毫秒回放 trace
+            print(f"\n❌ 场景使用 trace ({scenario['trace']}), 需要 --relay; 跳过该场景")
+            return False
+
         if scenario["rtt_ms"] == 0 and scenario["loss_rate"] == 0.0:
             # 理想网络，不需要配置
             return True
 
         print(f"\n配置网络: RTT={scenario['rtt_ms']*2}ms, 带宽={scenario['bandwidth']}, 丢包={scenario['loss_rate']*100}%")
 
+        if self.harness is not None:
+            # netem 队列由守护进程原地修改
+            self.harness.shape(LOOPBACK_LINK, scenario["bandwidth"],
+                               f"{scenario['rtt_ms']}ms", scenario["loss_rate"])
+            print("✅ 网络配置成功 (守护进程)")
+            return True
+
+        if self.use_relay:
+            return self.start_relay(scenario)
+
         # 注意：tcconfig 需要 root 权限，在本地回环上可能不生效
         # 这里只是示例，实际可能需要使用虚拟机或真实网络
 
@@ -111,20 +176,41 @@ class TestRunner:
 
                 result = subprocess.run(cmd, capture_output=True, text=True)
                 if result.returncode != 0:
-                    print(f"⚠️  网络配置可能失败（需要 root 权限或虚拟机环境）")
-                    print(f"   继续使用本地回环测试...")
-                    return True
+                    # 不整形的回环测得的数字与场景无关, 不能当作该场景的结果
+                    print(f"❌ 网络配置失败 (需要 root 权限): {result.stderr.strip()}")
+                    print("   跳过该场景; 不需要 root 的方式: --relay")
+                    return False
 
             print("✅ 网络配置成功")
             return True
 
         except Exception as e:
-            print(f"⚠️  网络配置跳过: {e}")
-            print("   在本地回环上测试...")
-            return True
+            print(f"❌ 网络配置失败: {e}")
+            print("   跳过该场景; 不需要 root 的方式: --relay")
+            return False
+
+    def start_relay(self, scenario):
+        """启动用户态 relay, 两个方向使用相同的参数 (与 tcset lo 一致)"""
+        self.relay = relay.Relay(self.relay_port, self.server_port, rate=scenario["bandwidth"],
+                                 delay=f"{scenario['rtt_ms']}ms", loss=scenario["loss_rate"],
+                                 symmetric=True, trace=scenario.get("trace"))
+        if not self.relay.start():
+            print(f"❌ relay 启动失败; {relay.BUILD_HINT}")
+            self.relay = None
+            return False
+        print(f"✅ 网络配置成功 (relay: {self.relay.describe()})")
+        return True
 
     def cleanup_network(self):
         """清理网络配置"""
+        if self.harness is not None:
+            self.harness.clear(LOOPBACK_LINK)
+            return
+        if self.use_relay:
+            if self.relay is not None:
+                self.relay.stop()
+                self.relay = None
+            return
         try:
             subprocess.run(["sudo", "tcdel", "lo", "--all"],
                          stdout=subprocess.DEVNULL,
@@ -132,8 +218,46 @@ class TestRunner:
         except:
             pass
 
-    def run_single_test(self, impl_dir, impl_name, scenario, trial):
-        """运行单次测试"""
+    def run_single_test_via_harness(self, impl_dir, ack_policy, pacing):
+        """通过常驻守护进程运行单次测试 (服务器已预先启动)"""
+        extra = {} if ack_policy is None else {"ack_policy": ack_policy}
+        if pacing is not None:
+            extra["pacing"] = pacing
+        result = self.harness.trial(LOOPBACK_LINK, impl_dir, TEST_FILE, 65, **extra)
+        original_size = os.path.getsize(TEST_FILE)
+        ack_rate = tcp_stats.ack_rate(result.get("stats"))
+        syscalls_per_mb = tcp_stats.syscalls_per_mb(result.get("stats"))
+        if result["returncode"] != 0 or result.get("timed_out") or result["duration_ms"] is None:
+            return {
+                "success": False,
+                "duration_ms": None,
+                "throughput_mbps": None,
+                "file_size": result["output_size"],
+                "original_size": original_size,
+                "completion_rate": result["output_size"] / original_size * 100,
+                "ack_rate": ack_rate,
+                "syscalls_per_mb": syscalls_per_mb,
+            }
+
+        file_size = result["output_size"]
+        duration_ms = result["duration_ms"]
+        return {
+            "success": file_size == original_size,
+            "duration_ms": duration_ms,
+            "throughput_mbps": (file_size * 8) / (duration_ms * 1000),
+            "file_size": file_size,
+            "original_size": original_size,
+            "completion_rate": file_size / original_size * 100,
+            "ack_rate": ack_rate,
+            "syscalls_per_mb": syscalls_per_mb,
+        }
+
+    def run_single_test(self, impl_dir, impl_name, scenario, trial, ack_policy=None, pacing=None):
+        """运行单次测试; ack_policy / pacing 为 None 时不设置 FOGGY_ACK_POLICY / FOGGY_PACING
+        (实现不支持或使用默认值)"""
+        if self.harness is not None:
+            return self.run_single_test_via_harness(impl_dir, ack_policy, pacing)
+
         os.chdir(impl_dir)
 
         output_file = f"/tmp/test_output_{impl_name}_{scenario['name']}_{trial}.bin"
@@ -142,40 +266,62 @@ class TestRunner:
         if os.path.exists(output_file):
             os.remove(output_file)
 
+        # 传输时长由 client/server 写出的 CLOCK_MONOTONIC 时间戳计算
+        client_timing, server_timing = timing.make_paths("/tmp", f"timing_{impl_name}")
+        # 客户端 (发送端) 的 ACK 计数, 用于计算 ACK 率
+        client_stats = timing.make_path("/tmp", f"stats_{impl_name}", "client")
+        env = dict(os.environ, FOGGY_STATS=str(client_stats))
+        server_cmd = ["./server", "--timing", str(server_timing), SERVER_IP, str(self.server_port),
+                      output_file]
+        # 有 relay 时客户端连接 relay, 由它转发给服务器
+        client_port = self.relay_port if self.relay is not None else self.server_port
+        if ack_policy is not None:
+            # ACK 策略只影响接收端, 即服务器
+            env["FOGGY_ACK_POLICY"] = ack_policy
+            server_cmd = ["env", f"FOGGY_ACK_POLICY={ack_policy}"] + server_cmd
+        if pacing is not None:
+            # pacing 只影响发送端, 即客户端
+            env["FOGGY_PACING"] = pacing
+
         # 启动服务器
         server_log = f"/tmp/server_{impl_name}_{scenario['name']}_{trial}.log"
-        server_proc = subprocess.Popen(
-            ["./server", SERVER_IP, str(SERVER_PORT), output_file],
-            stdout=open(server_log, "w"),
-            stderr=subprocess.STDOUT
-        )
-
-        # 等待服务器启动
-        time.sleep(1)
-
-        # 运行客户端并计时
-        start_time = time.time()
-
+        with open(server_log, "w") as server_out:
+            # 检测到端口绑定后立即返回
+            server_proc = launcher.start_server(
+                server_cmd,
+                self.server_port,
+                stdout=server_out,
+                stderr=subprocess.STDOUT
+            )
+        if server_proc is None:
+            timing.remove(client_timing, server_timing, client_stats)
+            raise RuntimeError("服务器启动失败")
+
+        # 运行客户端
         client_log = f"/tmp/client_{impl_name}_{scenario['name']}_{trial}.log"
-        client_result = subprocess.run(
-            ["timeout", "60", "./client", SERVER_IP, str(SERVER_PORT), TEST_FILE],
-            stdout=open(client_log, "w"),
-            stderr=subprocess.STDOUT,
-            timeout=65
-        )
-
-        end_time = time.time()
-        duration_ms = (end_time - start_time) * 1000
-
-        # 停止服务器
-        server_proc.terminate()
-        try:
-            server_proc.wait(timeout=2)
-        except:
-            server_proc.kill()
+        with open(client_log, "w") as client_out:
+            client_result = subprocess.run(
+                ["timeout", "60", "./client", "--no-wait", "--timing", str(client_timing),
+                 SERVER_IP, str(client_port), TEST_FILE],
+                stdout=client_out,
+                stderr=subprocess.STDOUT,
+                timeout=65,
+                env=env
+            )
+
+        # 停止服务器 (服务器在 SIGTERM 时写出计时文件)
+        launcher.stop_server(server_proc)
+
+        duration_ms = timing.transfer_ms(timing.load(client_timing), timing.load(server_timing))
+        client_stats_data = tcp_stats.load(client_stats)
+        ack_rate = tcp_stats.ack_rate(client_stats_data)
+        syscalls_per_mb = tcp_stats.syscalls_per_mb(client_stats_data)
+        timing.remove(client_timing, server_timing, client_stats)
+        if client_result.returncode == 0 and duration_ms is None:
+            print(f"  [警告] {timing.RECOMPILE_HINT}")
 
         # 检查结果
-        if client_result.returncode == 0 and os.path.exists(output_file):
+        if client_result.returncode == 0 and duration_ms is not None and os.path.exists(output_file):
             file_size = os.path.getsize(output_file)
             original_size = os.path.getsize(TEST_FILE)
 
@@ -192,6 +338,8 @@ class TestRunner:
                 "file_size": file_size,
                 "original_size": original_size,
                 "completion_rate": file_size / original_size * 100,
+                "ack_rate": ack_rate,
+                "syscalls_per_mb": syscalls_per_mb,
             }
         else:
             return {
@@ -201,28 +349,40 @@ class TestRunner:
                 "file_size": 0,
                 "original_size": os.path.getsize(TEST_FILE),
                 "completion_rate": 0,
+                "ack_rate": ack_rate,
+                "syscalls_per_mb": syscalls_per_mb,
             }
 
-    def test_implementation(self, impl_dir, impl_name):
-        """测试一个实现的所有场景"""
+    def test_implementation(self, impl_dir, impl_name, ack_policy=None, pacing=None):
+        """测试一个实现的所有场景; ack_policy 为接收端 ACK 策略, pacing 为发送端 pacing 模式,
+        None 表示实现不支持或使用默认值"""
         print(f"\n{'='*60}")
-        print(f"测试 {impl_name}")
+        print(f"测试 {impl_label(impl_name, ack_policy)}")
         print(f"{'='*60}")
 
         for scenario in TEST_SCENARIOS:
             print(f"\n场景: {scenario['description']}")
             print(f"-" * 60)
 
-            # 配置网络
-            self.setup_network(scenario)
+            # 配置网络; 失败时跳过该场景, 不在不整形的回环上测试
+            if not self.setup_network(scenario):
+                continue
 
             scenario_results = []
+            scenario_rows = []
+            stopper = self.stopper_factory() if self.stopper_factory else None
+            limit = TRIALS_PER_SCENARIO if stopper is None else stopper.max_trials
+            trial = 0
 
-            for trial in range(1, TRIALS_PER_SCENARIO + 1):
-                print(f"  试验 {trial}/{TRIALS_PER_SCENARIO}...", end=" ", flush=True)
+            while (trial < TRIALS_PER_SCENARIO if stopper is None
+                   else stopper.stop_reason() is None):
+                trial += 1
+                print(f"  试验 {trial}/{limit}...", end=" ", flush=True)
 
+                result = None
                 try:
-                    result = self.run_single_test(impl_dir, impl_name, scenario, trial)
+                    result = self.run_single_test(impl_dir, impl_name, scenario, trial,
+                                                  ack_policy, pacing)
 
                     if result["success"]:
                         print(f"✅ {result['duration_ms']:.0f}ms ({result['throughput_mbps']:.2f} Mbps)")
@@ -230,18 +390,23 @@ class TestRunner:
                         print(f"❌ 失败 (完成率: {result['completion_rate']:.1f}%)")
 
                     # 记录结果
-                    self.results.append({
+                    scenario_rows.append({
                         "implementation": impl_name,
+                        "ack_policy": ack_policy or "",
+                        "pacing": pacing or "",
                         "scenario": scenario["name"],
                         "scenario_desc": scenario["description"],
                         "trial": trial,
                         "rtt_ms": scenario["rtt_ms"] * 2,
                         "bandwidth": scenario["bandwidth"],
                         "loss_rate": scenario["loss_rate"],
+                        "trace": scenario.get("trace", ""),
                         "success": result["success"],
                         "duration_ms": result["duration_ms"],
                         "throughput_mbps": result["throughput_mbps"],
                         "completion_rate": result["completion_rate"],
+                        "ack_rate": result["ack_rate"],
+                        "syscalls_per_mb": result["syscalls_per_mb"],
                     })
 
                     if result["success"]:
@@ -250,8 +415,22 @@ class TestRunner:
                 except Exception as e:
                     print(f"❌ 错误: {e}")
 
-                # 短暂延迟
-                time.sleep(0.5)
+                if stopper is not None:
+                    ok = result is not None and result["success"]
+                    stopper.add(result["throughput_mbps"] if ok else None)
+
+            # 记录该场景的停止原因与最终置信区间相对半宽
+            if stopper is not None:
+                reason = stopper.stop_reason()
+                ci = stopper.ci if stopper.values else None
+                print(f"\n  [自适应] 停止: {reason}, 相对半宽 "
+                      f"{ci if ci is None else round(ci, 4)} (目标 {stopper.ci_target})")
+            else:
+                reason, ci = adaptive.STOP_FIXED, None
+            for row in scenario_rows:
+                row["ci_rel_width"] = ci
+                row["stop_reason"] = reason
+            self.results.extend(scenario_rows)
 
             # 打印场景统计
             if scenario_results:
@@ -259,15 +438,22 @@ class TestRunner:
                 throughputs = [r["throughput_mbps"] for r in scenario_results]
 
                 print(f"\n  统计:")
-                print(f"    成功次数: {len(scenario_results)}/{TRIALS_PER_SCENARIO}")
+                print(f"    成功次数: {len(scenario_results)}/{len(scenario_rows)}")
                 print(f"    平均时间: {statistics.mean(durations):.0f} ms (±{statistics.stdev(durations) if len(durations) > 1 else 0:.0f})")
                 print(f"    平均吞吐量: {statistics.mean(throughputs):.2f} Mbps")
+                ack_rates = [r["ack_rate"] for r in scenario_results if r["ack_rate"] is not None]
+                if ack_rates:
+                    print(f"    ACK/数据段: {statistics.mean(ack_rates):.2f}")
+                syscalls = [r["syscalls_per_mb"] for r in scenario_results
+                            if r["syscalls_per_mb"] is not None]
+                if syscalls:
+                    print(f"    系统调用/MB: {statistics.mean(syscalls):.1f}")
 
             # 清理网络配置
             self.cleanup_network()
 
     def save_results(self):
-        """保存结果到 CSV"""
+        """保存结果到 CSV, 同时写入结果存储 (foggytcp2/results/store/benchmark_<时间戳>/, 见 results_store.py)"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         csv_file = os.path.join(OUTPUT_DIR, f"benchmark_results_{timestamp}.csv")
 
@@ -277,8 +463,14 @@ class TestRunner:
                 writer.writeheader()
                 writer.writerows(self.results)
 
+        run_id = f"benchmark_{timestamp}"
+        if self.results:
+            results_store.write(results_store.benchmark_rows(self.results), run_id)
+
         print(f"\n{'='*60}")
         print(f"结果已保存到: {csv_file}")
+        if self.results:
+            print(f"结果存储: {results_store.STORE_DIR / run_id}")
         print(f"{'='*60}")
 
         return csv_file
@@ -289,8 +481,8 @@ class TestRunner:
         print("测试摘要")
         print(f"{'='*60}\n")
 
-        # 按实现和场景分组
-        implementations = set(r["implementation"] for r in self.results)
+        # 按实现 (及 ACK 策略) 和场景分组
+        implementations = sorted(set((r["implementation"], r["ack_policy"]) for r in self.results))
         scenarios = set(r["scenario"] for r in self.results)
 
         for scenario in scenarios:
@@ -298,53 +490,118 @@ class TestRunner:
             print(f"\n场景: {scenario_desc}")
             print("-" * 60)
 
-            for impl in implementations:
-                impl_results = [
-                    r for r in self.results
-                    if r["implementation"] == impl and r["scenario"] == scenario and r["success"]
-                ]
+            for impl, policy in implementations:
+                impl_results = self._successes(impl, policy, scenario)
+                label = impl_label(impl, policy)
 
                 if impl_results:
                     durations = [r["duration_ms"] for r in impl_results]
                     throughputs = [r["throughput_mbps"] for r in impl_results]
 
-                    print(f"{impl:20s}: {statistics.mean(durations):7.0f} ms  "
+                    attempts = sum(1 for r in self.results
+                                   if r["implementation"] == impl and r["ack_policy"] == policy
+                                   and r["scenario"] == scenario)
+                    print(f"{label:28s}: {statistics.mean(durations):7.0f} ms  "
                           f"({statistics.mean(throughputs):5.2f} Mbps)  "
-                          f"成功: {len(impl_results)}/{TRIALS_PER_SCENARIO}")
+                          f"成功: {len(impl_results)}/{attempts}")
                 else:
-                    print(f"{impl:20s}: 全部失败")
+                    print(f"{label:28s}: 全部失败")
 
         # 计算性能提升
         print(f"\n{'='*60}")
         print("性能对比")
         print(f"{'='*60}\n")
 
+        reno_policies = sorted(set(r["ack_policy"] for r in self.results
+                                   if r["implementation"] == "foggytcp2_reno"))
+
         for scenario in scenarios:
             scenario_desc = next(r["scenario_desc"] for r in self.results if r["scenario"] == scenario)
+            cubic_results = self._successes("enhanced_cubic", "", scenario)
 
-            reno_results = [
-                r for r in self.results
-                if r["implementation"] == "foggytcp2_reno" and r["scenario"] == scenario and r["success"]
-            ]
-
-            cubic_results = [
-                r for r in self.results
-                if r["implementation"] == "enhanced_cubic" and r["scenario"] == scenario and r["success"]
-            ]
+            for policy in reno_policies:
+                reno_results = self._successes("foggytcp2_reno", policy, scenario)
+                if not (reno_results and cubic_results):
+                    continue
 
-            if reno_results and cubic_results:
                 reno_avg = statistics.mean([r["duration_ms"] for r in reno_results])
                 cubic_avg = statistics.mean([r["duration_ms"] for r in cubic_results])
 
                 improvement = (reno_avg - cubic_avg) / reno_avg * 100
 
                 print(f"{scenario_desc}:")
-                print(f"  Reno:  {reno_avg:7.0f} ms")
+                print(f"  Reno ({policy}):  {reno_avg:7.0f} ms")
                 print(f"  Cubic: {cubic_avg:7.0f} ms")
                 print(f"  提升:  {improvement:+6.1f}% {'✅' if improvement > 0 else '❌'}")
                 print()
 
+        if len(reno_policies) > 1:
+            self.print_ack_summary(scenarios, reno_policies)
+
+    def _successes(self, impl, policy, scenario):
+        return [
+            r for r in self.results
+            if r["implementation"] == impl and r["ack_policy"] == policy
+            and r["scenario"] == scenario and r["success"]
+        ]
+
+    def print_ack_summary(self, scenarios, policies):
+        """对比 foggytcp2 各 ACK 策略的 ACK 率与吞吐量"""
+        print(f"\n{'='*60}")
+        print("ACK 策略对比 (foggytcp2_reno)")
+        print(f"{'='*60}\n")
+
+        for scenario in scenarios:
+            scenario_desc = next(r["scenario_desc"] for r in self.results if r["scenario"] == scenario)
+            print(f"{scenario_desc}:")
+            for policy in policies:
+                results = self._successes("foggytcp2_reno", policy, scenario)
+                if not results:
+                    print(f"  {policy:8s}: 全部失败")
+                    continue
+                throughput = statistics.mean([r["throughput_mbps"] for r in results])
+                ack_rates = [r["ack_rate"] for r in results if r["ack_rate"] is not None]
+                ack_rate = f"{statistics.mean(ack_rates):.2f}" if ack_rates else "-"
+                print(f"  {policy:8s}: ACK/数据段 {ack_rate:>5s}  吞吐量 {throughput:6.2f} Mbps")
+            print()
+
+def impl_label(impl_name, ack_policy):
+    return impl_name if not ack_policy else f"{impl_name} [{ack_policy}]"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="TCP 拥塞控制算法性能对比测试")
+    parser.add_argument("--daemon", nargs="?", const=DEFAULT_SOCKET, default=None,
+                        metavar="SOCKET",
+                        help="通过常驻守护进程执行测试, 需先运行 "
+                             "sudo python3 foggytcp2/scripts/harness_daemon.py --loopback "
+                             f"(默认套接字 {DEFAULT_SOCKET})")
+    parser.add_argument("--relay", action="store_true",
+                        help="由用户态 relay (foggytcp2/foggytcp: make relay) 施加网络参数, "
+                             "不需要 root, 可与其他实例同时运行")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default=DEFAULT_LOG_LEVEL,
+                        help=f"client/server 的日志级别 FOGGY_LOG_LEVEL (默认 {DEFAULT_LOG_LEVEL}); "
+                             "release 版本只保留 error 级别")
+    parser.add_argument("--ack-policy", nargs="+", choices=ACK_POLICIES,
+                        default=[DEFAULT_ACK_POLICY], metavar="POLICY",
+                        help=f"foggytcp2 接收端的 ACK 策略 FOGGY_ACK_POLICY, 可给出多个依次测试并对比 "
+                             f"({', '.join(ACK_POLICIES)}; 默认 {DEFAULT_ACK_POLICY})")
+    parser.add_argument("--pacing", type=pacing_mode, default=None, metavar="MODE",
+                        help="foggytcp2 发送端的 pacing 模式 FOGGY_PACING: off、on 或正数增益, "
+                             "如 1.25 (默认不设置, 即实现的默认值 off)")
+    adaptive.add_arguments(parser)
+    args = parser.parse_args()
+    adaptive.check_arguments(parser, args)
+    if args.relay and args.daemon:
+        parser.error("--relay 与 --daemon 不能同时使用")
+    return args
+
+
 def main():
+    args = parse_args()
+    # 子进程 (client/server) 继承该环境变量; 守护进程模式使用守护进程的 --log-level
+    os.environ["FOGGY_LOG_LEVEL"] = args.log_level
+
     print("""
 ╔══════════════════════════════════════════════════════════════╗
 ║           TCP 拥塞控制算法性能对比测试                        ║
@@ -355,7 +612,21 @@ def main():
 ╚══════════════════════════════════════════════════════════════╝
     """)
 
-    runner = TestRunner()
+    harness = None
+    if args.daemon:
+        harness = HarnessClient(args.daemon)
+        try:
+            harness.ping()
+        except HarnessError as e:
+            print(f"❌ {e}")
+            return
+
+    if args.relay and not relay.available():
+        print(f"❌ relay 不存在: {relay.RELAY_BIN}; {relay.BUILD_HINT}")
+        return
+
+    stopper_factory = (lambda: adaptive.stopper_from_args(args)) if args.adaptive else None
+    runner = TestRunner(harness, stopper_factory, args.relay)
 
     # 编译两个实现
     if not runner.compile_implementation(FOGGYTCP2_DIR, "foggytcp2_reno"):
@@ -366,8 +637,9 @@ def main():
         print("❌ enhanced_cca 编译失败，退出")
         return
 
-    # 测试 Reno
-    runner.test_implementation(FOGGYTCP2_DIR, "foggytcp2_reno")
+    # 测试 Reno, 每个 ACK 策略一轮 (enhanced_cca 没有 ACK 策略, 每段都 ACK)
+    for ack_policy in dict.fromkeys(args.ack_policy):
+        runner.test_implementation(FOGGYTCP2_DIR, "foggytcp2_reno", ack_policy, args.pacing)
 
     # 测试 Cubic
     runner.test_implementation(ENHANCED_CCA_DIR, "enhanced_cubic")